@@ -0,0 +1,215 @@
+import os
+
+from typing import Any, Dict, List, Tuple, Union
+from image_ops import fit_size
+
+DEFAULT_SEGMENT_SECONDS = 6
+DEFAULT_AUDIO_BITRATE = "128k"
+DEFAULT_CODEC = "libx264"
+
+HLS_MASTER_PLAYLIST_NAME = "master.m3u8"
+
+
+def get_abr_ladder(render_output: Dict[str, Any], declared_target: Dict[str, Any]) -> Union[Dict[str, Any], None]:
+    """
+    Returns the ABR ladder an output target is packaged with, or None.
+
+    A cut published for web playback declares the ladder once under
+    "render_output.abr_ladder", and a target may replace it with its own
+    "abr_ladder" (or null to skip packaging):
+
+        "abr_ladder": {
+            "renditions": [
+                {"name": "720p", "height": 720, "video_bitrate": "3000k"},
+                {"name": "360p", "height": 360, "video_bitrate": "800k"}
+            ],
+            "segment_seconds": 6,
+            "audio_bitrate": "128k",
+            "codec": "libx264"
+        }
+
+    A rendition sets a "width" or a "height", the other follows from the cut's
+    aspect ratio; "max_bitrate" and "buffer_size" default to 1.5x and 2x the
+    video bitrate.
+    """
+    if "abr_ladder" in declared_target:
+        return declared_target["abr_ladder"]
+
+    return render_output.get("abr_ladder")
+
+
+def get_hls_output_pathname(cut_output_file_pathname: str) -> str:
+    """Returns the directory a cut's HLS renditions are written to, e.g. "cut.mp4" -> "cut_hls"."""
+    name, _ = os.path.splitext(cut_output_file_pathname)
+    return f"{name}_hls"
+
+
+def hls_output_is_complete(cut_output_file_pathname: str) -> bool:
+    """The HLS directory only appears once complete, see video_utility.atomic_output_directory()."""
+    return os.path.isfile(os.path.join(get_hls_output_pathname(cut_output_file_pathname), HLS_MASTER_PLAYLIST_NAME))
+
+
+def round_to_even(value) -> int:
+    return max(2, int(round(value / 2.0)) * 2)
+
+
+def plan_renditions(abr_ladder: Dict[str, Any], size: Tuple[int, int]) -> List[Dict[str, Any]]:
+    """
+    Works out the frame size and bitrates of every rendition of a cut of the
+    given size. Renditions larger than the cut are skipped rather than upscaled.
+    """
+    renditions = []
+    names = set()
+
+    for rendition in abr_ladder.get("renditions", []):
+        if rendition.get("width"):
+            rendition_size = fit_size(size, width=rendition["width"])
+        elif rendition.get("height"):
+            rendition_size = fit_size(size, height=rendition["height"])
+        else:
+            rendition_size = size
+
+        rendition_size = (round_to_even(rendition_size[0]), round_to_even(rendition_size[1]))
+
+        if rendition_size[0] > size[0] or rendition_size[1] > size[1]:
+            print(f"Skipping ABR rendition {rendition.get('name', rendition_size)}, it is larger than the {size[0]}x{size[1]} cut.")
+            continue
+
+        name = rendition.get("name") or f"{rendition_size[1]}p"
+
+        if name in names:
+            raise ValueError(f"Duplicate ABR rendition name: {name}")
+        names.add(name)
+
+        video_bitrate = rendition["video_bitrate"]
+        bitrate_kbps = parse_bitrate_kbps(video_bitrate)
+
+        renditions.append({
+            "name": name,
+            "size": rendition_size,
+            "video_bitrate": video_bitrate,
+            "max_bitrate": rendition.get("max_bitrate") or f"{int(bitrate_kbps * 1.5)}k",
+            "buffer_size": rendition.get("buffer_size") or f"{int(bitrate_kbps * 2)}k",
+        })
+
+    return renditions
+
+
+def parse_bitrate_kbps(bitrate) -> float:
+    """Parses an ffmpeg bitrate such as "3000k", "3M" or 3000000 into kbit/s."""
+    text = str(bitrate).strip().lower()
+
+    if text.endswith("k"):
+        return float(text[:-1])
+    if text.endswith("m"):
+        return float(text[:-1]) * 1000
+
+    return float(text) / 1000
+
+
+def build_abr_filter_graph(renditions: List[Dict[str, Any]]) -> Tuple[str, str, List[str]]:
+    """
+    Builds the filter graph splitting the decoded frames once into the cut and
+    every rendition, each rendition scaled from the full-size frames.
+
+    :return: The filter graph, the label of the full-size output and the
+             labels of the renditions.
+    """
+    labels = [f"[abr{index}]" for index in range(len(renditions))]
+    split = f"[0:v]split={len(renditions) + 1}[cut]" + "".join(f"[abr_in{index}]" for index in range(len(renditions)))
+    scales = [
+        f"[abr_in{index}]scale={rendition['size'][0]}:{rendition['size'][1]}:flags=lanczos{labels[index]}"
+        for index, rendition in enumerate(renditions)
+    ]
+
+    return ";".join([split] + scales), "[cut]", labels
+
+
+def build_hls_output_arguments(
+    hls_output_pathname: str,
+    renditions: List[Dict[str, Any]],
+    labels: List[str],
+    fps,
+    codec: str,
+    preset: str,
+    has_audio: bool,
+    audio_codec: str,
+    segment_seconds,
+    audio_bitrate: str,
+) -> List[str]:
+    """
+    Builds the ffmpeg arguments writing every rendition as HLS with fMP4
+    segments, and the master playlist referencing them.
+
+    Keyframes are forced on segment boundaries, so every rendition's segments
+    start at the same times and players can switch between them.
+    """
+    arguments = []
+    stream_map = []
+
+    for index, label in enumerate(labels):
+        arguments.extend(["-map", label])
+
+        if has_audio:
+            arguments.extend(["-map", "1:a"])
+            stream_map.append(f"v:{index},a:{index},name:{renditions[index]['name']}")
+        else:
+            stream_map.append(f"v:{index},name:{renditions[index]['name']}")
+
+    for index, rendition in enumerate(renditions):
+        arguments.extend([
+            f"-b:v:{index}", str(rendition["video_bitrate"]),
+            f"-maxrate:v:{index}", str(rendition["max_bitrate"]),
+            f"-bufsize:v:{index}", str(rendition["buffer_size"]),
+        ])
+
+    arguments.extend([
+        "-c:v", codec,
+        "-preset", preset,
+        "-pix_fmt", "yuv420p",
+        "-force_key_frames", f"expr:gte(t,n_forced*{segment_seconds})",
+        "-r", "%.02f" % fps,
+    ])
+
+    if has_audio:
+        # The soundtrack is already encoded for the cut, AAC is copied as is
+        if audio_codec == "aac":
+            arguments.extend(["-c:a", "copy"])
+        else:
+            arguments.extend(["-c:a", "aac", "-b:a", audio_bitrate])
+
+    arguments.extend([
+        "-f", "hls",
+        "-hls_time", str(segment_seconds),
+        "-hls_playlist_type", "vod",
+        "-hls_segment_type", "fmp4",
+        "-hls_flags", "independent_segments",
+        "-hls_fmp4_init_filename", "init.mp4",
+        "-hls_segment_filename", os.path.join(hls_output_pathname, "%v", "segment_%05d.m4s"),
+        "-master_pl_name", HLS_MASTER_PLAYLIST_NAME,
+        "-var_stream_map", " ".join(stream_map),
+        os.path.join(hls_output_pathname, "%v", "playlist.m3u8"),
+    ])
+
+    return arguments
+
+
+def build_hls_output(abr_ladder: Dict[str, Any], size: Tuple[int, int], partial_hls_output_pathname: str, preset: str, audio_codec: str) -> Union[Dict[str, Any], None]:
+    """
+    Returns the hls_output options of frame_sink.build_encoder_command() for
+    a cut of the given size, or None if no rendition fits the cut.
+    """
+    renditions = plan_renditions(abr_ladder, size)
+
+    if not renditions:
+        return None
+
+    return {
+        "path": partial_hls_output_pathname,
+        "renditions": renditions,
+        "segment_seconds": abr_ladder.get("segment_seconds", DEFAULT_SEGMENT_SECONDS),
+        "codec": abr_ladder.get("codec", DEFAULT_CODEC),
+        "preset": abr_ladder.get("preset", preset),
+        "audio_codec": audio_codec,
+        "audio_bitrate": abr_ladder.get("audio_bitrate", DEFAULT_AUDIO_BITRATE),
+    }
@@ -0,0 +1,215 @@
+import os
+import time
+import subprocess as sp
+
+import numpy as np
+
+from typing import Any, Dict, List
+from functools import lru_cache
+from moviepy import AudioClip, AudioFileClip
+from moviepy.config import FFMPEG_BINARY
+from moviepy.tools import cross_platform_popen_params
+from fingerprint_utility import source_fingerprint
+from video_utility import atomic_output_file, ensure_directory_exists
+from staging_cache import resolve_source_path
+from render_metrics import record_cache_lookup
+
+DEFAULT_AUDIO_CACHE_PATH = os.path.join(os.path.expanduser("~"), ".composeflow", "audio")
+DEFAULT_AUDIO_CACHE_SIZE_MB = 4096
+
+# The sample rate and channel count MoviePy's AudioFileClip decodes to
+DEFAULT_AUDIO_CACHE_FPS = 44100
+AUDIO_CACHE_CHANNELS = 2
+
+# Decoded sources kept mapped, shared by every scene and cut rendered in this process
+MAPPED_AUDIO_CACHE_SIZE = 32
+
+# The decoded audio cache settings of the cut being rendered
+_audio_cache: Dict[str, Any] = {
+    "enabled": False,
+    "path": DEFAULT_AUDIO_CACHE_PATH,
+    "max_size_mb": DEFAULT_AUDIO_CACHE_SIZE_MB,
+    "fps": DEFAULT_AUDIO_CACHE_FPS,
+}
+
+
+def configure_audio_cache(settings: Dict) -> None:
+    """
+    Reads the decoded audio cache options from the video assembly settings.
+
+    Settings:
+        "audio_cache": {
+            "enabled": false,
+            "path": Directory of the cache (default ~/.composeflow/audio).
+            "max_size_mb": Least recently used sources are removed above this size (default 4096).
+            "fps": Sample rate the sources are decoded to (default 44100).
+        }
+    """
+    audio_cache = settings.get("audio_cache", {})
+
+    _audio_cache["enabled"] = audio_cache.get("enabled", False)
+    _audio_cache["path"] = audio_cache.get("path") or DEFAULT_AUDIO_CACHE_PATH
+    _audio_cache["max_size_mb"] = audio_cache.get("max_size_mb", DEFAULT_AUDIO_CACHE_SIZE_MB)
+    _audio_cache["fps"] = int(audio_cache.get("fps") or DEFAULT_AUDIO_CACHE_FPS)
+
+
+def is_audio_cache_enabled() -> bool:
+    return bool(_audio_cache["enabled"])
+
+
+def get_audio_cache_file_pathname(fingerprint: str, fps: int) -> str:
+    return os.path.join(_audio_cache["path"], fingerprint[:2], f"{fingerprint}.{fps}.f32")
+
+
+def decode_audio(source_path: str, pcm_file_pathname: str, fps: int) -> None:
+    """Decodes the audio of a source to raw interleaved float32 PCM, resampled like AudioFileClip does."""
+    ensure_directory_exists(pcm_file_pathname)
+    start_time = time.time()
+
+    with atomic_output_file(pcm_file_pathname) as partial_file_pathname:
+        cmd = [
+            FFMPEG_BINARY, "-y", "-loglevel", "error",
+            "-i", source_path,
+            "-vn",
+            "-f", "f32le", "-acodec", "pcm_f32le",
+            "-ar", str(fps), "-ac", str(AUDIO_CACHE_CHANNELS),
+            partial_file_pathname,
+        ]
+
+        process = sp.run(cmd, **cross_platform_popen_params({"stdout": sp.DEVNULL, "stderr": sp.PIPE}))
+
+        if process.returncode != 0:
+            raise IOError(f"Decoding the audio of '{source_path}' failed:\n{process.stderr.decode(errors='replace')}")
+
+        # A truncated decode would shift every later sample of an interleaved file
+        if os.path.getsize(partial_file_pathname) % (AUDIO_CACHE_CHANNELS * 4) != 0:
+            raise IOError(f"Decoding the audio of '{source_path}' returned a partial sample frame.")
+
+    print(f"Decoded the audio of '{source_path}' to the audio cache in {time.time() - start_time:.2f}s.")
+
+
+def trim_audio_cache(keep_file_pathname: str) -> None:
+    """
+    Removes the least recently used decoded sources until the cache fits its
+    size. Renders on other processes keep reading removed files they already
+    have mapped.
+    """
+    max_size = _audio_cache["max_size_mb"] * 1024 * 1024
+    cache_files = []
+
+    for directory, _, file_names in os.walk(_audio_cache["path"]):
+        for file_name in file_names:
+            if not file_name.endswith(".f32"):
+                continue
+
+            file_pathname = os.path.join(directory, file_name)
+
+            try:
+                file_stat = os.stat(file_pathname)
+            except OSError:
+                continue
+
+            cache_files.append((file_stat.st_mtime, file_stat.st_size, file_pathname))
+
+    cache_size = sum(file_size for _, file_size, _ in cache_files)
+
+    for _, file_size, file_pathname in sorted(cache_files):
+        if cache_size <= max_size:
+            break
+
+        if file_pathname == keep_file_pathname:
+            continue
+
+        try:
+            os.remove(file_pathname)
+        except OSError:
+            continue
+
+        cache_size -= file_size
+
+
+@lru_cache(maxsize=MAPPED_AUDIO_CACHE_SIZE)
+def map_decoded_audio(pcm_file_pathname: str) -> np.ndarray:
+    """
+    Maps a decoded source read-only as an array of (samples, channels). The
+    pages are shared with every other process mapping the same source.
+    """
+    sample_count = os.path.getsize(pcm_file_pathname) // (AUDIO_CACHE_CHANNELS * 4)
+
+    if sample_count == 0:
+        return np.zeros((0, AUDIO_CACHE_CHANNELS), dtype=np.float32)
+
+    samples = np.memmap(pcm_file_pathname, dtype=np.float32, mode="r", shape=(sample_count, AUDIO_CACHE_CHANNELS))
+
+    # A plain array view, so slices and the arrays computed from them are not memmaps
+    return samples.view(np.ndarray)
+
+
+def get_decoded_audio(source_path: str) -> np.ndarray:
+    """Returns the decoded samples of a source, decoding it on first use."""
+    fps = _audio_cache["fps"]
+    pcm_file_pathname = get_audio_cache_file_pathname(source_fingerprint(source_path), fps)
+    audio_cached = os.path.isfile(pcm_file_pathname)
+    record_cache_lookup("audio", audio_cached)
+
+    if audio_cached:
+        # The modification time orders the cache for trim_audio_cache()
+        os.utime(pcm_file_pathname)
+    else:
+        decode_audio(resolve_source_path(source_path), pcm_file_pathname, fps)
+        trim_audio_cache(pcm_file_pathname)
+
+    return map_decoded_audio(pcm_file_pathname)
+
+
+class DecodedAudioClip(AudioClip):
+    """
+    An audio clip playing decoded samples from the audio cache. Consecutive
+    times, as requested when the soundtrack is written in chunks, are returned
+    as views of the mapped samples without copying them.
+    """
+
+    def __init__(self, source_path: str, samples: np.ndarray, fps: int):
+        self.filename = source_path
+        self.samples = samples
+
+        super().__init__(frame_function=self.get_samples, duration=len(samples) / fps, fps=fps)
+
+    def get_samples(self, t):
+        sample_count = len(self.samples)
+
+        if isinstance(t, np.ndarray):
+            frames = np.round(self.fps * t).astype(int)
+
+            if len(frames) and 0 <= frames[0] and frames[-1] < sample_count and frames[-1] - frames[0] + 1 == len(frames):
+                return self.samples[frames[0]:frames[-1] + 1]
+
+            # Out of range times are silent, as with AudioFileClip
+            result = np.zeros((len(frames), AUDIO_CACHE_CHANNELS), dtype=np.float32)
+            in_range = (frames >= 0) & (frames < sample_count)
+            result[in_range] = self.samples[frames[in_range]]
+
+            return result
+
+        frame = int(round(self.fps * t))
+
+        if 0 <= frame < sample_count:
+            return self.samples[frame]
+
+        return np.zeros(AUDIO_CACHE_CHANNELS, dtype=np.float32)
+
+
+def open_audio_source(source_path: str, clips_to_close: List):
+    """
+    Opens an audio file for a scene: from the decoded audio cache when it is
+    enabled, so music beds and voice-overs used by many scenes are decoded and
+    resampled once, otherwise as an AudioFileClip.
+    """
+    if is_audio_cache_enabled():
+        audio_clip = DecodedAudioClip(source_path, get_decoded_audio(source_path), _audio_cache["fps"])
+    else:
+        audio_clip = AudioFileClip(resolve_source_path(source_path))
+
+    clips_to_close.append(audio_clip)
+
+    return audio_clip
@@ -0,0 +1,438 @@
+import os
+import sys
+import json
+import time
+import shutil
+import hashlib
+
+from typing import Any, Callable, Dict, List
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+from output_target_utility import get_output_targets
+from segment_utility import iter_scene_renders
+from scene_utility import render_scene_targets
+from video_assembly_helper import SCENE_LABEL_KEYS
+from video_utility import atomic_output_file, ensure_directory_exists
+from image_ops import configure_image_ops, get_image_ops_backend
+from chunk_encode_utility import configure_chunked_encoding
+from frame_pipeline import configure_frame_pipeline
+from smart_cut_utility import configure_smart_cut, is_smart_cut_enabled
+from mezzanine_cache import configure_mezzanine_cache
+from resource_governor import configure_resource_governor, allocate_threads, allocate_worker_count, set_process_share
+from audio_cache import configure_audio_cache
+from clip_cache import configure_clip_cache
+from image_helper import configure_raster_cache
+from staging_cache import configure_staging_cache
+from render_metrics import (
+    configure_render_metrics, get_render_metrics_settings, set_render_metrics_settings, open_metrics_export, export_metrics,
+    increment_metric, take_metrics, merge_metrics
+)
+from render_journal import RenderJournal
+from cut_utility import build_render_journal_file_pathname
+from render_telemetry import (
+    RenderTelemetry, RenderProgress, get_render_telemetry_pathname, get_scene_features, get_scene_telemetry_key,
+    get_cut_features, get_cut_telemetry_key, take_stage_seconds
+)
+
+# CPU threads a batch worker is planned with when the worker count is not given
+BATCH_THREADS_PER_WORKER = 4
+
+
+def collect_video_assembly_files(paths: List[str]) -> List[str]:
+    """
+    Expands the batch arguments: files are taken as they are, directories
+    contribute the video assembly JSON files directly inside them.
+    """
+    video_assembly_files = []
+
+    for path in paths:
+        if not os.path.isdir(path):
+            video_assembly_files.append(path)
+            continue
+
+        for file_name in sorted(os.listdir(path)):
+            file_path = os.path.join(path, file_name)
+
+            if file_name.lower().endswith(".json") and is_video_assembly_file(file_path):
+                video_assembly_files.append(file_path)
+
+    return list(dict.fromkeys(video_assembly_files))
+
+
+def is_video_assembly_file(file_path: str) -> bool:
+    try:
+        with open(file_path, "r") as file:
+            video_assembly = json.load(file)
+    except (OSError, ValueError):
+        return False
+
+    return isinstance(video_assembly, dict) and "cut" in video_assembly
+
+
+def get_scene_render_key(scene: Dict, target: Dict, source_file_watermark: bool) -> str:
+    """
+    Returns a key that is equal for scene renders producing the same pixels,
+    whichever assembly they come from.
+    """
+    render_description = {
+        "scene": {key: value for key, value in scene.items() if key not in SCENE_LABEL_KEYS},
+        "target": {
+            "name": target["name"],
+            "aspect_ratio": target["aspect_ratio"],
+            "resolution": target["resolution"],
+            "quick_and_dirty": target["quick_and_dirty"],
+            "render_settings": target["render_settings"],
+        },
+        "source_file_watermark": source_file_watermark,
+        "image_ops_backend": get_image_ops_backend(),
+        "smart_cut": is_smart_cut_enabled(),
+    }
+
+    return hashlib.sha256(json.dumps(render_description, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+
+
+def plan_batch(video_assembly_files: List[str], resume: bool = False) -> Dict[str, Any]:
+    """
+    Builds one plan for all assemblies.
+
+    Every pending scene render is keyed by get_scene_render_key(). The first
+    assembly that needs a key renders it; later assemblies needing the same key
+    get a copy of that output instead of rendering it again, also when it was
+    complete before the batch started. With resume, outputs count as complete
+    only when their assembly's journal recorded them, as the cuts will check.
+
+    :return: The scene tasks, the copies to make once a task is done, the
+             copies of outputs that are already complete, and per assembly
+             the tasks its cut waits for and what predicts its cut's render time.
+    """
+    tasks = []
+    copies = []
+    task_by_render_key = {}
+    render_key_by_output = {}
+    assemblies = []
+
+    for video_assembly_file in video_assembly_files:
+        with open(video_assembly_file, "r") as file:
+            video_assembly = json.load(file)
+
+        settings = video_assembly.get("composeflow.org", {}).get("settings", {})
+        source_file_watermark = settings.get("source_file_watermark", False)
+        cut = video_assembly.get("cut", {})
+        render_output = cut["render_output"]
+
+        configure_image_ops(settings)
+        configure_smart_cut(settings)
+        configure_resource_governor(settings)
+        configure_render_metrics(settings)
+
+        # The first assembly enabling metrics starts their export for the whole batch
+        open_metrics_export()
+
+        output_targets = get_output_targets(render_output, settings.get("quick_and_dirty", False))
+
+        journal_file_pathname = build_render_journal_file_pathname(cut, render_output)
+        render_journal = RenderJournal(journal_file_pathname, resume)
+
+        assembly = {
+            "video_assembly_file": video_assembly_file,
+            "journal_file_pathname": journal_file_pathname,
+            "telemetry_pathname": get_render_telemetry_pathname(settings, render_output),
+            "task_indexes": set(),
+            "cut_telemetry": [],
+        }
+        assemblies.append(assembly)
+
+        scene_task = None
+        content_seconds_by_scene = {}
+        segment_sequences = set()
+
+        for segment, scene, target, output_path in iter_scene_renders(video_assembly, output_targets):
+            render_key = get_scene_render_key(scene, target, source_file_watermark)
+            scene_sequence = (segment["sequence"], scene["sequence"])
+            segment_sequences.add(segment["sequence"])
+
+            if scene_sequence not in content_seconds_by_scene:
+                content_seconds_by_scene[scene_sequence] = get_scene_features(scene, [])["content_seconds"]
+
+            # Scene outputs are not content addressed, two different renders must not share a file
+            if render_key_by_output.setdefault(os.path.abspath(output_path), render_key) != render_key:
+                raise ValueError(f"Two assemblies render different scenes to '{output_path}', render them separately.")
+
+            if render_journal.is_complete(output_path):
+                # A finished output is the copy source of later assemblies needing the same render
+                task_by_render_key.setdefault(render_key, (None, output_path))
+                continue
+
+            if render_key in task_by_render_key:
+                task_index, source_path = task_by_render_key[render_key]
+
+                if task_index is None:
+                    copies.append((source_path, output_path, assembly["journal_file_pathname"]))
+                    continue
+
+                if source_path != output_path:
+                    tasks[task_index]["copies"].append((source_path, output_path, assembly["journal_file_pathname"]))
+
+                assembly["task_indexes"].add(task_index)
+                continue
+
+            # All new target renders of a scene share one task, and one decode
+            if scene_task is None or scene_task["scene"] is not scene:
+                scene_task = {
+                    "scene": scene,
+                    "settings": settings,
+                    "source_file_watermark": source_file_watermark,
+                    "targets": [],
+                    "output_paths": {},
+                    "clip_path": render_output["output_paths"].get("clip"),
+                    "journal_file_pathname": assembly["journal_file_pathname"],
+                    "telemetry_pathname": assembly["telemetry_pathname"],
+                    "copies": [],
+                }
+                tasks.append(scene_task)
+
+            scene_task["targets"].append(target)
+            scene_task["output_paths"][target["name"]] = output_path
+            task_by_render_key[render_key] = (len(tasks) - 1, output_path)
+            assembly["task_indexes"].add(len(tasks) - 1)
+
+        for target in output_targets:
+            cut_features = get_cut_features(sum(content_seconds_by_scene.values()), len(segment_sequences), target)
+            assembly["cut_telemetry"].append((get_cut_telemetry_key(cut, target), cut_features))
+
+    return {"tasks": tasks, "copies": copies, "assemblies": assemblies}
+
+
+def predict_batch(tasks: List[Dict[str, Any]], assemblies: List[Dict[str, Any]], get_telemetry: Callable) -> Dict[Any, float]:
+    """
+    Predicts the render time of every scene task and cut of the batch from the
+    telemetry of their assemblies. Cuts are predicted as if all their targets
+    were pending.
+
+    :param get_telemetry: Returns the RenderTelemetry of a telemetry pathname.
+    :return: Predicted seconds keyed by ("scene", task index) and ("cut", assembly index).
+    """
+    predicted_seconds = {}
+
+    for task_index, task in enumerate(tasks):
+        if task["telemetry_pathname"] is None:
+            continue
+
+        predicted_seconds[("scene", task_index)] = get_telemetry(task["telemetry_pathname"]).predict_seconds(
+            "scene", get_scene_telemetry_key(task["scene"], task["targets"]), get_scene_features(task["scene"], task["targets"])
+        )
+
+    for assembly_index, assembly in enumerate(assemblies):
+        if assembly["telemetry_pathname"] is None:
+            continue
+
+        render_telemetry = get_telemetry(assembly["telemetry_pathname"])
+        predicted_seconds[("cut", assembly_index)] = sum(
+            render_telemetry.predict_seconds("cut", cut_key, cut_features) for cut_key, cut_features in assembly["cut_telemetry"]
+        )
+
+    return predicted_seconds
+
+
+def _initialize_batch_worker(worker_count: int, render_metrics_settings: Dict) -> None:
+    set_process_share(worker_count)
+
+    # Workers hand their metrics to the batch process with their results
+    set_render_metrics_settings(render_metrics_settings)
+
+
+def render_batch_scene(task: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Batch worker: renders one scene for the output targets of its task.
+
+    :return: The render time, the time spent per stage and the metrics, recorded by the batch process.
+    """
+    start_time = time.time()
+
+    # Stage times left behind by a failed task in this worker
+    take_stage_seconds()
+
+    configure_resource_governor(task["settings"])
+    configure_image_ops(task["settings"])
+    configure_smart_cut(task["settings"])
+    configure_mezzanine_cache(task["settings"])
+    configure_audio_cache(task["settings"])
+    configure_raster_cache(task["settings"])
+    configure_clip_cache(task["settings"], task["clip_path"])
+    configure_staging_cache(task["settings"])
+    configure_render_metrics(task["settings"])
+
+    # The pool already keeps every core busy, so scenes are not split into chunk or compositor processes
+    configure_chunked_encoding({"chunked_encoding": {"enabled": False}})
+    configure_frame_pipeline({"frame_pipeline": {"enabled": False}})
+
+    render_scene_targets(task["scene"], task["targets"], task["output_paths"], task["source_file_watermark"])
+    increment_metric("scenes_rendered")
+
+    return {"render_seconds": time.time() - start_time, "stage_seconds": take_stage_seconds(), "metrics": take_metrics()}
+
+
+def render_batch_cut(render_cut: Callable, video_assembly_file: str, resume: bool) -> Dict[str, Any]:
+    """Batch worker: renders the cut of one assembly and returns its render time and metrics."""
+    start_time = time.time()
+
+    render_cut(video_assembly_file, resume)
+
+    return {"render_seconds": time.time() - start_time, "metrics": take_metrics()}
+
+
+def copy_scene_output(source_file_pathname: str, output_file_pathname: str) -> None:
+    """Shares a scene output with another assembly, as a hard link when the file system allows it."""
+    ensure_directory_exists(output_file_pathname)
+
+    with atomic_output_file(output_file_pathname) as partial_file_pathname:
+        try:
+            os.link(source_file_pathname, partial_file_pathname)
+        except OSError:
+            shutil.copyfile(source_file_pathname, partial_file_pathname)
+
+
+def render_batch(video_assembly_files: List[str], render_cut: Callable, workers=None, resume: bool = False) -> None:
+    """
+    Renders many video assemblies over one worker pool.
+
+    The scenes of all assemblies are planned together (see plan_batch()), so
+    identical scene renders are done once. Scenes are rendered in the pool, and
+    each assembly's cut is queued in the same pool as soon as its scenes are
+    done. Source probes and decoded overlay images are cached per worker
+    process and shared by every task it runs.
+
+    Scenes are dispatched longest first, as predicted from the render
+    telemetry, so the batch does not end waiting on one long scene started
+    last. The telemetry also gives the batch's ETA.
+
+    :param render_cut: Renders the cut of one assembly file, render_cut(video_assembly_file, resume).
+    :param workers: Number of scenes and cuts rendered at the same time (default:
+                    as many as the resource governor allows, with
+                    BATCH_THREADS_PER_WORKER encoder threads each).
+    """
+    start_time = time.time()
+
+    plan = plan_batch(video_assembly_files, resume)
+    tasks = plan["tasks"]
+    assemblies = plan["assemblies"]
+
+    # Each worker encodes with its share of the budget, see resource_governor.allocate_threads()
+    workers = allocate_worker_count(BATCH_THREADS_PER_WORKER, workers)
+    encoder_threads = allocate_threads(workers)
+
+    copy_count = len(plan["copies"]) + sum(len(task["copies"]) for task in tasks)
+
+    print(
+        f"Batch: {len(assemblies)} assemblies, {len(tasks)} scene renders, {copy_count} shared scene outputs, "
+        f"{workers} workers with {encoder_threads} encoder threads each."
+    )
+
+    telemetries = {}
+
+    def get_telemetry(telemetry_pathname):
+        if telemetry_pathname not in telemetries:
+            telemetries[telemetry_pathname] = RenderTelemetry(telemetry_pathname)
+        return telemetries[telemetry_pathname]
+
+    predicted_seconds = predict_batch(tasks, assemblies, get_telemetry)
+    progress = RenderProgress(predicted_seconds, workers)
+    progress.print_estimate()
+
+    # Longest job first: the pool runs tasks in the order they are submitted
+    task_order = sorted(range(len(tasks)), key=lambda task_index: predicted_seconds.get(("scene", task_index), 0.0), reverse=True)
+
+    journals = {}
+
+    def get_journal(journal_file_pathname):
+        if journal_file_pathname not in journals:
+            journals[journal_file_pathname] = RenderJournal(journal_file_pathname)
+        return journals[journal_file_pathname]
+
+    for source_path, output_path, journal_file_pathname in plan["copies"]:
+        copy_scene_output(source_path, output_path)
+        get_journal(journal_file_pathname).record_complete(output_path, "scene")
+
+    failed_tasks = set()
+    failed_assemblies = []
+
+    with ProcessPoolExecutor(max_workers=workers, initializer=_initialize_batch_worker, initargs=(workers, get_render_metrics_settings())) as executor:
+        futures = {executor.submit(render_batch_scene, tasks[task_index]): ("scene", task_index) for task_index in task_order}
+        pending_assemblies = list(assemblies)
+
+        try:
+            while futures or pending_assemblies:
+                # Queue the cuts whose scenes are all rendered
+                for assembly in list(pending_assemblies):
+                    if assembly["task_indexes"] & failed_tasks:
+                        print(f"Batch: skipping the cut of '{assembly['video_assembly_file']}', one of its scenes failed.", file=sys.stderr)
+                        failed_assemblies.append(assembly["video_assembly_file"])
+                        pending_assemblies.remove(assembly)
+                    elif not assembly["task_indexes"]:
+                        futures[executor.submit(render_batch_cut, render_cut, assembly["video_assembly_file"], resume)] = ("cut", assembly)
+                        pending_assemblies.remove(assembly)
+
+                if not futures:
+                    break
+
+                done, _ = wait(futures, return_when=FIRST_COMPLETED)
+
+                for future in done:
+                    kind, item = futures.pop(future)
+                    error = future.exception()
+
+                    if kind == "cut":
+                        if error is not None:
+                            print(f"Batch: cut of '{item['video_assembly_file']}' failed: {error!r}", file=sys.stderr)
+                            failed_assemblies.append(item["video_assembly_file"])
+                        else:
+                            merge_metrics(future.result()["metrics"])
+                            progress.complete(("cut", assemblies.index(item)), future.result()["render_seconds"])
+                        continue
+
+                    task = tasks[item]
+
+                    if error is not None:
+                        print(f"Batch: scene render to {list(task['output_paths'].values())} failed: {error!r}", file=sys.stderr)
+                        failed_tasks.add(item)
+                        continue
+
+                    for output_path in task["output_paths"].values():
+                        get_journal(task["journal_file_pathname"]).record_complete(output_path, "scene")
+
+                    scene_render = future.result()
+                    merge_metrics(scene_render["metrics"])
+
+                    if task["telemetry_pathname"] is not None:
+                        get_telemetry(task["telemetry_pathname"]).record(
+                            "scene", get_scene_telemetry_key(task["scene"], task["targets"]), get_scene_features(task["scene"], task["targets"]),
+                            scene_render["render_seconds"], scene_render["stage_seconds"]
+                        )
+
+                    progress.complete(("scene", item), scene_render["render_seconds"])
+
+                    for source_path, output_path, journal_file_pathname in task["copies"]:
+                        copy_scene_output(source_path, output_path)
+                        get_journal(journal_file_pathname).record_complete(output_path, "scene")
+
+                    for assembly in pending_assemblies:
+                        assembly["task_indexes"].discard(item)
+        except BaseException:
+            for future in futures:
+                future.cancel()
+            raise
+        finally:
+            for render_telemetry in telemetries.values():
+                render_telemetry.close()
+
+            export_metrics()
+
+    elapsed_time = time.time() - start_time
+    minutes, seconds = divmod(elapsed_time, 60)
+
+    print(
+        f"Batch: rendered {len(assemblies) - len(failed_assemblies)} of {len(assemblies)} assemblies "
+        f"in {int(minutes)}m {seconds:.2f}s."
+    )
+
+    for video_assembly_file in failed_assemblies:
+        print(f"  - failed: {video_assembly_file}")
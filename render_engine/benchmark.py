@@ -0,0 +1,160 @@
+import os
+import time
+import argparse
+import tempfile
+import tracemalloc
+
+import numpy as np
+
+from moviepy import VideoClip, ImageClip
+from frame_sink import FrameSink
+from image_ops import IMAGE_OPS_BACKENDS, set_image_ops_backend, resize_clip, composite_overlay
+from video_utility import crop_video_to_aspect_ratio
+
+
+def parse_size(size_text: str):
+    """Parses a size such as "1920x1080" into (width, height)."""
+    width_text, height_text = size_text.lower().split("x")
+    return int(width_text), int(height_text)
+
+
+def make_synthetic_clip(size, duration, fps):
+    """
+    Builds a clip whose frame function allocates a fresh frame per call, like
+    the composite chain of a real scene does.
+    """
+    width, height = size
+    rng = np.random.default_rng(0)
+    base_frame = rng.integers(0, 255, size=(height, width, 3), dtype=np.uint8)
+
+    def frame_function(t):
+        return base_frame + np.uint8(int(t * fps) % 255)
+
+    return VideoClip(frame_function=frame_function, duration=duration).with_fps(fps)
+
+
+def print_result(name, frame_count, wall_time, main_thread_time, peak_memory):
+    print(
+        f"{name:<24} {frame_count / wall_time:8.1f} fps"
+        f"  {1000 * main_thread_time / frame_count:7.2f} ms main-thread CPU/frame"
+        f"  {peak_memory / (1024 * 1024):8.1f} MB peak traced"
+    )
+
+
+def benchmark_encode(clip, output_file_pathname, fps, write_frames):
+    tracemalloc.start()
+    start_time = time.perf_counter()
+    start_thread_time = time.thread_time()
+
+    write_frames(clip, output_file_pathname, fps)
+
+    main_thread_time = time.thread_time() - start_thread_time
+    wall_time = time.perf_counter() - start_time
+    _, peak_memory = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return wall_time, main_thread_time, peak_memory
+
+
+def write_with_moviepy(clip, output_file_pathname, fps):
+    clip.write_videofile(output_file_pathname, codec="libx264", fps=fps, preset="ultrafast", audio=False, logger=None)
+
+
+def write_with_frame_sink(clip, output_file_pathname, fps):
+    with FrameSink(output_file_pathname, clip.size, fps, codec="libx264", preset="ultrafast") as frame_sink:
+        for frame in clip.iter_frames(fps=fps):
+            frame_sink.write_frame(frame)
+
+
+def benchmark_frame_sink(args):
+    """Compares MoviePy's writer with the FrameSink used by write_video."""
+    size = parse_size(args.size)
+    duration = args.frames / args.fps
+    clip = make_synthetic_clip(size, duration, args.fps)
+
+    print(f"Encoding {args.frames} frames at {size[0]}x{size[1]}")
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        for name, write_frames in (
+            ("moviepy write_videofile", write_with_moviepy),
+            ("frame sink", write_with_frame_sink),
+        ):
+            output_file_pathname = os.path.join(temp_dir, f"{name.replace(' ', '_')}.mp4")
+            wall_time, main_thread_time, peak_memory = benchmark_encode(clip, output_file_pathname, args.fps, write_frames)
+            print_result(name, args.frames, wall_time, main_thread_time, peak_memory)
+
+
+def make_overlay_clip(size, duration):
+    """Builds a semi-transparent RGBA overlay, like a logo."""
+    width, height = size
+    overlay_frame = np.zeros((height, width, 3), dtype=np.uint8)
+    overlay_frame[:, :, 0] = 255
+    mask_frame = np.full((height, width), 0.5)
+
+    mask = ImageClip(mask_frame, is_mask=True, duration=duration)
+    return ImageClip(overlay_frame, duration=duration).with_mask(mask).with_position(("right", "bottom"))
+
+
+def time_frames(clip, frame_count, fps):
+    start_time = time.perf_counter()
+
+    for frame_index in range(frame_count):
+        clip.get_frame(frame_index / fps)
+
+    return (time.perf_counter() - start_time) / frame_count
+
+
+def benchmark_image_ops(args):
+    """Measures the per-frame cost of crop, resize and overlay for each backend."""
+    size = parse_size(args.size)
+    output_size = parse_size(args.output_size)
+    duration = args.frames / args.fps
+
+    print(f"Per-frame cost over {args.frames} frames, {size[0]}x{size[1]} source, {output_size[0]}x{output_size[1]} output")
+
+    # The source frame is cached, so only the image ops are measured
+    source_frame = make_synthetic_clip(size, duration, args.fps).get_frame(0)
+    source_clip = VideoClip(frame_function=lambda t: source_frame, duration=duration)
+    base_time = time_frames(source_clip, args.frames, args.fps)
+
+    for backend in IMAGE_OPS_BACKENDS:
+        set_image_ops_backend(backend)
+
+        cropped_clip = crop_video_to_aspect_ratio(source_clip, "9:16")
+        resized_clip = resize_clip(source_clip, output_size)
+        overlay_clip = make_overlay_clip((output_size[0] // 4, output_size[1] // 4), duration)
+        composited_clip = composite_overlay(resized_clip, overlay_clip)
+
+        resize_time = time_frames(resized_clip, args.frames, args.fps)
+
+        print(
+            f"{backend:<8}"
+            f"  crop {1000 * (time_frames(cropped_clip, args.frames, args.fps) - base_time):7.3f} ms"
+            f"  resize {1000 * (resize_time - base_time):7.3f} ms"
+            f"  overlay {1000 * (time_frames(composited_clip, args.frames, args.fps) - resize_time):7.3f} ms"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Micro-benchmarks for the render engine's frame hot path.")
+    subparsers = parser.add_subparsers(dest="benchmark", required=True)
+
+    frame_sink_parser = subparsers.add_parser("frame_sink", help="Compare encoder frame pipes.")
+    frame_sink_parser.add_argument("--size", default="1920x1080", help="Frame size, e.g. 1920x1080.")
+    frame_sink_parser.add_argument("--frames", type=int, default=300, help="Number of frames to encode.")
+    frame_sink_parser.add_argument("--fps", type=int, default=30, help="Frames per second.")
+    frame_sink_parser.set_defaults(run=benchmark_frame_sink)
+
+    image_ops_parser = subparsers.add_parser("image_ops", help="Compare image-ops backends.")
+    image_ops_parser.add_argument("--size", default="3840x2160", help="Source frame size.")
+    image_ops_parser.add_argument("--output-size", default="1280x720", help="Resize target size.")
+    image_ops_parser.add_argument("--frames", type=int, default=60, help="Number of frames to process.")
+    image_ops_parser.add_argument("--fps", type=int, default=30, help="Frames per second.")
+    image_ops_parser.set_defaults(run=benchmark_image_ops)
+
+    args = parser.parse_args()
+    args.run(args)
+
+
+if __name__ == "__main__":
+    main()
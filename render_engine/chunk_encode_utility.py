@@ -0,0 +1,230 @@
+import os
+import time
+import subprocess as sp
+
+from typing import Any, Callable, Dict, List, Tuple
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from moviepy.config import FFMPEG_BINARY
+from moviepy.tools import cross_platform_popen_params
+from resource_governor import allocate_threads, allocate_worker_count
+from render_metrics import merge_metrics
+from worker_settings import get_worker_settings, apply_worker_settings
+from video_utility import atomic_output_file, ensure_directory_exists, write_temp_audio_file, get_render_fps
+
+# Scenes at least this long are encoded in chunks, in seconds
+DEFAULT_MIN_SCENE_SECONDS = 600
+DEFAULT_CHUNK_SECONDS = 60
+DEFAULT_GOP_SECONDS = 2
+
+# The chunked encoding settings of the cut being rendered
+_chunked_encoding: Dict[str, Any] = {
+    "enabled": True,
+    "min_scene_seconds": DEFAULT_MIN_SCENE_SECONDS,
+    "chunk_seconds": DEFAULT_CHUNK_SECONDS,
+    "gop_seconds": DEFAULT_GOP_SECONDS,
+    "workers": None,
+}
+
+
+def configure_chunked_encoding(settings: Dict) -> None:
+    """
+    Reads the chunked encoding options from the video assembly settings.
+
+    Settings:
+        "chunked_encoding": {
+            "enabled": true,
+            "min_scene_seconds": Scenes at least this long are split (default 600).
+            "chunk_seconds": Target chunk length, rounded to whole GOPs (default 60).
+            "gop_seconds": Keyframe interval of the chunk encodes (default 2).
+            "workers": Number of encoder processes (default: as many as the resource governor allows).
+        }
+    """
+    chunked_encoding = settings.get("chunked_encoding", {})
+
+    _chunked_encoding["enabled"] = chunked_encoding.get("enabled", True)
+    _chunked_encoding["min_scene_seconds"] = chunked_encoding.get("min_scene_seconds", DEFAULT_MIN_SCENE_SECONDS)
+    _chunked_encoding["chunk_seconds"] = chunked_encoding.get("chunk_seconds", DEFAULT_CHUNK_SECONDS)
+    _chunked_encoding["gop_seconds"] = chunked_encoding.get("gop_seconds", DEFAULT_GOP_SECONDS)
+    _chunked_encoding["workers"] = chunked_encoding.get("workers")
+
+
+def get_chunk_worker_count() -> int:
+    return allocate_worker_count(requested=_chunked_encoding["workers"])
+
+
+def plan_chunks(frame_count: int, fps: float, chunk_seconds: float, gop_seconds: float) -> List[Tuple[int, int]]:
+    """
+    Splits a scene into frame ranges that start on GOP boundaries.
+
+    :param frame_count: Number of frames in the scene.
+    :return: A list of (first frame, end frame) ranges.
+    """
+    gop_frames = max(1, int(round(gop_seconds * fps)))
+    chunk_frames = max(1, int(round(chunk_seconds / gop_seconds))) * gop_frames
+
+    return [
+        (first_frame, min(first_frame + chunk_frames, frame_count))
+        for first_frame in range(0, frame_count, chunk_frames)
+    ]
+
+
+def should_encode_in_chunks(branches: List[Dict[str, Any]]) -> bool:
+    """
+    Returns True if the scene is long enough to be split, and its branches can
+    share one chunk plan.
+    """
+    if not _chunked_encoding["enabled"] or len(branches) == 0 or get_chunk_worker_count() < 2:
+        return False
+
+    # Chunks are cut on frame boundaries common to all branches
+    frame_rates = {get_render_fps(branch["render_settings"], branch["clip"]) for branch in branches}
+
+    if len(frame_rates) != 1:
+        return False
+
+    duration = branches[0]["clip"].duration
+
+    return duration is not None and duration >= _chunked_encoding["min_scene_seconds"]
+
+
+def get_chunk_file_pathname(output_file_pathname: str, chunk_index: int) -> str:
+    """Returns the pathname of one chunk, e.g. "scene.chunk0003.mp4"."""
+    name, extension = os.path.splitext(output_file_pathname)
+    return f"{name}.chunk{chunk_index:04d}{extension}"
+
+
+def get_chunk_render_settings(render_settings: Dict, fps: float, threads: int) -> Dict:
+    """
+    Returns the render settings of a chunk encode: a fixed keyframe interval,
+    so every chunk starts a GOP and the joined stream has a regular cadence.
+    """
+    gop_frames = str(max(1, int(round(_chunked_encoding["gop_seconds"] * fps))))
+
+    chunk_render_settings = dict(render_settings)
+    chunk_render_settings["threads"] = threads
+    chunk_render_settings["ffmpeg_params"] = list(render_settings.get("ffmpeg_params") or []) + [
+        "-g", gop_frames, "-keyint_min", gop_frames
+    ]
+
+    return chunk_render_settings
+
+
+def join_chunks(chunk_file_pathnames: List[str], audio_file_pathname, output_file_pathname: str) -> None:
+    """
+    Joins encoded chunks without re-encoding, using ffmpeg's concat demuxer,
+    and muxes the scene's soundtrack.
+    """
+    ensure_directory_exists(output_file_pathname)
+
+    with atomic_output_file(output_file_pathname) as partial_file_pathname:
+        concat_list_pathname = partial_file_pathname + ".concat.txt"
+
+        with open(concat_list_pathname, "w", encoding="utf-8") as concat_list_file:
+            for chunk_file_pathname in chunk_file_pathnames:
+                escaped_pathname = os.path.abspath(chunk_file_pathname).replace("'", "'\\''")
+                concat_list_file.write(f"file '{escaped_pathname}'\n")
+
+        # Absolute, so ffmpeg doesn't read the ":" of a relative name like "16:9/scene.mp4" as a protocol
+        cmd = [FFMPEG_BINARY, "-y", "-loglevel", "error", "-f", "concat", "-safe", "0", "-i", os.path.abspath(concat_list_pathname)]
+
+        if audio_file_pathname is not None:
+            cmd.extend(["-i", os.path.abspath(audio_file_pathname), "-map", "0:v", "-map", "1:a"])
+
+        cmd.extend(["-c", "copy", os.path.abspath(partial_file_pathname)])
+
+        try:
+            process = sp.run(cmd, **cross_platform_popen_params({"stdout": sp.DEVNULL, "stderr": sp.PIPE}))
+        finally:
+            os.remove(concat_list_pathname)
+
+        if process.returncode != 0:
+            raise IOError(
+                f"Joining chunks of '{output_file_pathname}' failed:\n{process.stderr.decode(errors='replace')}"
+            )
+
+
+def encode_in_chunks(branches: List[Dict[str, Any]], chunk_worker: Callable, worker_arguments: Tuple) -> None:
+    """
+    Encodes the branches of a long scene as GOP-aligned chunks in parallel
+    worker processes, then joins each branch's chunks losslessly.
+
+    MoviePy clips cannot be sent to other processes, so each worker rebuilds the
+    scene from its JSON description and encodes one frame range:
+
+        chunk_worker(chunk_file_pathnames, frame_range, chunk_render_settings, *worker_arguments)
+
+    Workers return the metrics they recorded, see render_metrics.take_metrics().
+    The soundtrack is written once here and muxed when the chunks are joined.
+
+    :param branches: The output branches, see write_video_targets().
+    """
+    fps = get_render_fps(branches[0]["render_settings"], branches[0]["clip"])
+    frame_count = int(branches[0]["clip"].duration * fps)
+    chunks = plan_chunks(frame_count, fps, _chunked_encoding["chunk_seconds"], _chunked_encoding["gop_seconds"])
+
+    worker_count = min(get_chunk_worker_count(), len(chunks))
+    threads = allocate_threads(worker_count)
+
+    chunk_render_settings = [get_chunk_render_settings(branch["render_settings"], fps, threads) for branch in branches]
+    chunk_file_pathnames = [
+        [get_chunk_file_pathname(branch["output_file_pathname"], chunk_index) for branch in branches]
+        for chunk_index in range(len(chunks))
+    ]
+
+    print(f"Encoding {len(chunks)} chunks of '{branches[0]['output_file_pathname']}' on {worker_count} workers with {threads} threads each.")
+
+    start_time = time.time()
+    audio_files = {}
+
+    try:
+        for branch in branches:
+            ensure_directory_exists(branch["output_file_pathname"])
+
+        with ProcessPoolExecutor(
+            max_workers=worker_count,
+            initializer=apply_worker_settings,
+            initargs=(get_worker_settings(),)
+        ) as executor:
+            futures = [
+                executor.submit(chunk_worker, chunk_file_pathnames[chunk_index], frame_range, chunk_render_settings, *worker_arguments)
+                for chunk_index, frame_range in enumerate(chunks)
+            ]
+
+            # The soundtrack is written while the workers encode
+            for branch in branches:
+                audio_codec = branch["render_settings"].get("audio", {}).get("codec", "aac")
+
+                if branch["clip"].audio and audio_codec not in audio_files:
+                    audio_files[audio_codec] = write_temp_audio_file(branch["clip"], branch["output_file_pathname"], audio_codec)
+
+            try:
+                for completed_count, future in enumerate(as_completed(futures), start=1):
+                    merge_metrics(future.result())
+                    print(f"  - Chunk {completed_count}/{len(chunks)} encoded")
+            except BaseException:
+                for future in futures:
+                    future.cancel()
+                raise
+
+        for branch_index, branch in enumerate(branches):
+            audio_codec = branch["render_settings"].get("audio", {}).get("codec", "aac")
+
+            join_chunks(
+                [chunk_file_pathnames[chunk_index][branch_index] for chunk_index in range(len(chunks))],
+                audio_files.get(audio_codec) if branch["clip"].audio else None,
+                branch["output_file_pathname"]
+            )
+    finally:
+        for chunk_file_pathnames_of_chunk in chunk_file_pathnames:
+            for chunk_file_pathname in chunk_file_pathnames_of_chunk:
+                if os.path.exists(chunk_file_pathname):
+                    os.remove(chunk_file_pathname)
+
+        for audio_file_pathname in audio_files.values():
+            if os.path.exists(audio_file_pathname):
+                os.remove(audio_file_pathname)
+
+    elapsed_time = time.time() - start_time
+    minutes, seconds = divmod(elapsed_time, 60)
+
+    print(f"Processed {len(chunks)} chunks of {len(branches)} output targets in {int(minutes)}m {seconds:.2f}s.")
@@ -0,0 +1,108 @@
+import os
+import re
+import json
+import hashlib
+
+from typing import Any, Dict, Union
+from video_utility import video_file_exists
+from video_assembly_helper import collect_media_paths, get_file_signature
+from output_target_utility import resolve_target_overrides
+from image_ops import get_image_ops_backend
+from mezzanine_cache import MEZZANINE_RENDER_SETTINGS, DEFAULT_MEZZANINE_FPS
+
+DEFAULT_CLIP_CACHE_PATH = os.path.join(os.path.expanduser("~"), ".composeflow", "clips")
+
+# Clips are kept in the lossless intermediate format of the mezzanine cache
+CLIP_CODEC = "libx264"
+
+# The clip cache settings of the cut being rendered
+_clip_cache: Dict[str, Any] = {
+    "enabled": False,
+    "path": DEFAULT_CLIP_CACHE_PATH,
+}
+
+
+def configure_clip_cache(settings: Dict, clip_path: Union[str, None]) -> None:
+    """
+    Reads the clip cache options of a cut.
+
+    Settings:
+        "render_individual_clips": true to render every timeline clip of a
+                                   video scene on its own, see get_clip_key().
+
+    :param clip_path: The cut's "render_output.output_paths.clip", where the
+                      clips are kept (default ~/.composeflow/clips).
+    """
+    _clip_cache["enabled"] = bool(settings.get("render_individual_clips", False))
+    _clip_cache["path"] = clip_path or DEFAULT_CLIP_CACHE_PATH
+
+
+def get_clip_cache_settings() -> Dict[str, Any]:
+    """Returns the clip cache settings, to configure worker processes alike."""
+    return dict(_clip_cache)
+
+
+def set_clip_cache_settings(clip_cache_settings: Dict[str, Any]) -> None:
+    _clip_cache.update(clip_cache_settings)
+
+
+def is_clip_cache_enabled() -> bool:
+    return bool(_clip_cache["enabled"])
+
+
+def get_clip_key(video_clip_meta: Dict, target: Dict, source_file_watermark: bool) -> str:
+    """
+    Returns a key over everything that decides a finished timeline clip's
+    frames and sound: the trim, volume and overlays of the clip as this target
+    sees them, the target's framing and frame rate, the watermark and the
+    media files.
+
+    The key does not depend on the scene, so a clip is reused when a sibling
+    clip of its scene changes, or when it appears in several scenes or cuts.
+    The source file watermark shows the clip's sequence, so with the watermark
+    the sequence is part of the key.
+    """
+    ignored_keys = ("overlay_images",) if source_file_watermark else ("sequence", "overlay_images")
+    clip_description = {key: value for key, value in video_clip_meta.items() if key not in ignored_keys}
+    clip_description["overlay_images"] = [resolve_target_overrides(overlay, target) for overlay in video_clip_meta.get("overlay_images", [])]
+
+    content_description = {
+        "clip": clip_description,
+        "aspect_ratio": target["aspect_ratio"],
+        "resolution": target["resolution"],
+        # Keyframed overlays are computed at the target's frame rate
+        "fps": target["render_settings"].get("fps"),
+        "source_file_watermark": source_file_watermark,
+        "image_ops_backend": get_image_ops_backend(),
+        "files": sorted((path, get_file_signature(path)) for path in collect_media_paths(video_clip_meta)),
+        "clip_render_settings": MEZZANINE_RENDER_SETTINGS[CLIP_CODEC],
+    }
+
+    return hashlib.sha256(json.dumps(content_description, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+
+
+def get_clip_file_pathname(video_clip_meta: Dict, clip_key: str) -> str:
+    """Returns where a finished clip is kept, named after its source so the clip folder stays readable."""
+    source_name = os.path.splitext(os.path.basename(video_clip_meta["path"]))[0]
+    safe_source_name = re.sub(r'[^a-zA-Z0-9_-]', '_', source_name)[:50]
+
+    return os.path.join(_clip_cache["path"], f"{safe_source_name}_{clip_key[:16]}.mkv")
+
+
+def get_clip_render_settings(clip) -> Dict[str, Any]:
+    """Returns the render settings writing a finished clip losslessly, at its own frame rate."""
+    render_settings = dict(MEZZANINE_RENDER_SETTINGS[CLIP_CODEC])
+    render_settings["fps"] = getattr(clip, "fps", None) or DEFAULT_MEZZANINE_FPS
+    render_settings["audio"] = {"codec": "pcm_s16le"}
+
+    return render_settings
+
+
+def clip_exists(clip_file_pathname: str) -> bool:
+    if not video_file_exists(clip_file_pathname):
+        return False
+
+    # The access time keeps recently used clips when the folder is trimmed by age
+    os.utime(clip_file_pathname)
+
+    return True
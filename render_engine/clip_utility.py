@@ -1,16 +1,41 @@
 from moviepy import *
 from image_helper import append_image
-from video_utility import crop_video_to_aspect_ratio
+from video_utility import crop_video_to_aspect_ratio, get_cropped_size, get_display_size, probe_media_source, get_decode_resolution, resize_video_to_resolution, get_render_fps
 from text_helper import append_watermark
+from output_target_utility import resolve_target_overrides
+from staging_cache import resolve_source_path
+from render_metrics import count_decoded_frames
 
 def load_video_clip(video_clip_meta, aspect_ratio, render_settings, video_clips_to_close, source_file_watermark = False):
-    return_video_clip = None
-    
+    video_clip, watermark, source_size = open_video_source(video_clip_meta, video_clips_to_close)
+
+    return finish_video_clip(video_clip, video_clip_meta, aspect_ratio, watermark, video_clips_to_close, source_file_watermark, source_size = source_size)
+
+def open_video_source(video_clip_meta, video_clips_to_close, output_targets = None):
+    """
+    Opens and trims the source of a timeline clip without any pixel changes.
+
+    The returned clip can be shared by several output targets, which then only
+    differ in the work done by finish_video_clip(). When every target has an
+    output resolution, ffmpeg downscales the frames while decoding so that all
+    later stages work on the smaller frames.
+
+    :return: The trimmed clip, the watermark text describing it and the
+             (width, height) of the source file.
+    """
     video_path = video_clip_meta["path"]
 
     watermark = video_path
 
-    video_clip = VideoFileClip(video_path)
+    # Rotated footage is decoded upright, so overlays and the decode resolution follow its displayed size
+    source_size = get_display_size(probe_media_source(video_path))
+    decode_resolution = None
+
+    if output_targets:
+        decode_resolution = get_decode_resolution(source_size, output_targets)
+
+    video_clip = VideoFileClip(resolve_source_path(video_path), target_resolution=decode_resolution)
+    count_decoded_frames(video_clip.reader)
     video_clips_to_close.append(video_clip)
 
     if "volume" in video_clip_meta:
@@ -25,23 +50,66 @@ def load_video_clip(video_clip_meta, aspect_ratio, render_settings, video_clips_
     if video_clip.fps is None:
         raise ValueError("Error: FPS could not be determined. Check your video file.")
 
-    return_video_clip, watermark = process_video_time_codes(video_clip_meta, video_clips_to_close, watermark, video_clip)
-    
+    video_clip, watermark = process_video_time_codes(video_clip_meta, video_clips_to_close, watermark, video_clip)
+
+    return video_clip, watermark, source_size
+
+def finish_video_clip(video_clip, video_clip_meta, aspect_ratio, watermark, video_clips_to_close, source_file_watermark = False, target = None, source_size = None):
+    """
+    Crops a trimmed clip to the aspect ratio, scales it to the target's output
+    resolution and applies its overlays and watermark.
+
+    Overlay sizes and absolute positions are authored against the source
+    resolution, so they are rescaled by the same factor as the frames.
+
+    :param target: The output target being rendered, used to resolve the output
+                   resolution and per-target overlay positions.
+    :param source_size: The (width, height) of the source file.
+    """
+    return_video_clip = video_clip
+    overlay_scale = 1.0
+
     if return_video_clip != None:
         video_clips_to_close.append(return_video_clip)
         cropped_video_clip = crop_video_to_aspect_ratio(return_video_clip, aspect_ratio) 
-        video_clips_to_close.append(video_clips_to_close)
+        video_clips_to_close.append(cropped_video_clip)
         return_video_clip = cropped_video_clip
+
+        resolution = target.get("resolution") if target else None
+
+        if resolution is not None:
+            return_video_clip = resize_video_to_resolution(return_video_clip, resolution)
+            video_clips_to_close.append(return_video_clip)
+
+        if source_size is not None:
+            overlay_scale = return_video_clip.w / get_cropped_size(source_size, aspect_ratio)[0]
     
     if "overlay_images" in video_clip_meta:
         for image in video_clip_meta["overlay_images"]:
-            return_video_clip = append_image(image, return_video_clip, video_clips_to_close)
+            fps = get_render_fps(target["render_settings"], return_video_clip) if target else None
+            return_video_clip = append_image(resolve_target_overrides(image, target), return_video_clip, video_clips_to_close, overlay_scale, fps)
 
     if source_file_watermark:
         return_video_clip = append_watermark(watermark, return_video_clip, video_clips_to_close)
 
     return return_video_clip
 
+def get_clip_trim_seconds(video_clip_meta):
+    """
+    Returns the (start, end) of a timeline clip's trim in seconds, as applied by
+    process_video_time_codes(). end is None when the clip plays to its end.
+    """
+    start = 0.0
+    end = None
+
+    if video_clip_meta.get("trim_start_seconds") is not None:
+        start = float((video_clip_meta.get("trim_start_minutes") or 0) * 60 + float(video_clip_meta["trim_start_seconds"]))
+
+    if video_clip_meta.get("trim_end_seconds") is not None:
+        end = float((video_clip_meta.get("trim_end_minutes") or 0) * 60 + float(video_clip_meta["trim_end_seconds"]))
+
+    return start, end
+
 def process_video_time_codes(video_clip_meta, video_clips_to_close, watermark, video_clip):
     if (video_clip_meta.get("trim_start_seconds") is not None and video_clip_meta.get("trim_end_seconds") is not None):
         trim_start_minutes = video_clip_meta.get("trim_start_minutes")
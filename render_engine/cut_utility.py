@@ -1,138 +1,32 @@
 import os
 import re
+import time
 
-from video_utility import write_video, resize_clips_to_max_resolution, video_file_exists
-from segment_utility import generate_video_segment
+from video_utility import write_video, resize_clips_to_max_resolution
+from segment_utility import generate_video_segment, iter_scene_renders
 from moviepy import concatenate_videoclips
-from image_helper import append_image
+from image_helper import append_image, configure_raster_cache
 from video_assembly_helper import skip_segment_render
-
-def generate_html_from_video_assembly(data: dict, output_html_path: str) -> None:
-    """
-    Generates an HTML page from the provided video assembly JSON structure.
-
-    :param data: Dictionary containing the video assembly data.
-    :param output_html_path: Path to the output HTML file.
-    """
-    
-    cut = data.get("cut", {})
-    title = cut.get("title", "Untitled")
-    subtitle = cut.get("subtitle", "")
-
-    html_content = f"""<!DOCTYPE html>
-    <html lang="en">
-    <head>
-        <meta charset="UTF-8">
-        <meta name="viewport" content="width=device-width, initial-scale=1.0">
-        <title>{title}</title>
-        <style>
-            body {{ font-family: Arial, sans-serif; line-height: 1.6; }}
-            h1 {{ text-align: center; }}
-            h2 {{ text-align: center; color: gray; }}
-            h3 {{ margin-top: 20px; }}
-            h4 {{ margin-top: 10px; font-style: italic; }}
-            table {{ width: 100%; border-collapse: collapse; margin-bottom: 20px; }}
-            th, td {{ border: 1px solid #ddd; padding: 8px; text-align: left; }}
-            th {{ background-color: #f4f4f4; }}
-            .clip-path {{ font-size: 8pt; color: gray; }}
-            .clip-name {{ font-weight: bold; }}
-        </style>
-    </head>
-    <body>
-        <h1>{title}</h1>
-        <h2>{subtitle}</h2>
-    """
-
-    # Process segments
-    for segment in cut.get("segments", []):
-        segment_title = segment.get("title", "Unnamed Segment")
-        html_content += f"<h3>{segment_title}</h3>\n"
-
-        for scene in segment.get("scenes", []):
-            scene_title = scene.get("title")
-            if scene_title:
-                html_content += f"<h4>{scene_title}</h4>\n"
-
-            html_content += """
-            <table>
-                <tr>
-                    <th>Sequence</th>
-                    <th>Clip File Pathname</th>
-                    <th>Trim Start (min:sec)</th>
-                    <th>Trim End (min:sec)</th>
-                </tr>
-            """
-
-            timeline_clip_type = scene.get("timeline_clip_type", "video")
-
-            if timeline_clip_type == "video":
-                for clip in scene.get("timeline_clips", []):
-                    sequence = clip.get("sequence", "N/A")
-                    clip_path = clip.get("clip_file_pathname", "Unknown Path")
-
-                    clip_start = ""
-                    clip_end = ""
-                    # Extract optional values safely
-                    if "trim_start_seconds" in clip:
-                        trim_start_minutes = clip.get("trim_start_minutes", 0)
-                        trim_start_seconds = float(clip.get("trim_start_seconds", 0))
-                        clip_start = f"{trim_start_minutes}:{trim_start_seconds:05.2f}"
-                    else:
-                        clip_start = "Start of clip"
-
-                    if "trim_end_seconds" in clip:
-                        trim_end_minutes = clip.get("trim_end_minutes", 0)
-                        trim_end_seconds = float(clip.get("trim_end_seconds", 0))
-                        clip_end = f"{trim_end_minutes}:{trim_end_seconds:05.2f}"
-                    else:
-                        clip_end = "End of clip"
-
-                    file_path, file_name = os.path.split(clip_path)
-
-                    html_content += f"""
-                    <tr>
-                        <td>{sequence}</td>
-                        <td>
-                            <div class="clip-path">{file_path}</div>
-                            <div class="clip-name">{file_name}</div>
-                        </td>
-                        <td>{clip_start}</td>
-                        <td>{clip_end}</td>
-                    </tr>
-                    """
-            elif timeline_clip_type == "image":
-                for image in scene.get("timeline_clips", []):
-                    sequence = image.get("sequence", "N/A")
-                    clip_path = image.get("clip_file_pathname", "Unknown Path")
-
-                    clip_start = "Start of clip"
-                    clip_end = "End of clip"
-
-                    file_path, file_name = os.path.split(clip_path)
-
-                    html_content += f"""
-                    <tr>
-                        <td>{sequence}</td>
-                        <td>
-                            <div class="clip-path">{file_path}</div>
-                            <div class="clip-name">{file_name}</div>
-                        </td>
-                        <td>N/A</td>
-                        <td>N/A</td>
-                    </tr>
-                    """
-            html_content += "</table>\n"
-
-    html_content += """
-    </body>
-    </html>
-    """
-
-    # Write HTML to file
-    with open(output_html_path, 'w', encoding='utf-8') as html_file:
-        html_file.write(html_content)
-    
-    print(f"HTML file successfully created: {output_html_path}")
+from output_target_utility import get_output_targets, get_cut_render_settings
+from abr_ladder_utility import hls_output_is_complete
+from image_ops import configure_image_ops
+from chunk_encode_utility import configure_chunked_encoding
+from frame_pipeline import configure_frame_pipeline
+from smart_cut_utility import configure_smart_cut
+from mezzanine_cache import configure_mezzanine_cache
+from resource_governor import configure_resource_governor
+from audio_cache import configure_audio_cache
+from clip_cache import configure_clip_cache
+from staging_cache import configure_staging_cache, open_source_staging, close_source_staging
+from prefetch_utility import configure_prefetch, open_scene_prefetch, close_scene_prefetch
+from render_metrics import configure_render_metrics, open_metrics_export, export_metrics, observe_metric
+from render_preview import is_render_preview_enabled, get_preview_pathname, open_render_previews, close_render_previews
+from render_journal import open_render_journal, output_is_complete, record_output_complete
+from render_report import open_render_report, close_render_report, report_cut_output, get_output_facts
+from render_telemetry import (
+    RenderTelemetry, get_render_telemetry_pathname, open_render_telemetry, close_render_telemetry, get_render_telemetry,
+    start_render_progress, record_cut_render, get_scene_features, get_scene_telemetry_key, get_cut_features, get_cut_telemetry_key
+)
 
 def build_video_cut_output_file_pathname(
     cut, aspect_ratio_text, render_output, quick_and_dirty
@@ -168,7 +62,77 @@ def build_video_cut_output_file_pathname(
     return output_path
     
 
-def generate_video_cut(video_assembly, cut, video_assembly_last_modified_timestamp):
+def build_render_journal_file_pathname(cut, render_output) -> str:
+    """
+    Returns the pathname of the cut's render journal, kept next to the cut output.
+    """
+    safe_cut_title = re.sub(r'[^a-zA-Z0-9_-]', '_', cut["title"])[:100]
+
+    return os.path.join(render_output["output_paths"]["cut"], f"{safe_cut_title}.render_journal.jsonl")
+
+
+def plan_pending_scenes(video_assembly, pending_targets):
+    """
+    Returns the scenes the cut still has to render, in render order.
+
+    :return: A (key, scene, targets) per scene, where key is the output
+             pathname of the scene's first pending target and targets are the
+             targets it is rendered for.
+    """
+    pending_targets_by_scene = {}
+
+    for segment, scene, target, output_path in iter_scene_renders(video_assembly, pending_targets):
+        if not output_is_complete(output_path):
+            pending_targets_by_scene.setdefault((segment["sequence"], scene["sequence"]), (output_path, scene, []))[2].append(target)
+
+    return list(pending_targets_by_scene.values())
+
+
+def open_preview_playlists(video_assembly, pending_targets):
+    """Starts the preview of every pending cut target, see render_preview.RenderPreview."""
+    previews = {get_preview_pathname(target["cut_output_file_pathname"]): [] for target in pending_targets}
+    longest_scene_seconds = 0.0
+
+    for _, scene, target, output_path in iter_scene_renders(video_assembly, pending_targets):
+        previews[get_preview_pathname(target["cut_output_file_pathname"])].append(output_path)
+        longest_scene_seconds = max(longest_scene_seconds, get_scene_features(scene, [])["content_seconds"])
+
+    open_render_previews(previews, longest_scene_seconds)
+
+
+def predict_cut_render(video_assembly, cut, pending_targets, pending_scenes, render_telemetry: RenderTelemetry):
+    """
+    Predicts the render time of every scene the cut still has to render, and
+    of the pending cut encodes.
+
+    :param pending_scenes: See plan_pending_scenes().
+    :return: Predicted seconds keyed by the output pathname of each scene's
+             first pending target, and by each pending cut output pathname.
+    """
+    predicted_seconds = {}
+    content_seconds_by_scene = {}
+    segment_sequences = set()
+
+    for segment, scene, _, _ in iter_scene_renders(video_assembly, pending_targets):
+        scene_sequence = (segment["sequence"], scene["sequence"])
+        segment_sequences.add(segment["sequence"])
+
+        if scene_sequence not in content_seconds_by_scene:
+            content_seconds_by_scene[scene_sequence] = get_scene_features(scene, [])["content_seconds"]
+
+    for output_path, scene, scene_targets in pending_scenes:
+        predicted_seconds[output_path] = render_telemetry.predict_seconds(
+            "scene", get_scene_telemetry_key(scene, scene_targets), get_scene_features(scene, scene_targets)
+        )
+
+    for target in pending_targets:
+        cut_features = get_cut_features(sum(content_seconds_by_scene.values()), len(segment_sequences), target)
+        predicted_seconds[target["cut_output_file_pathname"]] = render_telemetry.predict_seconds("cut", get_cut_telemetry_key(cut, target), cut_features)
+
+    return predicted_seconds
+
+
+def generate_video_cut(video_assembly, cut, video_assembly_last_modified_timestamp, resume = False):
     # Read settings with default values safely
     composeflow_org = video_assembly.get("composeflow.org", {})
     settings = composeflow_org.get("settings", {})
@@ -176,62 +140,133 @@ def generate_video_cut(video_assembly, cut, video_assembly_last_modified_timesta
     quick_and_dirty = settings.get("quick_and_dirty", False)
     source_file_watermark = settings.get("source_file_watermark", False)
 
+    configure_image_ops(settings)
+    configure_chunked_encoding(settings)
+    configure_frame_pipeline(settings)
+    configure_smart_cut(settings)
+    configure_mezzanine_cache(settings)
+    configure_resource_governor(settings)
+    configure_audio_cache(settings)
+    configure_raster_cache(settings)
+    configure_prefetch(settings)
+    configure_staging_cache(settings)
+    configure_render_metrics(settings)
+
+    # Metrics are exported for as long as the process runs, see render_metrics.MetricsExporter
+    open_metrics_export()
+
     render_output = cut["render_output"]
-    aspect_ratio_text = render_output["aspect_ratio"]
+    configure_clip_cache(settings, render_output["output_paths"].get("clip"))
 
-    render_settings = {}
-    
-    if quick_and_dirty:
-        render_settings = render_output["quick_render"]
-    else:
-        render_settings = render_output["high_quality_render"]
+    # Completed scenes and cuts are journaled so an interrupted render can be resumed
+    open_render_journal(build_render_journal_file_pathname(cut, render_output), resume)
+
+    # Every output target shares one decode of the sources
+    output_targets = get_output_targets(render_output, quick_and_dirty)
+
+    pending_targets = []
+
+    for target in output_targets:
+        video_output_file_pathname = build_video_cut_output_file_pathname(cut, target["label"], render_output, target["quick_and_dirty"])
+        target["cut_output_file_pathname"] = video_output_file_pathname
+
+        if output_is_complete(video_output_file_pathname, video_assembly_last_modified_timestamp) == False:
+            pending_targets.append(target)
+        elif target["abr_ladder"] and not hls_output_is_complete(video_output_file_pathname):
+            pending_targets.append(target)
+
+    cut["rendered_video_path"] = output_targets[0]["cut_output_file_pathname"]
+
+    if len(pending_targets) > 0:
+        report_file_pathname = os.path.splitext(pending_targets[0]["cut_output_file_pathname"])[0]
 
-    video_output_file_pathname = build_video_cut_output_file_pathname(cut, aspect_ratio_text, render_output, quick_and_dirty)
+        # The report is streamed while the cut renders, see render_report.RenderReport
+        open_render_report(report_file_pathname + ".video_assembly_timeline.html", report_file_pathname + ".render_report.json", video_assembly, output_targets)
 
-    cut["rendered_video_path"] = video_output_file_pathname
+        pending_scenes = plan_pending_scenes(video_assembly, pending_targets)
 
-    if video_file_exists(video_output_file_pathname, video_assembly_last_modified_timestamp) == False:
-        html_output_file_pathname = os.path.splitext(video_output_file_pathname)[0] + ".video_assembly_timeline.html"
+        # Render times are recorded to predict later renders, and this one's ETA
+        open_render_telemetry(get_render_telemetry_pathname(settings, render_output))
 
-        generate_html_from_video_assembly(video_assembly, html_output_file_pathname)
+        if get_render_telemetry() is not None:
+            start_render_progress(predict_cut_render(video_assembly, cut, pending_targets, pending_scenes, get_render_telemetry()))
 
-        # Sort segments by sequence value before looping
-        sorted_segments = sorted(cut["segments"], key=lambda segment: segment["sequence"])
+        # Sources on slow volumes are copied to local disk, in the order the scenes read them
+        open_source_staging([scene for _, scene, _ in pending_scenes])
 
-        segments_for_aspect_ratio = []
+        # The next scenes' sources are read while the current one encodes
+        open_scene_prefetch([(key, scene) for key, scene, _ in pending_scenes])
 
-        video_clips_to_close = []
+        # Completed scenes can be reviewed while later ones render
+        if is_render_preview_enabled(settings):
+            open_preview_playlists(video_assembly, pending_targets)
 
-        for segment in sorted_segments:
-            if skip_segment_render(video_assembly, segment):
-                continue
+        report_status = "failed"
 
-            print(f"  Segment Title: {segment['title']}")
-            print(f"  Min Length: {segment['min_len_seconds']} seconds")
-            print(f"  Max Length: {segment['max_len_seconds']} seconds") 
+        try:
+            render_pending_cut_targets(video_assembly, cut, output_targets, pending_targets, video_assembly_last_modified_timestamp, render_output, source_file_watermark)
+            report_status = "completed"
+        except KeyboardInterrupt:
+            report_status = "cancelled"
+            raise
+        finally:
+            close_render_report(report_status)
+            close_render_telemetry()
+            close_scene_prefetch()
+            close_source_staging()
+            close_render_previews(report_status)
+            export_metrics()
 
-            segment_video = generate_video_segment(video_assembly, cut, segment, quick_and_dirty, video_assembly_last_modified_timestamp, aspect_ratio_text, render_output, source_file_watermark)
 
-            if segment_video != None:
-                segments_for_aspect_ratio.append(segment_video)
-                
+def render_pending_cut_targets(video_assembly, cut, output_targets, pending_targets, video_assembly_last_modified_timestamp, render_output, source_file_watermark = False):
+    """
+    Renders the segments of the cut and writes the cut of every pending output target.
+    """
+    # Sort segments by sequence value before looping
+    sorted_segments = sorted(cut["segments"], key=lambda segment: segment["sequence"])
+
+    segments_by_target = {target["name"]: [] for target in pending_targets}
+
+    video_clips_to_close = []
+
+    for segment in sorted_segments:
+        if skip_segment_render(video_assembly, segment):
+            continue
+
+        print(f"  Segment Title: {segment['title']}")
+        print(f"  Min Length: {segment['min_len_seconds']} seconds")
+        print(f"  Max Length: {segment['max_len_seconds']} seconds") 
+
+        segment_videos = generate_video_segment(video_assembly, cut, segment, pending_targets, video_assembly_last_modified_timestamp, render_output, source_file_watermark)
+
+        for target_name, segment_video in segment_videos.items():
+            segments_by_target[target_name].append(segment_video)
+
+    for target in output_targets:
+        if target not in pending_targets:
+            report_cut_output(target, get_output_facts(target["cut_output_file_pathname"], True), 0.0)
+            continue
+
+        segments_for_aspect_ratio = segments_by_target[target["name"]]
+
         if len(segments_for_aspect_ratio) > 0:
+            start_time = time.time()
+
             if len(segments_for_aspect_ratio) == 1:
                 cut_for_aspect_ratio = segments_for_aspect_ratio[0]
             else:
-                segments_for_aspect_ratio = resize_clips_to_max_resolution(segments_for_aspect_ratio)
+                segments_for_aspect_ratio = resize_clips_to_max_resolution(segments_for_aspect_ratio, target["resolution"])
                 cut_for_aspect_ratio = concatenate_videoclips(segments_for_aspect_ratio)
 
-            if quick_and_dirty:
-                render_settings = render_output["quick_render"]
-            else:
-                render_settings = render_output["high_quality_render"]
-
             # Save video
-            write_video(cut_for_aspect_ratio, video_output_file_pathname, render_settings)     
-
-        for video_clip_item in video_clips_to_close:
-            try:
-                video_clip_item.close()
-            except:
-                pass
+            write_video(cut_for_aspect_ratio, target["cut_output_file_pathname"], get_cut_render_settings(target), target["abr_ladder"])
+            record_output_complete(target["cut_output_file_pathname"], "cut")
+            observe_metric("stage_seconds", time.time() - start_time, stage="encode_cut")
+            report_cut_output(target, get_output_facts(target["cut_output_file_pathname"], False), time.time() - start_time)
+            record_cut_render(cut, target, get_cut_features(cut_for_aspect_ratio.duration, len(segments_for_aspect_ratio), target), time.time() - start_time)
+
+    for video_clip_item in video_clips_to_close:
+        try:
+            video_clip_item.close()
+        except:
+            pass
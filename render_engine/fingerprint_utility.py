@@ -0,0 +1,44 @@
+import os
+import hashlib
+
+CHECKSUM_CHUNK_SIZE = 4 * 1024 * 1024
+
+
+def file_checksum(file_path: str) -> str:
+    """
+    Returns the SHA-256 hex digest of a file's contents.
+
+    :param file_path: The path to the file.
+    :return: The hex digest.
+    """
+    checksum = hashlib.sha256()
+
+    with open(file_path, "rb") as file:
+        for chunk in iter(lambda: file.read(CHECKSUM_CHUNK_SIZE), b""):
+            checksum.update(chunk)
+
+    return checksum.hexdigest()
+
+
+FINGERPRINT_SAMPLE_SIZE = 1024 * 1024
+
+
+def source_fingerprint(file_path: str) -> str:
+    """
+    Returns a fast fingerprint of a media file: the SHA-256 of its size and of
+    samples taken at its start, middle and end. Large sources are identified
+    without reading them in full, and the fingerprint stays the same when the
+    file is moved or renamed.
+
+    :param file_path: The path to the file.
+    :return: The hex digest.
+    """
+    file_size = os.path.getsize(file_path)
+    checksum = hashlib.sha256(str(file_size).encode("ascii"))
+
+    with open(file_path, "rb") as file:
+        for offset in (0, file_size // 2, file_size - FINGERPRINT_SAMPLE_SIZE):
+            file.seek(max(offset, 0))
+            checksum.update(file.read(FINGERPRINT_SAMPLE_SIZE))
+
+    return checksum.hexdigest()
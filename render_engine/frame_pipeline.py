@@ -0,0 +1,637 @@
+import time
+import threading
+import multiprocessing
+
+import numpy as np
+
+from functools import partial
+from typing import Any, Callable, Dict, List, Tuple, Union
+from multiprocessing import shared_memory
+from concurrent.futures import ProcessPoolExecutor
+from moviepy import VideoFileClip
+from moviepy.video.io.ffmpeg_reader import FFMPEG_VideoReader
+from frame_sink import get_input_pixel_format, get_frame_buffer_shape, convert_frame
+from video_utility import open_branch_frame_sinks, get_render_fps
+from resource_governor import allocate_worker_count, lease
+from render_metrics import merge_metrics, count_decoded_frames
+from worker_settings import get_worker_settings, apply_worker_settings
+
+# Shorter scenes are not worth starting the workers for, in seconds
+DEFAULT_MIN_SCENE_SECONDS = 10
+DEFAULT_MAX_MEMORY_MB = 1024
+
+# Ring slots per compositor worker: composited frames, and source frames per
+# source frame shown in an output frame
+OUTPUT_FRAMES_PER_WORKER = 2
+SOURCE_FRAMES_PER_WORKER = 4
+
+# How long a wait on a ring blocks before checking for failures, in seconds
+WAIT_SECONDS = 0.5
+
+# The hold of a worker that reads no more frames of a source
+RELEASED_HOLD = 2 ** 62
+
+# The frame pipeline settings of the cut being rendered
+_frame_pipeline: Dict[str, Any] = {
+    "enabled": False,
+    "workers": None,
+    "min_scene_seconds": DEFAULT_MIN_SCENE_SECONDS,
+    "max_memory_mb": DEFAULT_MAX_MEMORY_MB,
+}
+
+# The pipeline a compositor worker process renders for, see _initialize_pipeline_worker()
+_worker_pipeline = None
+
+
+def configure_frame_pipeline(settings: Dict) -> None:
+    """
+    Reads the frame pipeline options from the video assembly settings.
+
+    Settings:
+        "frame_pipeline": {
+            "enabled": false,
+            "workers": Number of compositor processes (default: as many as the resource governor allows).
+            "min_scene_seconds": Shorter scenes are composited in the render process (default 10).
+            "max_memory_mb": Shared memory of the frame rings (default 1024).
+        }
+    """
+    frame_pipeline = settings.get("frame_pipeline", {})
+
+    _frame_pipeline["enabled"] = frame_pipeline.get("enabled", False)
+    _frame_pipeline["workers"] = frame_pipeline.get("workers")
+    _frame_pipeline["min_scene_seconds"] = frame_pipeline.get("min_scene_seconds", DEFAULT_MIN_SCENE_SECONDS)
+    _frame_pipeline["max_memory_mb"] = frame_pipeline.get("max_memory_mb", DEFAULT_MAX_MEMORY_MB)
+
+
+def get_pipeline_worker_count() -> int:
+    return allocate_worker_count(requested=_frame_pipeline["workers"])
+
+
+def get_max_ring_bytes() -> int:
+    return int(_frame_pipeline["max_memory_mb"] * 1024 * 1024)
+
+
+class FrameRing:
+    """
+    Frames of one size in a ring of shared memory slots, frame n in slot
+    n % slot_count. Every slot records the frame it holds, -1 while it is
+    empty or being written.
+
+    All rings of a pipeline share one condition, which every change notifies.
+    """
+
+    def __init__(self, slot_count: int, slot_bytes: int, condition):
+        self.slot_count = slot_count
+        self.slot_bytes = slot_bytes
+        self.condition = condition
+        self.shm = shared_memory.SharedMemory(create=True, size=max(1, slot_count * slot_bytes))
+        self.slot_frames = multiprocessing.RawArray("q", [-1] * slot_count)
+
+    @property
+    def nbytes(self) -> int:
+        return self.slot_count * self.slot_bytes
+
+    def get_slot(self, frame_index: int) -> int:
+        return frame_index % self.slot_count
+
+    def slot_buffer(self, frame_index: int, offset: int = 0, nbytes: Union[int, None] = None) -> memoryview:
+        start = self.get_slot(frame_index) * self.slot_bytes + offset
+        return self.shm.buf[start:start + (self.slot_bytes - offset if nbytes is None else nbytes)]
+
+    def slot_array(self, frame_index: int, shape, offset: int = 0) -> np.ndarray:
+        return np.ndarray(shape, dtype=np.uint8, buffer=self.shm.buf, offset=self.get_slot(frame_index) * self.slot_bytes + offset)
+
+    def close(self) -> None:
+        try:
+            self.shm.close()
+        except BufferError:
+            # A view is still referenced, e.g. by the traceback of a failed render
+            pass
+
+        self.shm.unlink()
+
+
+class OutputRing(FrameRing):
+    """
+    Composited frames on their way from the compositor workers to the
+    encoders. Workers write frames out of order, the render process reads
+    them in order.
+
+    A worker only writes a frame within slot_count frames of the oldest frame
+    not encoded yet, so the ring bounds how far the workers run ahead of the
+    encoders.
+    """
+
+    def __init__(self, slot_count: int, slot_bytes: int, condition):
+        super().__init__(slot_count, slot_bytes, condition)
+        self.released_frames = multiprocessing.RawValue("q", 0)
+
+    def acquire(self, frame_index: int, aborted) -> None:
+        """Worker: waits until the frame's slot is free."""
+        with self.condition:
+            while frame_index >= self.released_frames.value + self.slot_count:
+                if aborted.value:
+                    raise RuntimeError("The frame pipeline was aborted.")
+
+                self.condition.wait(WAIT_SECONDS)
+
+    def publish(self, frame_index: int) -> None:
+        """Worker: marks the frame as written."""
+        with self.condition:
+            self.slot_frames[self.get_slot(frame_index)] = frame_index
+            self.condition.notify_all()
+
+    def wait_frame(self, frame_index: int, check_workers: Callable) -> None:
+        """Render process: waits until the frame is written, raising the error of a failed worker."""
+        with self.condition:
+            while self.slot_frames[self.get_slot(frame_index)] != frame_index:
+                check_workers()
+                self.condition.wait(WAIT_SECONDS)
+
+    def release(self, frame_index: int) -> None:
+        """Render process: frees the slots of the frame and every frame before it."""
+        with self.condition:
+            self.released_frames.value = max(self.released_frames.value, frame_index + 1)
+            self.condition.notify_all()
+
+
+class SourceRing(FrameRing):
+    """
+    The decoded frames of one video source, shared by every compositor
+    worker so the source is decoded once rather than once per worker.
+
+    The render process decodes the source in order, starting near the first
+    frame a worker asks for. Every worker holds the last frame it read, and a
+    frame is only overwritten once all workers moved past it. A worker asking
+    for a frame the ring cannot give, e.g. one already overwritten or one too
+    far ahead of the slowest worker, reads it with its own reader instead.
+    """
+
+    def __init__(self, reader, worker_count: int, frames_per_worker: int, condition):
+        width, height = reader.size
+        self.shape = (int(height), int(width), reader.depth)
+        self.fps = reader.fps
+        self.n_frames = reader.n_frames
+
+        super().__init__(frames_per_worker * worker_count, int(np.prod(self.shape)), condition)
+
+        self.start_frame = multiprocessing.RawValue("q", -1)
+        self.end_frame = multiprocessing.RawValue("q", RELEASED_HOLD)
+        self.holds = multiprocessing.RawArray("q", [-1] * worker_count)
+
+    def matches(self, reader) -> bool:
+        """True if a worker's reader opened the same frames as the reader the ring decodes."""
+        width, height = reader.size
+        return (int(height), int(width), reader.depth) == self.shape and reader.fps == self.fps and reader.n_frames == self.n_frames
+
+    def get_min_hold(self) -> int:
+        # Workers that read nothing yet will start near the first frame read
+        return min(hold if hold >= 0 else self.start_frame.value for hold in self.holds)
+
+    def read(self, frame_number: int, worker_index: int, aborted) -> Union[np.ndarray, None]:
+        """
+        Worker: returns a source frame, or None if the worker has to decode it itself.
+
+        The returned frame is a view of the ring, valid until the worker reads
+        a later frame of the source.
+        """
+        with self.condition:
+            if self.start_frame.value < 0:
+                self.start_frame.value = max(0, frame_number - self.slot_count // 2)
+                self.condition.notify_all()
+
+            hold = self.holds[worker_index]
+
+            if frame_number >= hold:
+                self.holds[worker_index] = frame_number
+                self.condition.notify_all()
+
+            slot = self.get_slot(frame_number)
+
+            while True:
+                if aborted.value:
+                    raise RuntimeError("The frame pipeline was aborted.")
+
+                if self.slot_frames[slot] == frame_number:
+                    frame = self.slot_array(frame_number, self.shape)
+                    frame.flags.writeable = False
+
+                    # A frame before the worker's hold may be overwritten once the lock is released
+                    return frame if frame_number >= hold else frame.copy()
+
+                if (
+                    frame_number < self.start_frame.value
+                    or frame_number >= self.end_frame.value
+                    or frame_number < self.slot_frames[slot]
+                    or frame_number >= self.get_min_hold() + self.slot_count
+                ):
+                    return None
+
+                self.condition.wait(WAIT_SECONDS)
+
+    def release(self, worker_index: int) -> None:
+        """Worker: reads no more frames of the source."""
+        with self.condition:
+            self.holds[worker_index] = RELEASED_HOLD
+            self.condition.notify_all()
+
+    def decode(self, scene_reader, stopped: threading.Event) -> None:
+        """
+        Render process, on a decoder thread: reads the source's frames in order into the ring.
+
+        :param scene_reader: The reader of the scene clip the ring decodes.
+        """
+        frame_number = None
+        reader = None
+
+        try:
+            with self.condition:
+                while self.start_frame.value < 0:
+                    if stopped.is_set():
+                        return
+
+                    self.condition.wait(WAIT_SECONDS)
+
+                frame_number = self.start_frame.value
+
+            reader = open_decoder_reader(scene_reader)
+
+            while frame_number < self.n_frames:
+                slot = self.get_slot(frame_number)
+
+                with self.condition:
+                    while frame_number >= self.get_min_hold() + self.slot_count:
+                        if stopped.is_set():
+                            return
+
+                        self.condition.wait(WAIT_SECONDS)
+
+                    self.slot_frames[slot] = -1
+
+                # MoviePy's reader, so the frames match what the workers would decode themselves
+                np.copyto(self.slot_array(frame_number, self.shape), reader.get_frame(frame_number / reader.fps))
+
+                with self.condition:
+                    self.slot_frames[slot] = frame_number
+                    self.condition.notify_all()
+
+                frame_number += 1
+        except Exception as e:
+            # The workers decode the frames themselves
+            print(f"Frame pipeline: decoding '{scene_reader.filename}' failed: {e!r}")
+        finally:
+            with self.condition:
+                self.end_frame.value = frame_number if frame_number is not None else 0
+                self.condition.notify_all()
+
+            if reader is not None:
+                reader.close()
+
+
+def open_decoder_reader(scene_reader) -> FFMPEG_VideoReader:
+    """
+    Opens a reader decoding the same frames as a scene clip's reader.
+
+    The scene clip's own ffmpeg process was started before the workers were
+    forked, so they share its pipe and closing it, e.g. to seek, would wait on
+    a process the workers keep alive.
+    """
+    target_resolution = None
+
+    if list(scene_reader.size) != list(scene_reader.infos.get("video_size", scene_reader.size)):
+        target_resolution = tuple(scene_reader.size)
+
+    return count_decoded_frames(FFMPEG_VideoReader(
+        scene_reader.filename,
+        pixel_format=scene_reader.pixel_format,
+        target_resolution=target_resolution,
+        resize_algo=scene_reader.resize_algo,
+    ))
+
+
+class SharedFrameReader:
+    """
+    Stands in for the FFMPEG_VideoReader of a VideoFileClip in a compositor
+    worker, reading frames from the source's ring and falling back to the
+    clip's own reader.
+    """
+
+    def __init__(self, reader, source_ring: SourceRing, worker_index: int, aborted):
+        self.reader = reader
+        self.source_ring = source_ring
+        self.worker_index = worker_index
+        self.aborted = aborted
+
+    def get_frame(self, t):
+        frame = self.source_ring.read(self.reader.get_frame_number(t), self.worker_index, self.aborted)
+
+        if frame is None:
+            return self.reader.get_frame(t)
+
+        return frame
+
+    def close(self, delete_lastread=True):
+        self.reader.close(delete_lastread)
+
+    def __getattr__(self, name):
+        return getattr(self.reader, name)
+
+
+def collect_video_readers(clips_to_close: List) -> List:
+    """Returns the readers of the video files a scene opened, in the order they were opened."""
+    readers = []
+
+    for clip in clips_to_close:
+        reader = getattr(clip, "reader", None) if isinstance(clip, VideoFileClip) else None
+
+        if reader is not None and not any(reader is other_reader for other_reader in readers):
+            readers.append(reader)
+
+    return readers
+
+
+class FramePipeline:
+    """
+    Composites a scene on several processes and encodes it in the render
+    process, passing frames through shared memory instead of pickling them:
+
+        decoders --(source rings)--> compositor workers --(output ring)--> encoders
+
+    Each compositor worker rebuilds the scene from its JSON description, like
+    a chunk worker, and composites every worker_count-th frame into the
+    output ring, already converted to the encoders' input pixel format. The
+    render process hands the ring slots to the encoders in frame order
+    without copying them, see frame_sink.FrameSink.write_frame_buffer().
+
+    The video sources are decoded once, by the readers of the render
+    process's own scene clips, into a ring per source that every worker reads.
+
+    Every ring has a fixed number of slots and writers wait for free slots, so
+    a slow encoder holds back the workers and a slow worker holds back the
+    decoders, and memory stays bounded.
+    """
+
+    def __init__(self, branches: List[Dict[str, Any]], readers: List, worker_count: int, fps, frame_count: int):
+        self.worker_count = worker_count
+        self.fps = fps
+        self.frame_count = frame_count
+        self.condition = multiprocessing.Condition()
+        self.aborted = multiprocessing.RawValue("b", 0)
+        self.layouts = get_branch_layouts(branches)
+
+        self.output_ring = OutputRing(OUTPUT_FRAMES_PER_WORKER * worker_count, sum(layout["nbytes"] for layout in self.layouts), self.condition)
+        self.source_rings = []
+
+        ring_bytes = self.output_ring.nbytes
+
+        try:
+            for reader in readers:
+                frames_per_worker = SOURCE_FRAMES_PER_WORKER * max(1, int(np.ceil(reader.fps / fps)))
+                source_bytes = frames_per_worker * worker_count * int(np.prod(reader.size)) * reader.depth
+
+                # Sources beyond the memory budget are decoded by every worker
+                if ring_bytes + source_bytes > get_max_ring_bytes() or not reader.n_frames:
+                    self.source_rings.append(None)
+                    continue
+
+                self.source_rings.append(SourceRing(reader, worker_count, frames_per_worker, self.condition))
+                ring_bytes += source_bytes
+        except BaseException:
+            self.close()
+            raise
+
+        self.nbytes = ring_bytes
+        self.stopped = threading.Event()
+        self.decoder_threads = []
+
+    def __getstate__(self):
+        # The decoders stay in the render process
+        state = dict(self.__dict__)
+        state["stopped"] = None
+        state["decoder_threads"] = []
+        return state
+
+    def start_decoders(self, readers: List) -> None:
+        """Render process: starts decoding the sources into their rings, each on its own thread."""
+        for reader, source_ring in zip(readers, self.source_rings):
+            if source_ring is not None:
+                decoder_thread = threading.Thread(target=source_ring.decode, args=(reader, self.stopped), name="frame_pipeline_decoder", daemon=True)
+                decoder_thread.start()
+                self.decoder_threads.append(decoder_thread)
+
+    def stop_decoders(self) -> None:
+        self.stopped.set()
+
+        for decoder_thread in self.decoder_threads:
+            decoder_thread.join()
+
+        self.decoder_threads = []
+
+    def abort(self) -> None:
+        """Makes every worker waiting on a ring raise, so the pool can shut down."""
+        with self.condition:
+            self.aborted.value = 1
+            self.condition.notify_all()
+
+    def attach_source_rings(self, clips_to_close: List, worker_index: int) -> None:
+        """Worker: points the scene's video clips at the source rings, see SharedFrameReader."""
+        shared_readers = {}
+
+        for reader, source_ring in zip(collect_video_readers(clips_to_close), self.source_rings):
+            if source_ring is not None and source_ring.matches(reader):
+                shared_readers[id(reader)] = SharedFrameReader(reader, source_ring, worker_index, self.aborted)
+
+        # Trimmed copies of a clip share its reader, and read it through the original clip
+        for clip in clips_to_close:
+            if isinstance(clip, VideoFileClip) and id(clip.reader) in shared_readers:
+                clip.reader = shared_readers[id(clip.reader)]
+
+    def release_sources(self, worker_index: int) -> None:
+        for source_ring in self.source_rings:
+            if source_ring is not None:
+                source_ring.release(worker_index)
+
+    def render_frames(self, worker_index: int, branches: List[Dict[str, Any]]) -> None:
+        """Worker: composites this worker's share of the frames into the output ring."""
+        if [layout["size"] for layout in self.layouts] != [tuple(branch["clip"].size) for branch in branches]:
+            raise ValueError("The scene rebuilt by the frame pipeline worker does not match the scene being encoded.")
+
+        for frame_index in range(worker_index, self.frame_count, self.worker_count):
+            self.output_ring.acquire(frame_index, self.aborted)
+            t = frame_index / self.fps
+
+            for branch, layout in zip(branches, self.layouts):
+                convert_frame(branch["clip"].get_frame(t), layout["pixel_format"], self.output_ring.slot_array(frame_index, layout["shape"], layout["offset"]))
+
+            self.output_ring.publish(frame_index)
+
+    def encode(self, frame_sinks: List, check_workers: Callable) -> None:
+        """Render process: hands the composited frames to the encoders in order."""
+        pending_sinks = {}
+        pending_lock = threading.Lock()
+
+        def frame_written(frame_index):
+            with pending_lock:
+                pending_sinks[frame_index] -= 1
+                written = pending_sinks[frame_index] == 0
+
+                if written:
+                    del pending_sinks[frame_index]
+
+            if written:
+                self.output_ring.release(frame_index)
+
+        for frame_index in range(self.frame_count):
+            self.output_ring.wait_frame(frame_index, check_workers)
+
+            with pending_lock:
+                pending_sinks[frame_index] = len(frame_sinks)
+
+            for frame_sink, layout in zip(frame_sinks, self.layouts):
+                frame_sink.write_frame_buffer(self.output_ring.slot_buffer(frame_index, layout["offset"], layout["nbytes"]), partial(frame_written, frame_index))
+
+    def close(self) -> None:
+        for ring in [self.output_ring] + getattr(self, "source_rings", []):
+            if ring is not None:
+                ring.close()
+
+
+def get_branch_layouts(branches: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Returns where each branch's frame lies in an output ring slot, in the pixel format its encoder reads."""
+    layouts = []
+    offset = 0
+
+    for branch in branches:
+        size = tuple(branch["clip"].size)
+        pixel_format = get_input_pixel_format(size, branch["render_settings"].get("pixel_format"))
+        shape = get_frame_buffer_shape(size, pixel_format)
+        nbytes = int(np.prod(shape))
+
+        layouts.append({"size": size, "pixel_format": pixel_format, "shape": shape, "offset": offset, "nbytes": nbytes})
+        offset += nbytes
+
+    return layouts
+
+
+def should_encode_in_pipeline(branches: List[Dict[str, Any]]) -> bool:
+    """
+    Returns True if the scene is long enough to be composited by the frame
+    pipeline, and its branches can share one frame ring.
+    """
+    if not _frame_pipeline["enabled"] or len(branches) == 0:
+        return False
+
+    frame_rates = {get_render_fps(branch["render_settings"], branch["clip"]) for branch in branches}
+    durations = {branch["clip"].duration for branch in branches}
+
+    if len(frame_rates) != 1 or len(durations) != 1 or None in durations:
+        return False
+
+    # The frame sinks drop masks, like the single pass encoder does
+    if any(branch["clip"].mask is not None or branch["render_settings"].get("frame_sink", True) is False for branch in branches):
+        return False
+
+    if branches[0]["clip"].duration < _frame_pipeline["min_scene_seconds"]:
+        return False
+
+    worker_count = get_pipeline_worker_count()
+
+    if worker_count < 2:
+        return False
+
+    output_ring_bytes = OUTPUT_FRAMES_PER_WORKER * worker_count * sum(layout["nbytes"] for layout in get_branch_layouts(branches))
+
+    return output_ring_bytes <= get_max_ring_bytes()
+
+
+def _initialize_pipeline_worker(frame_pipeline: FramePipeline, worker_settings: Dict) -> None:
+    global _worker_pipeline
+
+    apply_worker_settings(worker_settings)
+
+    _worker_pipeline = frame_pipeline
+
+
+def render_pipeline_frames(worker_index: int, branches: List[Dict[str, Any]], clips_to_close: List) -> None:
+    """
+    Compositor worker: renders this worker's share of a scene's frames into
+    the frame pipeline, see encode_in_pipeline().
+
+    :param branches: The branches the worker rebuilt from the scene.
+    :param clips_to_close: The clips opened to build them, their video files
+                           are read from the source rings.
+    """
+    _worker_pipeline.attach_source_rings(clips_to_close, worker_index)
+
+    try:
+        _worker_pipeline.render_frames(worker_index, branches)
+    finally:
+        _worker_pipeline.release_sources(worker_index)
+
+
+def encode_in_pipeline(branches: List[Dict[str, Any]], clips_to_close: List, pipeline_worker: Callable, worker_arguments: Tuple) -> None:
+    """
+    Composites the branches of a scene on several worker processes and
+    encodes them here, see FramePipeline.
+
+    MoviePy clips cannot be sent to other processes, so each worker rebuilds
+    the scene from its JSON description and calls render_pipeline_frames():
+
+        pipeline_worker(worker_index, *worker_arguments)
+
+    Workers return the metrics they recorded, see render_metrics.take_metrics().
+
+    :param branches: The output branches, see write_video_targets().
+    :param clips_to_close: The clips opened to build the branches, their
+                           video files are decoded for the workers.
+    """
+    fps = get_render_fps(branches[0]["render_settings"], branches[0]["clip"])
+    frame_count = int(branches[0]["clip"].duration * fps)
+    worker_count = min(get_pipeline_worker_count(), frame_count)
+
+    readers = collect_video_readers(clips_to_close)
+    frame_pipeline = FramePipeline(branches, readers, worker_count, fps, frame_count)
+    shared_source_count = len([source_ring for source_ring in frame_pipeline.source_rings if source_ring is not None])
+
+    print(
+        f"Compositing '{branches[0]['output_file_pathname']}' on {worker_count} workers, "
+        f"{shared_source_count} of {len(frame_pipeline.source_rings)} sources decoded once, "
+        f"{frame_pipeline.nbytes / (1024 * 1024):.0f} MB of frame rings."
+    )
+
+    start_time = time.time()
+
+    try:
+        with lease(worker_count, frame_pipeline.nbytes), ProcessPoolExecutor(
+            max_workers=worker_count,
+            initializer=_initialize_pipeline_worker,
+            initargs=(frame_pipeline, get_worker_settings())
+        ) as executor:
+            futures = [executor.submit(pipeline_worker, worker_index, *worker_arguments) for worker_index in range(worker_count)]
+
+            def check_workers():
+                for future in futures:
+                    if future.done() and future.exception() is not None:
+                        raise future.exception()
+
+            try:
+                # The encoders start after the workers, so the workers do not inherit their pipes
+                frame_pipeline.start_decoders(readers)
+
+                with open_branch_frame_sinks(branches) as frame_sinks:
+                    frame_pipeline.encode(frame_sinks, check_workers)
+
+                for future in futures:
+                    merge_metrics(future.result())
+            except BaseException:
+                frame_pipeline.abort()
+                raise
+            finally:
+                frame_pipeline.stop_decoders()
+    finally:
+        frame_pipeline.close()
+
+    elapsed_time = time.time() - start_time
+    minutes, seconds = divmod(elapsed_time, 60)
+
+    print(f"Processed {frame_count} frames of {len(branches)} output targets on {worker_count} workers in {int(minutes)}m {seconds:.2f}s.")
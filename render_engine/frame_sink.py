@@ -0,0 +1,313 @@
+import time
+import queue
+import threading
+import subprocess as sp
+
+import numpy as np
+
+from functools import partial
+from moviepy.config import FFMPEG_BINARY
+from moviepy.tools import cross_platform_popen_params, ffmpeg_escape_filename
+from abr_ladder_utility import build_abr_filter_graph, build_hls_output_arguments
+from render_metrics import increment_metric, set_metric
+
+try:
+    import cv2
+except ImportError:
+    cv2 = None
+
+
+def get_input_pixel_format(size, output_pixel_format=None) -> str:
+    """
+    Returns the pixel format frames of the given size are piped to the encoder in, see FrameSink.
+
+    :param output_pixel_format: The pixel format the encoder writes. Frames
+                                are only subsampled before they are piped
+                                when it is yuv420p or left to the encoder.
+    """
+    if output_pixel_format not in (None, "yuv420p"):
+        return "rgb24"
+
+    if cv2 is not None and int(size[0]) % 2 == 0 and int(size[1]) % 2 == 0:
+        return "yuv420p"
+
+    return "rgb24"
+
+
+def get_frame_buffer_shape(size, input_pixel_format: str):
+    """Returns the array shape of one frame in the input pixel format."""
+    width, height = int(size[0]), int(size[1])
+
+    if input_pixel_format == "yuv420p":
+        return (height * 3 // 2, width)
+
+    return (height, width, 3)
+
+
+def convert_frame(frame, input_pixel_format: str, buffer) -> None:
+    """Copies an RGB or RGBA frame into a buffer of the input pixel format, converting it once."""
+    if frame.shape[2] == 4:
+        frame = frame[:, :, :3]
+
+    if input_pixel_format == "yuv420p":
+        if frame.dtype != np.uint8:
+            frame = frame.astype(np.uint8)
+        cv2.cvtColor(frame, cv2.COLOR_RGB2YUV_I420, dst=buffer)
+    else:
+        np.copyto(buffer, frame, casting="unsafe")
+
+
+class FrameSink:
+    """
+    Feeds raw frames to an ffmpeg encoder from a ring of preallocated buffers.
+
+    Compared to MoviePy's FFMPEG_VideoWriter, which calls tobytes() on every
+    frame, each frame is copied (or converted) once into a reused buffer and
+    handed to the pipe as a memoryview. The pipe writes run on a writer thread,
+    so they overlap with producing the next frame; blocking pipe writes release
+    the GIL.
+
+    When OpenCV is available and the frame size is even, frames are converted
+    to yuv420p before they are piped, which halves the bytes per frame
+    compared to rgb24 and saves ffmpeg the conversion.
+    """
+
+    def __init__(
+        self,
+        output_file_pathname,
+        size,
+        fps,
+        codec="libx264",
+        preset="medium",
+        audiofile=None,
+        threads=None,
+        ffmpeg_params=None,
+        output_pixel_format=None,
+        buffer_count=4,
+        hls_output=None,
+    ):
+        """
+        :param hls_output: Also packages the frames as an HLS ABR ladder in the
+                           same encoder, see build_encoder_command().
+        """
+        self.output_file_pathname = output_file_pathname
+        self.width, self.height = int(size[0]), int(size[1])
+        self.frames_written = 0
+        self.error = None
+        self.start_time = time.time()
+
+        self.input_pixel_format = get_input_pixel_format((self.width, self.height), output_pixel_format)
+        buffer_shape = get_frame_buffer_shape((self.width, self.height), self.input_pixel_format)
+
+        self.buffers = [np.empty(buffer_shape, dtype=np.uint8) for _ in range(buffer_count)]
+        self.buffer_views = [memoryview(buffer).cast("B") for buffer in self.buffers]
+
+        # Buffers cycle from free_buffers to filled_buffers and back once written,
+        # filled_buffers holds (frame bytes, callback once written)
+        self.free_buffers = queue.Queue()
+        self.filled_buffers = queue.Queue()
+
+        for buffer_index in range(buffer_count):
+            self.free_buffers.put(buffer_index)
+
+        cmd = build_encoder_command(
+            output_file_pathname,
+            (self.width, self.height),
+            fps,
+            self.input_pixel_format,
+            codec=codec,
+            preset=preset,
+            audiofile=audiofile,
+            threads=threads,
+            ffmpeg_params=ffmpeg_params,
+            output_pixel_format=output_pixel_format,
+            hls_output=hls_output,
+        )
+
+        popen_params = cross_platform_popen_params(
+            {"stdout": sp.DEVNULL, "stderr": sp.PIPE, "stdin": sp.PIPE}
+        )
+
+        self.proc = sp.Popen(cmd, **popen_params)
+
+        self.writer_thread = threading.Thread(target=self._write_buffers, daemon=True)
+        self.writer_thread.start()
+
+    def _write_buffers(self):
+        while True:
+            filled_buffer = self.filled_buffers.get()
+
+            if filled_buffer is None:
+                break
+
+            frame_buffer, on_written = filled_buffer
+
+            try:
+                if self.error is None:
+                    self.proc.stdin.write(frame_buffer)
+            except (IOError, ValueError) as e:
+                self.error = e
+            finally:
+                on_written()
+
+    def write_frame(self, frame):
+        """Copies one RGB frame into a free buffer and queues it for the encoder."""
+        if self.error is not None:
+            self._raise_encoder_error()
+
+        buffer_index = self.free_buffers.get()
+        convert_frame(frame, self.input_pixel_format, self.buffers[buffer_index])
+
+        self.filled_buffers.put((self.buffer_views[buffer_index], partial(self.free_buffers.put, buffer_index)))
+        self.frames_written += 1
+        increment_metric("frames_encoded")
+
+    def write_frame_buffer(self, frame_buffer, on_written):
+        """
+        Queues a frame already converted to input_pixel_format, e.g. a slot of
+        a shared frame ring, without copying it.
+
+        :param on_written: Called once the frame is piped, so its buffer can be reused.
+        """
+        if self.error is not None:
+            self._raise_encoder_error()
+
+        self.filled_buffers.put((frame_buffer, on_written))
+        self.frames_written += 1
+        increment_metric("frames_encoded")
+
+    def _raise_encoder_error(self):
+        _, ffmpeg_error = self.proc.communicate()
+        ffmpeg_error = ffmpeg_error.decode(errors="replace") if ffmpeg_error else ""
+
+        raise IOError(
+            f"{self.error}\n\nFFMPEG encountered the following error while "
+            f"writing file {self.output_file_pathname}:\n\n {ffmpeg_error}"
+        )
+
+    def close(self):
+        """Flushes the queued frames and waits for the encoder to finish."""
+        if self.proc is None:
+            return
+
+        self.filled_buffers.put(None)
+        self.writer_thread.join()
+
+        if self.error is not None:
+            self._raise_encoder_error()
+
+        self.proc.stdin.close()
+        ffmpeg_error = self.proc.stderr.read()
+        self.proc.stderr.close()
+        return_code = self.proc.wait()
+        self.proc = None
+
+        if return_code != 0:
+            raise IOError(
+                f"FFMPEG exited with code {return_code} while writing file "
+                f"{self.output_file_pathname}:\n\n {ffmpeg_error.decode(errors='replace')}"
+            )
+
+        set_metric("encode_fps", self.frames_written / max(time.time() - self.start_time, 1e-6))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+        elif self.proc is not None:
+            # Do not mask the original exception with encoder errors
+            self.proc.kill()
+            self.filled_buffers.put(None)
+            self.writer_thread.join()
+            self.proc.wait()
+            self.proc = None
+
+
+def build_encoder_command(
+    output_file_pathname,
+    size,
+    fps,
+    input_pixel_format,
+    codec="libx264",
+    preset="medium",
+    audiofile=None,
+    threads=None,
+    ffmpeg_params=None,
+    output_pixel_format=None,
+    hls_output=None,
+):
+    """
+    Builds the ffmpeg command reading raw frames from stdin, matching the
+    arguments MoviePy uses for its own writer.
+
+    :param hls_output: The options of abr_ladder_utility.build_hls_output() to also write the renditions of an
+                       ABR ladder as HLS. The frames are split once inside
+                       ffmpeg and scaled per rendition, so the ladder costs
+                       the rendition encodes only.
+    """
+    cmd = [
+        FFMPEG_BINARY,
+        "-y",
+        "-loglevel",
+        "error",
+        "-f",
+        "rawvideo",
+        "-vcodec",
+        "rawvideo",
+        "-s",
+        "%dx%d" % (size[0], size[1]),
+        "-pix_fmt",
+        input_pixel_format,
+        "-r",
+        "%.02f" % fps,
+        "-an",
+        "-i",
+        "-",
+    ]
+
+    if audiofile is not None:
+        cmd.extend(["-i", audiofile])
+
+    if hls_output is not None:
+        filter_graph, cut_label, rendition_labels = build_abr_filter_graph(hls_output["renditions"])
+        cmd.extend(["-filter_complex", filter_graph, "-map", cut_label])
+
+        if audiofile is not None:
+            cmd.extend(["-map", "1:a"])
+
+    if audiofile is not None:
+        cmd.extend(["-acodec", "copy"])
+
+    cmd.extend(["-vcodec", codec, "-preset", preset])
+
+    if ffmpeg_params is not None:
+        cmd.extend(ffmpeg_params)
+
+    if threads is not None:
+        cmd.extend(["-threads", str(threads)])
+
+    if output_pixel_format is None and codec == "libx264" and size[0] % 2 == 0 and size[1] % 2 == 0:
+        output_pixel_format = "yuv420p"
+
+    if output_pixel_format is not None:
+        cmd.extend(["-pix_fmt", output_pixel_format])
+
+    cmd.append(ffmpeg_escape_filename(output_file_pathname))
+
+    if hls_output is not None:
+        cmd.extend(build_hls_output_arguments(
+            hls_output["path"],
+            hls_output["renditions"],
+            rendition_labels,
+            fps,
+            hls_output["codec"],
+            hls_output["preset"],
+            audiofile is not None,
+            hls_output["audio_codec"],
+            hls_output["segment_seconds"],
+            hls_output["audio_bitrate"],
+        ))
+
+    return cmd
@@ -1,7 +1,162 @@
-from moviepy import ImageClip, CompositeVideoClip
+import os
+import json
+import hashlib
 
+import numpy as np
 
-def create_video_from_image(image_clip_meta, aspect_ratio, quick_and_dirty, clips_to_close, source_file_watermark):
+from typing import Any, Dict, Tuple, Union
+from functools import lru_cache
+from PIL import Image
+from moviepy import ImageClip
+from imageio.v2 import imread
+from image_ops import fit_size, composite_overlay
+from overlay_animation import compile_overlay_animation
+from video_utility import atomic_output_file, ensure_directory_exists, get_cropped_size
+from video_assembly_helper import get_file_signature
+from staging_cache import resolve_source_path
+from render_metrics import record_cache_lookup
+
+# Frame rate overlay animations are compiled at when the video's is unknown
+DEFAULT_ANIMATION_FPS = 30
+
+# Decoded images kept in memory, shared by every scene and cut rendered in this process
+IMAGE_CACHE_SIZE = 64
+
+DEFAULT_RASTER_CACHE_PATH = os.path.join(os.path.expanduser("~"), ".composeflow", "rasters")
+
+# The scaled raster cache settings of the cut being rendered
+_raster_cache: Dict[str, Any] = {
+    "enabled": True,
+    "path": DEFAULT_RASTER_CACHE_PATH,
+}
+
+
+def configure_raster_cache(settings: Dict) -> None:
+    """
+    Reads the scaled raster cache options from the video assembly settings.
+
+    Settings:
+        "raster_cache": {
+            "enabled": true,
+            "path": Directory of the cache (default ~/.composeflow/rasters).
+        }
+    """
+    raster_cache = settings.get("raster_cache", {})
+
+    _raster_cache["enabled"] = raster_cache.get("enabled", True)
+    _raster_cache["path"] = raster_cache.get("path") or DEFAULT_RASTER_CACHE_PATH
+
+
+@lru_cache(maxsize=IMAGE_CACHE_SIZE)
+def load_image_array(image_file_pathname: str):
+    """
+    Decodes an image file once. Overlays such as logos are reused by most
+    scenes, so they are not read from disk again for every clip.
+
+    The returned array is shared and must not be modified.
+    """
+    image_array = imread(resolve_source_path(image_file_pathname))
+    image_array.flags.writeable = False
+
+    return image_array
+
+
+def get_image_size(image_file_pathname: str) -> Tuple[int, int]:
+    """Returns the (width, height) of an image, reading only its header."""
+    with Image.open(resolve_source_path(image_file_pathname)) as image:
+        return image.size
+
+
+def decode_scaled_image(image_file_pathname: str, size: Tuple[int, int], aspect_ratio: Union[str, None], quick_and_dirty: bool) -> np.ndarray:
+    """
+    Decodes an image straight to size, center cropped to the aspect ratio
+    first if one is given (as crop_video_to_aspect_ratio() does).
+
+    JPEG decoders can scale by 1/2, 1/4 or 1/8 while decoding (draft mode), so
+    a large photo is decoded at the smallest of those scales that still covers
+    size, and then downscaled once with a high quality filter.
+    """
+    width, height = size
+
+    with Image.open(resolve_source_path(image_file_pathname)) as image:
+        crop_width, crop_height = get_cropped_size(image.size, aspect_ratio) if aspect_ratio else image.size
+        decode_scale = max(width / crop_width, height / crop_height)
+
+        if decode_scale < 1.0:
+            image.draft(image.mode, (int(np.ceil(image.width * decode_scale)), int(np.ceil(image.height * decode_scale))))
+
+        if image.mode == "P":
+            image = image.convert("RGBA" if "transparency" in image.info else "RGB")
+
+        if aspect_ratio:
+            cropped_width, cropped_height = get_cropped_size(image.size, aspect_ratio)
+            crop_x = (image.width - cropped_width) // 2
+            crop_y = (image.height - cropped_height) // 2
+            image = image.crop((crop_x, crop_y, crop_x + cropped_width, crop_y + cropped_height))
+
+        if image.size != (width, height):
+            resample = Image.Resampling.BILINEAR if quick_and_dirty else Image.Resampling.LANCZOS
+            image = image.resize((width, height), resample=resample, reducing_gap=None if quick_and_dirty else 3.0)
+
+        return np.asarray(image)
+
+
+def get_raster_file_pathname(image_file_pathname: str, file_signature, size: Tuple[int, int], aspect_ratio: Union[str, None], quick_and_dirty: bool) -> str:
+    raster_description = [image_file_pathname, file_signature, list(size), aspect_ratio, quick_and_dirty]
+    raster_key = hashlib.sha256(json.dumps(raster_description).encode("utf-8")).hexdigest()
+
+    return os.path.join(_raster_cache["path"], raster_key[:2], f"{raster_key}.npy")
+
+
+@lru_cache(maxsize=IMAGE_CACHE_SIZE)
+def _load_scaled_image_array(image_file_pathname: str, file_signature, size: Tuple[int, int], aspect_ratio: Union[str, None], quick_and_dirty: bool):
+    raster_file_pathname = get_raster_file_pathname(image_file_pathname, file_signature, size, aspect_ratio, quick_and_dirty)
+
+    if _raster_cache["enabled"] and os.path.isfile(raster_file_pathname):
+        try:
+            image_array = np.load(raster_file_pathname)
+            image_array.flags.writeable = False
+            record_cache_lookup("raster", True)
+            return image_array
+        except (OSError, ValueError):
+            # A damaged raster is decoded again and replaced
+            pass
+
+    if _raster_cache["enabled"]:
+        record_cache_lookup("raster", False)
+
+    image_array = decode_scaled_image(image_file_pathname, size, aspect_ratio, quick_and_dirty)
+
+    if _raster_cache["enabled"]:
+        ensure_directory_exists(raster_file_pathname)
+
+        with atomic_output_file(raster_file_pathname) as partial_file_pathname:
+            with open(partial_file_pathname, "wb") as raster_file:
+                np.save(raster_file, image_array)
+
+    image_array.flags.writeable = False
+
+    return image_array
+
+
+def load_scaled_image_array(image_file_pathname: str, size, aspect_ratio: Union[str, None] = None, quick_and_dirty: bool = False):
+    """
+    Returns an image decoded at the size it is shown at, see
+    decode_scaled_image(). A 50 megapixel photo shown in a 1080p scene then
+    takes 6 MB of memory instead of 150 MB, and is not resized per frame.
+
+    Scaled rasters are cached in memory and on disk, keyed by the image's
+    path, mtime and size, and the size, framing and quality they are scaled to.
+
+    The returned array is shared and must not be modified.
+    """
+    image_file_pathname = os.path.abspath(image_file_pathname)
+    size = (int(size[0]), int(size[1]))
+
+    return _load_scaled_image_array(image_file_pathname, get_file_signature(image_file_pathname), size, aspect_ratio, quick_and_dirty)
+
+
+def create_video_from_image(image_clip_meta, aspect_ratio, quick_and_dirty, clips_to_close, source_file_watermark, resolution = None):
     """
     Convert a PNG image to a video clip of specified duration.
     
@@ -9,19 +164,38 @@ def create_video_from_image(image_clip_meta, aspect_ratio, quick_and_dirty, clip
         image_path (str): Path to the input PNG image
         output_path (str): Path for the output video file
         duration (int): Duration of the video in seconds
+        resolution (Tuple[int, int]): Output resolution. When set, the image is
+            decoded cropped to the aspect ratio at that size, see load_scaled_image_array().
     """
     duration_seconds = image_clip_meta.get("duration_seconds", 5)
     source_image_file_pathname = image_clip_meta.get("path", None)
     image_clip = None
     
     # Create a clip from the image
-    image_clip = ImageClip(source_image_file_pathname, duration=duration_seconds)
+    if resolution is None:
+        image_array = load_image_array(source_image_file_pathname)
+    else:
+        image_array = load_scaled_image_array(source_image_file_pathname, resolution, aspect_ratio, quick_and_dirty)
+
+    image_clip = ImageClip(image_array, duration=duration_seconds)
     clips_to_close.append(image_clip)
     
     return image_clip
 
 
-def set_image_position(image_meta, image):
+def scale_position_value(value, scale):
+    """Scales the numeric parts of a position, leaving presets like "center" untouched."""
+    if isinstance(value, (int, float)):
+        return int(value * scale)
+    return value
+
+def set_image_position(image_meta, image, scale = 1.0, animation = None):
+    """
+    Positions an overlay as set in its JSON.
+
+    :param animation: The compiled animation of a "keyframes" position, see
+                      overlay_animation.compile_overlay_animation().
+    """
     # Extract position data
     position_data = image_meta["position"]
     position_type = position_data.get("type")
@@ -31,50 +205,77 @@ def set_image_position(image_meta, image):
     if position_type == "preset":
         position = position_value  # e.g., "center"
     elif position_type == "absolute":
-        position = tuple(position_value)  # Convert list to tuple
+        position = tuple(scale_position_value(value, scale) for value in position_value)  # Convert list to tuple
     elif position_type == "relative":
         position = tuple(position_value)
+    elif position_type == "keyframes":
+        position = animation.position
     elif position_type == "function":
-        position = eval(position_value)  # Converts the lambda string to a function (CAUTION: only use with trusted sources)
+        print("Warning: \"function\" overlay positions are deprecated and run Python code per frame, use \"keyframes\" positions instead.")
+        position_function = eval(position_value)  # Converts the lambda string to a function (CAUTION: only use with trusted sources)
+
+        if scale == 1.0:
+            position = position_function
+        else:
+            position = lambda t: tuple(scale_position_value(value, scale) for value in position_function(t))
 
     # Apply position from JSON
     image = image.with_position(position)
 
     return image
 
-def append_image(image_meta, video_clip, video_clips_to_close):
+def append_image(image_meta, video_clip, video_clips_to_close, scale = 1.0, fps = None):
+    """
+    Overlays an image on the video clip.
+
+    :param scale: Factor applied to the overlay's height, width and absolute
+                  position when the video is rendered below source resolution.
+    :param fps: The frame rate the video is rendered at, which keyframe
+                animations are compiled at.
+    """
     auto_size = True
 
     image_file_pathname = image_meta["path"]
 
-    # Load the transparent image
-    image = ImageClip(image_file_pathname)
+    # The overlay's size is worked out from the image header, so it is decoded once at that size
+    image_size = get_image_size(image_file_pathname)
+    overlay_size = image_size
 
     if "height" in image_meta:
-        image_height = image_meta["height"]
-        image = image.resized(height=image_height)
+        image_height = int(image_meta["height"] * scale)
+        overlay_size = fit_size(overlay_size, height=image_height)
         auto_size = False
 
     if "width" in image_meta:
-        image_width = image_meta["width"]
-        image = image.resized(width=image_width)
+        image_width = int(image_meta["width"] * scale)
+        overlay_size = fit_size(overlay_size, width=image_width)
         auto_size = False
 
+    if auto_size:
+        # Resize image to match video width while maintaining aspect ratio
+        overlay_size = fit_size(overlay_size, width=video_clip.size[0])
+
+    # Load the transparent image
+    if tuple(overlay_size) == tuple(image_size):
+        image = ImageClip(load_image_array(image_file_pathname))
+    else:
+        image = ImageClip(load_scaled_image_array(image_file_pathname, overlay_size))
+
+    # Keyframed positions and opacity are computed for every frame up front
+    animation = compile_overlay_animation(image_meta, video_clip.size, video_clip.duration, fps or video_clip.fps or DEFAULT_ANIMATION_FPS, scale)
+
     if "position" in image_meta:
-        image = set_image_position(image_meta, image)
+        image = set_image_position(image_meta, image, scale, animation)
     else:
         # Center the image
         image = image.with_position("center")
 
-    if auto_size:
-        # Resize image to match video width while maintaining aspect ratio
-        image = image.resized(width=video_clip.size[0])
-
     # Set the duration for the overlay
     image = image.with_duration(video_clip.duration)
 
     # Create a composite video with the image overlay
-    final_clip = CompositeVideoClip([video_clip, image])
+    animated = image_meta.get("position", {}).get("type") == "function"
+    final_clip = composite_overlay(video_clip, image, animated, animation)
 
     video_clips_to_close.append(video_clip)
     video_clips_to_close.append(final_clip)
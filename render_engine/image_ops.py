@@ -0,0 +1,200 @@
+import numpy as np
+
+from typing import Dict, Tuple
+from moviepy import VideoClip, CompositeVideoClip
+from moviepy.tools import compute_position
+
+try:
+    import cv2
+except ImportError:
+    cv2 = None
+
+IMAGE_OPS_BACKENDS = ("moviepy", "opencv")
+
+# The backend used by the frame hot path: "opencv" when cv2 is installed
+_image_ops_backend = "opencv" if cv2 is not None else "moviepy"
+
+
+def configure_image_ops(settings: Dict) -> None:
+    """
+    Selects the image-ops backend from the video assembly settings.
+
+    Settings:
+        "image_ops_backend": "opencv" (default when cv2 is installed) or "moviepy".
+        "image_ops_threads": Number of OpenCV worker threads. OpenCV runs its
+                             resize and blend kernels on these threads with
+                             the GIL released.
+    """
+    set_image_ops_backend(settings.get("image_ops_backend", _image_ops_backend))
+
+    image_ops_threads = settings.get("image_ops_threads")
+
+    if cv2 is not None and image_ops_threads:
+        cv2.setNumThreads(int(image_ops_threads))
+
+
+def set_image_ops_backend(backend: str) -> None:
+    """Sets the image-ops backend, falling back to MoviePy if cv2 is missing."""
+    global _image_ops_backend
+
+    if backend not in IMAGE_OPS_BACKENDS:
+        raise ValueError(f"Unknown image ops backend '{backend}', expected one of {IMAGE_OPS_BACKENDS}")
+
+    if backend == "opencv" and cv2 is None:
+        print("Warning: opencv-python is not installed, using the moviepy image ops backend.")
+        backend = "moviepy"
+
+    _image_ops_backend = backend
+
+
+def get_image_ops_backend() -> str:
+    return _image_ops_backend
+
+
+def fit_size(size: Tuple[int, int], width=None, height=None) -> Tuple[int, int]:
+    """
+    Returns the size after resizing to a width or height, keeping the aspect ratio.
+    """
+    clip_width, clip_height = size
+
+    if width and height:
+        return int(width), int(height)
+    elif width:
+        return int(width), int(round(clip_height * width / clip_width))
+    elif height:
+        return int(round(clip_width * height / clip_height)), int(height)
+
+    return clip_width, clip_height
+
+
+def resize_clip(clip: VideoClip, size: Tuple[int, int]) -> VideoClip:
+    """
+    Resizes every frame of the clip (and its mask) to size.
+
+    With the opencv backend the interpolation is chosen once per clip: area
+    averaging when shrinking, bilinear when enlarging.
+    """
+    width, height = int(size[0]), int(size[1])
+
+    if tuple(clip.size) == (width, height):
+        return clip
+
+    if _image_ops_backend != "opencv":
+        return clip.resized((width, height))
+
+    if width < clip.w:
+        interpolation = cv2.INTER_AREA
+    else:
+        interpolation = cv2.INTER_LINEAR
+
+    def resize_frame(frame):
+        return cv2.resize(frame, (width, height), interpolation=interpolation)
+
+    return clip.image_transform(resize_frame, apply_to=["mask"])
+
+
+def composite_overlay(video_clip: VideoClip, overlay_clip: VideoClip, animated: bool = False, animation = None) -> VideoClip:
+    """
+    Draws a full-length overlay (e.g. a transparent logo) on top of the video.
+
+    With the opencv backend the overlay's pixels, alpha weights and position are
+    computed once, and each frame only blends the covered region with
+    cv2.blendLinear. MoviePy's compositor instead converts the whole frame to an
+    RGBA Pillow image and composites a full-size canvas on every frame.
+
+    :param animated: True if the overlay position is a function of time, which
+                     needs MoviePy's compositor.
+    :param animation: The overlay_animation.OverlayAnimation of an overlay
+                      moving or fading along keyframes. Its position and
+                      opacity are looked up per frame.
+    """
+    if _image_ops_backend != "opencv" or animated:
+        if animation is not None and animation.opacity is not None:
+            overlay_mask = overlay_clip.mask if overlay_clip.mask is not None else overlay_clip.with_mask().mask
+            overlay_clip = overlay_clip.with_mask(overlay_mask.transform(lambda get_frame, t: get_frame(t) * animation.opacity_at(t)))
+
+        return CompositeVideoClip([video_clip, overlay_clip])
+
+    overlay_frame = overlay_clip.get_frame(0).astype(np.uint8)
+    overlay_height, overlay_width = overlay_frame.shape[:2]
+
+    if overlay_clip.mask is not None:
+        alpha = overlay_clip.mask.get_frame(0).astype(np.float32)
+    else:
+        alpha = np.ones((overlay_height, overlay_width), dtype=np.float32)
+
+    if animation is not None and animation.moves:
+        x = y = 0
+    else:
+        x, y = compute_position(
+            (overlay_width, overlay_height), video_clip.size, overlay_clip.pos(0), overlay_clip.relative_pos
+        )
+        x, y = int(x), int(y)
+
+    if animation is not None:
+        return blend_animated_overlay(video_clip, overlay_frame, alpha, (x, y), animation)
+
+    # Clip the overlay to the part that lands inside the frame
+    frame_width, frame_height = video_clip.size
+    x1, y1 = max(x, 0), max(y, 0)
+    x2, y2 = min(x + overlay_width, frame_width), min(y + overlay_height, frame_height)
+
+    if x1 >= x2 or y1 >= y2:
+        return video_clip
+
+    overlay_region = np.ascontiguousarray(overlay_frame[y1 - y:y2 - y, x1 - x:x2 - x, :3])
+    overlay_weights = np.ascontiguousarray(alpha[y1 - y:y2 - y, x1 - x:x2 - x])
+    frame_weights = 1.0 - overlay_weights
+
+    def blend_frame(frame):
+        blended_frame = np.array(frame, dtype=np.uint8)
+        region = blended_frame[y1:y2, x1:x2]
+        region[...] = cv2.blendLinear(np.ascontiguousarray(region), overlay_region, frame_weights, overlay_weights)
+        return blended_frame
+
+    return video_clip.image_transform(blend_frame)
+
+
+def blend_animated_overlay(video_clip: VideoClip, overlay_frame: np.ndarray, alpha: np.ndarray, position: Tuple[int, int], animation) -> VideoClip:
+    """
+    Blends an overlay whose position or opacity changes per frame, looking both
+    up in the animation's precomputed arrays.
+
+    :param position: The overlay's (x, y) when the animation does not move it.
+    """
+    overlay_height, overlay_width = overlay_frame.shape[:2]
+    frame_width, frame_height = video_clip.size
+    overlay_pixels = np.ascontiguousarray(overlay_frame[:, :, :3])
+
+    def blend_frame(get_frame, t):
+        frame = get_frame(t)
+        frame_index = animation.frame_index(t)
+
+        if animation.moves:
+            x, y = int(animation.x[frame_index]), int(animation.y[frame_index])
+        else:
+            x, y = position
+
+        opacity = 1.0 if animation.opacity is None else float(animation.opacity[frame_index])
+
+        x1, y1 = max(x, 0), max(y, 0)
+        x2, y2 = min(x + overlay_width, frame_width), min(y + overlay_height, frame_height)
+
+        if x1 >= x2 or y1 >= y2 or opacity <= 0.0:
+            return frame
+
+        overlay_weights = alpha[y1 - y:y2 - y, x1 - x:x2 - x]
+
+        if opacity < 1.0:
+            overlay_weights = overlay_weights * opacity
+
+        overlay_weights = np.ascontiguousarray(overlay_weights)
+
+        blended_frame = np.array(frame, dtype=np.uint8)
+        region = blended_frame[y1:y2, x1:x2]
+        region[...] = cv2.blendLinear(
+            np.ascontiguousarray(region), np.ascontiguousarray(overlay_pixels[y1 - y:y2 - y, x1 - x:x2 - x]), 1.0 - overlay_weights, overlay_weights
+        )
+        return blended_frame
+
+    return video_clip.transform(blend_frame)
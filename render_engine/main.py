@@ -1,7 +1,10 @@
 import os
 import json
+import signal
 import argparse
 
+from datetime import datetime
+
 from typing import Any, Dict
 from video_assembly_helper import clear_this_run_only, skip_segment_render, skip_scene_render
 
@@ -9,6 +12,8 @@ from video_assembly_helper import clear_this_run_only, skip_segment_render, skip
 try:
     from cut_utility import generate_video_cut
     from video_utility import get_last_modified_timestamp
+    from batch_utility import collect_video_assembly_files, render_batch
+    from watch_utility import watch_video_assembly
 except ImportError as e:
     print(f"Error: Missing required module - {e.name}")
     exit(1)
@@ -34,14 +39,29 @@ def load_json(file_path: str) -> Dict:
         print(f"Unexpected error while reading JSON: {e}")
         exit(1)
 
-def get_video_assembly_file_pathname() -> str:
-    """Get the video assembly file pathname from the command-line."""
+def parse_command_line() -> argparse.Namespace:
+    """Parse the command-line arguments."""
     parser = argparse.ArgumentParser(description="Generate videos from a video assembly file.")
-    parser.add_argument("video_assembly_file", nargs="?", default=None, help="Path to the video assembly JSON file.")
-    
+    parser.add_argument("video_assembly_files", nargs="*", help="Path to the video assembly JSON file. Several files or directories of them are rendered as one batch.")
+    parser.add_argument("--resume", action="store_true", help="Continue an interrupted render, reusing only scenes the render journal verifies as complete.")
+    parser.add_argument("--watch", action="store_true", help="Keep running and re-render the scenes affected by changes to the assembly or its media.")
+    parser.add_argument("--debounce", type=float, default=0.5, help="Watch mode: seconds without changes before re-rendering.")
+    parser.add_argument("--workers", type=int, default=None, help="Batch mode: number of scenes and cuts rendered at the same time.")
+
     args = parser.parse_args()
-    
-    file_path = args.video_assembly_file or input("Enter the file pathname to the video assembly JSON file: ").strip()
+
+    if args.watch and is_batch(args):
+        parser.error("--watch renders a single video assembly file, not several files or a directory.")
+
+    return args
+
+def is_batch(args: argparse.Namespace) -> bool:
+    """Several assemblies, or a directory of them, are rendered as one batch."""
+    return len(args.video_assembly_files) > 1 or any(os.path.isdir(path) for path in args.video_assembly_files)
+
+def get_video_assembly_file_pathname(args: argparse.Namespace) -> str:
+    """Get the video assembly file pathname from the command-line."""
+    file_path = (args.video_assembly_files[0] if args.video_assembly_files else None) or input("Enter the file pathname to the video assembly JSON file: ").strip()
     
     if not file_path:
         print("Error: No file path provided.")
@@ -166,9 +186,20 @@ def update_file_pathnames_with_common_base_file_path(video_assembly: Dict[str, A
     return video_assembly
 
 
-def main():
-    video_assembly_file_pathname = get_video_assembly_file_pathname()
-    
+def handle_termination(signum, frame):
+    """
+    Turn SIGTERM (sent by the editor when a render is cancelled) into a
+    KeyboardInterrupt, so partial output files are cleaned up on the way out.
+    """
+    raise KeyboardInterrupt(f"Render cancelled by signal {signum}")
+
+def render_video_assembly_file(video_assembly_file_pathname: str, resume: bool = False, force_cut: bool = False) -> None:
+    """
+    Renders the cut of one video assembly file.
+
+    :param force_cut: Render the cut even if it is newer than the assembly, e.g.
+                      after a source file changed.
+    """
     video_assembly = load_json(video_assembly_file_pathname)
     video_assembly_original_json_text = json.dumps(video_assembly)
     
@@ -183,13 +214,33 @@ def main():
     
     video_assembly_last_modified_timestamp = get_last_modified_timestamp(video_assembly_file_pathname)
 
+    if force_cut:
+        video_assembly_last_modified_timestamp = datetime.now()
+
     # Access the "cut"  safely
     cut = video_assembly.get("cut", {})
     
     if check_file_existence(video_assembly):
-        generate_video_cut(video_assembly, cut, video_assembly_last_modified_timestamp)
+        generate_video_cut(video_assembly, cut, video_assembly_last_modified_timestamp, resume)
     else:
         print("Video Assembly Processing Stopped due to missing files.")
 
+def main():
+    signal.signal(signal.SIGTERM, handle_termination)
+
+    args = parse_command_line()
+
+    if is_batch(args):
+        render_batch(collect_video_assembly_files(args.video_assembly_files), render_video_assembly_file, args.workers, args.resume)
+        return
+
+    video_assembly_file_pathname = get_video_assembly_file_pathname(args)
+
+    if args.watch:
+        watch_video_assembly(video_assembly_file_pathname, render_video_assembly_file, args.debounce)
+        return
+
+    render_video_assembly_file(video_assembly_file_pathname, args.resume)
+
 if __name__ == "__main__":
     main()
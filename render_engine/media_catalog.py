@@ -0,0 +1,438 @@
+import os
+import sys
+import json
+import time
+import sqlite3
+import argparse
+
+from typing import Any, Dict, List, Union
+from concurrent.futures import ThreadPoolExecutor
+from PIL import Image
+from moviepy.video.io.ffmpeg_reader import ffmpeg_parse_infos
+from resource_governor import allocate_worker_count
+
+DEFAULT_MEDIA_CATALOG_PATH = os.path.join(os.path.expanduser("~"), ".composeflow", "media_catalog.sqlite3")
+MEDIA_TYPES = ("video", "audio", "image")
+SCHEMA_VERSION = 1
+
+# Directories modified this close to the start of a scan may change again within
+# the same mtime tick (exFAT and FAT drives store mtimes in 2 second steps), so
+# they are not trusted for short-circuiting on the next scan
+RACY_MTIME_SECONDS = 2.0
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS scans (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    root TEXT NOT NULL,
+    started_at REAL NOT NULL,
+    finished_at REAL
+);
+CREATE TABLE IF NOT EXISTS directories (
+    path TEXT PRIMARY KEY,
+    parent TEXT,
+    root TEXT NOT NULL,
+    mtime_ns INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS directories_root ON directories (root);
+CREATE TABLE IF NOT EXISTS files (
+    path TEXT PRIMARY KEY,
+    directory TEXT NOT NULL,
+    root TEXT NOT NULL,
+    media_type TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    probe TEXT,
+    added_in_scan INTEGER NOT NULL,
+    changed_in_scan INTEGER NOT NULL,
+    deleted_in_scan INTEGER
+);
+CREATE INDEX IF NOT EXISTS files_root ON files (root);
+CREATE INDEX IF NOT EXISTS files_changed_in_scan ON files (changed_in_scan);
+"""
+
+
+def get_media_catalog_pathname(settings: Dict) -> str:
+    """
+    Returns the catalog database pathname from the video assembly settings.
+
+    Settings:
+        "media_catalog_path": The SQLite database file (default ~/.composeflow/media_catalog.sqlite3).
+    """
+    return settings.get("media_catalog_path") or DEFAULT_MEDIA_CATALOG_PATH
+
+
+def get_media_type_by_extension(video_assembly: Dict) -> Dict[str, str]:
+    """Maps lower-case file extensions to "video", "audio" or "image" using the supported_*_file_extensions lists."""
+    composeflow_org = video_assembly.get("composeflow.org", {})
+    media_type_by_extension = {}
+
+    for media_type in MEDIA_TYPES:
+        for extension in composeflow_org.get(f"supported_{media_type}_file_extensions", []):
+            media_type_by_extension[extension.lower()] = media_type
+
+    return media_type_by_extension
+
+
+def probe_media_file(file_path: str, media_type: str) -> Union[Dict[str, Any], None]:
+    """
+    Reads the metadata the engine and editor need from a media file.
+
+    :return: The probe metadata, or None if the file cannot be read.
+    """
+    try:
+        if media_type == "image":
+            # Pillow only reads the header here
+            with Image.open(file_path) as image:
+                return {"size": list(image.size), "format": image.format}
+
+        infos = ffmpeg_parse_infos(file_path)
+    except Exception:
+        return None
+
+    probe = {"duration": infos.get("duration"), "bitrate": infos.get("bitrate"), "audio_found": infos.get("audio_found", False)}
+
+    if infos.get("video_found"):
+        probe.update({
+            "video_size": infos.get("video_size"),
+            "video_fps": infos.get("video_fps"),
+            "video_codec_name": infos.get("video_codec_name"),
+            "video_rotation": infos.get("video_rotation", 0),
+        })
+
+    if infos.get("audio_found"):
+        probe["audio_fps"] = infos.get("audio_fps")
+
+    return probe
+
+
+class MediaCatalog:
+    """
+    SQLite catalog of the media files below the content source roots.
+
+    Scans are incremental. A directory whose mtime is unchanged since the last
+    scan has the same entries, so it is neither listed nor are its files
+    stat'ed again; only its known subdirectories are visited. Files that are new
+    or whose size or mtime changed are probed. Every file row records the scan
+    that added, last changed and deleted it, which answers "what changed since
+    scan N" with one indexed query. Lookups by path use the primary key.
+
+    Files edited in place do not change their directory's mtime. Use a full
+    scan to pick those up.
+    """
+
+    def __init__(self, catalog_pathname: str):
+        self.catalog_pathname = catalog_pathname
+
+        catalog_directory = os.path.dirname(os.path.abspath(catalog_pathname))
+        os.makedirs(catalog_directory, exist_ok=True)
+
+        self.connection = sqlite3.connect(catalog_pathname)
+        self.connection.row_factory = sqlite3.Row
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+
+        if self.connection.execute("PRAGMA user_version").fetchone()[0] != SCHEMA_VERSION:
+            self.connection.executescript(SCHEMA)
+            self.connection.execute(f"PRAGMA user_version={SCHEMA_VERSION}")
+
+    def close(self) -> None:
+        self.connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def get_file(self, file_path: str) -> Union[Dict[str, Any], None]:
+        """Returns the catalog entry of a file, or None if it is not cataloged."""
+        row = self.connection.execute(
+            "SELECT * FROM files WHERE path = ? AND deleted_in_scan IS NULL", (os.path.abspath(file_path),)
+        ).fetchone()
+
+        return _file_row_to_dict(row) if row else None
+
+    def get_last_scan_id(self, root: Union[str, None] = None) -> int:
+        """Returns the id of the latest finished scan (of a root), or 0 if there is none."""
+        if root is None:
+            row = self.connection.execute("SELECT MAX(id) FROM scans WHERE finished_at IS NOT NULL").fetchone()
+        else:
+            row = self.connection.execute(
+                "SELECT MAX(id) FROM scans WHERE root = ? AND finished_at IS NOT NULL", (os.path.abspath(root),)
+            ).fetchone()
+
+        return row[0] or 0
+
+    def get_changed_files(self, since_scan_id: int, root: Union[str, None] = None) -> List[Dict[str, Any]]:
+        """
+        Returns the files added, modified or deleted by the scans after since_scan_id.
+
+        Each entry has a "change" key: "added", "modified" or "deleted".
+        """
+        query = "SELECT * FROM files WHERE (changed_in_scan > ? OR deleted_in_scan > ?)"
+        parameters = [since_scan_id, since_scan_id]
+
+        if root is not None:
+            query += " AND root = ?"
+            parameters.append(os.path.abspath(root))
+
+        changed_files = []
+
+        for row in self.connection.execute(query + " ORDER BY path", parameters):
+            changed_file = _file_row_to_dict(row)
+
+            if row["deleted_in_scan"] is not None and row["deleted_in_scan"] > since_scan_id:
+                changed_file["change"] = "deleted"
+            elif row["added_in_scan"] > since_scan_id:
+                changed_file["change"] = "added"
+            else:
+                changed_file["change"] = "modified"
+
+            changed_files.append(changed_file)
+
+        return changed_files
+
+    def scan(
+        self,
+        root: str,
+        media_type_by_extension: Dict[str, str],
+        include_subpaths: bool = True,
+        full: bool = False,
+        probe: bool = True,
+        workers: Union[int, None] = None,
+    ) -> Dict[str, Any]:
+        """
+        Scans a content source root and updates the catalog.
+
+        :param media_type_by_extension: See get_media_type_by_extension(). Other files are not cataloged.
+        :param include_subpaths: Whether to descend into subdirectories.
+        :param full: List every directory and stat every file, ignoring directory mtimes.
+        :param probe: Probe the metadata of new and changed files.
+        :param workers: Number of files probed at the same time (default: as many
+                        as the resource governor allows).
+        :return: The scan id and counts of the work done.
+        """
+        root = os.path.abspath(root)
+        started_at = time.time()
+
+        cursor = self.connection.execute("INSERT INTO scans (root, started_at) VALUES (?, ?)", (root, started_at))
+        scan_id = cursor.lastrowid
+
+        known_directories = {}
+        subdirectories_by_parent = {}
+
+        for row in self.connection.execute("SELECT path, parent, mtime_ns FROM directories WHERE root = ?", (root,)):
+            known_directories[row["path"]] = row["mtime_ns"]
+            subdirectories_by_parent.setdefault(row["parent"], []).append(row["path"])
+
+        known_files = {}
+        files_by_directory = {}
+
+        for row in self.connection.execute(
+            "SELECT path, directory, size, mtime_ns FROM files WHERE root = ? AND deleted_in_scan IS NULL", (root,)
+        ):
+            known_files[row["path"]] = (row["size"], row["mtime_ns"])
+            files_by_directory.setdefault(row["directory"], []).append(row["path"])
+
+        seen_directories = set()
+        seen_files = set()
+        directory_rows = []
+        changed_files = []
+        skipped_directory_count = 0
+
+        pending_directories = [(root, None)]
+
+        while pending_directories:
+            directory, parent = pending_directories.pop()
+
+            try:
+                directory_mtime_ns = os.stat(directory).st_mtime_ns
+            except OSError:
+                continue
+
+            seen_directories.add(directory)
+
+            if not full and known_directories.get(directory) == directory_mtime_ns:
+                # Same entries as last time, reuse them without listing the directory
+                skipped_directory_count += 1
+                seen_files.update(files_by_directory.get(directory, []))
+
+                if include_subpaths:
+                    pending_directories.extend((subdirectory, directory) for subdirectory in subdirectories_by_parent.get(directory, []))
+                continue
+
+            try:
+                entries = list(os.scandir(directory))
+            except OSError as e:
+                print(f"Media catalog: cannot list '{directory}': {e}", file=sys.stderr)
+                continue
+
+            for entry in entries:
+                # Skip hidden files, including the ._ files macOS leaves on external drives
+                if entry.name.startswith("."):
+                    continue
+
+                try:
+                    if entry.is_dir(follow_symlinks=False):
+                        if include_subpaths:
+                            pending_directories.append((entry.path, directory))
+                        continue
+
+                    media_type = media_type_by_extension.get(os.path.splitext(entry.name)[1].lower())
+
+                    if media_type is None or not entry.is_file():
+                        continue
+
+                    entry_stat = entry.stat()
+                except OSError:
+                    continue
+
+                seen_files.add(entry.path)
+
+                if known_files.get(entry.path) != (entry_stat.st_size, entry_stat.st_mtime_ns):
+                    changed_files.append((entry.path, directory, media_type, entry_stat.st_size, entry_stat.st_mtime_ns))
+
+            # A directory modified during the scan must be listed again next time
+            if directory_mtime_ns >= (started_at - RACY_MTIME_SECONDS) * 1e9:
+                directory_mtime_ns = -1
+
+            directory_rows.append((directory, parent, root, directory_mtime_ns))
+
+        deleted_files = [(scan_id, path) for path in known_files if path not in seen_files]
+
+        probes = {}
+
+        if probe and changed_files:
+            with ThreadPoolExecutor(max_workers=allocate_worker_count(requested=workers)) as executor:
+                probe_results = executor.map(lambda changed_file: probe_media_file(changed_file[0], changed_file[2]), changed_files)
+                probes = {changed_file[0]: probe_result for changed_file, probe_result in zip(changed_files, probe_results)}
+
+        with self.connection:
+            self.connection.executemany(
+                "INSERT INTO directories (path, parent, root, mtime_ns) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT (path) DO UPDATE SET parent = excluded.parent, root = excluded.root, mtime_ns = excluded.mtime_ns",
+                directory_rows
+            )
+            self.connection.executemany(
+                "DELETE FROM directories WHERE path = ?",
+                [(path,) for path in known_directories if path not in seen_directories]
+            )
+            self.connection.executemany(
+                "INSERT INTO files (path, directory, root, media_type, size, mtime_ns, probe, added_in_scan, changed_in_scan) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?) "
+                "ON CONFLICT (path) DO UPDATE SET directory = excluded.directory, root = excluded.root, "
+                "media_type = excluded.media_type, size = excluded.size, mtime_ns = excluded.mtime_ns, probe = excluded.probe, "
+                "added_in_scan = CASE WHEN files.deleted_in_scan IS NULL THEN files.added_in_scan ELSE excluded.added_in_scan END, "
+                "changed_in_scan = excluded.changed_in_scan, deleted_in_scan = NULL",
+                [
+                    (path, directory, root, media_type, size, mtime_ns, json.dumps(probes.get(path)) if path in probes else None, scan_id, scan_id)
+                    for path, directory, media_type, size, mtime_ns in changed_files
+                ]
+            )
+            self.connection.executemany("UPDATE files SET deleted_in_scan = ? WHERE path = ?", deleted_files)
+            self.connection.execute("UPDATE scans SET finished_at = ? WHERE id = ?", (time.time(), scan_id))
+
+        return {
+            "scan_id": scan_id,
+            "root": root,
+            "files": len(seen_files),
+            "changed": len(changed_files),
+            "deleted": len(deleted_files),
+            "directories": len(seen_directories),
+            "skipped_directories": skipped_directory_count,
+            "seconds": round(time.time() - started_at, 3),
+        }
+
+
+def _file_row_to_dict(row: sqlite3.Row) -> Dict[str, Any]:
+    file_entry = dict(row)
+    file_entry["probe"] = json.loads(row["probe"]) if row["probe"] else None
+
+    return file_entry
+
+
+def scan_content_sources(video_assembly: Dict, full: bool = False, probe: bool = True, workers: Union[int, None] = None) -> List[Dict[str, Any]]:
+    """
+    Scans every content source root of the cut into the media catalog.
+
+    :return: One scan summary per content source.
+    """
+    settings = video_assembly.get("composeflow.org", {}).get("settings", {})
+    media_type_by_extension = get_media_type_by_extension(video_assembly)
+    content_sources = sorted(video_assembly.get("cut", {}).get("content_sources", []), key=lambda source: source.get("order", 0))
+
+    scan_summaries = []
+
+    with MediaCatalog(get_media_catalog_pathname(settings)) as media_catalog:
+        for content_source in content_sources:
+            if not content_source.get("path"):
+                continue
+
+            scan_summary = media_catalog.scan(
+                content_source["path"],
+                media_type_by_extension,
+                include_subpaths=content_source.get("include_subpaths", True),
+                full=full,
+                probe=probe,
+                workers=workers
+            )
+            print(
+                f"Media catalog: scanned '{scan_summary['root']}' in {scan_summary['seconds']}s, "
+                f"{scan_summary['files']} files, {scan_summary['changed']} changed, {scan_summary['deleted']} deleted",
+                file=sys.stderr
+            )
+            scan_summaries.append(scan_summary)
+
+    return scan_summaries
+
+
+def load_json(file_path: str) -> Dict:
+    with open(file_path, "r") as file:
+        return json.load(file)
+
+
+def parse_command_line() -> argparse.Namespace:
+    """Parse the command-line arguments."""
+    parser = argparse.ArgumentParser(description="Maintain the SQLite media catalog of a video assembly's content sources.")
+    parser.add_argument("--catalog", default=None, help="Path to the catalog database, overriding the assembly settings.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    scan_parser = subparsers.add_parser("scan", help="Incrementally scan the content sources of a video assembly.")
+    scan_parser.add_argument("video_assembly_file", help="Path to the video assembly JSON file.")
+    scan_parser.add_argument("--full", action="store_true", help="Stat every file, ignoring directory mtimes.")
+    scan_parser.add_argument("--no-probe", action="store_true", help="Do not probe the metadata of new and changed files.")
+    scan_parser.add_argument("--workers", type=int, default=None, help="Number of files probed at the same time.")
+
+    lookup_parser = subparsers.add_parser("lookup", help="Print the catalog entry of a file.")
+    lookup_parser.add_argument("file", help="Path to the media file.")
+
+    changed_parser = subparsers.add_parser("changed", help="Print the files changed since a scan.")
+    changed_parser.add_argument("since_scan_id", type=int, help="Scan id, e.g. from a previous scan summary.")
+    changed_parser.add_argument("--root", default=None, help="Only files below this content source root.")
+
+    return parser.parse_args()
+
+
+def main():
+    args = parse_command_line()
+
+    if args.command == "scan":
+        video_assembly = load_json(args.video_assembly_file)
+
+        if args.catalog:
+            video_assembly.setdefault("composeflow.org", {}).setdefault("settings", {})["media_catalog_path"] = args.catalog
+
+        result = scan_content_sources(video_assembly, args.full, not args.no_probe, args.workers)
+    else:
+        with MediaCatalog(args.catalog or DEFAULT_MEDIA_CATALOG_PATH) as media_catalog:
+            if args.command == "lookup":
+                result = media_catalog.get_file(args.file)
+            else:
+                result = media_catalog.get_changed_files(args.since_scan_id, args.root)
+
+    # JSON on stdout for the editor, progress goes to stderr
+    json.dump(result, sys.stdout)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,435 @@
+import io
+import os
+import sys
+import json
+import mmap
+import base64
+import struct
+import argparse
+import subprocess as sp
+
+import numpy as np
+
+from typing import Any, Dict, List, Tuple, Union
+from concurrent.futures import ThreadPoolExecutor
+from PIL import Image
+from moviepy.config import FFMPEG_BINARY
+from moviepy.tools import cross_platform_popen_params
+from moviepy.video.io.ffmpeg_reader import ffmpeg_parse_infos
+from fingerprint_utility import source_fingerprint
+from video_utility import atomic_output_file, ensure_directory_exists
+from resource_governor import allocate_worker_count
+
+DEFAULT_MEDIA_INDEX_PATH = os.path.join(os.path.expanduser("~"), ".composeflow", "media_index")
+DEFAULT_THUMBNAIL_INTERVAL_SECONDS = 2.0
+DEFAULT_THUMBNAIL_HEIGHT = 90
+DEFAULT_PEAKS_PER_SECOND = 100
+
+# Audio is decoded to mono at this rate for peak extraction, which is plenty for a waveform
+PEAKS_SAMPLE_RATE = 8000
+THUMBNAIL_JPEG_QUALITY = 75
+
+# Sidecar layouts, all little-endian:
+#
+#   .thumbs  header, uint64 offsets[count + 1], concatenated JPEG images
+#   .peaks   header, int16 [count][2] (min, max) pairs
+THUMBNAILS_MAGIC = b"CFTH"
+THUMBNAILS_HEADER = struct.Struct("<4sHHHHdI")  # magic, version, width, height, reserved, interval, count
+PEAKS_MAGIC = b"CFPK"
+PEAKS_HEADER = struct.Struct("<4sHdI")          # magic, version, peaks per second, count
+SIDECAR_VERSION = 1
+
+
+def get_media_index_settings(settings: Dict) -> Dict[str, Any]:
+    """
+    Reads the media index options from the video assembly settings.
+
+    Settings:
+        "media_index": {
+            "path": Directory of the sidecar files (default ~/.composeflow/media_index).
+            "thumbnail_interval_seconds": Time between thumbnails (default 2).
+            "thumbnail_height": Thumbnail height in pixels (default 90).
+            "peaks_per_second": Audio peak resolution (default 100).
+        }
+    """
+    media_index = settings.get("media_index", {})
+
+    return {
+        "path": media_index.get("path") or DEFAULT_MEDIA_INDEX_PATH,
+        "thumbnail_interval_seconds": float(media_index.get("thumbnail_interval_seconds", DEFAULT_THUMBNAIL_INTERVAL_SECONDS)),
+        "thumbnail_height": int(media_index.get("thumbnail_height", DEFAULT_THUMBNAIL_HEIGHT)),
+        "peaks_per_second": float(media_index.get("peaks_per_second", DEFAULT_PEAKS_PER_SECOND)),
+    }
+
+
+def get_sidecar_pathnames(index_path: str, fingerprint: str) -> Tuple[str, str]:
+    """Returns the thumbnail and peak sidecar pathnames of a source fingerprint."""
+    # Fan out over subdirectories so a large library does not end up in one directory
+    sidecar_path = os.path.join(index_path, fingerprint[:2], fingerprint)
+
+    return sidecar_path + ".thumbs", sidecar_path + ".peaks"
+
+
+def collect_referenced_sources(video_assembly: Dict) -> List[str]:
+    """
+    Returns the video and audio files referenced by the cut, in timeline order
+    and without duplicates.
+    """
+    source_paths = []
+
+    for segment in video_assembly.get("cut", {}).get("segments", []):
+        for scene in segment.get("scenes", []):
+            if scene.get("timeline_clip_type", "video").lower() == "video":
+                source_paths.extend(clip.get("path") for clip in scene.get("timeline_clips", []))
+
+            source_paths.extend(clip.get("path") for clip in scene.get("sequential_audio_clips", []))
+
+    return list(dict.fromkeys(path for path in source_paths if path))
+
+
+def _read_thumbnails_header(sidecar_pathname: str):
+    with open(sidecar_pathname, "rb") as sidecar_file:
+        return THUMBNAILS_HEADER.unpack(sidecar_file.read(THUMBNAILS_HEADER.size))
+
+
+def _read_peaks_header(sidecar_pathname: str):
+    with open(sidecar_pathname, "rb") as sidecar_file:
+        return PEAKS_HEADER.unpack(sidecar_file.read(PEAKS_HEADER.size))
+
+
+def thumbnails_are_current(sidecar_pathname: str, interval: float, height: int) -> bool:
+    """Returns True if the sidecar exists and was extracted with the same options."""
+    try:
+        magic, version, _, thumbnail_height, _, thumbnail_interval, _ = _read_thumbnails_header(sidecar_pathname)
+    except (OSError, struct.error):
+        return False
+
+    return magic == THUMBNAILS_MAGIC and version == SIDECAR_VERSION and thumbnail_height == height and thumbnail_interval == interval
+
+
+def peaks_are_current(sidecar_pathname: str, peaks_per_second: float) -> bool:
+    """Returns True if the sidecar exists and was extracted with the same options."""
+    try:
+        magic, version, sidecar_peaks_per_second, _ = _read_peaks_header(sidecar_pathname)
+    except (OSError, struct.error):
+        return False
+
+    return magic == PEAKS_MAGIC and version == SIDECAR_VERSION and sidecar_peaks_per_second == peaks_per_second
+
+
+def _open_ffmpeg_pipe(cmd: List[str]) -> sp.Popen:
+    return sp.Popen(cmd, **cross_platform_popen_params({"stdout": sp.PIPE, "stderr": sp.PIPE, "stdin": sp.DEVNULL}))
+
+
+def _finish_ffmpeg_pipe(process: sp.Popen, source_path: str) -> None:
+    process.stdout.close()
+    error_output = process.stderr.read()
+    process.stderr.close()
+
+    if process.wait() != 0:
+        raise IOError(f"ffmpeg failed to decode '{source_path}':\n{error_output.decode(errors='replace')}")
+
+
+def extract_thumbnails(source_path: str, sidecar_pathname: str, source_size, duration, interval: float, height: int) -> int:
+    """
+    Extracts one thumbnail per interval into a thumbnail sidecar.
+
+    Only keyframes are decoded (-skip_frame nokey), and each thumbnail shows the
+    latest keyframe at its time, which keeps extraction fast on long sources.
+
+    :return: The number of thumbnails.
+    """
+    width = max(2, int(round(source_size[0] * height / source_size[1] / 2)) * 2)
+    frame_size = width * height * 3
+
+    cmd = [
+        FFMPEG_BINARY, "-loglevel", "error",
+        "-skip_frame", "nokey",
+        "-i", source_path,
+        "-an", "-sn",
+        "-vf", f"fps=1/{interval}:eof_action=pass,scale={width}:{height}",
+        "-f", "rawvideo", "-pix_fmt", "rgb24", "-",
+    ]
+
+    images = []
+    process = _open_ffmpeg_pipe(cmd)
+
+    try:
+        while True:
+            frame_bytes = process.stdout.read(frame_size)
+
+            if len(frame_bytes) < frame_size:
+                break
+
+            image_file = io.BytesIO()
+            Image.frombuffer("RGB", (width, height), frame_bytes).save(image_file, format="JPEG", quality=THUMBNAIL_JPEG_QUALITY)
+            images.append(image_file.getvalue())
+    finally:
+        _finish_ffmpeg_pipe(process, source_path)
+
+    # The fps filter stops at the last keyframe, the thumbnails after it repeat that keyframe
+    if duration and images:
+        thumbnail_count = int(np.ceil(duration / interval))
+        images = (images + [images[-1]] * thumbnail_count)[:thumbnail_count]
+
+    offsets = np.zeros(len(images) + 1, dtype="<u8")
+    offsets[1:] = np.cumsum([len(image) for image in images])
+
+    ensure_directory_exists(sidecar_pathname)
+
+    with atomic_output_file(sidecar_pathname) as partial_file_pathname:
+        with open(partial_file_pathname, "wb") as sidecar_file:
+            sidecar_file.write(THUMBNAILS_HEADER.pack(THUMBNAILS_MAGIC, SIDECAR_VERSION, width, height, 0, interval, len(images)))
+            sidecar_file.write(offsets.tobytes())
+
+            for image in images:
+                sidecar_file.write(image)
+
+    return len(images)
+
+
+def extract_audio_peaks(source_path: str, sidecar_pathname: str, peaks_per_second: float) -> int:
+    """
+    Extracts the min/max sample of every 1/peaks_per_second of audio into a
+    peak sidecar. Audio is decoded to mono and reduced block by block, so memory
+    use does not depend on the source length.
+
+    :return: The number of peaks.
+    """
+    samples_per_peak = max(1, int(round(PEAKS_SAMPLE_RATE / peaks_per_second)))
+    block_size = samples_per_peak * 4096
+
+    cmd = [
+        FFMPEG_BINARY, "-loglevel", "error",
+        "-i", source_path,
+        "-vn", "-sn",
+        "-ac", "1", "-ar", str(PEAKS_SAMPLE_RATE),
+        "-f", "f32le", "-",
+    ]
+
+    peak_blocks = []
+    process = _open_ffmpeg_pipe(cmd)
+
+    try:
+        while True:
+            block_bytes = process.stdout.read(block_size * 4)
+
+            if len(block_bytes) == 0:
+                break
+
+            samples = np.frombuffer(block_bytes[:len(block_bytes) // 4 * 4], dtype="<f4")
+
+            # Only the last block can end with a partial peak, pad it with silence
+            padding = -len(samples) % samples_per_peak
+            samples = np.pad(samples, (0, padding)).reshape(-1, samples_per_peak)
+
+            block_peaks = np.stack([samples.min(axis=1), samples.max(axis=1)], axis=1)
+            peak_blocks.append(np.round(np.clip(block_peaks, -1.0, 1.0) * 32767).astype("<i2"))
+    finally:
+        _finish_ffmpeg_pipe(process, source_path)
+
+    peaks = np.concatenate(peak_blocks) if peak_blocks else np.zeros((0, 2), dtype="<i2")
+
+    ensure_directory_exists(sidecar_pathname)
+
+    with atomic_output_file(sidecar_pathname) as partial_file_pathname:
+        with open(partial_file_pathname, "wb") as sidecar_file:
+            sidecar_file.write(PEAKS_HEADER.pack(PEAKS_MAGIC, SIDECAR_VERSION, peaks_per_second, len(peaks)))
+            sidecar_file.write(peaks.tobytes())
+
+    return len(peaks)
+
+
+def _index_source(source_path: str, index_settings: Dict, executor: ThreadPoolExecutor) -> Dict[str, Any]:
+    """Fingerprints a source and queues the extraction of its missing sidecars."""
+    fingerprint = source_fingerprint(source_path)
+    thumbnails_pathname, peaks_pathname = get_sidecar_pathnames(index_settings["path"], fingerprint)
+    infos = ffmpeg_parse_infos(source_path)
+
+    entry = {
+        "path": source_path,
+        "fingerprint": fingerprint,
+        "duration": infos.get("duration"),
+        "thumbnails": None,
+        "peaks": None,
+    }
+
+    interval = index_settings["thumbnail_interval_seconds"]
+    height = index_settings["thumbnail_height"]
+    peaks_per_second = index_settings["peaks_per_second"]
+
+    if infos.get("video_found") and infos.get("video_size"):
+        entry["thumbnails"] = thumbnails_pathname
+
+        if not thumbnails_are_current(thumbnails_pathname, interval, height):
+            entry["thumbnails_task"] = executor.submit(extract_thumbnails, source_path, thumbnails_pathname, infos["video_size"], infos.get("duration"), interval, height)
+
+    if infos.get("audio_found"):
+        entry["peaks"] = peaks_pathname
+
+        if not peaks_are_current(peaks_pathname, peaks_per_second):
+            entry["peaks_task"] = executor.submit(extract_audio_peaks, source_path, peaks_pathname, peaks_per_second)
+
+    return entry
+
+
+def build_media_index(source_paths: List[str], index_settings: Dict, workers: Union[int, None] = None) -> List[Dict[str, Any]]:
+    """
+    Builds the thumbnail and peak sidecars of the given sources.
+
+    Sidecars are keyed by the source fingerprint, so they are shared by every
+    assembly that uses a source and survive the source being moved. Sources
+    whose sidecars are current are skipped. Extraction runs in ffmpeg processes,
+    several at a time.
+
+    :param index_settings: See get_media_index_settings().
+    :param workers: Number of sidecars extracted at the same time (default: as many
+                    as the resource governor allows).
+    :return: One entry per source with its fingerprint and sidecar pathnames.
+    """
+    entries = []
+    extracted_count = 0
+
+    with ThreadPoolExecutor(max_workers=allocate_worker_count(requested=workers)) as executor:
+        for source_path in source_paths:
+            if not os.path.isfile(source_path):
+                print(f"Media index: skipping missing file '{source_path}'", file=sys.stderr)
+                continue
+
+            entries.append(_index_source(source_path, index_settings, executor))
+
+        for entry in entries:
+            for task_key in ("thumbnails_task", "peaks_task"):
+                if task_key in entry:
+                    entry.pop(task_key).result()
+                    extracted_count += 1
+
+    print(f"Media index: {len(entries)} sources, {extracted_count} sidecars extracted, index at '{index_settings['path']}'", file=sys.stderr)
+
+    return entries
+
+
+def index_video_assembly(video_assembly: Dict, workers: Union[int, None] = None) -> List[Dict[str, Any]]:
+    """Builds the media index of every source referenced by a video assembly."""
+    settings = video_assembly.get("composeflow.org", {}).get("settings", {})
+
+    return build_media_index(collect_referenced_sources(video_assembly), get_media_index_settings(settings), workers)
+
+
+def read_thumbnails(sidecar_pathname: str, start_time: float = 0.0, end_time: Union[float, None] = None) -> Dict[str, Any]:
+    """
+    Reads the thumbnails between start_time and end_time from a thumbnail sidecar.
+
+    The sidecar is memory-mapped, so only the requested images are read.
+
+    :return: The thumbnail size and interval, and a list of (time, JPEG bytes).
+    """
+    with open(sidecar_pathname, "rb") as sidecar_file:
+        with mmap.mmap(sidecar_file.fileno(), 0, access=mmap.ACCESS_READ) as sidecar:
+            _, _, width, height, _, interval, count = THUMBNAILS_HEADER.unpack_from(sidecar, 0)
+            offsets = np.frombuffer(sidecar, dtype="<u8", count=count + 1, offset=THUMBNAILS_HEADER.size)
+            data_start = THUMBNAILS_HEADER.size + offsets.nbytes
+
+            first_index = max(0, int(start_time // interval))
+            end_index = count if end_time is None else min(count, int(np.ceil(end_time / interval)))
+
+            thumbnails = [
+                (index * interval, sidecar[data_start + int(offsets[index]):data_start + int(offsets[index + 1])])
+                for index in range(first_index, end_index)
+            ]
+
+            # The offsets view must be released before the map can close
+            del offsets
+
+    return {"width": width, "height": height, "interval": interval, "thumbnails": thumbnails}
+
+
+def read_audio_peaks(
+    sidecar_pathname: str, start_time: float = 0.0, end_time: Union[float, None] = None, bucket_count: Union[int, None] = None
+) -> Dict[str, Any]:
+    """
+    Reads the audio peaks between start_time and end_time from a peak sidecar.
+
+    :param bucket_count: Optional number of (min, max) pairs to reduce the range
+                         to, e.g. the pixel width of the timeline clip.
+    :return: The peak resolution and an int16 array of (min, max) pairs.
+    """
+    _, _, peaks_per_second, count = _read_peaks_header(sidecar_pathname)
+
+    if count == 0:
+        return {"peaks_per_second": peaks_per_second, "peaks": np.zeros((0, 2), dtype="<i2")}
+
+    peaks = np.memmap(sidecar_pathname, dtype="<i2", mode="r", offset=PEAKS_HEADER.size, shape=(count, 2))
+
+    first_index = max(0, int(start_time * peaks_per_second))
+    end_index = count if end_time is None else min(count, int(np.ceil(end_time * peaks_per_second)))
+    peaks = peaks[first_index:max(first_index, end_index)]
+
+    if bucket_count and 0 < bucket_count < len(peaks):
+        bucket_starts = np.linspace(0, len(peaks), bucket_count, endpoint=False).astype(np.int64)
+        peaks = np.stack([np.minimum.reduceat(peaks[:, 0], bucket_starts), np.maximum.reduceat(peaks[:, 1], bucket_starts)], axis=1)
+        peaks_per_second = peaks_per_second * bucket_count / (end_index - first_index)
+
+    return {"peaks_per_second": peaks_per_second, "peaks": np.array(peaks)}
+
+
+def get_source_sidecar_pathnames(source_path: str, index_path: str) -> Tuple[str, str]:
+    return get_sidecar_pathnames(index_path, source_fingerprint(source_path))
+
+
+def load_json(file_path: str) -> Dict:
+    with open(file_path, "r") as file:
+        return json.load(file)
+
+
+def parse_command_line() -> argparse.Namespace:
+    """Parse the command-line arguments."""
+    parser = argparse.ArgumentParser(description="Build and query the thumbnail and audio peak index of media sources.")
+    parser.add_argument("--index-path", default=None, help="Directory of the sidecar files.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    build_parser = subparsers.add_parser("build", help="Index every source referenced by a video assembly.")
+    build_parser.add_argument("video_assembly_file", help="Path to the video assembly JSON file.")
+    build_parser.add_argument("--workers", type=int, default=None, help="Number of sidecars extracted at the same time.")
+
+    for command, help_text in (("thumbnails", "Print the thumbnails of a time range."), ("peaks", "Print the audio peaks of a time range.")):
+        range_parser = subparsers.add_parser(command, help=help_text)
+        range_parser.add_argument("source_file", help="Path to the indexed media file.")
+        range_parser.add_argument("--start", type=float, default=0.0, help="Start time in seconds.")
+        range_parser.add_argument("--end", type=float, default=None, help="End time in seconds.")
+
+        if command == "peaks":
+            range_parser.add_argument("--buckets", type=int, default=None, help="Reduce the range to this many (min, max) pairs.")
+
+    return parser.parse_args()
+
+
+def main():
+    args = parse_command_line()
+
+    if args.command == "build":
+        video_assembly = load_json(args.video_assembly_file)
+
+        if args.index_path:
+            video_assembly.setdefault("composeflow.org", {}).setdefault("settings", {}).setdefault("media_index", {})["path"] = args.index_path
+
+        result = index_video_assembly(video_assembly, args.workers)
+    else:
+        thumbnails_pathname, peaks_pathname = get_source_sidecar_pathnames(args.source_file, args.index_path or DEFAULT_MEDIA_INDEX_PATH)
+
+        if args.command == "thumbnails":
+            result = read_thumbnails(thumbnails_pathname, args.start, args.end)
+            result["thumbnails"] = [
+                {"time": time, "jpeg_base64": base64.b64encode(image).decode("ascii")}
+                for time, image in result["thumbnails"]
+            ]
+        else:
+            result = read_audio_peaks(peaks_pathname, args.start, args.end, args.buckets)
+            result["peaks"] = result["peaks"].tolist()
+
+    # JSON on stdout for the editor, progress goes to stderr
+    json.dump(result, sys.stdout)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,162 @@
+import os
+import json
+import time
+import hashlib
+import subprocess as sp
+
+from typing import Any, Dict
+from moviepy.config import FFMPEG_BINARY
+from moviepy.tools import cross_platform_popen_params
+from video_utility import atomic_output_file, ensure_directory_exists, video_file_exists
+from video_assembly_helper import SCENE_LABEL_KEYS, collect_media_paths, get_file_signature
+from image_ops import get_image_ops_backend
+from overlay_animation import has_keyframe_animation
+from resource_governor import allocate_threads, lease
+
+DEFAULT_MEZZANINE_CACHE_PATH = os.path.join(os.path.expanduser("~"), ".composeflow", "mezzanine")
+DEFAULT_MEZZANINE_CODEC = "libx264"
+DEFAULT_MEZZANINE_FPS = 30
+
+# Intermediate codecs, both without chroma subsampling: lossless 4:4:4 H.264 is
+# fast to write and read, off the RGB frames only by the YUV conversion's
+# rounding; FFV1 stores the RGB planes exactly, at a higher cost
+MEZZANINE_RENDER_SETTINGS = {
+    "libx264": {"codec": "libx264", "quality_preset": "ultrafast", "ffmpeg_params": ["-qp", "0"], "pixel_format": "yuv444p"},
+    "ffv1": {"codec": "ffv1", "quality_preset": "medium", "ffmpeg_params": ["-level", "3", "-slices", "4"], "pixel_format": "gbrp"},
+}
+
+# The mezzanine cache settings of the cut being rendered
+_mezzanine_cache: Dict[str, Any] = {
+    "enabled": False,
+    "path": DEFAULT_MEZZANINE_CACHE_PATH,
+    "codec": DEFAULT_MEZZANINE_CODEC,
+    "fps": None,
+}
+
+
+def configure_mezzanine_cache(settings: Dict) -> None:
+    """
+    Reads the mezzanine cache options from the video assembly settings.
+
+    Settings:
+        "mezzanine_cache": {
+            "enabled": false,
+            "path": Directory of the cache (default ~/.composeflow/mezzanine).
+            "codec": "libx264" (lossless H.264, default) or "ffv1".
+            "fps": Frame rate of the mezzanines (default: the scene's own frame rate).
+        }
+    """
+    mezzanine_cache = settings.get("mezzanine_cache", {})
+
+    codec = mezzanine_cache.get("codec", DEFAULT_MEZZANINE_CODEC)
+
+    if codec not in MEZZANINE_RENDER_SETTINGS:
+        raise ValueError(f"Unknown mezzanine codec '{codec}', use one of {sorted(MEZZANINE_RENDER_SETTINGS)}.")
+
+    _mezzanine_cache["enabled"] = mezzanine_cache.get("enabled", False)
+    _mezzanine_cache["path"] = mezzanine_cache.get("path") or DEFAULT_MEZZANINE_CACHE_PATH
+    _mezzanine_cache["codec"] = codec
+    _mezzanine_cache["fps"] = mezzanine_cache.get("fps")
+
+
+def is_mezzanine_cache_enabled() -> bool:
+    return bool(_mezzanine_cache["enabled"])
+
+
+def get_mezzanine_key(scene: Dict, target: Dict, source_file_watermark: bool) -> str:
+    """
+    Returns a key over everything that decides a scene's composited frames: the
+    scene, the target's framing (and frame rate, for keyframed overlays), the
+    watermark and the media files. Encoder settings are left out, so every
+    delivery profile of the same framing shares one mezzanine.
+    """
+    content_description = {
+        "scene": {key: value for key, value in scene.items() if key not in SCENE_LABEL_KEYS},
+        "aspect_ratio": target["aspect_ratio"],
+        "resolution": target["resolution"],
+        "source_file_watermark": source_file_watermark,
+        "image_ops_backend": get_image_ops_backend(),
+        "files": sorted((path, get_file_signature(path)) for path in collect_media_paths(scene)),
+        "mezzanine_render_settings": MEZZANINE_RENDER_SETTINGS[_mezzanine_cache["codec"]],
+        "mezzanine_fps": _mezzanine_cache["fps"],
+    }
+
+    # Keyframed overlays are computed at the target's frame rate, not the mezzanine's
+    if has_keyframe_animation(scene):
+        content_description["fps"] = target["render_settings"].get("fps")
+
+    # Still images are loaded at a lower quality for quick renders
+    if scene.get("timeline_clip_type", "video").lower() == "image":
+        content_description["quick_and_dirty"] = target["quick_and_dirty"]
+
+    return hashlib.sha256(json.dumps(content_description, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+
+
+def get_mezzanine_file_pathname(mezzanine_key: str) -> str:
+    return os.path.join(_mezzanine_cache["path"], mezzanine_key[:2], f"{mezzanine_key}.mkv")
+
+
+def get_mezzanine_render_settings(clip) -> Dict[str, Any]:
+    """
+    Returns the render settings writing a scene clip to its mezzanine, at the
+    scene's own frame rate so any delivery frame rate can be derived from it.
+    """
+    render_settings = dict(MEZZANINE_RENDER_SETTINGS[_mezzanine_cache["codec"]])
+    render_settings["fps"] = _mezzanine_cache["fps"] or getattr(clip, "fps", None) or DEFAULT_MEZZANINE_FPS
+    render_settings["audio"] = {"codec": "pcm_s16le"}
+
+    return render_settings
+
+
+def mezzanine_exists(mezzanine_file_pathname: str) -> bool:
+    if not video_file_exists(mezzanine_file_pathname):
+        return False
+
+    # The access time keeps recently used mezzanines when the cache is trimmed by age
+    os.utime(mezzanine_file_pathname)
+
+    return True
+
+
+def encode_from_mezzanine(mezzanine_file_pathname: str, output_file_pathname: str, render_settings: Dict) -> None:
+    """
+    Encodes a delivery output from a scene's mezzanine, with the same codec,
+    preset, frame rate and parameters write_video() would use.
+    """
+    codec = render_settings.get("codec", "libx264")
+    audio_codec = render_settings.get("audio", {}).get("codec", "aac")
+
+    cmd = [FFMPEG_BINARY, "-y", "-loglevel", "error", "-i", mezzanine_file_pathname]
+
+    # Without a profile frame rate the mezzanine's own is kept, see video_utility.get_render_fps()
+    if render_settings.get("fps"):
+        cmd.extend(["-r", "%.02f" % render_settings["fps"]])
+
+    cmd.extend([
+        "-vcodec", codec,
+        "-preset", render_settings.get("quality_preset", "medium"),
+    ])
+
+    if render_settings.get("ffmpeg_params"):
+        cmd.extend(render_settings["ffmpeg_params"])
+
+    threads = render_settings.get("threads") or allocate_threads()
+    cmd.extend(["-threads", str(threads)])
+
+    if codec == "libx264":
+        cmd.extend(["-pix_fmt", "yuv420p"])
+
+    ensure_directory_exists(output_file_pathname)
+    start_time = time.time()
+
+    with lease(threads), atomic_output_file(output_file_pathname) as partial_file_pathname:
+        cmd.extend(["-acodec", audio_codec, partial_file_pathname])
+
+        process = sp.run(cmd, **cross_platform_popen_params({"stdout": sp.DEVNULL, "stderr": sp.PIPE}))
+
+        if process.returncode != 0:
+            raise IOError(
+                f"Encoding '{output_file_pathname}' from its mezzanine failed:\n{process.stderr.decode(errors='replace')}"
+            )
+
+    print(f"Encoded '{output_file_pathname}' from its mezzanine in {time.time() - start_time:.2f}s.")
@@ -0,0 +1,145 @@
+import copy
+
+from typing import Any, Dict, List
+from video_utility import get_output_resolution
+from abr_ladder_utility import get_abr_ladder
+
+
+def get_render_profile(render_output: Dict[str, Any], quick_and_dirty: bool) -> Dict[str, Any]:
+    """
+    Returns the render profile (quick or high quality) selected for this run.
+
+    :param render_output: The cut's "render_output" dictionary.
+    :param quick_and_dirty: True to select the "quick_render" profile.
+    :return: The render profile dictionary.
+    """
+    if quick_and_dirty:
+        return render_output["quick_render"]
+    else:
+        return render_output["high_quality_render"]
+
+
+def get_output_targets(render_output: Dict[str, Any], quick_and_dirty: bool) -> List[Dict[str, Any]]:
+    """
+    Builds the list of output targets to render in a single pass.
+
+    A cut can declare several targets under "render_output.output_targets", e.g.:
+
+        "output_targets": [
+            {"name": "landscape", "aspect_ratio": "16:9"},
+            {"name": "vertical", "aspect_ratio": "9:16"},
+            {"name": "square_hq", "aspect_ratio": "1:1", "profile": "high_quality_render"}
+        ]
+
+    "profile" selects "quick_render" or "high_quality_render" and defaults to the
+    profile chosen by the quick_and_dirty setting. A target may set its own
+    "width" or "height", otherwise the profile's are used; with neither the
+    target keeps the source resolution. A target's cut can also be packaged
+    as an HLS ABR ladder, see abr_ladder_utility.get_abr_ladder(). When no targets are declared,
+    a single target is built from "render_output.aspect_ratio" so existing
+    video assemblies render exactly as before.
+
+    :param render_output: The cut's "render_output" dictionary.
+    :param quick_and_dirty: The quick_and_dirty setting of the run.
+    :return: A list of target dictionaries with the keys "name", "label",
+             "aspect_ratio", "resolution", "quick_and_dirty", "profile",
+             "render_settings" and "abr_ladder".
+    """
+    default_profile_key = "quick_render" if quick_and_dirty else "high_quality_render"
+    declared_targets = render_output.get("output_targets") or [{}]
+
+    output_targets = []
+    names = set()
+    labels = set()
+
+    for declared_target in declared_targets:
+        profile_key = declared_target.get("profile", default_profile_key)
+        profile = copy.deepcopy(render_output[profile_key])
+
+        aspect_ratio = (
+            declared_target.get("aspect_ratio")
+            or render_output.get("aspect_ratio")
+            or profile.get("aspect_ratio", "16:9")
+        )
+
+        # The label becomes part of the output file names
+        label = declared_target.get("name") or aspect_ratio
+        name = declared_target.get("name") or f"{aspect_ratio}_{profile_key}"
+
+        if name in names:
+            raise ValueError(f"Duplicate output target name: {name}")
+        names.add(name)
+
+        # Unnamed targets sharing an aspect ratio are told apart by their profile
+        if label in labels and not declared_target.get("name"):
+            label = name
+
+        if label in labels:
+            raise ValueError(f"Output target '{name}' would write the same files as another target, give it a different name.")
+        labels.add(label)
+
+        if "width" in declared_target or "height" in declared_target:
+            profile["width"] = declared_target.get("width")
+            profile["height"] = declared_target.get("height")
+
+        resolution = get_output_resolution(aspect_ratio, profile.get("width"), profile.get("height"))
+
+        if resolution is not None:
+            # write_video resizes to the profile's width, keep it consistent with the rounding
+            profile["width"], profile["height"] = resolution
+
+        render_settings = copy.deepcopy(profile.get("render_settings", {}))
+        render_settings.update(declared_target.get("render_settings", {}))
+
+        output_targets.append({
+            "name": name,
+            "label": label,
+            "aspect_ratio": aspect_ratio,
+            "resolution": resolution,
+            "quick_and_dirty": profile_key == "quick_render",
+            "profile": profile,
+            "render_settings": render_settings,
+            "abr_ladder": get_abr_ladder(render_output, declared_target),
+        })
+
+    return output_targets
+
+
+def get_cut_render_settings(target: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Returns the render settings of a target's cut: the target's render
+    settings, as its scenes are encoded with, at the profile's frame rate
+    unless the target sets its own.
+    """
+    render_settings = dict(target["render_settings"])
+
+    if render_settings.get("fps") is None:
+        render_settings["fps"] = target["profile"].get("fps")
+
+    return render_settings
+
+
+def resolve_target_overrides(meta: Dict[str, Any], target: Dict[str, Any] = None) -> Dict[str, Any]:
+    """
+    Applies per-target overrides to an overlay definition.
+
+    An overlay may position itself differently for each output target:
+
+        "targets": {"vertical": {"position": {"type": "preset", "value": "top"}, "width": 600}}
+
+    :param meta: The overlay dictionary from the video assembly.
+    :param target: The output target being rendered, or None.
+    :return: The overlay dictionary to use for this target.
+    """
+    if target is None:
+        return meta
+
+    overrides = meta.get("targets", {}).get(target["name"])
+
+    if not overrides:
+        return meta
+
+    resolved_meta = dict(meta)
+    resolved_meta.update(overrides)
+
+    return resolved_meta
@@ -0,0 +1,184 @@
+import numpy as np
+
+from typing import Callable, Dict, List, Tuple, Union
+
+# Easing curves, each mapping the progress between two keyframes (0 to 1) to
+# the share of the change applied. An easing set on a keyframe shapes the
+# move from that keyframe to the next.
+EASINGS: Dict[str, Callable[[np.ndarray], np.ndarray]] = {
+    "linear": lambda u: u,
+    "hold": lambda u: np.zeros_like(u),
+    "ease_in": lambda u: u ** 3,
+    "ease_out": lambda u: 1.0 - (1.0 - u) ** 3,
+    "ease_in_out": lambda u: np.where(u < 0.5, 4.0 * u ** 3, 1.0 - (2.0 - 2.0 * u) ** 3 / 2.0),
+}
+
+DEFAULT_EASING = "linear"
+
+
+class OverlayAnimation:
+    """
+    The position and opacity of an overlay at every output frame, computed
+    once when the clip is set up.
+
+    Rendering a frame at time t only looks up frame round(t * fps) in the
+    arrays; times past the end hold the last frame.
+    """
+
+    def __init__(self, fps: float, x: Union[np.ndarray, None], y: Union[np.ndarray, None], opacity: Union[np.ndarray, None]):
+        """
+        :param x: The overlay's left edge in pixels per frame, None if it does not move.
+        :param y: The overlay's top edge in pixels per frame, None if it does not move.
+        :param opacity: The overlay's opacity (0 to 1) per frame, None if it does not fade.
+        """
+        self.fps = fps
+        self.x = x
+        self.y = y
+        self.opacity = opacity
+        self.frame_count = max(len(track) for track in (x, y, opacity) if track is not None)
+
+    @property
+    def moves(self) -> bool:
+        return self.x is not None
+
+    def frame_index(self, t: float) -> int:
+        return min(max(int(round(t * self.fps)), 0), self.frame_count - 1)
+
+    def position(self, t: float) -> Tuple[int, int]:
+        frame_index = self.frame_index(t)
+        return int(self.x[frame_index]), int(self.y[frame_index])
+
+    def opacity_at(self, t: float) -> float:
+        if self.opacity is None:
+            return 1.0
+        return float(self.opacity[self.frame_index(t)])
+
+
+def has_keyframe_animation(node) -> bool:
+    """Returns True if an overlay found in a part of the assembly, e.g. a scene, has keyframed position or opacity."""
+    if isinstance(node, dict):
+        if node.get("position", {}).get("type") == "keyframes" or isinstance(node.get("opacity"), list):
+            return True
+
+        return any(has_keyframe_animation(value) for value in node.values())
+
+    if isinstance(node, list):
+        return any(has_keyframe_animation(item) for item in node)
+
+    return False
+
+
+def get_frame_times(duration: float, fps: float) -> np.ndarray:
+    """Returns the time of every frame rendered for a clip, and one past its end."""
+    return np.arange(int(duration * fps) + 2, dtype=np.float64) / fps
+
+
+def compile_keyframe_track(keyframes: List[Dict], field: str, frame_times: np.ndarray, scale: float = 1.0) -> Union[np.ndarray, None]:
+    """
+    Interpolates one field of a keyframe list at every frame time.
+
+    Keyframes without the field are skipped, so position and opacity keyframes
+    can be mixed in one list. Before the first keyframe the track holds its
+    value, and likewise after the last one.
+
+    :param keyframes: [{"time": seconds, field: value, "easing": name}, ...]
+    :param scale: Factor applied to the values, e.g. to rescale pixel positions.
+    :return: The value per frame, or None if no keyframe sets the field.
+    """
+    track_keyframes = sorted((keyframe for keyframe in keyframes if field in keyframe), key=lambda keyframe: float(keyframe.get("time", 0)))
+
+    if not track_keyframes:
+        return None
+
+    key_times = np.array([float(keyframe.get("time", 0)) for keyframe in track_keyframes])
+    key_values = np.array([float(keyframe[field]) * scale for keyframe in track_keyframes])
+
+    if len(track_keyframes) == 1:
+        return np.full(len(frame_times), key_values[0])
+
+    # The keyframe each frame moves away from, and its progress towards the next one
+    segment_indexes = np.clip(np.searchsorted(key_times, frame_times, side="right") - 1, 0, len(key_times) - 2)
+    start_times = key_times[segment_indexes]
+    segment_seconds = key_times[segment_indexes + 1] - start_times
+    progress = np.clip((frame_times - start_times) / np.where(segment_seconds > 0, segment_seconds, 1.0), 0.0, 1.0)
+    progress[segment_seconds <= 0] = 1.0
+
+    eased_progress = np.empty_like(progress)
+
+    for segment_index, keyframe in enumerate(track_keyframes[:-1]):
+        easing_name = keyframe.get("easing", DEFAULT_EASING)
+
+        if easing_name not in EASINGS:
+            raise ValueError(f"Unknown overlay easing '{easing_name}', expected one of {tuple(EASINGS)}")
+
+        in_segment = segment_indexes == segment_index
+        eased_progress[in_segment] = EASINGS[easing_name](progress[in_segment])
+
+    start_values = key_values[segment_indexes]
+    values = start_values + (key_values[segment_indexes + 1] - start_values) * eased_progress
+
+    # The last keyframe is reached whatever the easing into it, e.g. "hold" jumps to it
+    values[frame_times >= key_times[-1]] = key_values[-1]
+
+    return values
+
+
+def compile_overlay_animation(image_meta: Dict, video_size: Tuple[int, int], duration: float, fps: float, scale: float = 1.0) -> Union[OverlayAnimation, None]:
+    """
+    Compiles the animated position and opacity of an overlay into per-frame arrays.
+
+    Overlay JSON:
+        "position": {
+            "type": "keyframes",
+            "relative": false,   # true if x and y are fractions of the frame size
+            "value": [
+                {"time": 0, "x": 40, "y": 900, "easing": "ease_out"},
+                {"time": 1.5, "x": 40, "y": 40}
+            ]
+        },
+        "opacity": 0.8, or a keyframe list [{"time": 0, "value": 0}, {"time": 0.5, "value": 1}]
+
+    Absolute keyframe positions are scaled by scale like "absolute" positions.
+
+    :return: The animation, or None if the overlay neither moves nor fades.
+    """
+    position_data = image_meta.get("position", {})
+    position_type = position_data.get("type")
+    opacity_data = image_meta.get("opacity")
+
+    if position_type != "keyframes" and opacity_data is None:
+        return None
+
+    frame_times = get_frame_times(duration, fps)
+    x = y = opacity = None
+
+    if position_type == "keyframes":
+        if position_data.get("relative", False):
+            x = compile_keyframe_track(position_data["value"], "x", frame_times, video_size[0])
+            y = compile_keyframe_track(position_data["value"], "y", frame_times, video_size[1])
+        else:
+            x = compile_keyframe_track(position_data["value"], "x", frame_times, scale)
+            y = compile_keyframe_track(position_data["value"], "y", frame_times, scale)
+
+        if x is None or y is None:
+            raise ValueError("Keyframe overlay positions need an x and a y keyframe")
+
+    if isinstance(opacity_data, list):
+        opacity = compile_keyframe_track(opacity_data, "value", frame_times)
+
+        if opacity is not None:
+            opacity = np.clip(opacity, 0.0, 1.0)
+    elif opacity_data is not None:
+        opacity = np.full(len(frame_times), min(max(float(opacity_data), 0.0), 1.0))
+
+    if x is not None:
+        x = np.round(x).astype(np.int32)
+        y = np.round(y).astype(np.int32)
+
+    if opacity is not None:
+        opacity = opacity.astype(np.float32)
+
+    if x is None and opacity is None:
+        return None
+
+    return OverlayAnimation(fps, x, y, opacity)
@@ -0,0 +1,282 @@
+import os
+import threading
+
+from typing import Any, Dict, List, Tuple, Union
+from concurrent.futures import ThreadPoolExecutor
+from video_utility import probe_media_source
+from clip_utility import get_clip_trim_seconds
+from staging_cache import resolve_source_path
+from render_metrics import record_source_read
+
+DEFAULT_PREFETCH_SCENES = 2
+DEFAULT_PREFETCH_WINDOW_MB = 1024
+DEFAULT_PREFETCH_THREADS = 2
+
+# Size of the sequential reads pulling sources into the OS cache
+PREFETCH_READ_SIZE = 4 * 1024 * 1024
+
+# Also read this far before a trim start, so the keyframe ffmpeg seeks back to is cached too
+PREFETCH_LEAD_SECONDS = 5.0
+
+# The prefetch settings of the cut being rendered
+_prefetch: Dict[str, Any] = {
+    "enabled": True,
+    "scenes": DEFAULT_PREFETCH_SCENES,
+    "window_mb": DEFAULT_PREFETCH_WINDOW_MB,
+    "threads": DEFAULT_PREFETCH_THREADS,
+}
+
+
+def configure_prefetch(settings: Dict) -> None:
+    """
+    Reads the prefetch options from the video assembly settings.
+
+    Settings:
+        "prefetch": {
+            "enabled": true,
+            "scenes": Number of scenes prefetched ahead of the one rendering (default 2).
+            "window_mb": Source bytes read ahead at most (default 1024).
+            "threads": Background threads reading ahead (default 2).
+        }
+    """
+    prefetch = settings.get("prefetch", {})
+
+    _prefetch["enabled"] = prefetch.get("enabled", True)
+    _prefetch["scenes"] = int(prefetch.get("scenes", DEFAULT_PREFETCH_SCENES))
+    _prefetch["window_mb"] = prefetch.get("window_mb", DEFAULT_PREFETCH_WINDOW_MB)
+    _prefetch["threads"] = int(prefetch.get("threads", DEFAULT_PREFETCH_THREADS))
+
+
+def collect_overlay_paths(node) -> List[str]:
+    """Returns the image paths of every overlay in a part of the assembly."""
+    overlay_paths = []
+
+    if isinstance(node, dict):
+        for key, value in node.items():
+            if key == "overlay_images" and isinstance(value, list):
+                overlay_paths.extend(overlay["path"] for overlay in value if isinstance(overlay, dict) and overlay.get("path"))
+            else:
+                overlay_paths.extend(collect_overlay_paths(value))
+    elif isinstance(node, list):
+        for item in node:
+            overlay_paths.extend(collect_overlay_paths(item))
+
+    return overlay_paths
+
+
+def get_source_byte_range(clip: Dict) -> Tuple[int, int]:
+    """
+    Estimates the bytes of a video source a trimmed clip reads, from the trim
+    and the source's duration. The whole file when it cannot be probed.
+    """
+    file_size = os.path.getsize(clip["path"])
+
+    try:
+        duration = probe_media_source(clip["path"]).get("duration")
+    except Exception:
+        duration = None
+
+    if not duration:
+        return 0, file_size
+
+    start, end = get_clip_trim_seconds(clip)
+    bytes_per_second = file_size / duration
+
+    first_byte = int(max(0.0, start - PREFETCH_LEAD_SECONDS) * bytes_per_second)
+    end_byte = file_size if end is None else int(min(duration, end + 1.0) * bytes_per_second)
+
+    return first_byte, max(first_byte, end_byte)
+
+
+def get_scene_prefetch_plan(scene: Dict) -> Dict[str, Any]:
+    """
+    Returns what rendering a scene reads first: the byte ranges of its video
+    and audio sources, overlays and still images.
+
+    Images are only read, not decoded: they are decoded at the size they are
+    shown at when the scene renders, see image_helper.load_scaled_image_array().
+    """
+    timeline_clip_type = scene.get("timeline_clip_type", "video").lower()
+    byte_ranges = []
+    raster_paths = collect_overlay_paths(scene)
+
+    for clip in scene.get("timeline_clips", []):
+        if not clip.get("path") or not os.path.isfile(clip["path"]):
+            continue
+
+        if timeline_clip_type == "image":
+            raster_paths.append(clip["path"])
+        else:
+            first_byte, end_byte = get_source_byte_range(clip)
+            byte_ranges.append((clip["path"], first_byte, end_byte))
+
+    for audio_clip in scene.get("sequential_audio_clips", []):
+        if audio_clip.get("path") and os.path.isfile(audio_clip["path"]):
+            byte_ranges.append((audio_clip["path"], 0, os.path.getsize(audio_clip["path"])))
+
+    for raster_path in raster_paths:
+        if os.path.isfile(raster_path):
+            byte_ranges.append((raster_path, 0, os.path.getsize(raster_path)))
+
+    return {"byte_ranges": byte_ranges}
+
+
+class ScenePrefetcher:
+    """
+    Reads ahead the scenes after the one rendering, on background threads.
+
+    Rendering a scene starts by probing and opening its sources and decoding
+    its overlays, which stalls on slow drives while the CPU is idle. The
+    prefetcher does that work for the next scenes while the current one
+    encodes: the bytes its trims, overlays and still images read are pulled
+    into the OS cache with large sequential reads.
+
+    The source bytes read ahead are bounded by a window, taken by the scenes
+    in render order. A scene holds its share of the window until a later scene
+    starts rendering, and a scene that is reached before its turn in the window
+    comes is not prefetched at all.
+    """
+
+    def __init__(self, scenes: List[Tuple[Any, Dict]], scenes_ahead: int, window_bytes: int, threads: int):
+        """
+        :param scenes: The (key, scene) of every scene to render, in render order.
+        """
+        self.scenes = scenes
+        self.index_by_key = {key: index for index, (key, _) in enumerate(scenes)}
+        self.scenes_ahead = scenes_ahead
+        self.window_bytes = window_bytes
+        self.executor = ThreadPoolExecutor(max_workers=max(1, threads), thread_name_prefix="scene_prefetch")
+        self.condition = threading.Condition()
+        self.current_index = -1
+        self.scheduled_count = 0
+        self.next_reserve_index = 0
+        self.reserved_bytes = {}
+        self.closed = False
+
+    def advance(self, key) -> None:
+        """Marks the scene with key as rendering: earlier scenes leave the window, later ones are prefetched."""
+        index = self.index_by_key.get(key)
+
+        if index is None:
+            return
+
+        with self.condition:
+            self.current_index = max(self.current_index, index)
+
+            for reserved_index in [reserved_index for reserved_index in self.reserved_bytes if reserved_index < self.current_index]:
+                del self.reserved_bytes[reserved_index]
+
+            self.condition.notify_all()
+
+            first_index = max(self.scheduled_count, self.current_index + 1)
+            end_index = min(len(self.scenes), self.current_index + 1 + self.scenes_ahead)
+            self.scheduled_count = max(self.scheduled_count, end_index)
+
+        for scene_index in range(first_index, end_index):
+            self.executor.submit(self._prefetch_scene, scene_index)
+
+    def _can_reserve(self, index: int, byte_count: int) -> bool:
+        is_turn = index == max(self.next_reserve_index, self.current_index + 1)
+
+        return is_turn and sum(self.reserved_bytes.values()) + byte_count <= self.window_bytes
+
+    def _reserve(self, index: int, byte_count: int) -> bool:
+        """
+        Waits until it is the scene's turn and its bytes fit the window. False
+        if the scene no longer needs prefetching.
+        """
+        byte_count = min(byte_count, self.window_bytes)
+
+        with self.condition:
+            while self._is_wanted(index) and not self._can_reserve(index, byte_count):
+                self.condition.wait()
+
+            if not self._is_wanted(index):
+                return False
+
+            self.reserved_bytes[index] = byte_count
+            self.next_reserve_index = index + 1
+            self.condition.notify_all()
+
+        return True
+
+    def _pass_turn(self, index: int) -> None:
+        """Lets the next scene take its turn in the window when this one did not reserve it."""
+        with self.condition:
+            if self.next_reserve_index <= index:
+                self.next_reserve_index = index + 1
+                self.condition.notify_all()
+
+    def _is_wanted(self, index: int) -> bool:
+        return not self.closed and index > self.current_index
+
+    def _prefetch_scene(self, index: int) -> None:
+        _, scene = self.scenes[index]
+
+        try:
+            plan = get_scene_prefetch_plan(scene)
+
+            if not self._reserve(index, sum(end_byte - first_byte for _, first_byte, end_byte in plan["byte_ranges"])):
+                return
+
+            budget = self.reserved_bytes.get(index, 0)
+
+            for source_path, first_byte, end_byte in plan["byte_ranges"]:
+                # A staged source is read from its local copy, see staging_cache
+                read_path = resolve_source_path(source_path)
+
+                with open(read_path, "rb") as source_file:
+                    source_file.seek(first_byte)
+                    position = first_byte
+
+                    while position < end_byte and budget > 0:
+                        if not self._is_wanted(index):
+                            return
+
+                        data = source_file.read(min(PREFETCH_READ_SIZE, end_byte - position, budget))
+
+                        if not data:
+                            break
+
+                        position += len(data)
+                        budget -= len(data)
+                        record_source_read(read_path, len(data), "prefetch")
+        except Exception as e:
+            # Prefetching is only a hint, the render reads the sources itself
+            print(f"Prefetch of scene {index + 1} failed: {e!r}")
+        finally:
+            self._pass_turn(index)
+
+    def close(self) -> None:
+        with self.condition:
+            self.closed = True
+            self.condition.notify_all()
+
+        self.executor.shutdown(wait=True, cancel_futures=True)
+
+
+# The prefetcher of the cut being rendered
+_scene_prefetcher: Union[ScenePrefetcher, None] = None
+
+
+def open_scene_prefetch(scenes: List[Tuple[Any, Dict]]) -> None:
+    """Starts prefetching for the scenes of the cut being rendered, see ScenePrefetcher."""
+    global _scene_prefetcher
+
+    close_scene_prefetch()
+
+    if _prefetch["enabled"] and _prefetch["scenes"] > 0 and scenes:
+        _scene_prefetcher = ScenePrefetcher(scenes, _prefetch["scenes"], int(_prefetch["window_mb"] * 1024 * 1024), _prefetch["threads"])
+
+
+def advance_scene_prefetch(key) -> None:
+    if _scene_prefetcher is not None:
+        _scene_prefetcher.advance(key)
+
+
+def close_scene_prefetch() -> None:
+    global _scene_prefetcher
+
+    if _scene_prefetcher is not None:
+        _scene_prefetcher.close()
+        _scene_prefetcher = None
@@ -0,0 +1,142 @@
+import os
+import json
+import datetime
+
+from typing import Dict, Tuple, Union
+from fingerprint_utility import file_checksum
+from video_utility import video_file_exists, ensure_directory_exists
+
+
+class RenderJournal:
+    """
+    Append-only record of the render tasks (scenes and cuts) that completed.
+
+    Each line of the journal file is a JSON object with the task type, the
+    output file pathname, its size, modification time and SHA-256 checksum.
+    Lines are flushed and fsynced as soon as a task completes, so a crash or
+    cancellation never loses the record of work that finished before it.
+
+    In resume mode an existing output is only reused when the journal recorded
+    it and its size and checksum still match; anything else is rendered again.
+    The checksum is only recomputed when the file's modification time differs
+    from the recorded one, and then once per run. Without resume, existing
+    outputs are reused as before and the journal is only written.
+    """
+
+    def __init__(self, journal_file_pathname: str, resume: bool = False):
+        self.journal_file_pathname = journal_file_pathname
+        self.resume = resume
+        self.records: Dict[str, Dict] = {}
+        # (size, mtime_ns) of outputs whose checksum was verified during this run
+        self.verified_signatures: Dict[str, Tuple[int, int]] = {}
+
+        if os.path.isfile(journal_file_pathname):
+            self._load()
+
+    def _load(self) -> None:
+        with open(self.journal_file_pathname, "r", encoding="utf-8") as journal_file:
+            for line in journal_file:
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    # A crash while appending leaves at most one torn line
+                    continue
+
+                self.records[record["output"]] = record
+
+    def is_complete(self, output_file_pathname: str, and_is_newer_than=None) -> bool:
+        """
+        Returns True if the output can be reused instead of being rendered again.
+
+        :param output_file_pathname: The scene or cut output file.
+        :param and_is_newer_than: Optional timestamp the output must be newer than.
+        """
+        if not video_file_exists(output_file_pathname, and_is_newer_than):
+            return False
+
+        if not self.resume:
+            return True
+
+        output_file_pathname = os.path.abspath(output_file_pathname)
+        record = self.records.get(output_file_pathname)
+
+        if record is None:
+            return False
+
+        file_stat = os.stat(output_file_pathname)
+        signature = (file_stat.st_size, file_stat.st_mtime_ns)
+
+        if record["size"] != file_stat.st_size:
+            return False
+
+        # Untouched since it was recorded or verified, so the checksum still holds
+        if record.get("mtime_ns") == file_stat.st_mtime_ns or self.verified_signatures.get(output_file_pathname) == signature:
+            return True
+
+        if record["sha256"] != file_checksum(output_file_pathname):
+            return False
+
+        self.verified_signatures[output_file_pathname] = signature
+
+        return True
+
+    def record_complete(self, output_file_pathname: str, task: str) -> None:
+        """
+        Appends a completed task to the journal.
+
+        :param output_file_pathname: The output file that was written.
+        :param task: The task type, e.g. "scene" or "cut".
+        """
+        output_file_pathname = os.path.abspath(output_file_pathname)
+        file_stat = os.stat(output_file_pathname)
+
+        record = {
+            "task": task,
+            "output": output_file_pathname,
+            "size": file_stat.st_size,
+            "mtime_ns": file_stat.st_mtime_ns,
+            "sha256": file_checksum(output_file_pathname),
+            "completed_at": datetime.datetime.now().isoformat(timespec="seconds"),
+        }
+
+        self.records[output_file_pathname] = record
+
+        ensure_directory_exists(self.journal_file_pathname)
+
+        with open(self.journal_file_pathname, "a", encoding="utf-8") as journal_file:
+            journal_file.write(json.dumps(record) + "\n")
+            journal_file.flush()
+            os.fsync(journal_file.fileno())
+
+
+# The journal of the cut being rendered
+_render_journal: Union[RenderJournal, None] = None
+
+
+def open_render_journal(journal_file_pathname: str, resume: bool = False) -> RenderJournal:
+    """Opens the journal for the cut being rendered and makes it the active journal."""
+    global _render_journal
+
+    _render_journal = RenderJournal(journal_file_pathname, resume)
+
+    if resume:
+        print(f"Resuming from render journal: {journal_file_pathname} ({len(_render_journal.records)} completed tasks)")
+
+    return _render_journal
+
+
+def output_is_complete(output_file_pathname: str, and_is_newer_than=None) -> bool:
+    """
+    Checks an output against the active journal, or only its existence when no
+    journal is open.
+    """
+    if _render_journal is None:
+        return video_file_exists(output_file_pathname, and_is_newer_than)
+
+    return _render_journal.is_complete(output_file_pathname, and_is_newer_than)
+
+
+def record_output_complete(output_file_pathname: str, task: str) -> None:
+    """Records a completed output in the active journal, if one is open."""
+    if _render_journal is not None:
+        _render_journal.record_complete(output_file_pathname, task)
@@ -0,0 +1,400 @@
+import os
+import math
+import time
+import bisect
+import threading
+
+import psutil
+
+from typing import Any, Dict, Tuple, Union
+from functools import lru_cache
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+DEFAULT_METRICS_PATH = os.path.join(os.path.expanduser("~"), ".composeflow", "metrics", "render_metrics.prom")
+DEFAULT_METRICS_INTERVAL_SECONDS = 15
+DEFAULT_METRICS_HTTP_HOST = "127.0.0.1"
+
+METRIC_NAME_PREFIX = "composeflow_"
+OPENMETRICS_CONTENT_TYPE = "application/openmetrics-text; version=1.0.0; charset=utf-8"
+
+STAGE_SECONDS_BUCKETS = (0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600, 1800, 3600)
+
+# The type, help text and histogram buckets of every metric
+METRICS: Dict[str, Tuple[str, str, Union[Tuple, None]]] = {
+    "frames_decoded": ("counter", "Video frames decoded from sources and cached clips.", None),
+    "frames_encoded": ("counter", "Frames piped to video encoders.", None),
+    "encode_fps": ("gauge", "Frames per second of the last finished encode.", None),
+    "scenes_rendered": ("counter", "Scenes rendered for their output targets.", None),
+    "cache_hits": ("counter", "Lookups served from a cache.", None),
+    "cache_misses": ("counter", "Lookups a cache could not serve.", None),
+    "source_read_bytes": ("counter", "Bytes of media read per volume, estimated from the frames decoded for decoders.", None),
+    "stage_seconds": ("histogram", "Seconds per render stage.", STAGE_SECONDS_BUCKETS),
+    "open_readers": ("gauge", "ffmpeg processes decoding media for the render.", None),
+    "resident_memory_bytes": ("gauge", "Resident memory of the render process and of its worker and ffmpeg processes.", None),
+}
+
+# The metrics settings of the cut being rendered
+_render_metrics: Dict[str, Any] = {
+    "enabled": False,
+    "path": DEFAULT_METRICS_PATH,
+    "interval_seconds": DEFAULT_METRICS_INTERVAL_SECONDS,
+    "http_port": None,
+    "http_host": DEFAULT_METRICS_HTTP_HOST,
+    # Worker processes hand their metrics to the process that started them, see take_metrics()
+    "export": True,
+}
+
+# The values recorded in this process: counters and gauges keyed by
+# (name, labels), histograms as their bucket counts followed by their sum
+_metric_values: Dict[Tuple[str, Tuple], Any] = {}
+_metrics_lock = threading.Lock()
+
+
+def configure_render_metrics(settings: Dict) -> None:
+    """
+    Reads the metrics export options from the video assembly settings.
+
+    Settings:
+        "render_metrics": {
+            "enabled": false,
+            "path": OpenMetrics text file, rewritten at every export (default ~/.composeflow/metrics/render_metrics.prom).
+            "interval_seconds": Seconds between exports (default 15).
+            "http_port": Also serves the metrics at http://<http_host>:<http_port>/metrics (default: no server).
+            "http_host": Interface the server listens on (default 127.0.0.1).
+        }
+    """
+    render_metrics = settings.get("render_metrics", {})
+
+    _render_metrics["enabled"] = render_metrics.get("enabled", False)
+    _render_metrics["path"] = render_metrics.get("path") or DEFAULT_METRICS_PATH
+    _render_metrics["interval_seconds"] = render_metrics.get("interval_seconds", DEFAULT_METRICS_INTERVAL_SECONDS)
+    _render_metrics["http_port"] = render_metrics.get("http_port")
+    _render_metrics["http_host"] = render_metrics.get("http_host") or DEFAULT_METRICS_HTTP_HOST
+
+
+def get_render_metrics_settings() -> Dict[str, Any]:
+    """Returns the metrics settings, to configure worker processes alike."""
+    return dict(_render_metrics, export=False)
+
+
+def set_render_metrics_settings(render_metrics_settings: Dict[str, Any]) -> None:
+    """Worker: configures the metrics, starting over from the values a forked worker inherits."""
+    _render_metrics.update(render_metrics_settings)
+
+    with _metrics_lock:
+        _metric_values.clear()
+
+
+def get_metric_key(name: str, labels: Dict[str, Any]) -> Tuple[str, Tuple]:
+    return name, tuple(sorted((label, str(value)) for label, value in labels.items()))
+
+
+def increment_metric(name: str, value: float = 1, **labels) -> None:
+    if not _render_metrics["enabled"]:
+        return
+
+    metric_key = get_metric_key(name, labels)
+
+    with _metrics_lock:
+        _metric_values[metric_key] = _metric_values.get(metric_key, 0) + value
+
+
+def set_metric(name: str, value: float, **labels) -> None:
+    if not _render_metrics["enabled"]:
+        return
+
+    with _metrics_lock:
+        _metric_values[get_metric_key(name, labels)] = value
+
+
+def observe_metric(name: str, value: float, **labels) -> None:
+    """Adds a value to a histogram."""
+    if not _render_metrics["enabled"]:
+        return
+
+    buckets = METRICS[name][2]
+    metric_key = get_metric_key(name, labels)
+
+    with _metrics_lock:
+        # One count per bucket and one for +Inf, counted individually and made
+        # cumulative when formatted, followed by the sum
+        histogram = _metric_values.setdefault(metric_key, [0] * (len(buckets) + 2))
+        histogram[bisect.bisect_left(buckets, value)] += 1
+        histogram[-1] += value
+
+
+def record_cache_lookup(cache: str, hit: bool) -> None:
+    increment_metric("cache_hits" if hit else "cache_misses", cache=cache)
+
+
+@lru_cache(maxsize=None)
+def get_mount_point(directory: str) -> str:
+    while not os.path.ismount(directory):
+        parent_directory = os.path.dirname(directory)
+
+        if parent_directory == directory:
+            break
+
+        directory = parent_directory
+
+    return directory
+
+
+def get_source_volume(source_path: str) -> str:
+    """Returns the mount point of the volume a source is on, the volume label of its reads."""
+    return get_mount_point(os.path.dirname(os.path.abspath(source_path)))
+
+
+def record_source_read(source_path: str, byte_count: int, reader: str) -> None:
+    """
+    :param reader: What read the bytes: "decode", "prefetch" or "staging".
+    """
+    if _render_metrics["enabled"] and byte_count > 0:
+        increment_metric("source_read_bytes", byte_count, volume=get_source_volume(source_path), reader=reader)
+
+
+def count_decoded_frames(reader):
+    """
+    Counts the frames a MoviePy video reader decodes, including those it
+    skips over, and the source bytes they stand for.
+
+    ffmpeg reads the source itself, so the bytes are estimated from the
+    source's size per frame.
+    """
+    if not _render_metrics["enabled"]:
+        return reader
+
+    read_frame = reader.read_frame
+    skip_frames = reader.skip_frames
+
+    volume = get_source_volume(reader.filename)
+
+    try:
+        bytes_per_frame = os.path.getsize(reader.filename) / max(1, reader.n_frames)
+    except (OSError, TypeError):
+        bytes_per_frame = 0
+
+    def count_frames(frame_count):
+        increment_metric("frames_decoded", frame_count)
+        increment_metric("source_read_bytes", int(bytes_per_frame * frame_count), volume=volume, reader="decode")
+
+    def counted_read_frame():
+        count_frames(1)
+        return read_frame()
+
+    def counted_skip_frames(n=1):
+        count_frames(n)
+        return skip_frames(n)
+
+    reader.read_frame = counted_read_frame
+    reader.skip_frames = counted_skip_frames
+
+    return reader
+
+
+def take_metrics() -> Dict[Tuple[str, Tuple], Any]:
+    """
+    Worker: returns the metrics recorded since they were last taken and
+    starts over, so the worker's parent can add them with merge_metrics().
+    """
+    with _metrics_lock:
+        metric_values = dict(_metric_values)
+        _metric_values.clear()
+
+    return metric_values
+
+
+def merge_metrics(metric_values: Union[Dict[Tuple[str, Tuple], Any], None]) -> None:
+    """Adds the metrics a worker process took, see take_metrics()."""
+    if not metric_values:
+        return
+
+    with _metrics_lock:
+        for metric_key, value in metric_values.items():
+            metric_type = METRICS[metric_key[0]][0]
+
+            if metric_type == "gauge" or metric_key not in _metric_values:
+                _metric_values[metric_key] = list(value) if metric_type == "histogram" else value
+            elif metric_type == "histogram":
+                _metric_values[metric_key] = [total + added for total, added in zip(_metric_values[metric_key], value)]
+            else:
+                _metric_values[metric_key] += value
+
+
+def sample_process_metrics() -> None:
+    """
+    Samples the gauges of the render's process tree: resident memory, and the
+    ffmpeg readers decoding for this process and its workers.
+    """
+    process = psutil.Process()
+    children_rss = 0
+    open_readers = {"video": 0, "audio": 0}
+
+    for child in process.children(recursive=True):
+        try:
+            children_rss += child.memory_info().rss
+            cmdline = child.cmdline()
+        except (psutil.NoSuchProcess, psutil.AccessDenied):
+            continue
+
+        # MoviePy's readers pipe the decoded media to stdout
+        if cmdline and "ffmpeg" in os.path.basename(cmdline[0]) and cmdline[-1] == "-":
+            open_readers["video" if "image2pipe" in cmdline else "audio"] += 1
+
+    gauges = {
+        get_metric_key("resident_memory_bytes", {"process": "render"}): process.memory_info().rss,
+        get_metric_key("resident_memory_bytes", {"process": "children"}): children_rss,
+    }
+
+    for kind, count in open_readers.items():
+        gauges[get_metric_key("open_readers", {"kind": kind})] = count
+
+    # Set even if a later cut disabled the metrics, the export goes on
+    with _metrics_lock:
+        _metric_values.update(gauges)
+
+
+def escape_label_value(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+
+def format_labels(labels: Tuple) -> str:
+    if not labels:
+        return ""
+
+    return "{" + ",".join(f'{label}="{escape_label_value(value)}"' for label, value in labels) + "}"
+
+
+def format_openmetrics() -> str:
+    """Returns the metrics in the OpenMetrics text format."""
+    with _metrics_lock:
+        metric_values = dict((metric_key, list(value) if isinstance(value, list) else value) for metric_key, value in _metric_values.items())
+
+    lines = []
+
+    for name, (metric_type, help_text, buckets) in METRICS.items():
+        samples = sorted((metric_key[1], value) for metric_key, value in metric_values.items() if metric_key[0] == name)
+
+        if not samples:
+            continue
+
+        metric_name = METRIC_NAME_PREFIX + name
+        lines.append(f"# TYPE {metric_name} {metric_type}")
+        lines.append(f"# HELP {metric_name} {help_text}")
+
+        for labels, value in samples:
+            if metric_type == "counter":
+                lines.append(f"{metric_name}_total{format_labels(labels)} {value}")
+            elif metric_type == "gauge":
+                lines.append(f"{metric_name}{format_labels(labels)} {value}")
+            else:
+                cumulative_count = 0
+
+                for bound, bucket_count in zip(list(buckets) + [math.inf], value[:-1]):
+                    cumulative_count += bucket_count
+                    bound_text = "+Inf" if bound == math.inf else repr(float(bound))
+                    lines.append(f"{metric_name}_bucket{format_labels(labels + (('le', bound_text),))} {cumulative_count}")
+
+                lines.append(f"{metric_name}_count{format_labels(labels)} {cumulative_count}")
+                lines.append(f"{metric_name}_sum{format_labels(labels)} {value[-1]}")
+
+    lines.append("# EOF")
+
+    return "\n".join(lines) + "\n"
+
+
+class MetricsExporter:
+    """
+    Exports the metrics of this process and of the workers it started, every
+    interval_seconds to an OpenMetrics text file and, with an http_port, to
+    whoever asks for http://<http_host>:<http_port>/metrics.
+
+    The file is replaced in one step, so a collector never reads half of it.
+    """
+
+    def __init__(self, metrics_pathname: str, interval_seconds: float, http_host: str, http_port: Union[int, None]):
+        self.metrics_pathname = metrics_pathname
+        self.interval_seconds = max(1.0, float(interval_seconds))
+        self.lock = threading.Lock()
+        self.http_server = None
+
+        if http_port is not None:
+            try:
+                self.http_server = ThreadingHTTPServer((http_host, int(http_port)), MetricsRequestHandler)
+                self.http_server.daemon_threads = True
+                threading.Thread(target=self.http_server.serve_forever, name="metrics_http", daemon=True).start()
+                print(f"Serving render metrics at http://{http_host}:{self.http_server.server_address[1]}/metrics")
+            except OSError as e:
+                print(f"Render metrics are not served on {http_host}:{http_port}: {e!r}")
+
+        self.thread = threading.Thread(target=self._export_periodically, name="metrics_export", daemon=True)
+        self.thread.start()
+
+    def _export_periodically(self) -> None:
+        while True:
+            time.sleep(self.interval_seconds)
+            self.export()
+
+    def export(self) -> None:
+        with self.lock:
+            try:
+                sample_process_metrics()
+                os.makedirs(os.path.dirname(os.path.abspath(self.metrics_pathname)), exist_ok=True)
+
+                # Not "name.partial.prom", collectors reading *.prom would pick it up
+                partial_metrics_pathname = f"{self.metrics_pathname}.partial"
+
+                with open(partial_metrics_pathname, "w") as metrics_file:
+                    metrics_file.write(format_openmetrics())
+
+                os.replace(partial_metrics_pathname, self.metrics_pathname)
+            except Exception as e:
+                # Metrics are only an observation, the render goes on without them
+                print(f"Exporting render metrics to '{self.metrics_pathname}' failed: {e!r}")
+
+
+class MetricsRequestHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+
+        sample_process_metrics()
+        body = format_openmetrics().encode("utf-8")
+
+        self.send_response(200)
+        self.send_header("Content-Type", OPENMETRICS_CONTENT_TYPE)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        # Scrapes every few seconds would flood the render log
+        pass
+
+
+# The exporter of this process, running for the life of the process once a cut enables it
+_metrics_exporter: Union[MetricsExporter, None] = None
+
+
+def open_metrics_export() -> None:
+    """
+    Starts exporting the metrics if they are enabled, see MetricsExporter.
+    The first cut that enables them starts the export, later cuts rendered by
+    the same process, e.g. in watch or batch mode, add to the same metrics.
+    """
+    global _metrics_exporter
+
+    if _metrics_exporter is not None or not _render_metrics["enabled"] or not _render_metrics["export"]:
+        return
+
+    _metrics_exporter = MetricsExporter(
+        _render_metrics["path"], _render_metrics["interval_seconds"], _render_metrics["http_host"], _render_metrics["http_port"]
+    )
+
+
+def export_metrics() -> None:
+    """Exports the metrics now, e.g. once a cut is rendered, rather than at the next interval."""
+    if _metrics_exporter is not None and _render_metrics["export"]:
+        _metrics_exporter.export()
+
@@ -0,0 +1,200 @@
+import os
+import math
+import shutil
+import subprocess as sp
+
+from typing import Dict, List
+from moviepy.config import FFMPEG_BINARY
+from moviepy.tools import cross_platform_popen_params
+from video_utility import video_file_exists
+
+PREVIEW_PLAYLIST_NAME = "preview.m3u8"
+
+# Longer than any scene, so each scene is remuxed into exactly one segment
+SCENE_SEGMENT_SECONDS = 86400
+
+
+def is_render_preview_enabled(settings: Dict) -> bool:
+    """
+    Settings:
+        "render_preview": {
+            "enabled": false,
+        }
+    """
+    return bool(settings.get("render_preview", {}).get("enabled", False))
+
+
+def get_preview_pathname(cut_output_file_pathname: str) -> str:
+    """Returns the directory of a cut's preview, e.g. "cut.mp4" -> "cut_preview"."""
+    name, _ = os.path.splitext(cut_output_file_pathname)
+    return f"{name}_preview"
+
+
+class RenderPreview:
+    """
+    A rolling HLS playlist of a cut target, growing as its scenes complete.
+
+    The cut is the concatenation of its scene outputs, so every completed
+    scene is remuxed (stream copied, not encoded) into one fragmented MP4
+    segment and appended to an EVENT playlist. A player opening the playlist
+    can start with the first scene while later ones still render, and keeps
+    picking up new scenes. Scenes are appended in cut order: a scene that
+    completes early waits for the ones before it.
+
+    Scenes are encoded separately, so each segment carries its own
+    initialization section and follows a discontinuity.
+    """
+
+    def __init__(self, preview_pathname: str, scene_output_paths: List[str], target_duration: float):
+        """
+        :param scene_output_paths: The target's scene output pathnames, in cut order.
+        :param target_duration: The longest scene expected, in seconds.
+        """
+        self.preview_pathname = preview_pathname
+        self.playlist_pathname = os.path.join(preview_pathname, PREVIEW_PLAYLIST_NAME)
+        self.scene_output_paths = [os.path.abspath(path) for path in scene_output_paths]
+        self.scene_indexes = {path: index for index, path in enumerate(self.scene_output_paths)}
+        self.target_duration = max(1, math.ceil(target_duration))
+        self.ready_indexes = set()
+        self.segments = []
+        self.completed = False
+        self.failed = False
+
+        # Scenes may have changed since the last render, so the preview starts over
+        if os.path.isdir(preview_pathname):
+            shutil.rmtree(preview_pathname)
+
+        os.makedirs(preview_pathname)
+
+        self.write_playlist()
+
+        for scene_output_path in self.scene_output_paths:
+            if video_file_exists(scene_output_path):
+                self.add_scene(scene_output_path)
+
+    def add_scene(self, scene_output_path: str) -> None:
+        """Marks a scene output as complete, appending it and any scenes waiting on it."""
+        index = self.scene_indexes.get(os.path.abspath(scene_output_path))
+
+        if index is None or self.failed:
+            return
+
+        self.ready_indexes.add(index)
+        appended = False
+
+        try:
+            while len(self.segments) in self.ready_indexes:
+                self.segments.append(self.remux_scene(len(self.segments)))
+                appended = True
+        except Exception as e:
+            # The preview is only a convenience, the render goes on without it
+            print(f"Preview of '{self.preview_pathname}' stopped: {e!r}")
+            self.failed = True
+
+        if appended:
+            self.write_playlist()
+            print(f"Preview: {len(self.segments)} of {len(self.scene_output_paths)} scenes in {self.playlist_pathname}")
+
+    def remux_scene(self, index: int) -> Dict:
+        """Stream copies a scene output into one fMP4 segment of the preview."""
+        segment_name = f"scene_{index + 1:04d}"
+        scene_playlist_pathname = os.path.join(self.preview_pathname, f"{segment_name}.m3u8")
+
+        cmd = [
+            FFMPEG_BINARY, "-y", "-loglevel", "error",
+            "-i", self.scene_output_paths[index],
+            "-map", "0", "-c", "copy",
+            "-f", "hls",
+            "-hls_time", str(SCENE_SEGMENT_SECONDS),
+            "-hls_playlist_type", "vod",
+            "-hls_segment_type", "fmp4",
+            "-hls_fmp4_init_filename", f"{segment_name}_init.mp4",
+            "-hls_segment_filename", os.path.join(self.preview_pathname, f"{segment_name}_%d.m4s"),
+            scene_playlist_pathname,
+        ]
+
+        process = sp.run(cmd, **cross_platform_popen_params({"stdout": sp.DEVNULL, "stderr": sp.PIPE}))
+
+        if process.returncode != 0:
+            raise IOError(f"Adding '{self.scene_output_paths[index]}' to the preview failed:\n{process.stderr.decode(errors='replace')}")
+
+        # The scene's own playlist has the exact duration of its segment
+        parts = []
+
+        with open(scene_playlist_pathname, "r") as scene_playlist:
+            for line in scene_playlist:
+                line = line.strip()
+
+                if line.startswith("#EXTINF:"):
+                    duration = float(line[len("#EXTINF:"):].split(",")[0])
+                elif line and not line.startswith("#"):
+                    parts.append((duration, line))
+
+        os.remove(scene_playlist_pathname)
+
+        return {"init": f"{segment_name}_init.mp4", "parts": parts}
+
+    def write_playlist(self) -> None:
+        """Rewrites the playlist, replacing it in one step so players never read half of it."""
+        target_duration = max([self.target_duration] + [math.ceil(duration) for segment in self.segments for duration, _ in segment["parts"]])
+
+        lines = [
+            "#EXTM3U",
+            "#EXT-X-VERSION:7",
+            f"#EXT-X-TARGETDURATION:{target_duration}",
+            "#EXT-X-MEDIA-SEQUENCE:0",
+            "#EXT-X-PLAYLIST-TYPE:EVENT",
+            "#EXT-X-INDEPENDENT-SEGMENTS",
+        ]
+
+        for index, segment in enumerate(self.segments):
+            if index > 0:
+                lines.append("#EXT-X-DISCONTINUITY")
+
+            lines.append(f'#EXT-X-MAP:URI="{segment["init"]}"')
+
+            for duration, media in segment["parts"]:
+                lines.append(f"#EXTINF:{duration:.6f},")
+                lines.append(media)
+
+        if self.completed:
+            lines.append("#EXT-X-ENDLIST")
+
+        partial_playlist_pathname = f"{self.playlist_pathname}.partial"
+
+        with open(partial_playlist_pathname, "w") as playlist:
+            playlist.write("\n".join(lines) + "\n")
+
+        os.replace(partial_playlist_pathname, self.playlist_pathname)
+
+    def close(self, status: str = "completed") -> None:
+        """Ends the playlist once every scene is in it, so players stop polling for more."""
+        if status == "completed" and len(self.segments) == len(self.scene_output_paths):
+            self.completed = True
+            self.write_playlist()
+
+
+# The previews of the cut being rendered, one per pending output target
+_render_previews: List[RenderPreview] = []
+
+
+def open_render_previews(previews: Dict[str, List[str]], target_duration: float) -> None:
+    """
+    Starts a preview per cut target, see RenderPreview.
+
+    :param previews: The scene output pathnames in cut order, keyed by the preview's directory.
+    """
+    close_render_previews("cancelled")
+
+    for preview_pathname, scene_output_paths in previews.items():
+        _render_previews.append(RenderPreview(preview_pathname, scene_output_paths, target_duration))
+
+
+def preview_scene_output(scene_output_path: str) -> None:
+    for render_preview in _render_previews:
+        render_preview.add_scene(scene_output_path)
+
+
+def close_render_previews(status: str = "completed") -> None:
+    while _render_previews:
+        _render_previews.pop().close(status)
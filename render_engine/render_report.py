@@ -0,0 +1,290 @@
+import os
+import json
+import html
+import datetime
+
+from typing import Any, Dict, List, Union
+from video_utility import ensure_directory_exists, probe_media_source
+
+REPORT_STYLE = """
+body { font-family: Arial, sans-serif; line-height: 1.6; }
+h1 { text-align: center; }
+h2 { text-align: center; color: gray; }
+h3 { margin-top: 20px; }
+h4 { margin-top: 10px; font-style: italic; }
+table { width: 100%; border-collapse: collapse; margin-bottom: 20px; }
+th, td { border: 1px solid #ddd; padding: 8px; text-align: left; }
+th { background-color: #f4f4f4; }
+.clip-path { font-size: 8pt; color: gray; }
+.clip-name { font-weight: bold; }
+.render-facts { font-size: 9pt; color: #444; }
+.cache-hit { color: green; }
+.cache-miss { color: #b05000; }
+"""
+
+
+def format_trim(clip: Dict, prefix: str, default_text: str) -> str:
+    """Formats a clip's trim_start_* or trim_end_* values as min:sec."""
+    if f"{prefix}_seconds" not in clip:
+        return default_text
+
+    minutes = clip.get(f"{prefix}_minutes", 0)
+    seconds = float(clip.get(f"{prefix}_seconds", 0))
+
+    return f"{minutes}:{seconds:05.2f}"
+
+
+def format_file_size(size: Union[int, None]) -> str:
+    if size is None:
+        return "N/A"
+
+    return f"{size / (1024 * 1024):.1f} MB"
+
+
+def get_source_probe(clip_path: str) -> Union[Dict[str, Any], None]:
+    """Returns the probe facts of a source that the report shows."""
+    try:
+        infos = probe_media_source(clip_path)
+    except Exception:
+        return None
+
+    return {
+        "duration": infos.get("duration"),
+        "video_size": infos.get("video_size"),
+        "video_fps": infos.get("video_fps"),
+        "video_codec_name": infos.get("video_codec_name"),
+        "audio_found": infos.get("audio_found", False),
+        "bitrate": infos.get("bitrate"),
+    }
+
+
+def get_output_facts(output_file_pathname: str, cache_hit: bool) -> Dict[str, Any]:
+    return {
+        "output": output_file_pathname,
+        "cache_hit": cache_hit,
+        "size": os.path.getsize(output_file_pathname) if os.path.isfile(output_file_pathname) else None,
+    }
+
+
+class RenderReport:
+    """
+    Render report of a cut, streamed to an HTML page and a JSON document.
+
+    The HTML lists the timeline as before, with the render facts of every scene
+    (render time, cache hit or miss, output sizes) and the probe data of its
+    sources. Each part is written to disk as soon as it is known, so the cost
+    stays linear in the size of the assembly and the report of a cancelled
+    render shows how far it got.
+    """
+
+    def __init__(self, html_file_pathname: str, json_file_pathname: str, video_assembly: Dict, output_targets: List[Dict]):
+        self.html_file_pathname = html_file_pathname
+        self.json_file_pathname = json_file_pathname
+        self.scene_count = 0
+        self.cache_hit_count = 0
+        self.render_seconds = 0.0
+        self.cut_outputs = []
+
+        cut = video_assembly.get("cut", {})
+        title = cut.get("title", "Untitled")
+        subtitle = cut.get("subtitle", "")
+
+        ensure_directory_exists(html_file_pathname)
+        ensure_directory_exists(json_file_pathname)
+
+        self.html_file = open(html_file_pathname, "w", encoding="utf-8")
+        self.json_file = open(json_file_pathname, "w", encoding="utf-8")
+
+        self.html_file.write(
+            "<!DOCTYPE html>\n<html lang=\"en\">\n<head>\n"
+            "<meta charset=\"UTF-8\">\n"
+            "<meta name=\"viewport\" content=\"width=device-width, initial-scale=1.0\">\n"
+            f"<title>{html.escape(title)}</title>\n"
+            f"<style>{REPORT_STYLE}</style>\n"
+            "</head>\n<body>\n"
+            f"<h1>{html.escape(title)}</h1>\n"
+            f"<h2>{html.escape(subtitle)}</h2>\n"
+        )
+
+        # The JSON document is written up to the open scenes array, see close()
+        header = {
+            "title": title,
+            "subtitle": subtitle,
+            "started_at": datetime.datetime.now().isoformat(timespec="seconds"),
+            "targets": [{"name": target["name"], "aspect_ratio": target["aspect_ratio"], "resolution": target["resolution"]} for target in output_targets],
+        }
+        self.json_file.write(json.dumps(header)[:-1] + ', "scenes": [\n')
+
+    def start_segment(self, segment: Dict) -> None:
+        self.html_file.write(f"<h3>{html.escape(str(segment.get('title', 'Unnamed Segment')))}</h3>\n")
+
+    def add_scene(self, segment: Dict, scene: Dict, outputs: List[Dict[str, Any]], render_seconds: float) -> None:
+        """
+        Writes a rendered (or reused) scene.
+
+        :param outputs: One entry per output target, see get_output_facts().
+        :param render_seconds: Wall time spent on the scene.
+        """
+        timeline_clip_type = scene.get("timeline_clip_type", "video")
+        cache_hit = len(outputs) > 0 and all(output["cache_hit"] for output in outputs)
+
+        clips = []
+
+        for clip in sorted(scene.get("timeline_clips", []), key=lambda clip: clip.get("sequence", 0)):
+            clip_path = clip.get("path") or clip.get("clip_file_pathname") or "Unknown Path"
+
+            clip_facts = {"sequence": clip.get("sequence", "N/A"), "path": clip_path}
+
+            if timeline_clip_type == "video":
+                clip_facts["trim_start"] = format_trim(clip, "trim_start", "Start of clip")
+                clip_facts["trim_end"] = format_trim(clip, "trim_end", "End of clip")
+                clip_facts["probe"] = get_source_probe(clip_path)
+            else:
+                clip_facts["trim_start"] = "N/A"
+                clip_facts["trim_end"] = "N/A"
+                clip_facts["probe"] = None
+
+            clips.append(clip_facts)
+
+        self._write_scene_html(scene, clips, outputs, render_seconds, cache_hit)
+
+        scene_facts = {
+            "segment": segment.get("title"),
+            "sequence": scene.get("sequence"),
+            "title": scene.get("title"),
+            "timeline_clip_type": timeline_clip_type,
+            "render_seconds": round(render_seconds, 3),
+            "cache_hit": cache_hit,
+            "outputs": outputs,
+            "clips": clips,
+        }
+
+        if self.scene_count > 0:
+            self.json_file.write(",\n")
+
+        self.json_file.write(json.dumps(scene_facts))
+
+        self.scene_count += 1
+        self.cache_hit_count += 1 if cache_hit else 0
+        self.render_seconds += render_seconds
+
+        self.html_file.flush()
+        self.json_file.flush()
+
+    def _write_scene_html(self, scene: Dict, clips: List[Dict], outputs: List[Dict], render_seconds: float, cache_hit: bool) -> None:
+        scene_title = scene.get("title")
+
+        if scene_title:
+            self.html_file.write(f"<h4>{html.escape(str(scene_title))}</h4>\n")
+
+        cache_class, cache_text = ("cache-hit", "cache hit") if cache_hit else ("cache-miss", "rendered")
+        output_text = ", ".join(
+            f"{html.escape(os.path.basename(output['output']))} ({format_file_size(output['size'])})" for output in outputs
+        )
+
+        self.html_file.write(
+            f"<div class=\"render-facts\"><span class=\"{cache_class}\">{cache_text}</span>"
+            f" in {render_seconds:.2f}s: {output_text}</div>\n"
+            "<table>\n<tr><th>Sequence</th><th>Clip File Pathname</th><th>Trim Start (min:sec)</th>"
+            "<th>Trim End (min:sec)</th><th>Source</th></tr>\n"
+        )
+
+        for clip in clips:
+            file_path, file_name = os.path.split(clip["path"])
+            probe = clip["probe"]
+
+            if probe and probe.get("video_size"):
+                source_text = (
+                    f"{probe['video_size'][0]}x{probe['video_size'][1]} {probe.get('video_fps')} fps "
+                    f"{probe.get('video_codec_name')}, {probe.get('duration')}s"
+                )
+            else:
+                source_text = "N/A"
+
+            self.html_file.write(
+                f"<tr><td>{html.escape(str(clip['sequence']))}</td>"
+                f"<td><div class=\"clip-path\">{html.escape(file_path)}</div>"
+                f"<div class=\"clip-name\">{html.escape(file_name)}</div></td>"
+                f"<td>{clip['trim_start']}</td><td>{clip['trim_end']}</td>"
+                f"<td>{html.escape(source_text)}</td></tr>\n"
+            )
+
+        self.html_file.write("</table>\n")
+
+    def add_cut_output(self, target: Dict, output_facts: Dict[str, Any], render_seconds: float) -> None:
+        output_facts = dict(output_facts, target=target["name"], render_seconds=round(render_seconds, 3))
+        self.cut_outputs.append(output_facts)
+
+    def close(self, status: str = "completed") -> None:
+        """Finishes both documents with the cut outputs and totals."""
+        summary = {
+            "scenes": self.scene_count,
+            "scene_cache_hits": self.cache_hit_count,
+            "scene_render_seconds": round(self.render_seconds, 3),
+        }
+
+        self.html_file.write("<h3>Cut</h3>\n<table>\n<tr><th>Target</th><th>Output</th><th>Size</th><th>Time</th></tr>\n")
+
+        for cut_output in self.cut_outputs:
+            cut_time_text = "cache hit" if cut_output["cache_hit"] else f"{cut_output['render_seconds']:.2f}s"
+            self.html_file.write(
+                f"<tr><td>{html.escape(cut_output['target'])}</td><td>{html.escape(cut_output['output'])}</td>"
+                f"<td>{format_file_size(cut_output['size'])}</td><td>{cut_time_text}</td></tr>\n"
+            )
+
+        self.html_file.write(
+            "</table>\n"
+            f"<p class=\"render-facts\">Render {html.escape(status)}: {summary['scenes']} scenes, "
+            f"{summary['scene_cache_hits']} cache hits, {summary['scene_render_seconds']:.2f}s in scenes.</p>\n"
+            "</body>\n</html>\n"
+        )
+
+        footer = {
+            "cut_outputs": self.cut_outputs,
+            "summary": summary,
+            "status": status,
+            "finished_at": datetime.datetime.now().isoformat(timespec="seconds"),
+        }
+        self.json_file.write("\n], " + json.dumps(footer)[1:] + "\n")
+
+        self.html_file.close()
+        self.json_file.close()
+
+        print(f"Render report written: {self.html_file_pathname}")
+
+
+# The report of the cut being rendered
+_render_report: Union[RenderReport, None] = None
+
+
+def open_render_report(html_file_pathname: str, json_file_pathname: str, video_assembly: Dict, output_targets: List[Dict]) -> RenderReport:
+    """Opens the report of the cut being rendered and makes it the active report."""
+    global _render_report
+
+    _render_report = RenderReport(html_file_pathname, json_file_pathname, video_assembly, output_targets)
+
+    return _render_report
+
+
+def close_render_report(status: str = "completed") -> None:
+    """Finishes the active report, if one is open."""
+    global _render_report
+
+    if _render_report is not None:
+        _render_report.close(status)
+        _render_report = None
+
+
+def report_segment(segment: Dict) -> None:
+    if _render_report is not None:
+        _render_report.start_segment(segment)
+
+
+def report_scene(segment: Dict, scene: Dict, outputs: List[Dict[str, Any]], render_seconds: float) -> None:
+    if _render_report is not None:
+        _render_report.add_scene(segment, scene, outputs, render_seconds)
+
+
+def report_cut_output(target: Dict, output_facts: Dict[str, Any], render_seconds: float) -> None:
+    if _render_report is not None:
+        _render_report.add_cut_output(target, output_facts, render_seconds)
@@ -0,0 +1,432 @@
+import os
+import json
+import time
+import heapq
+import sqlite3
+import hashlib
+import statistics
+
+import numpy as np
+
+from typing import Any, Dict, List, Union
+from contextlib import contextmanager
+from PIL import Image
+from video_utility import probe_media_source
+from video_assembly_helper import SCENE_LABEL_KEYS
+from clip_utility import get_clip_trim_seconds
+from render_metrics import increment_metric, observe_metric
+
+TELEMETRY_FILE_NAME = "render_telemetry.sqlite3"
+SCHEMA_VERSION = 1
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS renders (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    recorded_at REAL NOT NULL,
+    kind TEXT NOT NULL,
+    render_key TEXT NOT NULL,
+    timeline_clip_type TEXT NOT NULL,
+    clip_count INTEGER NOT NULL,
+    overlay_count INTEGER NOT NULL,
+    source_width INTEGER,
+    source_height INTEGER,
+    source_codec TEXT,
+    content_seconds REAL NOT NULL,
+    output_megapixels REAL NOT NULL,
+    target_count INTEGER NOT NULL,
+    render_seconds REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS renders_kind_render_key ON renders (kind, render_key);
+CREATE TABLE IF NOT EXISTS stages (
+    render_id INTEGER NOT NULL,
+    stage TEXT NOT NULL,
+    seconds REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS stages_render_id ON stages (render_id);
+"""
+
+# Length a still image is shown when the clip does not say, as in image_helper.create_video_from_image()
+DEFAULT_IMAGE_SECONDS = 5
+
+# Renders predicted from; older ones describe a machine or engine that may have changed
+HISTORY_SIZE = 500
+
+# Renders needed before the cost model is fitted, below that a median rate is used
+MIN_MODEL_HISTORY = 8
+
+# Seconds per second of content and output megapixel when there is no history yet
+DEFAULT_SECONDS_PER_WORK = 0.5
+
+MIN_PREDICTED_SECONDS = 0.1
+
+
+def get_render_telemetry_pathname(settings: Dict, render_output: Dict) -> Union[str, None]:
+    """
+    Returns the telemetry database pathname from the video assembly settings,
+    or None when telemetry is disabled.
+
+    Settings:
+        "render_telemetry": {
+            "enabled": true,
+            "path": The SQLite database file (default: render_telemetry.sqlite3 in the cut output directory).
+        }
+    """
+    render_telemetry = settings.get("render_telemetry", {})
+
+    if not render_telemetry.get("enabled", True):
+        return None
+
+    return render_telemetry.get("path") or os.path.join(render_output["output_paths"]["cut"], TELEMETRY_FILE_NAME)
+
+
+def count_overlays(node) -> int:
+    """Counts the overlay images in a part of the assembly, e.g. a scene with its clips."""
+    overlay_count = 0
+
+    if isinstance(node, dict):
+        for key, value in node.items():
+            if key == "overlay_images" and isinstance(value, list):
+                overlay_count += len(value)
+            overlay_count += count_overlays(value)
+    elif isinstance(node, list):
+        for item in node:
+            overlay_count += count_overlays(item)
+
+    return overlay_count
+
+
+def get_output_megapixels(output_targets: List[Dict]) -> float:
+    """Returns the megapixels per frame written for all targets; targets at source size count as 1080p."""
+    megapixels = 0.0
+
+    for target in output_targets:
+        width, height = target.get("resolution") or (1920, 1080)
+        megapixels += width * height / 1e6
+
+    return megapixels
+
+
+def get_scene_features(scene: Dict, output_targets: List[Dict]) -> Dict[str, Any]:
+    """
+    Returns what decides the render cost of a scene: its length, sources,
+    overlays and output size. Sources that cannot be probed are left out.
+    """
+    timeline_clip_type = scene.get("timeline_clip_type", "video").lower()
+    timeline_clips = scene.get("timeline_clips", [])
+
+    content_seconds = 0.0
+    source_width = None
+    source_height = None
+    source_codec = None
+
+    for clip in timeline_clips:
+        try:
+            if timeline_clip_type == "image":
+                content_seconds += float(clip.get("duration_seconds", DEFAULT_IMAGE_SECONDS))
+
+                # Pillow only reads the header here
+                with Image.open(clip["path"]) as image:
+                    width, height = image.size
+                    codec = image.format
+            else:
+                infos = probe_media_source(clip["path"])
+                start, end = get_clip_trim_seconds(clip)
+                content_seconds += max(0.0, (end if end is not None else infos.get("duration") or 0.0) - start)
+
+                width, height = infos.get("video_size") or (0, 0)
+                codec = infos.get("video_codec_name")
+        except Exception:
+            continue
+
+        if source_width is None or width * height > source_width * source_height:
+            source_width, source_height, source_codec = width, height, codec
+
+    return {
+        "timeline_clip_type": timeline_clip_type,
+        "clip_count": len(timeline_clips),
+        "overlay_count": count_overlays(scene),
+        "source_width": source_width,
+        "source_height": source_height,
+        "source_codec": source_codec,
+        "content_seconds": content_seconds,
+        "output_megapixels": get_output_megapixels(output_targets),
+        "target_count": len(output_targets),
+    }
+
+
+def get_cut_features(content_seconds: float, segment_count: int, target: Dict) -> Dict[str, Any]:
+    """Returns the features of assembling and encoding a cut from its segments."""
+    return {
+        "timeline_clip_type": "cut",
+        "clip_count": segment_count,
+        "overlay_count": 0,
+        "source_width": None,
+        "source_height": None,
+        "source_codec": None,
+        "content_seconds": content_seconds,
+        "output_megapixels": get_output_megapixels([target]),
+        "target_count": 1,
+    }
+
+
+def get_scene_telemetry_key(scene: Dict, output_targets: List[Dict]) -> str:
+    """Returns a key equal for renders of the same scene to the same targets."""
+    render_description = {
+        "scene": {key: value for key, value in scene.items() if key not in SCENE_LABEL_KEYS},
+        "targets": [[target["aspect_ratio"], target["resolution"], target["render_settings"]] for target in output_targets],
+    }
+
+    return hashlib.sha256(json.dumps(render_description, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+
+
+def get_cut_telemetry_key(cut: Dict, target: Dict) -> str:
+    """Returns a key equal for renders of the same cut to the same target, edits included."""
+    return f"{cut.get('title', 'Untitled')}/{target['name']}"
+
+
+def get_cost_vector(features) -> List[float]:
+    """
+    The terms render time is fitted to: a fixed cost per render, and costs per
+    second of content that grow with the output pixels, the overlays
+    composited over them and the source pixels decoded.
+    """
+    content_seconds = features["content_seconds"]
+    output_megapixels = features["output_megapixels"]
+    source_megapixels = (features["source_width"] or 0) * (features["source_height"] or 0) / 1e6
+
+    return [
+        1.0,
+        content_seconds * output_megapixels,
+        content_seconds * output_megapixels * features["overlay_count"],
+        content_seconds * source_megapixels,
+    ]
+
+
+class RenderTelemetry:
+    """
+    SQLite history of how long renders took, with the characteristics of what
+    was rendered. The history predicts the render time of scenes and cuts that
+    have not been rendered yet.
+    """
+
+    def __init__(self, telemetry_pathname: str):
+        self.telemetry_pathname = telemetry_pathname
+
+        os.makedirs(os.path.dirname(os.path.abspath(telemetry_pathname)), exist_ok=True)
+
+        self.connection = sqlite3.connect(telemetry_pathname)
+        self.connection.row_factory = sqlite3.Row
+        self.connection.executescript(SCHEMA)
+        self.connection.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+
+    def record(self, kind: str, render_key: str, features: Dict[str, Any], render_seconds: float, stage_seconds: Dict[str, float] = None) -> None:
+        """
+        Records a finished render.
+
+        :param kind: "scene" or "cut".
+        :param stage_seconds: Seconds spent per stage of the render, see time_stage().
+        """
+        with self.connection:
+            cursor = self.connection.execute(
+                "INSERT INTO renders (recorded_at, kind, render_key, timeline_clip_type, clip_count, overlay_count, "
+                "source_width, source_height, source_codec, content_seconds, output_megapixels, target_count, render_seconds) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (
+                    time.time(), kind, render_key, features["timeline_clip_type"], features["clip_count"], features["overlay_count"],
+                    features["source_width"], features["source_height"], features["source_codec"], features["content_seconds"],
+                    features["output_megapixels"], features["target_count"], render_seconds,
+                ),
+            )
+
+            self.connection.executemany(
+                "INSERT INTO stages (render_id, stage, seconds) VALUES (?, ?, ?)",
+                [(cursor.lastrowid, stage, seconds) for stage, seconds in (stage_seconds or {}).items()],
+            )
+
+    def predict_seconds(self, kind: str, render_key: str, features: Dict[str, Any]) -> float:
+        """
+        Predicts the render time. A render seen before takes as long as it did
+        the last times. Otherwise the cost model is fitted to the history of
+        similar renders (same clip type and source codec, or all of the kind if
+        there are too few), or a median rate is used while the history is short.
+        """
+        same_renders = self.connection.execute(
+            "SELECT render_seconds FROM renders WHERE kind = ? AND render_key = ? ORDER BY id DESC LIMIT 3",
+            (kind, render_key),
+        ).fetchall()
+
+        if same_renders:
+            return statistics.mean(row["render_seconds"] for row in same_renders)
+
+        history = self.connection.execute(
+            "SELECT * FROM renders WHERE kind = ? AND timeline_clip_type = ? AND source_codec IS ? ORDER BY id DESC LIMIT ?",
+            (kind, features["timeline_clip_type"], features["source_codec"], HISTORY_SIZE),
+        ).fetchall()
+
+        if len(history) < MIN_MODEL_HISTORY:
+            history = self.connection.execute(
+                "SELECT * FROM renders WHERE kind = ? ORDER BY id DESC LIMIT ?", (kind, HISTORY_SIZE)
+            ).fetchall()
+
+        cost_vector = np.array(get_cost_vector(features))
+
+        if len(history) >= MIN_MODEL_HISTORY:
+            coefficients, _, _, _ = np.linalg.lstsq(
+                np.array([get_cost_vector(row) for row in history]),
+                np.array([row["render_seconds"] for row in history]),
+                rcond=None,
+            )
+
+            return max(MIN_PREDICTED_SECONDS, float(cost_vector @ coefficients))
+
+        work = features["content_seconds"] * features["output_megapixels"]
+
+        if history:
+            seconds_per_work = statistics.median(
+                row["render_seconds"] / max(row["content_seconds"] * row["output_megapixels"], MIN_PREDICTED_SECONDS) for row in history
+            )
+        else:
+            seconds_per_work = DEFAULT_SECONDS_PER_WORK
+
+        return max(MIN_PREDICTED_SECONDS, seconds_per_work * work)
+
+    def close(self) -> None:
+        self.connection.close()
+
+
+def get_makespan(durations: List[float], worker_count: int) -> float:
+    """Returns when the last of the durations ends when workers always take the longest one left."""
+    workers = [0.0] * max(1, worker_count)
+
+    for duration in sorted(durations, reverse=True):
+        heapq.heapreplace(workers, workers[0] + duration)
+
+    return max(workers)
+
+
+def format_duration(seconds: float) -> str:
+    minutes, seconds = divmod(seconds, 60)
+
+    return f"{int(minutes)}m {seconds:.0f}s"
+
+
+class RenderProgress:
+    """
+    Prints how much of a render is done and its ETA, from the predicted render
+    times of its parts. The predictions are corrected by how far off they were
+    for the parts done so far.
+    """
+
+    def __init__(self, predicted_seconds: Dict[Any, float], worker_count: int = 1):
+        self.predicted_seconds = predicted_seconds
+        self.worker_count = worker_count
+        self.pending = set(predicted_seconds)
+        self.predicted_done_seconds = 0.0
+        self.actual_done_seconds = 0.0
+
+    def get_remaining_seconds(self) -> float:
+        correction = self.actual_done_seconds / self.predicted_done_seconds if self.predicted_done_seconds > 0 else 1.0
+
+        return get_makespan([self.predicted_seconds[key] * correction for key in self.pending], self.worker_count)
+
+    def print_estimate(self) -> None:
+        print(f"Render estimate: {len(self.predicted_seconds)} parts, about {format_duration(self.get_remaining_seconds())}.")
+
+    def complete(self, key, render_seconds: float) -> None:
+        if key not in self.pending:
+            return
+
+        self.pending.discard(key)
+        self.predicted_done_seconds += self.predicted_seconds[key]
+        self.actual_done_seconds += render_seconds
+
+        done_count = len(self.predicted_seconds) - len(self.pending)
+
+        print(f"Progress: {done_count} of {len(self.predicted_seconds)} parts rendered, ETA {format_duration(self.get_remaining_seconds())}.")
+
+
+# Seconds spent per stage of the scene being rendered in this process
+_stage_seconds: Dict[str, float] = {}
+
+
+@contextmanager
+def time_stage(stage: str):
+    """Adds the time the block takes to a stage of the scene being rendered."""
+    start_time = time.time()
+
+    try:
+        yield
+    finally:
+        _stage_seconds[stage] = _stage_seconds.get(stage, 0.0) + time.time() - start_time
+        observe_metric("stage_seconds", time.time() - start_time, stage=stage)
+
+
+def take_stage_seconds() -> Dict[str, float]:
+    """Returns the stage times of the scene just rendered and starts over."""
+    stage_seconds = dict(_stage_seconds)
+    _stage_seconds.clear()
+
+    return stage_seconds
+
+
+# The telemetry and progress of the cut being rendered
+_render_telemetry: Union[RenderTelemetry, None] = None
+_render_progress: Union[RenderProgress, None] = None
+
+
+def open_render_telemetry(telemetry_pathname: Union[str, None]) -> None:
+    """Opens the telemetry of the cut being rendered, None disables it."""
+    global _render_telemetry, _render_progress
+
+    _render_telemetry = RenderTelemetry(telemetry_pathname) if telemetry_pathname else None
+    _render_progress = None
+
+
+def get_render_telemetry() -> Union[RenderTelemetry, None]:
+    return _render_telemetry
+
+
+def start_render_progress(predicted_seconds: Dict[Any, float]) -> None:
+    """Tracks the progress of the cut being rendered over its predicted parts."""
+    global _render_progress
+
+    _render_progress = RenderProgress(predicted_seconds)
+    _render_progress.print_estimate()
+
+
+def close_render_telemetry() -> None:
+    global _render_telemetry, _render_progress
+
+    if _render_telemetry is not None:
+        _render_telemetry.close()
+
+    _render_telemetry = None
+    _render_progress = None
+
+
+def record_scene_render(scene: Dict, output_targets: List[Dict], progress_key, render_seconds: float) -> None:
+    """
+    Records a rendered scene in the active telemetry with its stage times and
+    in the metrics, and updates the progress.
+
+    :param progress_key: The scene's key in the predicted parts, the output pathname of its first target.
+    """
+    stage_seconds = take_stage_seconds()
+    increment_metric("scenes_rendered")
+
+    if _render_telemetry is not None:
+        _render_telemetry.record(
+            "scene", get_scene_telemetry_key(scene, output_targets), get_scene_features(scene, output_targets), render_seconds, stage_seconds
+        )
+
+    if _render_progress is not None:
+        _render_progress.complete(progress_key, render_seconds)
+
+
+def record_cut_render(cut: Dict, target: Dict, cut_features: Dict[str, Any], render_seconds: float) -> None:
+    """Records an encoded cut in the active telemetry, and updates the progress."""
+    if _render_telemetry is not None:
+        _render_telemetry.record("cut", get_cut_telemetry_key(cut, target), cut_features, render_seconds)
+
+    if _render_progress is not None:
+        _render_progress.complete(target["cut_output_file_pathname"], render_seconds)
@@ -0,0 +1,224 @@
+import os
+import json
+import threading
+import multiprocessing
+
+from typing import Any, Dict
+from contextlib import contextmanager
+
+import psutil
+
+DEFAULT_LEASE_PATH = os.path.join(os.path.expanduser("~"), ".composeflow", "governor")
+DEFAULT_WORKER_MEMORY_MB = 1024
+DEFAULT_MEMORY_FRACTION = 0.8
+
+# How long the host CPU load is sampled before an allocation, in seconds
+LOAD_SAMPLE_SECONDS = 0.2
+
+# The resource budget of this host
+_resource_governor: Dict[str, Any] = {
+    "cpu_threads": None,
+    "memory_mb": None,
+    "worker_memory_mb": DEFAULT_WORKER_MEMORY_MB,
+    "lease_path": DEFAULT_LEASE_PATH,
+}
+
+# The threads and memory leased by this process
+_leases = {"threads": 0, "memory": 0}
+_leases_lock = threading.Lock()
+
+# Number of worker processes sharing the budget with this one, e.g. in a batch pool
+_process_share = 1
+
+
+def configure_resource_governor(settings: Dict) -> None:
+    """
+    Reads the host budget from the video assembly settings.
+
+    Settings:
+        "resource_governor": {
+            "cpu_threads": CPU threads all renders on this host may use (default: CPU count).
+            "memory_mb": Memory all renders on this host may use (default: 80% of RAM).
+            "worker_memory_mb": Memory reserved per worker process (default 1024).
+            "lease_path": Directory where renders publish their leases (default ~/.composeflow/governor).
+        }
+    """
+    resource_governor = settings.get("resource_governor", {})
+
+    _resource_governor["cpu_threads"] = resource_governor.get("cpu_threads")
+    _resource_governor["memory_mb"] = resource_governor.get("memory_mb")
+    _resource_governor["worker_memory_mb"] = resource_governor.get("worker_memory_mb", DEFAULT_WORKER_MEMORY_MB)
+    _resource_governor["lease_path"] = resource_governor.get("lease_path") or DEFAULT_LEASE_PATH
+
+
+def get_resource_governor_settings() -> Dict[str, Any]:
+    """Returns the budget, to configure worker processes the same way."""
+    return {"resource_governor": dict(_resource_governor)}
+
+
+def get_cpu_thread_budget() -> int:
+    return int(_resource_governor["cpu_threads"] or multiprocessing.cpu_count())
+
+
+def get_memory_budget() -> int:
+    if _resource_governor["memory_mb"]:
+        return int(_resource_governor["memory_mb"] * 1024 * 1024)
+
+    return int(psutil.virtual_memory().total * DEFAULT_MEMORY_FRACTION)
+
+
+def get_lease_file_pathname(pid: int) -> str:
+    return os.path.join(_resource_governor["lease_path"], f"{pid}.json")
+
+
+def _publish_leases() -> None:
+    """Writes this process's leases where other renders on the host read them."""
+    lease_file_pathname = get_lease_file_pathname(os.getpid())
+
+    try:
+        if _leases["threads"] == 0 and _leases["memory"] == 0:
+            if os.path.exists(lease_file_pathname):
+                os.remove(lease_file_pathname)
+            return
+
+        os.makedirs(_resource_governor["lease_path"], exist_ok=True)
+        partial_file_pathname = lease_file_pathname + ".partial"
+
+        with open(partial_file_pathname, "w") as lease_file:
+            json.dump(_leases, lease_file)
+
+        os.replace(partial_file_pathname, lease_file_pathname)
+    except OSError as e:
+        # Leases are advisory, a render never fails because of them
+        print(f"Resource governor: cannot publish leases: {e}")
+
+
+def get_host_leases() -> Dict[str, int]:
+    """
+    Returns the threads and memory leased by all renders on the host. Leases of
+    processes that are gone are removed.
+    """
+    host_leases = {"threads": 0, "memory": 0}
+
+    try:
+        lease_file_names = os.listdir(_resource_governor["lease_path"])
+    except OSError:
+        lease_file_names = []
+
+    for lease_file_name in lease_file_names:
+        pid_text, extension = os.path.splitext(lease_file_name)
+
+        if extension != ".json" or not pid_text.isdigit():
+            continue
+
+        pid = int(pid_text)
+
+        if pid == os.getpid():
+            continue
+
+        lease_file_pathname = get_lease_file_pathname(pid)
+
+        if not psutil.pid_exists(pid):
+            try:
+                os.remove(lease_file_pathname)
+            except OSError:
+                pass
+            continue
+
+        try:
+            with open(lease_file_pathname, "r") as lease_file:
+                leases = json.load(lease_file)
+        except (OSError, ValueError):
+            continue
+
+        host_leases["threads"] += int(leases.get("threads", 0))
+        host_leases["memory"] += int(leases.get("memory", 0))
+
+    with _leases_lock:
+        host_leases["threads"] += _leases["threads"]
+        host_leases["memory"] += _leases["memory"]
+
+    return host_leases
+
+
+def get_busy_cpu_threads() -> float:
+    """Returns how many CPU threads the whole host keeps busy right now."""
+    return psutil.cpu_percent(interval=LOAD_SAMPLE_SECONDS) / 100 * psutil.cpu_count()
+
+
+def get_free_cpu_threads() -> int:
+    """
+    Returns the CPU threads left in the budget.
+
+    Leased threads are counted as busy even before their encoders ramp up, and
+    load the leases do not explain, e.g. the editor or other software, is taken
+    from the budget as well.
+    """
+    host_leases = get_host_leases()
+    busy_threads = max(host_leases["threads"], get_busy_cpu_threads())
+
+    return max(0, int(get_cpu_thread_budget() - busy_threads))
+
+
+def get_free_memory() -> int:
+    """Returns the bytes left in the memory budget, or actually available if less."""
+    host_leases = get_host_leases()
+
+    return max(0, min(get_memory_budget() - host_leases["memory"], psutil.virtual_memory().available))
+
+
+def set_process_share(process_count: int) -> None:
+    """Marks this process as one of process_count workers splitting the budget."""
+    global _process_share
+
+    _process_share = max(1, int(process_count))
+
+
+def allocate_threads(parallel_count: int = 1) -> int:
+    """
+    Returns the threads each of parallel_count encoders or decoders may use: the
+    free threads, but no more than this process's share of the budget, and at
+    least 1 so a render always makes progress.
+    """
+    threads = min(get_free_cpu_threads(), get_cpu_thread_budget() // _process_share)
+
+    return max(1, threads // max(1, parallel_count))
+
+
+def allocate_worker_count(threads_per_worker: int = 1, requested=None) -> int:
+    """
+    Returns how many worker processes fit in the free CPU threads and memory.
+
+    :param threads_per_worker: CPU threads each worker keeps busy.
+    :param requested: An explicit worker count, e.g. from the command line. It
+                      is used as is.
+    """
+    if requested:
+        return int(requested)
+
+    worker_memory = _resource_governor["worker_memory_mb"] * 1024 * 1024
+
+    thread_slots = get_free_cpu_threads() // max(1, threads_per_worker)
+    memory_slots = get_free_memory() // worker_memory if worker_memory > 0 else thread_slots
+
+    return max(1, min(thread_slots, memory_slots))
+
+
+@contextmanager
+def lease(threads: int = 0, memory: int = 0):
+    """
+    Holds threads and bytes of memory from the host budget while the block
+    runs, so concurrent renders on the host allocate around them.
+    """
+    with _leases_lock:
+        _leases["threads"] += threads
+        _leases["memory"] += memory
+        _publish_leases()
+
+    try:
+        yield
+    finally:
+        with _leases_lock:
+            _leases["threads"] -= threads
+            _leases["memory"] -= memory
+            _publish_leases()
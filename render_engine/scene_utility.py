@@ -1,14 +1,27 @@
 import os
 import re
+import time
 import uuid
 import datetime
 
 from typing import List, Dict
-from video_utility import write_video, crop_video_to_aspect_ratio, video_file_exists
-from moviepy import VideoFileClip, concatenate_videoclips, AudioFileClip, concatenate_audioclips, CompositeVideoClip
-from clip_utility import load_video_clip, process_video_time_codes
+from video_utility import write_video_targets, crop_video_to_aspect_ratio, video_file_exists, share_decoded_frames, resize_video_to_resolution
+from moviepy import VideoFileClip, concatenate_videoclips, concatenate_audioclips, CompositeVideoClip
+from clip_utility import open_video_source, finish_video_clip, process_video_time_codes
 from audio_helper import append_audio, process_audio_time_codes
+from audio_cache import open_audio_source
 from image_helper import create_video_from_image
+from render_journal import output_is_complete, record_output_complete
+from chunk_encode_utility import should_encode_in_chunks, encode_in_chunks
+from frame_pipeline import should_encode_in_pipeline, encode_in_pipeline, render_pipeline_frames
+from smart_cut_utility import can_smart_cut_scene, smart_cut_scene
+from clip_cache import is_clip_cache_enabled, get_clip_key, get_clip_file_pathname, get_clip_render_settings, clip_exists
+from mezzanine_cache import is_mezzanine_cache_enabled, get_mezzanine_key, get_mezzanine_file_pathname, get_mezzanine_render_settings, mezzanine_exists, encode_from_mezzanine
+from render_report import report_scene, get_output_facts
+from render_telemetry import time_stage, record_scene_render
+from prefetch_utility import advance_scene_prefetch
+from render_preview import preview_scene_output
+from render_metrics import record_cache_lookup, count_decoded_frames, take_metrics
 
 def sort_sequential_audio_clips_by_sequence(scene: Dict) -> List[Dict]:
     """
@@ -29,60 +42,96 @@ def sort_timeline_clips_by_sequence(scene: Dict) -> List[Dict]:
     """
     return sorted(scene.get("timeline_clips", []), key=lambda clip: clip["sequence"])
     
-def crop_and_process_sequential_audio_clips(scene, video_clips, audio_clips, aspect_ratio, clips_to_close, output_path, render_output, quick_and_dirty):
-    if len(video_clips) > 0:
+def crop_and_process_sequential_audio_clips(scene, video_clips_by_target, audio_clips, output_targets, clips_to_close, output_paths):
+    """
+    Crops each output target's timeline clips and adds the sequential audio.
+
+    :param video_clips_by_target: Timeline clips of the scene keyed by target name.
+    :param output_targets: The output targets that need to be rendered.
+    :param output_paths: Scene output file pathnames keyed by target name.
+    :return: The output branches to encode, see write_video_targets().
+    """
+    sequential_audio_clip = None
+
+    if "sequential_audio_clips" in scene:
+        sequential_audio_clip = load_audio_clips(audio_clips, clips_to_close)
+
+        if sequential_audio_clip != None:
+            clips_to_close.append(sequential_audio_clip)
+
+    branches = []
+
+    for target in output_targets:
+        video_clips = video_clips_by_target[target["name"]]
+
+        if len(video_clips) == 0:
+            continue
+
         cropped_video_clip = None 
 
         if len(video_clips) == 1:
-            cropped_video_clip = crop_video_to_aspect_ratio(video_clips[0], aspect_ratio) 
+            cropped_video_clip = crop_video_to_aspect_ratio(video_clips[0], target["aspect_ratio"]) 
         else:
             video_clip = concatenate_videoclips(video_clips)
             clips_to_close.append(video_clip)
-            cropped_video_clip = crop_video_to_aspect_ratio(video_clip, aspect_ratio)
+            cropped_video_clip = crop_video_to_aspect_ratio(video_clip, target["aspect_ratio"])
 
         clips_to_close.append(cropped_video_clip)
 
-        if "sequential_audio_clips" in scene:
-            sequential_audio_clip = load_audio_clips(audio_clips, clips_to_close)
-            
-            if sequential_audio_clip != None:
-                clips_to_close.append(sequential_audio_clip)
+        # Video clips already arrive at the output resolution, still images are scaled here
+        cropped_video_clip = resize_video_to_resolution(cropped_video_clip, target["resolution"])
+        clips_to_close.append(cropped_video_clip)
 
-                timeline_clip_type = scene.get("timeline_clip_type", "video").lower()
+        if sequential_audio_clip != None:
+            timeline_clip_type = scene.get("timeline_clip_type", "video").lower()
 
-                sequential_audio_timeline_clips_volume = 1
+            sequential_audio_timeline_clips_volume = 1
 
-                if timeline_clip_type == "image":
-                    # No audio for image clips
-                    sequential_audio_timeline_clips_volume = 0
-                else:
-                    sequential_audio_timeline_clips_volume = scene.get("sequential_audio_timeline_clips_volume", 1)
+            if timeline_clip_type == "image":
+                # No audio for image clips
+                sequential_audio_timeline_clips_volume = 0
+            else:
+                sequential_audio_timeline_clips_volume = scene.get("sequential_audio_timeline_clips_volume", 1)
 
-                clips_to_close.append(cropped_video_clip)
-                cropped_video_clip = append_audio(sequential_audio_clip, cropped_video_clip, sequential_audio_timeline_clips_volume, clips_to_close)
-                clips_to_close.append(cropped_video_clip)
+            cropped_video_clip = append_audio(sequential_audio_clip, cropped_video_clip, sequential_audio_timeline_clips_volume, clips_to_close)
+            clips_to_close.append(cropped_video_clip)
 
-        if quick_and_dirty:
-            render_settings = render_output["quick_render"]["render_settings"]
-        else:
-            render_settings = render_output["high_quality_render"]["render_settings"]
+        branches.append({
+            "clip": cropped_video_clip,
+            "output_file_pathname": output_paths[target["name"]],
+            "render_settings": target["render_settings"],
+        })
 
-        write_video(cropped_video_clip, output_path, render_settings)
+    return branches
+    
+def load_image_clips(scene, image_list, output_targets, clips_to_close, source_file_watermark = False):
+    """
+    Loads the still images of an image scene.
 
-        for video_clip_item in clips_to_close:
-            try:
-                video_clip_item.close()
-            except:
-                pass 
+    :return: The image clips keyed by target name. Each image is decoded
+             cropped and scaled to the target's frame, targets framing the
+             image alike share the decoded raster.
+    """
+    video_clips_by_target = {}
 
-        return output_path
-    else:
-        return None
-    
-def load_image_clips(segment, scene, image_list, audio_clips, aspect_ratio, render_output, quick_and_dirty, source_file_watermark = False):
-    # Load all video clips
-    video_clips = []
-    clips_to_close = []
+    for target in output_targets:
+        video_clips = []
+
+        for image_meta in image_list:
+            video_clip = create_video_from_image(image_meta, target["aspect_ratio"], target["quick_and_dirty"], clips_to_close, source_file_watermark, target["resolution"])
+            clips_to_close.append(video_clip)
+            video_clips.append(video_clip)
+
+        video_clips_by_target[target["name"]] = video_clips
+
+    return video_clips_by_target
+
+def build_image_scene_output_file_pathname(cut, segment, scene, aspect_ratio_text: str) -> str:
+    """
+    Constructs the file path for a rendered image scene, in the working directory.
+    """
+    # The cut title keeps cuts rendered from the same working directory apart
+    safe_cut_title = re.sub(r'[^a-zA-Z0-9_-]', '_', cut["title"])[:100]
 
     segment_title = segment["title"]
     scene_title = scene.get("title", "default-scene")
@@ -91,19 +140,15 @@ def load_image_clips(segment, scene, image_list, audio_clips, aspect_ratio, rend
     # Sanitize `segment_title` to remove problematic characters
     safe_segment_title = re.sub(r'[^a-zA-Z0-9_-]', '_', segment_title)[:50]  # Keep it safe & under 50 chars
     
-    output_path = f"temp_video_pipeline_clip_{safe_segment_title}_{scene_sequence}_{scene_title}_{aspect_ratio}.mp4"
+    return f"temp_video_pipeline_clip_{safe_cut_title}_{safe_segment_title}_{scene_sequence}_{scene_title}_{aspect_ratio_text}.mp4"
 
-    if video_file_exists(output_path, None) == False:
-        for image_meta in image_list:
-            video_clip = create_video_from_image(image_meta, aspect_ratio, quick_and_dirty, clips_to_close, source_file_watermark)
-            clips_to_close.append(video_clip)
-            video_clips.append(video_clip)
 
-        # Concatenate video clips
-        output_path = crop_and_process_sequential_audio_clips(scene, video_clips, audio_clips, aspect_ratio, clips_to_close, output_path, render_output, quick_and_dirty)
-        return output_path
-    else:
-        return output_path
+def build_scene_output_file_pathname(cut, segment, scene, render_output, target) -> str:
+    """Returns the output file pathname of a scene for one output target."""
+    if scene.get("timeline_clip_type", "video").lower() == "image":
+        return build_image_scene_output_file_pathname(cut, segment, scene, target["label"])
+
+    return build_video_segment_output_file_pathname(cut, segment, scene, render_output, target["quick_and_dirty"], target["label"])
 
 def build_video_segment_output_file_pathname(
     cut,
@@ -151,32 +196,115 @@ def build_video_segment_output_file_pathname(
     return output_path
 
 
-def load_video_clips(cut, segment, scene, video_clip_list, audio_clips, aspect_ratio, quick_and_dirty, render_output, source_file_watermark = False):
-    # Load all video clips
-    video_clips = []
+def render_video_clip_targets(video, output_targets, clip_paths, source_file_watermark = False):
+    """
+    Renders a finished timeline clip for the given output targets into the
+    clip cache, decoding the source once for all of them.
+    """
     clips_to_close = []
 
-    output_path = build_video_segment_output_file_pathname(cut, segment, scene, render_output, quick_and_dirty, aspect_ratio)
+    try:
+        source_clip, watermark, source_size = open_video_source(video, clips_to_close, output_targets)
 
-    segment["rendered_video_path"] = output_path
+        if len(output_targets) > 1:
+            source_clip = share_decoded_frames(source_clip)
 
-    if video_file_exists(output_path) == False:
-        for video in video_clip_list:
-            # If we have an image defined at the scene, then copy it to the clip
-            if "overlay_images" in scene:
-                if "overlay_images" not in video:
-                    video["overlay_images"] = []
-                video["overlay_images"].extend(scene["overlay_images"])
+        branches = []
 
-            video_clip = load_video_clip(video, aspect_ratio, quick_and_dirty, clips_to_close, source_file_watermark)
+        for target in output_targets:
+            video_clip = finish_video_clip(source_clip, video, target["aspect_ratio"], watermark, clips_to_close, source_file_watermark, target, source_size)
             clips_to_close.append(video_clip)
-            video_clips.append(video_clip)
 
-        # Concatenate video clips
-        output_path = crop_and_process_sequential_audio_clips(scene, video_clips, audio_clips, aspect_ratio, clips_to_close, output_path, render_output, quick_and_dirty)
-        return output_path
-    else:
-        return output_path
+            branches.append({
+                "clip": video_clip,
+                "output_file_pathname": clip_paths[target["name"]],
+                "render_settings": get_clip_render_settings(video_clip),
+            })
+
+        write_video_targets(branches)
+    finally:
+        for video_clip_item in clips_to_close:
+            try:
+                video_clip_item.close()
+            except:
+                pass
+
+
+def load_cached_video_clip(video, output_targets, clips_to_close, source_file_watermark = False):
+    """
+    Returns the finished clip of every target from the clip cache, see
+    clip_cache.get_clip_key(). Clips not cached yet are rendered first, so the
+    scene only concatenates finished clips.
+
+    :return: The finished clip keyed by target name.
+    """
+    clip_paths = {
+        target["name"]: get_clip_file_pathname(video, get_clip_key(video, target, source_file_watermark))
+        for target in output_targets
+    }
+
+    missing_targets = []
+
+    for target in output_targets:
+        # Targets with the same framing share one clip
+        if clip_paths[target["name"]] in {clip_paths[missing_target["name"]] for missing_target in missing_targets}:
+            continue
+
+        clip_cached = clip_exists(clip_paths[target["name"]])
+        record_cache_lookup("clip", clip_cached)
+
+        if not clip_cached:
+            missing_targets.append(target)
+
+    if len(missing_targets) > 0:
+        with time_stage("render_clips"):
+            render_video_clip_targets(video, missing_targets, clip_paths, source_file_watermark)
+
+    video_clips = {}
+
+    for target in output_targets:
+        video_clip = VideoFileClip(clip_paths[target["name"]])
+        count_decoded_frames(video_clip.reader)
+        clips_to_close.append(video_clip)
+        video_clips[target["name"]] = video_clip
+
+    return video_clips
+
+
+def load_video_clips(scene, video_clip_list, output_targets, clips_to_close, source_file_watermark = False):
+    """
+    Opens, trims and finishes the timeline clips of a video scene.
+
+    :return: The finished clips keyed by target name. Each source is decoded
+             once and shared by all targets. With render_individual_clips set,
+             the finished clips come from the clip cache instead.
+    """
+    video_clips_by_target = {target["name"]: [] for target in output_targets}
+
+    for video in video_clip_list:
+        # If we have an image defined at the scene, then apply it to the clip too.
+        # The timeline clip itself is left untouched so the scene can be rebuilt.
+        if "overlay_images" in scene:
+            video = dict(video)
+            video["overlay_images"] = video.get("overlay_images", []) + scene["overlay_images"]
+
+        if is_clip_cache_enabled():
+            for target_name, video_clip in load_cached_video_clip(video, output_targets, clips_to_close, source_file_watermark).items():
+                video_clips_by_target[target_name].append(video_clip)
+            continue
+
+        # Decode and trim each source once, then branch per output target
+        source_clip, watermark, source_size = open_video_source(video, clips_to_close, output_targets)
+
+        if len(output_targets) > 1:
+            source_clip = share_decoded_frames(source_clip)
+
+        for target in output_targets:
+            video_clip = finish_video_clip(source_clip, video, target["aspect_ratio"], watermark, clips_to_close, source_file_watermark, target, source_size)
+            clips_to_close.append(video_clip)
+            video_clips_by_target[target["name"]].append(video_clip)
+
+    return video_clips_by_target
 
 
 def load_audio_clips(audio_clip_list, clips_to_close):
@@ -187,7 +315,7 @@ def load_audio_clips(audio_clip_list, clips_to_close):
         A list of dictionaries, each containing:
         - 'clip_file_pathname': str, the file path to the audio clip.
         - 'audio_volume' (optional): float, the volume scaling factor.
-    :return: AudioFileClip
+    :return: AudioClip
         The concatenated audio clip.
     """
     audio_clips = []
@@ -195,8 +323,7 @@ def load_audio_clips(audio_clip_list, clips_to_close):
     for audio in audio_clip_list:
         audio_path = audio["path"]
 
-        audio_clip = AudioFileClip(audio_path)
-        clips_to_close.append(audio_clip)
+        audio_clip = open_audio_source(audio_path, clips_to_close)
 
         watermark = ""
         audio_clip, watermark = process_audio_time_codes(audio, clips_to_close, watermark, audio_clip)
@@ -223,24 +350,231 @@ def load_audio_clips(audio_clip_list, clips_to_close):
     
     
 
-def generate_video_scene(cut, segment, scene, quick_and_dirty, manifest_last_modified_timestamp, aspect_ratio, render_output, source_file_watermark = False):
+def build_scene_branches(scene, output_targets, output_paths, clips_to_close, source_file_watermark = False):
+    """
+    Builds the composited scene clip of every output target, ready to encode.
+
+    Only the scene's JSON description is needed, so chunk workers in other
+    processes can rebuild the same branches.
+
+    :return: The output branches, see write_video_targets().
+    """
     timeline_clip_type = scene.get("timeline_clip_type", "video").lower()
     sorted_timeline_clips = sort_timeline_clips_by_sequence(scene)
     sorted_sequential_audio_clips = sort_sequential_audio_clips_by_sequence(scene)
+
+    if timeline_clip_type == "image":
+        video_clips_by_target = load_image_clips(scene, sorted_timeline_clips, output_targets, clips_to_close, source_file_watermark)
+    else:
+        video_clips_by_target = load_video_clips(scene, sorted_timeline_clips, output_targets, clips_to_close, source_file_watermark)
+
+    return crop_and_process_sequential_audio_clips(scene, video_clips_by_target, sorted_sequential_audio_clips, output_targets, clips_to_close, output_paths)
+
+
+def render_scene_chunk(chunk_output_paths, frame_range, chunk_render_settings, scene, output_targets, output_paths, source_file_watermark = False):
+    """
+    Chunk worker: rebuilds the scene and encodes the video of one frame range.
+    The soundtrack is muxed when the chunks are joined, see encode_in_chunks().
+
+    :param chunk_output_paths: Chunk output file pathnames, one per branch.
+    :param frame_range: The (first frame, end frame) to encode.
+    :param chunk_render_settings: Render settings, one per branch.
+    :return: The metrics of the chunk, see render_metrics.take_metrics().
+    """
+    clips_to_close = []
+
+    try:
+        branches = build_scene_branches(scene, output_targets, output_paths, clips_to_close, source_file_watermark)
+
+        chunk_branches = []
+
+        for branch_index, branch in enumerate(branches):
+            chunk_branches.append({
+                "clip": branch["clip"].without_audio(),
+                "output_file_pathname": chunk_output_paths[branch_index],
+                "render_settings": chunk_render_settings[branch_index],
+            })
+
+        write_video_targets(chunk_branches, frame_range)
+    finally:
+        for video_clip_item in clips_to_close:
+            try:
+                video_clip_item.close()
+            except:
+                pass
+
+    return take_metrics()
+
+
+def render_scene_frames(worker_index, scene, output_targets, output_paths, source_file_watermark = False):
+    """
+    Frame pipeline worker: rebuilds the scene and composites its share of the
+    frames, see frame_pipeline.encode_in_pipeline().
+
+    :return: The metrics of the worker, see render_metrics.take_metrics().
+    """
+    clips_to_close = []
+
+    try:
+        branches = build_scene_branches(scene, output_targets, output_paths, clips_to_close, source_file_watermark)
+        render_pipeline_frames(worker_index, branches, clips_to_close)
+    finally:
+        for video_clip_item in clips_to_close:
+            try:
+                video_clip_item.close()
+            except:
+                pass
+
+    return take_metrics()
+
+
+def encode_scene_targets(scene, output_targets, output_paths, source_file_watermark = False, to_mezzanine = False):
+    """
+    Composites the scene for the given output targets and encodes them in one
+    pass, splitting long scenes into chunks that are encoded in parallel.
+
+    :param to_mezzanine: Encode to the lossless mezzanine format instead of the
+                         targets' render settings, see mezzanine_cache.
+    :return: The output file pathnames written.
+    """
+    clips_to_close = []
+
+    try:
+        branches = build_scene_branches(scene, output_targets, output_paths, clips_to_close, source_file_watermark)
+
+        if to_mezzanine:
+            for branch in branches:
+                branch["render_settings"] = get_mezzanine_render_settings(branch["clip"])
+
+        if len(branches) > 0:
+            if should_encode_in_chunks(branches):
+                encode_in_chunks(branches, render_scene_chunk, (scene, output_targets, output_paths, source_file_watermark))
+            elif should_encode_in_pipeline(branches):
+                encode_in_pipeline(branches, clips_to_close, render_scene_frames, (scene, output_targets, output_paths, source_file_watermark))
+            else:
+                write_video_targets(branches)
+
+        return [branch["output_file_pathname"] for branch in branches]
+    finally:
+        for video_clip_item in clips_to_close:
+            try:
+                video_clip_item.close()
+            except:
+                pass 
+
+
+def render_scene_targets_from_mezzanines(scene, output_targets, output_paths, source_file_watermark = False):
+    """
+    Encodes the scene's outputs from the mezzanines of its composited frames.
+    Only targets whose mezzanine is not cached are decoded and composited, so a
+    change of codec, preset, frame rate or quality profile only re-encodes.
+    """
+    mezzanine_paths = {
+        target["name"]: get_mezzanine_file_pathname(get_mezzanine_key(scene, target, source_file_watermark))
+        for target in output_targets
+    }
+
+    missing_targets = []
+
+    for target in output_targets:
+        mezzanine_path = mezzanine_paths[target["name"]]
+
+        # Targets with the same framing share one mezzanine
+        if mezzanine_path in {mezzanine_paths[missing_target["name"]] for missing_target in missing_targets}:
+            continue
+
+        mezzanine_cached = mezzanine_exists(mezzanine_path)
+        record_cache_lookup("mezzanine", mezzanine_cached)
+
+        if not mezzanine_cached:
+            missing_targets.append(target)
+
+    if len(missing_targets) > 0:
+        with time_stage("composite_mezzanine"):
+            encode_scene_targets(scene, missing_targets, mezzanine_paths, source_file_watermark, to_mezzanine=True)
+
+    for target in output_targets:
+        if video_file_exists(mezzanine_paths[target["name"]]):
+            with time_stage("encode_from_mezzanine"):
+                encode_from_mezzanine(mezzanine_paths[target["name"]], output_paths[target["name"]], target["render_settings"])
+            record_output_complete(output_paths[target["name"]], "scene")
+
+
+def render_scene_targets(scene, output_targets, output_paths, source_file_watermark = False):
+    """
+    Renders the scene for the given output targets in one pass. Targets that
+    need no pixel changes are smart cut from the sources instead, and with the
+    mezzanine cache enabled the outputs are encoded from cached mezzanines.
+    """
+    for target in list(output_targets):
+        if can_smart_cut_scene(scene, target, source_file_watermark):
+            with time_stage("smart_cut"):
+                smart_cut_scene(scene, target, output_paths[target["name"]])
+            record_output_complete(output_paths[target["name"]], "scene")
+            output_targets = [other_target for other_target in output_targets if other_target is not target]
+
+    if len(output_targets) == 0:
+        return
+
+    if is_mezzanine_cache_enabled():
+        render_scene_targets_from_mezzanines(scene, output_targets, output_paths, source_file_watermark)
+        return
+
+    with time_stage("composite_encode"):
+        output_file_pathnames = encode_scene_targets(scene, output_targets, output_paths, source_file_watermark)
+
+    for output_file_pathname in output_file_pathnames:
+        record_output_complete(output_file_pathname, "scene")
+
+
+def generate_video_scene(cut, segment, scene, output_targets, manifest_last_modified_timestamp, render_output, source_file_watermark = False):
+    """
+    Renders a scene for every output target.
+
+    :return: The rendered scene clips keyed by target name.
+    """
+    timeline_clip_type = scene.get("timeline_clip_type", "video").lower()
     enabled = scene.get("enabled", True)
 
-    scene_video = None 
-    timeline_video_clip = None 
+    scene_videos = {}
 
-    if enabled:
-        if timeline_clip_type == "image":
-            timeline_video_clip = load_image_clips(segment, scene, sorted_timeline_clips, sorted_sequential_audio_clips, aspect_ratio, quick_and_dirty, render_output, source_file_watermark)
+    if not enabled:
+        return scene_videos
 
-        else:
-            timeline_video_clip = load_video_clips(cut, segment, scene, sorted_timeline_clips, sorted_sequential_audio_clips, aspect_ratio, quick_and_dirty, render_output, source_file_watermark)
+    start_time = time.time()
 
-    if timeline_video_clip != None:
-        scene_video = VideoFileClip(timeline_video_clip)
+    output_paths = {}
+    pending_targets = []
 
-    return scene_video
-    
+    for target in output_targets:
+        output_path = build_scene_output_file_pathname(cut, segment, scene, render_output, target)
+        output_paths[target["name"]] = output_path
+
+        if output_is_complete(output_path) == False:
+            pending_targets.append(target)
+
+    if timeline_clip_type != "image":
+        segment["rendered_video_path"] = output_paths[output_targets[0]["name"]]
+
+    if len(pending_targets) > 0:
+        advance_scene_prefetch(output_paths[pending_targets[0]["name"]])
+        render_scene_targets(scene, pending_targets, output_paths, source_file_watermark)
+        record_scene_render(scene, pending_targets, output_paths[pending_targets[0]["name"]], time.time() - start_time)
+
+        for target in pending_targets:
+            preview_scene_output(output_paths[target["name"]])
+
+    pending_target_names = {target["name"] for target in pending_targets}
+
+    report_scene(
+        segment,
+        scene,
+        [get_output_facts(output_paths[target["name"]], target["name"] not in pending_target_names) for target in output_targets],
+        time.time() - start_time
+    )
+
+    for target_name, timeline_video_clip in output_paths.items():
+        if video_file_exists(timeline_video_clip):
+            scene_videos[target_name] = VideoFileClip(timeline_video_clip)
+
+    return scene_videos
@@ -1,46 +1,89 @@
-from scene_utility import generate_video_scene
+from typing import Dict, List
+from scene_utility import generate_video_scene, build_scene_output_file_pathname
 from moviepy import concatenate_videoclips
-from video_assembly_helper import skip_scene_render
+from video_assembly_helper import skip_segment_render, skip_scene_render
+from render_report import report_segment
+
+
+def get_scene_with_segment_overlays(segment, scene):
+    """
+    Returns the scene as it is rendered: if we have an image defined at the
+    segment, then it is applied to the scene too. The assembly itself is left
+    untouched, so a scene can be planned and rendered more than once.
+    """
+    if "overlay_images" not in segment:
+        return scene
+
+    scene = dict(scene)
+    scene["overlay_images"] = scene.get("overlay_images", []) + segment["overlay_images"]
+
+    return scene
+
+
+def iter_scene_renders(video_assembly: Dict, output_targets: List[Dict]):
+    """
+    Yields (segment, scene, target, output file pathname) for every scene
+    output the cut of an assembly renders, in render order. Scenes carry their
+    segment's overlays, as they are rendered.
+    """
+    cut = video_assembly.get("cut", {})
+    render_output = cut["render_output"]
+
+    for segment in sorted(cut.get("segments", []), key=lambda segment: segment["sequence"]):
+        if skip_segment_render(video_assembly, segment):
+            continue
+
+        for scene in sorted((scene for scene in segment.get("scenes", []) if "sequence" in scene), key=lambda scene: scene["sequence"]):
+            if skip_scene_render(video_assembly, segment, scene) or not scene.get("enabled", True):
+                continue
+
+            scene = get_scene_with_segment_overlays(segment, scene)
+
+            for target in output_targets:
+                yield segment, scene, target, build_scene_output_file_pathname(cut, segment, scene, render_output, target)
 
 
 def generate_video_segment(
-    video_assembly, cut, segment, quick_and_dirty, manifest_last_modified_timestamp, aspect_ratio, render_output, source_file_watermark = False
+    video_assembly, cut, segment, output_targets, manifest_last_modified_timestamp, render_output, source_file_watermark = False
 ):
+    """
+    Renders the scenes of a segment for every output target.
+
+    :return: The segment clips keyed by target name.
+    """
     # Sort scenes by sequence value before looping
     sorted_scenes = sorted(
         (scene for scene in segment.get("scenes", []) if "sequence" in scene),
         key=lambda scene: scene["sequence"],
     )
 
-    scene_video_clips = []
+    scene_video_clips = {target["name"]: [] for target in output_targets}
+
+    report_segment(segment)
 
     for scene in sorted_scenes:
         if skip_scene_render(video_assembly, segment, scene):
             continue
         
-        # If we have an image defined at the segment, then copy it to the scene
-        if "overlay_images" in segment:
-            if "overlay_images" not in scene:
-                scene["overlay_images"] = []
-            scene["overlay_images"].extend(segment["overlay_images"])
+        scene = get_scene_with_segment_overlays(segment, scene)
     
-        scene_video = generate_video_scene(cut, 
+        scene_videos = generate_video_scene(cut, 
             segment,
             scene,
-            quick_and_dirty,
+            output_targets,
             manifest_last_modified_timestamp,
-            aspect_ratio,
             render_output,
             source_file_watermark
         )
-        if scene_video != None:
-            scene_video_clips.append(scene_video)
-
-    if len(scene_video_clips) > 0:
-        if len(scene_video_clips) == 1:
-            return scene_video_clips[0]
-        else:
-            segment_video = concatenate_videoclips(scene_video_clips)
-            return segment_video
-    else:
-        return None
+        for target_name, scene_video in scene_videos.items():
+            scene_video_clips[target_name].append(scene_video)
+
+    segment_videos = {}
+
+    for target_name, target_scene_video_clips in scene_video_clips.items():
+        if len(target_scene_video_clips) == 1:
+            segment_videos[target_name] = target_scene_video_clips[0]
+        elif len(target_scene_video_clips) > 1:
+            segment_videos[target_name] = concatenate_videoclips(target_scene_video_clips)
+
+    return segment_videos
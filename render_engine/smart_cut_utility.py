@@ -0,0 +1,428 @@
+import os
+import re
+import json
+import time
+import subprocess as sp
+
+from typing import Any, Dict, List, Tuple, Union
+from fractions import Fraction
+from moviepy.config import FFMPEG_BINARY
+from moviepy.tools import cross_platform_popen_params, find_extension
+from fingerprint_utility import source_fingerprint
+from video_utility import atomic_output_file, ensure_directory_exists, get_cropped_size, probe_media_source
+from chunk_encode_utility import join_chunks
+from clip_utility import get_clip_trim_seconds
+from resource_governor import allocate_threads, lease
+from staging_cache import resolve_source_path
+from render_metrics import record_cache_lookup
+
+DEFAULT_KEYFRAME_INDEX_PATH = os.path.join(os.path.expanduser("~"), ".composeflow", "keyframe_index")
+DEFAULT_EDGE_CRF = 18
+DEFAULT_EDGE_PRESET = "medium"
+KEYFRAME_INDEX_VERSION = 1
+
+# Source codecs that can be smart cut, with the encoder used for the partial GOPs
+SMART_CUT_ENCODERS = {
+    "h264": "libx264",
+    "hevc": "libx265",
+}
+
+# ffmpeg profile names, as printed when probing, to encoder -profile:v values
+ENCODER_PROFILES = {
+    "Constrained Baseline": "baseline",
+    "Baseline": "baseline",
+    "Main": "main",
+    "High": "high",
+    "High 10": "high10",
+    "High 4:2:2": "high422",
+    "High 4:4:4 Predictive": "high444",
+    "Main 10": "main10",
+}
+
+VIDEO_STREAM_PATTERN = re.compile(r"Stream #0:\d+.*?: Video: (\w+)(?: \(([^)]*)\))?.*?, (\w+)[(,\s]")
+
+# The smart cut settings of the cut being rendered
+_smart_cut: Dict[str, Any] = {
+    "enabled": False,
+    "keyframe_index_path": DEFAULT_KEYFRAME_INDEX_PATH,
+    "crf": DEFAULT_EDGE_CRF,
+    "preset": DEFAULT_EDGE_PRESET,
+}
+
+
+def configure_smart_cut(settings: Dict) -> None:
+    """
+    Reads the smart cut options from the video assembly settings.
+
+    Settings:
+        "smart_cut": {
+            "enabled": false,
+            "keyframe_index_path": Directory of the keyframe index (default ~/.composeflow/keyframe_index).
+            "crf": Quality of the re-encoded partial GOPs (default 18).
+            "preset": Encoder preset of the partial GOPs (default "medium"). They are
+                      short, and the faster presets drop to a lower profile than
+                      the copied GOPs.
+        }
+    """
+    smart_cut = settings.get("smart_cut", {})
+
+    _smart_cut["enabled"] = smart_cut.get("enabled", False)
+    _smart_cut["keyframe_index_path"] = smart_cut.get("keyframe_index_path") or DEFAULT_KEYFRAME_INDEX_PATH
+    _smart_cut["crf"] = smart_cut.get("crf", DEFAULT_EDGE_CRF)
+    _smart_cut["preset"] = smart_cut.get("preset", DEFAULT_EDGE_PRESET)
+
+
+def is_smart_cut_enabled() -> bool:
+    return bool(_smart_cut["enabled"])
+
+
+def get_keyframe_index_file_pathname(index_path: str, fingerprint: str) -> str:
+    return os.path.join(index_path, fingerprint[:2], f"{fingerprint}.keyframes.json")
+
+
+def build_keyframe_index(source_path: str) -> Dict[str, Any]:
+    """
+    Lists the keyframes of a source's first video stream.
+
+    The packets are only demuxed, not decoded, so this takes a fraction of the
+    source's duration. Times are relative to the first frame, as MoviePy and
+    ffmpeg's input seeking count them.
+
+    :return: The codec facts of the stream and its keyframes as
+             {"time": seconds, "packet": index of the packet in decode order}.
+    """
+    cmd = [
+        FFMPEG_BINARY, "-hide_banner", "-loglevel", "info",
+        "-i", resolve_source_path(source_path),
+        "-map", "0:v:0", "-c", "copy", "-f", "framecrc", "-",
+    ]
+
+    process = sp.run(cmd, **cross_platform_popen_params({"stdout": sp.PIPE, "stderr": sp.PIPE}))
+
+    if process.returncode != 0:
+        raise IOError(f"Indexing the keyframes of '{source_path}' failed:\n{process.stderr.decode(errors='replace')}")
+
+    stream_match = VIDEO_STREAM_PATTERN.search(process.stderr.decode(errors="replace"))
+
+    time_base = None
+    width = height = None
+    first_dts = None
+    packet_pts = []
+    keyframe_packets = []
+
+    for line in process.stdout.decode(errors="replace").splitlines():
+        if line.startswith("#tb 0:"):
+            time_base = Fraction(line.split(":", 1)[1].strip())
+        elif line.startswith("#dimensions 0:"):
+            width, height = (int(value) for value in line.split(":", 1)[1].strip().split("x"))
+        elif line.startswith("0,"):
+            fields = [field.strip() for field in line.split(",")]
+            flags = int(fields[6][2:], 16) if len(fields) > 6 and fields[6].startswith("F=") else 1
+
+            if flags & 1:
+                keyframe_packets.append(len(packet_pts))
+
+            if first_dts is None:
+                first_dts = int(fields[1])
+
+            packet_pts.append(int(fields[2]))
+
+    if time_base is None or len(packet_pts) == 0:
+        raise IOError(f"'{source_path}' has no video packets to index.")
+
+    first_pts = min(packet_pts)
+
+    return {
+        "version": KEYFRAME_INDEX_VERSION,
+        "codec": stream_match.group(1) if stream_match else None,
+        "profile": stream_match.group(2) if stream_match else None,
+        "pix_fmt": stream_match.group(3) if stream_match else None,
+        "time_base": [time_base.numerator, time_base.denominator],
+        "size": [width, height],
+        "packet_count": len(packet_pts),
+        # How far decode times run ahead of presentation times, because of B-frames
+        "dts_delay": float(max(0, first_pts - first_dts) * time_base),
+        "keyframes": [
+            {"time": float((packet_pts[packet] - first_pts) * time_base), "packet": packet}
+            for packet in keyframe_packets
+        ],
+    }
+
+
+def get_keyframe_index(source_path: str) -> Dict[str, Any]:
+    """
+    Returns the keyframe index of a source, from the on-disk index when the
+    source was indexed before. Entries are keyed by the source's fingerprint,
+    so they survive moves and renames and never go stale.
+    """
+    index_file_pathname = get_keyframe_index_file_pathname(_smart_cut["keyframe_index_path"], source_fingerprint(source_path))
+
+    try:
+        with open(index_file_pathname, "r") as index_file:
+            keyframe_index = json.load(index_file)
+
+        if keyframe_index.get("version") == KEYFRAME_INDEX_VERSION:
+            record_cache_lookup("keyframe_index", True)
+            return keyframe_index
+    except (OSError, ValueError):
+        pass
+
+    record_cache_lookup("keyframe_index", False)
+    keyframe_index = build_keyframe_index(source_path)
+
+    ensure_directory_exists(index_file_pathname)
+
+    with atomic_output_file(index_file_pathname) as partial_file_pathname:
+        with open(partial_file_pathname, "w") as index_file:
+            json.dump(keyframe_index, index_file)
+
+    return keyframe_index
+
+
+def plan_smart_cut(keyframe_index: Dict[str, Any], fps: float, start: float, end: Union[float, None]) -> List[Dict[str, Any]]:
+    """
+    Splits a trim range into the parts of a smart cut: the GOPs fully inside
+    the range are copied, the partial GOPs at either edge are re-encoded.
+
+    :param end: End of the range in seconds, None for the end of the source.
+    :return: The parts in order, each {"mode": "copy" | "encode", "start": seconds,
+             "frames": frame or packet count}.
+    """
+    keyframes = keyframe_index["keyframes"]
+    half_frame = 0.5 / fps
+
+    # The first keyframe at or after the start, and the last one at or before the end
+    first_keyframe = next((keyframe for keyframe in keyframes if keyframe["time"] >= start - half_frame), None)
+
+    if end is None:
+        last_keyframe = {"time": None, "packet": keyframe_index["packet_count"]}
+    else:
+        last_keyframe = next((keyframe for keyframe in reversed(keyframes) if keyframe["time"] <= end + half_frame), None)
+
+    if first_keyframe is None or last_keyframe is None or last_keyframe["packet"] <= first_keyframe["packet"]:
+        # No whole GOP inside the range
+        if end is None:
+            return [{"mode": "encode", "start": start, "frames": None}]
+        return [{"mode": "encode", "start": start, "frames": int(round((end - start) * fps))}]
+
+    parts = []
+    head_frames = int(round((first_keyframe["time"] - start) * fps))
+
+    if head_frames > 0:
+        parts.append({"mode": "encode", "start": start, "frames": head_frames})
+
+    # Packets are counted in decode order, so the copy ends exactly before the last keyframe
+    parts.append({"mode": "copy", "start": first_keyframe["time"], "frames": last_keyframe["packet"] - first_keyframe["packet"]})
+
+    if end is not None:
+        tail_frames = int(round((end - last_keyframe["time"]) * fps))
+
+        if tail_frames > 0:
+            parts.append({"mode": "encode", "start": last_keyframe["time"], "frames": tail_frames})
+
+    return parts
+
+
+def can_smart_cut_scene(scene: Dict, target: Dict, source_file_watermark: bool = False) -> bool:
+    """
+    Returns True if the scene's output for the target needs no pixel changes,
+    so it can be cut from its sources: a video scene without overlays, watermark
+    or sequential audio, whose unrotated sources already have the target's size,
+    frame rate and codec and all share one stream format.
+    """
+    if not _smart_cut["enabled"] or source_file_watermark:
+        return False
+
+    if scene.get("timeline_clip_type", "video").lower() != "video":
+        return False
+
+    if scene.get("overlay_images") or scene.get("sequential_audio_clips"):
+        return False
+
+    timeline_clips = scene.get("timeline_clips", [])
+
+    if len(timeline_clips) == 0:
+        return False
+
+    render_settings = target["render_settings"]
+    stream_formats = set()
+    audio_found = set()
+
+    for clip in timeline_clips:
+        if clip.get("overlay_images") or not clip.get("path"):
+            return False
+
+        try:
+            infos = probe_media_source(clip["path"])
+            keyframe_index = get_keyframe_index(clip["path"])
+        except (IOError, OSError) as e:
+            print(f"Smart cut: cannot index '{clip['path']}': {e}")
+            return False
+
+        # ffmpeg decodes rotated footage upright, so its re-encoded edges would not match the copied GOPs
+        if infos.get("video_rotation", 0):
+            return False
+
+        source_size = tuple(infos.get("video_size") or ())
+
+        # No crop and no scaling
+        if len(source_size) != 2 or get_cropped_size(source_size, target["aspect_ratio"]) != source_size:
+            return False
+
+        if target["resolution"] is not None and tuple(target["resolution"]) != source_size:
+            return False
+
+        # Without a profile frame rate the output keeps the source's
+        if render_settings.get("fps") and abs((infos.get("video_fps") or 0) - render_settings["fps"]) > 0.01:
+            return False
+
+        if SMART_CUT_ENCODERS.get(keyframe_index["codec"]) != render_settings.get("codec", "libx264"):
+            return False
+
+        stream_formats.add((keyframe_index["codec"], keyframe_index["profile"], keyframe_index["pix_fmt"], source_size, infos.get("video_fps")))
+        audio_found.add(bool(infos.get("audio_found")))
+
+    # The copied GOPs are joined as one stream
+    return len(stream_formats) == 1 and len(audio_found) == 1
+
+
+def encode_smart_cut_part(source_path: str, part: Dict, keyframe_index: Dict, render_settings: Dict, part_file_pathname: str) -> None:
+    """Writes one part of a smart cut, copying or re-encoding it like the source stream."""
+    cmd = [FFMPEG_BINARY, "-y", "-loglevel", "error", "-ss", f"{part['start']:.6f}", "-i", resolve_source_path(source_path), "-map", "0:v:0", "-an"]
+    threads = 0
+
+    if part["frames"] is not None:
+        cmd.extend(["-frames:v", str(part["frames"])])
+
+    if part["mode"] == "copy":
+        cmd.extend(["-c:v", "copy"])
+    else:
+        # Without B-frames, and with the decode times shifted like the copied GOPs', so
+        # decode times keep increasing across the joins
+        cmd.extend([
+            "-c:v", SMART_CUT_ENCODERS[keyframe_index["codec"]],
+            "-preset", _smart_cut["preset"],
+            "-crf", str(_smart_cut["crf"]),
+            "-bf", "0",
+        ])
+
+        if keyframe_index["dts_delay"] > 0:
+            cmd.extend(["-bsf:v", f"setts=dts=DTS-{keyframe_index['dts_delay']:.9f}/TB"])
+
+        if keyframe_index["pix_fmt"]:
+            cmd.extend(["-pix_fmt", keyframe_index["pix_fmt"]])
+
+        if keyframe_index["profile"] in ENCODER_PROFILES:
+            cmd.extend(["-profile:v", ENCODER_PROFILES[keyframe_index["profile"]]])
+
+        threads = render_settings.get("threads") or allocate_threads()
+        cmd.extend(["-threads", str(threads)])
+
+    # Same timescale as the source, so the parts join without timestamp drift
+    cmd.extend(["-video_track_timescale", str(keyframe_index["time_base"][1]), part_file_pathname])
+
+    # Stream copies use next to no CPU, only re-encoded edges lease threads
+    with lease(threads):
+        process = sp.run(cmd, **cross_platform_popen_params({"stdout": sp.DEVNULL, "stderr": sp.PIPE}))
+
+    if process.returncode != 0:
+        raise IOError(f"Smart cut of '{source_path}' failed:\n{process.stderr.decode(errors='replace')}")
+
+
+def write_smart_cut_audio(clip_ranges: List[Tuple[Dict, float, Union[float, None]]], output_file_pathname: str, audio_codec: str) -> str:
+    """
+    Writes the soundtrack of the smart cut clips, trimmed and joined, next to
+    the output file.
+
+    :param clip_ranges: (timeline clip, start, end) of every clip.
+    :return: The temporary audio file pathname.
+    """
+    name, _ = os.path.splitext(os.path.basename(output_file_pathname))
+    audio_file_pathname = os.path.join(
+        os.path.dirname(os.path.abspath(output_file_pathname)),
+        f"{name}TEMP_smart_cut_snd.{find_extension(audio_codec)}"
+    )
+
+    cmd = [FFMPEG_BINARY, "-y", "-loglevel", "error"]
+    filters = []
+
+    for input_index, (clip, start, end) in enumerate(clip_ranges):
+        cmd.extend(["-ss", f"{start:.6f}"])
+
+        if end is not None:
+            cmd.extend(["-t", f"{end - start:.6f}"])
+
+        cmd.extend(["-i", resolve_source_path(clip["path"])])
+        filters.append(f"[{input_index}:a:0]volume={float(clip.get('volume', 1.0))}[a{input_index}]")
+
+    audio_inputs = "".join(f"[a{input_index}]" for input_index in range(len(clip_ranges)))
+    filters.append(f"{audio_inputs}concat=n={len(clip_ranges)}:v=0:a=1[a]")
+
+    cmd.extend(["-filter_complex", ";".join(filters), "-map", "[a]", "-c:a", audio_codec, audio_file_pathname])
+
+    process = sp.run(cmd, **cross_platform_popen_params({"stdout": sp.DEVNULL, "stderr": sp.PIPE}))
+
+    if process.returncode != 0:
+        raise IOError(f"Writing the smart cut soundtrack of '{output_file_pathname}' failed:\n{process.stderr.decode(errors='replace')}")
+
+    return audio_file_pathname
+
+
+def smart_cut_scene(scene: Dict, target: Dict, output_file_pathname: str) -> None:
+    """
+    Renders a scene by smart cutting its timeline clips, see can_smart_cut_scene().
+
+    The whole GOPs of every trimmed clip are copied as they are and only the
+    partial GOPs at the trim edges are re-encoded, then all parts are joined
+    without re-encoding and the soundtrack is muxed.
+    """
+    render_settings = target["render_settings"]
+    audio_codec = render_settings.get("audio", {}).get("codec", "aac")
+
+    timeline_clips = sorted(scene.get("timeline_clips", []), key=lambda clip: clip.get("sequence", 0))
+
+    start_time = time.time()
+    part_file_pathnames = []
+    clip_ranges = []
+    audio_file_pathname = None
+    copied_frames = encoded_frames = 0
+
+    ensure_directory_exists(output_file_pathname)
+    name, extension = os.path.splitext(output_file_pathname)
+
+    try:
+        for clip in timeline_clips:
+            start, end = get_clip_trim_seconds(clip)
+            keyframe_index = get_keyframe_index(clip["path"])
+
+            fps = render_settings.get("fps") or probe_media_source(clip["path"])["video_fps"]
+
+            for part in plan_smart_cut(keyframe_index, fps, start, end):
+                part_file_pathname = f"{name}.part{len(part_file_pathnames):04d}{extension}"
+                part_file_pathnames.append(part_file_pathname)
+
+                encode_smart_cut_part(clip["path"], part, keyframe_index, render_settings, part_file_pathname)
+
+                if part["mode"] == "copy":
+                    copied_frames += part["frames"]
+                else:
+                    encoded_frames += part["frames"] or 0
+
+            clip_ranges.append((clip, start, end))
+
+        if probe_media_source(timeline_clips[0]["path"]).get("audio_found"):
+            audio_file_pathname = write_smart_cut_audio(clip_ranges, output_file_pathname, audio_codec)
+
+        join_chunks(part_file_pathnames, audio_file_pathname, output_file_pathname)
+    finally:
+        for part_file_pathname in part_file_pathnames:
+            if os.path.exists(part_file_pathname):
+                os.remove(part_file_pathname)
+
+        if audio_file_pathname is not None and os.path.exists(audio_file_pathname):
+            os.remove(audio_file_pathname)
+
+    print(
+        f"Smart cut '{output_file_pathname}': {copied_frames} frames copied, {encoded_frames} re-encoded "
+        f"in {time.time() - start_time:.2f}s."
+    )
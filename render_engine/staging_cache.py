@@ -0,0 +1,320 @@
+import os
+import json
+import time
+import hashlib
+import threading
+
+from typing import Any, Dict, List, Union
+from video_utility import atomic_output_file, ensure_directory_exists
+from video_assembly_helper import collect_media_paths, get_file_signature
+from fingerprint_utility import file_checksum
+from render_metrics import record_cache_lookup, record_source_read
+
+DEFAULT_STAGING_CACHE_PATH = os.path.join(os.path.expanduser("~"), ".composeflow", "staging")
+DEFAULT_STAGING_CACHE_MAX_SIZE_MB = 51200
+
+# Size of the sequential reads copying a source off its volume
+STAGING_READ_SIZE = 8 * 1024 * 1024
+
+# The staging cache settings of the cut being rendered
+_staging_cache: Dict[str, Any] = {
+    "enabled": False,
+    "path": DEFAULT_STAGING_CACHE_PATH,
+    "max_size_mb": DEFAULT_STAGING_CACHE_MAX_SIZE_MB,
+    "volumes": [],
+}
+
+
+def configure_staging_cache(settings: Dict) -> None:
+    """
+    Reads the staging cache options from the video assembly settings.
+
+    Settings:
+        "staging_cache": {
+            "enabled": false,
+            "path": Local directory of the cache (default ~/.composeflow/staging).
+            "max_size_mb": Size the cache is trimmed to (default 51200).
+            "volumes": Path prefixes of the slow volumes whose sources are
+                       staged (default: the "common_base_file_path" setting).
+        }
+    """
+    staging_cache = settings.get("staging_cache", {})
+    volumes = staging_cache.get("volumes")
+
+    if volumes is None:
+        volumes = [settings["common_base_file_path"]] if settings.get("common_base_file_path") else []
+
+    _staging_cache["enabled"] = staging_cache.get("enabled", False)
+    _staging_cache["path"] = staging_cache.get("path") or DEFAULT_STAGING_CACHE_PATH
+    _staging_cache["max_size_mb"] = staging_cache.get("max_size_mb", DEFAULT_STAGING_CACHE_MAX_SIZE_MB)
+    _staging_cache["volumes"] = [os.path.abspath(volume) for volume in volumes]
+
+
+def get_staging_cache_settings() -> Dict[str, Any]:
+    """Returns the staging cache settings, to configure worker processes alike."""
+    return dict(_staging_cache)
+
+
+def set_staging_cache_settings(staging_cache_settings: Dict[str, Any]) -> None:
+    _staging_cache.update(staging_cache_settings)
+
+
+def is_staged_volume_path(source_path: str) -> bool:
+    """True if the source lives on one of the slow volumes."""
+    source_path = os.path.abspath(source_path)
+
+    return any(source_path == volume or source_path.startswith(volume.rstrip(os.sep) + os.sep) for volume in _staging_cache["volumes"])
+
+
+def get_staged_file_pathname(source_path: str, file_signature) -> str:
+    """
+    Returns where a source is staged, keyed by its path, mtime and size so an
+    edited source is staged again.
+    """
+    staging_key = hashlib.sha256(json.dumps([os.path.abspath(source_path), file_signature]).encode("utf-8")).hexdigest()
+    _, extension = os.path.splitext(source_path)
+
+    # The extension is kept so readers still detect the container
+    return os.path.join(_staging_cache["path"], staging_key[:2], f"{staging_key}{extension}")
+
+
+def get_staged_info_pathname(staged_file_pathname: str) -> str:
+    return f"{staged_file_pathname}.json"
+
+
+def read_staged_info(staged_file_pathname: str) -> Union[Dict[str, Any], None]:
+    try:
+        with open(get_staged_info_pathname(staged_file_pathname), "r") as info_file:
+            return json.load(info_file)
+    except (OSError, ValueError):
+        return None
+
+
+def is_staged_file_intact(staged_file_pathname: str, verify_checksum: bool) -> bool:
+    """
+    Checks a staged copy against what was recorded when it was staged: always
+    its size, and with verify_checksum the SHA-256 of its bytes.
+    """
+    staged_info = read_staged_info(staged_file_pathname)
+
+    if staged_info is None or not os.path.isfile(staged_file_pathname):
+        return False
+
+    if os.path.getsize(staged_file_pathname) != staged_info.get("size"):
+        return False
+
+    return not verify_checksum or file_checksum(staged_file_pathname) == staged_info.get("sha256")
+
+
+def remove_staged_file(staged_file_pathname: str) -> None:
+    for file_pathname in (staged_file_pathname, get_staged_info_pathname(staged_file_pathname)):
+        try:
+            os.remove(file_pathname)
+        except OSError:
+            pass
+
+
+def copy_to_staging(source_path: str, staged_file_pathname: str, is_cancelled=None) -> None:
+    """
+    Copies a source with large sequential reads, recording its size and
+    checksum next to the copy.
+
+    :param is_cancelled: Checked between reads, the copy stops with an
+                         InterruptedError once it returns True.
+    """
+    ensure_directory_exists(staged_file_pathname)
+    start_time = time.time()
+    checksum = hashlib.sha256()
+    size = 0
+
+    with atomic_output_file(staged_file_pathname) as partial_file_pathname:
+        with open(source_path, "rb") as source_file, open(partial_file_pathname, "wb") as staged_file:
+            for chunk in iter(lambda: source_file.read(STAGING_READ_SIZE), b""):
+                if is_cancelled is not None and is_cancelled():
+                    raise InterruptedError(f"Staging '{source_path}' was cancelled.")
+
+                staged_file.write(chunk)
+                checksum.update(chunk)
+                size += len(chunk)
+                record_source_read(source_path, len(chunk), "staging")
+
+    with atomic_output_file(get_staged_info_pathname(staged_file_pathname)) as partial_info_pathname:
+        with open(partial_info_pathname, "w") as info_file:
+            json.dump({"source_path": os.path.abspath(source_path), "size": size, "sha256": checksum.hexdigest()}, info_file)
+
+    print(f"Staged '{source_path}' ({size / (1024 * 1024):.1f} MB) in {time.time() - start_time:.2f}s.")
+
+
+def trim_staging_cache(needed_bytes: int, keep_file_pathnames) -> None:
+    """
+    Removes the least recently used staged sources until needed_bytes more fit
+    the cache's size. Sources staged for the current render are kept.
+    """
+    max_size = _staging_cache["max_size_mb"] * 1024 * 1024
+    cache_files = []
+
+    for directory, _, file_names in os.walk(_staging_cache["path"]):
+        for file_name in file_names:
+            if file_name.endswith(".json") or ".partial" in file_name:
+                continue
+
+            file_pathname = os.path.join(directory, file_name)
+
+            try:
+                file_stat = os.stat(file_pathname)
+            except OSError:
+                continue
+
+            cache_files.append((file_stat.st_mtime, file_stat.st_size, file_pathname))
+
+    cache_size = sum(file_size for _, file_size, _ in cache_files)
+
+    for _, file_size, file_pathname in sorted(cache_files):
+        if cache_size + needed_bytes <= max_size:
+            break
+
+        if file_pathname in keep_file_pathnames:
+            continue
+
+        remove_staged_file(file_pathname)
+        cache_size -= file_size
+
+
+class SourceStager:
+    """
+    Copies the sources on slow volumes to the local staging cache, on a
+    background thread and in the order the render reads them.
+
+    Random reads across many files on a USB or network drive are much slower
+    than one sequential read per file, so each source is copied whole, once,
+    and later reads go to the local copy. Until its copy is ready a source is
+    read from its volume as before.
+
+    Copies staged by earlier renders are checked against their recorded
+    checksum before they are used. Only copies staged or checked by this
+    stager are handed to readers.
+    """
+
+    def __init__(self, source_paths: List[str]):
+        """
+        :param source_paths: The sources to stage, in the order they are read.
+        """
+        self.source_paths = source_paths
+        self.staged_paths = {}
+        self.lock = threading.Lock()
+        self.closed = False
+        self.keep_file_pathnames = set()
+        self.thread = threading.Thread(target=self._stage_sources, name="source_stager", daemon=True)
+        self.thread.start()
+
+    def _stage_sources(self) -> None:
+        max_size = _staging_cache["max_size_mb"] * 1024 * 1024
+
+        for source_path in self.source_paths:
+            if self.closed:
+                return
+
+            try:
+                file_signature = get_file_signature(source_path)
+
+                if file_signature is None or file_signature[1] > max_size:
+                    continue
+
+                staged_file_pathname = get_staged_file_pathname(source_path, file_signature)
+                self.keep_file_pathnames.add(staged_file_pathname)
+
+                staged_file_intact = is_staged_file_intact(staged_file_pathname, verify_checksum=True)
+                record_cache_lookup("staging", staged_file_intact)
+
+                if staged_file_intact:
+                    # The modification time orders the cache for trim_staging_cache()
+                    os.utime(staged_file_pathname)
+                else:
+                    remove_staged_file(staged_file_pathname)
+                    trim_staging_cache(file_signature[1], self.keep_file_pathnames)
+                    copy_to_staging(source_path, staged_file_pathname, lambda: self.closed)
+
+                    # The source changed while it was copied
+                    if get_file_signature(source_path) != file_signature:
+                        remove_staged_file(staged_file_pathname)
+                        continue
+
+                with self.lock:
+                    self.staged_paths[os.path.abspath(source_path)] = staged_file_pathname
+            except InterruptedError:
+                return
+            except Exception as e:
+                # Staging is only an optimization, the render reads the volume itself
+                print(f"Staging '{source_path}' failed: {e!r}")
+
+    def get_staged_path(self, source_path: str) -> Union[str, None]:
+        with self.lock:
+            return self.staged_paths.get(os.path.abspath(source_path))
+
+    def close(self) -> None:
+        self.closed = True
+        self.thread.join()
+
+
+# The stager of the cut being rendered
+_source_stager: Union[SourceStager, None] = None
+
+
+def collect_staged_sources(scenes: List[Dict]) -> List[str]:
+    """Returns the sources of the scenes that live on slow volumes, in scene order and without repeats."""
+    source_paths = []
+
+    for scene in scenes:
+        for source_path in sorted(collect_media_paths(scene)):
+            if source_path not in source_paths and is_staged_volume_path(source_path) and os.path.isfile(source_path):
+                source_paths.append(source_path)
+
+    return source_paths
+
+
+def open_source_staging(scenes: List[Dict]) -> None:
+    """Starts staging the sources of the scenes about to render, see SourceStager."""
+    global _source_stager
+
+    close_source_staging()
+
+    if _staging_cache["enabled"] and _staging_cache["volumes"]:
+        source_paths = collect_staged_sources(scenes)
+
+        if source_paths:
+            _source_stager = SourceStager(source_paths)
+
+
+def close_source_staging() -> None:
+    global _source_stager
+
+    if _source_stager is not None:
+        _source_stager.close()
+        _source_stager = None
+
+
+def resolve_source_path(source_path: str) -> str:
+    """
+    Returns the path to read a source from: its local staged copy when one is
+    ready, otherwise the source itself.
+
+    Worker processes have no stager of their own, they read copies whose size
+    matches what was recorded when they were staged.
+    """
+    if not _staging_cache["enabled"] or not is_staged_volume_path(source_path):
+        return source_path
+
+    if _source_stager is not None:
+        return _source_stager.get_staged_path(source_path) or source_path
+
+    file_signature = get_file_signature(source_path)
+
+    if file_signature is None:
+        return source_path
+
+    staged_file_pathname = get_staged_file_pathname(source_path, file_signature)
+
+    if is_staged_file_intact(staged_file_pathname, verify_checksum=False):
+        return staged_file_pathname
+
+    return source_path
@@ -0,0 +1,5 @@
+import os
+import sys
+
+# The render engine modules import each other by name, as when main.py runs from render_engine
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
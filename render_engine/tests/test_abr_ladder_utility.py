@@ -0,0 +1,68 @@
+import os
+
+import pytest
+
+from moviepy import ColorClip
+from abr_ladder_utility import (
+    build_abr_filter_graph, build_hls_output_arguments, get_hls_output_pathname, hls_output_is_complete, parse_bitrate_kbps, plan_renditions,
+)
+from video_utility import write_video
+
+ABR_LADDER = {"renditions": [
+    {"name": "1080p", "height": 1080, "video_bitrate": "6000k"},
+    {"height": 361, "video_bitrate": "0.8M"},
+    {"name": "small", "width": 200, "video_bitrate": 400000, "max_bitrate": "500k"},
+]}
+
+
+def test_parse_bitrate_kbps():
+    assert parse_bitrate_kbps("3000k") == 3000
+    assert parse_bitrate_kbps("3M") == 3000
+    assert parse_bitrate_kbps(400000) == 400
+
+
+def test_plan_renditions_skips_upscales_and_rounds_to_even_sizes():
+    renditions = plan_renditions(ABR_LADDER, (1280, 720))
+
+    assert [(rendition["name"], rendition["size"]) for rendition in renditions] == [("360p", (642, 360)), ("small", (200, 112))]
+    assert (renditions[0]["max_bitrate"], renditions[0]["buffer_size"]) == ("1200k", "1600k")
+    assert (renditions[1]["max_bitrate"], renditions[1]["buffer_size"]) == ("500k", "800k")
+
+
+def test_plan_renditions_rejects_duplicate_names():
+    with pytest.raises(ValueError):
+        plan_renditions({"renditions": [{"height": 360, "video_bitrate": "800k"}, {"width": 640, "video_bitrate": "900k"}]}, (1280, 720))
+
+
+def test_build_abr_filter_graph_splits_the_frames_once():
+    renditions = [{"size": (640, 360)}, {"size": (320, 180)}]
+
+    assert build_abr_filter_graph(renditions) == (
+        "[0:v]split=3[cut][abr_in0][abr_in1];"
+        "[abr_in0]scale=640:360:flags=lanczos[abr0];"
+        "[abr_in1]scale=320:180:flags=lanczos[abr1]",
+        "[cut]",
+        ["[abr0]", "[abr1]"],
+    )
+
+
+def test_build_hls_output_arguments_map_every_rendition():
+    renditions = plan_renditions(ABR_LADDER, (1280, 720))
+    arguments = build_hls_output_arguments("cut_hls", renditions, ["[abr0]", "[abr1]"], 25, "libx264", "fast", True, "aac", 4, "128k")
+
+    assert arguments[arguments.index("-var_stream_map") + 1] == "v:0,a:0,name:360p v:1,a:1,name:small"
+    assert arguments[arguments.index("-force_key_frames") + 1] == "expr:gte(t,n_forced*4)"
+    assert arguments[arguments.index("-c:a") + 1] == "copy"
+    assert arguments[-1] == os.path.join("cut_hls", "%v", "playlist.m3u8")
+
+
+def test_write_video_packages_the_ladder(tmp_path):
+    output_file_pathname = str(tmp_path / "cut.mp4")
+    clip = ColorClip((128, 72), color=(40, 40, 200), duration=1).with_fps(10)
+    abr_ladder = {"renditions": [{"height": 36, "video_bitrate": "100k"}], "segment_seconds": 1}
+
+    write_video(clip, output_file_pathname, {"fps": 10, "quality_preset": "ultrafast"}, abr_ladder)
+
+    assert os.path.isfile(output_file_pathname)
+    assert hls_output_is_complete(output_file_pathname)
+    assert os.path.isfile(os.path.join(get_hls_output_pathname(output_file_pathname), "36p", "playlist.m3u8"))
@@ -0,0 +1,61 @@
+import os
+import subprocess as sp
+
+import numpy as np
+import pytest
+
+from moviepy import AudioFileClip
+from moviepy.config import FFMPEG_BINARY
+from audio_cache import DecodedAudioClip, configure_audio_cache, get_decoded_audio, trim_audio_cache
+
+
+@pytest.fixture
+def audio_cache(tmp_path):
+    configure_audio_cache({"audio_cache": {"enabled": True, "path": str(tmp_path / "audio"), "max_size_mb": 1}})
+    yield str(tmp_path / "audio")
+    configure_audio_cache({})
+
+
+def test_decoded_audio_clip_returns_views_of_consecutive_samples():
+    samples = np.arange(20, dtype=np.float32).reshape(10, 2)
+    audio_clip = DecodedAudioClip("music.wav", samples, fps=10)
+
+    consecutive_samples = audio_clip.get_samples(np.array([0.2, 0.3, 0.4]))
+    assert np.shares_memory(consecutive_samples, samples)
+    assert consecutive_samples.tolist() == [[4, 5], [6, 7], [8, 9]]
+
+    # Out of range times are silent
+    assert audio_clip.get_samples(np.array([0.9, 1.0])).tolist() == [[18, 19], [0, 0]]
+    assert audio_clip.get_samples(-1).tolist() == [0, 0]
+    assert audio_clip.duration == 1.0
+
+
+def test_get_decoded_audio_matches_audio_file_clip(audio_cache, tmp_path):
+    source_path = str(tmp_path / "music.wav")
+    sp.run([FFMPEG_BINARY, "-y", "-loglevel", "error", "-f", "lavfi", "-i", "sine=frequency=440:duration=1", "-ac", "2", source_path], check=True)
+
+    samples = get_decoded_audio(source_path)
+    audio_file_clip = AudioFileClip(source_path)
+
+    try:
+        times = np.arange(1000, 2000) / 44100
+        assert np.abs(DecodedAudioClip(source_path, samples, 44100).get_frame(times) - audio_file_clip.get_frame(times)).max() < 1e-3
+    finally:
+        audio_file_clip.close()
+
+    assert get_decoded_audio(source_path) is samples
+
+
+def test_trim_audio_cache_removes_least_recently_used_sources(audio_cache):
+    pcm_file_pathnames = [os.path.join(audio_cache, "ab", f"{name}.44100.f32") for name in ("rendering", "older", "newer")]
+    os.makedirs(os.path.dirname(pcm_file_pathnames[0]))
+
+    for age, pcm_file_pathname in enumerate(reversed(pcm_file_pathnames)):
+        with open(pcm_file_pathname, "wb") as pcm_file:
+            pcm_file.write(bytes(512 * 1024))
+        os.utime(pcm_file_pathname, (1000 - age, 1000 - age))
+
+    # The oldest source is the one being rendered, it stays
+    trim_audio_cache(pcm_file_pathnames[0])
+
+    assert [os.path.exists(pcm_file_pathname) for pcm_file_pathname in pcm_file_pathnames] == [True, False, True]
@@ -0,0 +1,99 @@
+import json
+import os
+
+import pytest
+
+from batch_utility import plan_batch
+from render_journal import RenderJournal
+
+
+def make_video_assembly(output_directory, title):
+    return {
+        "composeflow.org": {"settings": {"quick_and_dirty": True}},
+        "cut": {
+            "title": title,
+            "render_output": {
+                "aspect_ratio": "16:9",
+                "output_paths": {"cut": os.path.join(output_directory, "cut"), "segment_scene": os.path.join(output_directory, "scenes")},
+                "quick_render": {"aspect_ratio": "16:9", "fps": 10, "width": 320, "height": None, "render_settings": {"codec": "libx264"}},
+            },
+            "segments": [{
+                "sequence": 1,
+                "title": "Intro",
+                "scenes": [
+                    {"sequence": 1, "title": "one", "timeline_clips": [{"sequence": 1, "path": "one.mp4", "trim_start_seconds": 0, "trim_end_seconds": 1}]},
+                    {"sequence": 2, "title": "two", "timeline_clips": [{"sequence": 1, "path": "two.mp4", "trim_start_seconds": 0, "trim_end_seconds": 1}]},
+                ],
+            }],
+        },
+    }
+
+
+@pytest.fixture
+def write_video_assemblies(tmp_path):
+    def write_video_assemblies(*titles):
+        video_assembly_files = []
+
+        for title in titles:
+            video_assembly_file = str(tmp_path / f"{title}.json")
+
+            with open(video_assembly_file, "w") as file:
+                json.dump(make_video_assembly(str(tmp_path / title), title), file)
+
+            video_assembly_files.append(video_assembly_file)
+
+        return video_assembly_files
+
+    return write_video_assemblies
+
+
+def test_plan_batch_renders_shared_scenes_once(write_video_assemblies):
+    plan = plan_batch(write_video_assemblies("first", "second"))
+
+    assert len(plan["tasks"]) == 2
+    assert plan["copies"] == []
+    assert [len(task["copies"]) for task in plan["tasks"]] == [1, 1]
+    assert [assembly["task_indexes"] for assembly in plan["assemblies"]] == [{0, 1}, {0, 1}]
+
+
+def test_plan_batch_copies_complete_outputs(write_video_assemblies):
+    video_assembly_files = write_video_assemblies("first", "second")
+    first_plan = plan_batch(video_assembly_files[:1])
+
+    # Render the first scene of the first assembly
+    (complete_output_path,) = first_plan["tasks"][0]["output_paths"].values()
+    os.makedirs(os.path.dirname(complete_output_path), exist_ok=True)
+
+    with open(complete_output_path, "wb") as output_file:
+        output_file.write(b"frames")
+
+    plan = plan_batch(video_assembly_files)
+
+    assert len(plan["tasks"]) == 1
+    assert [(source_path, os.path.basename(journal_file_pathname)) for source_path, _, journal_file_pathname in plan["copies"]] == [
+        (complete_output_path, "second.render_journal.jsonl")
+    ]
+    assert plan["assemblies"][1]["task_indexes"] == {0}
+
+
+def test_plan_batch_resume_only_copies_journaled_outputs(write_video_assemblies):
+    video_assembly_files = write_video_assemblies("first", "second")
+    first_plan = plan_batch(video_assembly_files[:1])
+
+    (complete_output_path,) = first_plan["tasks"][0]["output_paths"].values()
+    os.makedirs(os.path.dirname(complete_output_path), exist_ok=True)
+
+    with open(complete_output_path, "wb") as output_file:
+        output_file.write(b"frames")
+
+    # Not in the first assembly's journal, so it is rendered again
+    plan = plan_batch(video_assembly_files, resume=True)
+
+    assert len(plan["tasks"]) == 2
+    assert plan["copies"] == []
+
+    RenderJournal(first_plan["assemblies"][0]["journal_file_pathname"]).record_complete(complete_output_path, "scene")
+    plan = plan_batch(video_assembly_files, resume=True)
+
+    assert len(plan["tasks"]) == 1
+    assert [source_path for source_path, _, _ in plan["copies"]] == [complete_output_path]
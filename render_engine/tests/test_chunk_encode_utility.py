@@ -0,0 +1,37 @@
+import os
+
+from moviepy import ColorClip
+from chunk_encode_utility import get_chunk_file_pathname, join_chunks, plan_chunks
+from video_utility import probe_media_source, write_video
+
+
+def test_plan_chunks_starts_every_chunk_on_a_gop_boundary():
+    # 2 s GOPs at 30 fps, 5 s chunks round to 2 GOPs of 60 frames
+    chunks = plan_chunks(frame_count=300, fps=30, chunk_seconds=5, gop_seconds=2)
+
+    assert chunks == [(0, 120), (120, 240), (240, 300)]
+    assert all(first_frame % 60 == 0 for first_frame, _ in chunks)
+
+
+def test_plan_chunks_covers_short_scenes_with_one_chunk():
+    assert plan_chunks(frame_count=10, fps=25, chunk_seconds=10, gop_seconds=2) == [(0, 10)]
+    assert plan_chunks(frame_count=0, fps=25, chunk_seconds=10, gop_seconds=2) == []
+
+
+def test_get_chunk_file_pathname():
+    assert get_chunk_file_pathname("out/scene.mp4", 3) == "out/scene.chunk0003.mp4"
+
+
+def test_join_chunks_in_relative_directory_with_colon(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    os.makedirs("16:9")
+
+    chunk_file_pathnames = [get_chunk_file_pathname("chunks/scene.mp4", index) for index in range(2)]
+
+    for chunk_file_pathname in chunk_file_pathnames:
+        clip = ColorClip((64, 36), color=(0, 0, 255), duration=0.5).with_fps(24)
+        write_video(clip, chunk_file_pathname, {"fps": 24, "quality_preset": "ultrafast"})
+
+    join_chunks(chunk_file_pathnames, None, "16:9/scene.mp4")
+
+    assert abs(probe_media_source(os.path.abspath("16:9/scene.mp4"))["duration"] - 1.0) < 0.1
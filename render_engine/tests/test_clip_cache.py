@@ -0,0 +1,71 @@
+from types import SimpleNamespace
+
+import pytest
+
+from clip_cache import configure_clip_cache, get_clip_cache_settings, get_clip_file_pathname, get_clip_key, get_clip_render_settings, set_clip_cache_settings
+
+
+def make_target(name, fps=30):
+    return {"name": name, "aspect_ratio": "16:9", "resolution": (640, 360), "render_settings": {"fps": fps}}
+
+
+@pytest.fixture
+def video_clip_meta(tmp_path):
+    return {
+        "sequence": 1,
+        "path": str(tmp_path / "Beach day (1).mp4"),
+        "trim_start_seconds": 2,
+        "overlay_images": [{"path": str(tmp_path / "logo.png"), "width": 100, "targets": {"vertical": {"width": 50}}}],
+    }
+
+
+def test_clip_key_ignores_the_clip_position(video_clip_meta):
+    moved_clip_meta = dict(video_clip_meta, sequence=4)
+
+    assert get_clip_key(moved_clip_meta, make_target("landscape"), False) == get_clip_key(video_clip_meta, make_target("landscape"), False)
+
+
+def test_watermarked_clip_key_follows_the_clip_position(video_clip_meta):
+    moved_clip_meta = dict(video_clip_meta, sequence=4)
+
+    # The watermark shows the sequence
+    assert get_clip_key(moved_clip_meta, make_target("landscape"), True) != get_clip_key(video_clip_meta, make_target("landscape"), True)
+
+
+def test_clip_key_follows_what_changes_the_frames(video_clip_meta, tmp_path):
+    key = get_clip_key(video_clip_meta, make_target("landscape"), False)
+
+    assert get_clip_key(dict(video_clip_meta, trim_start_seconds=3), make_target("landscape"), False) != key
+    assert get_clip_key(video_clip_meta, make_target("landscape", fps=25), False) != key
+    assert get_clip_key(video_clip_meta, make_target("landscape"), True) != key
+
+    (tmp_path / "logo.png").write_bytes(b"logo")
+    assert get_clip_key(video_clip_meta, make_target("landscape"), False) != key
+
+
+def test_clip_key_sees_overlay_overrides_of_its_target(video_clip_meta):
+    unanimated_clip_meta = dict(video_clip_meta, overlay_images=[{"path": video_clip_meta["overlay_images"][0]["path"], "width": 100}])
+
+    # Targets of the same framing share a clip unless one overrides an overlay
+    assert get_clip_key(unanimated_clip_meta, make_target("vertical"), False) == get_clip_key(unanimated_clip_meta, make_target("landscape"), False)
+    assert get_clip_key(video_clip_meta, make_target("vertical"), False) != get_clip_key(video_clip_meta, make_target("landscape"), False)
+
+
+def test_clip_file_pathname_is_named_after_its_source(video_clip_meta, tmp_path):
+    configure_clip_cache({"render_individual_clips": True}, str(tmp_path / "clips"))
+    clip_cache_settings = get_clip_cache_settings()
+
+    try:
+        assert get_clip_file_pathname(video_clip_meta, "0123456789abcdef0123") == str(tmp_path / "clips" / "Beach_day__1__0123456789abcdef.mkv")
+    finally:
+        configure_clip_cache({}, None)
+
+    set_clip_cache_settings(clip_cache_settings)
+    assert get_clip_cache_settings() == {"enabled": True, "path": str(tmp_path / "clips")}
+    configure_clip_cache({}, None)
+
+
+def test_clip_render_settings_keep_the_clip_frame_rate():
+    assert get_clip_render_settings(SimpleNamespace(fps=25))["fps"] == 25
+    assert get_clip_render_settings(SimpleNamespace(fps=None))["fps"] == 30
+    assert get_clip_render_settings(SimpleNamespace(fps=25))["audio"] == {"codec": "pcm_s16le"}
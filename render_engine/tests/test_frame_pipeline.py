@@ -0,0 +1,103 @@
+import threading
+import multiprocessing
+
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+
+import frame_pipeline
+from frame_pipeline import OutputRing, SourceRing, configure_frame_pipeline, get_branch_layouts, should_encode_in_pipeline
+
+
+@pytest.fixture
+def pipeline_settings():
+    configure_frame_pipeline({"frame_pipeline": {"enabled": True, "workers": 2, "min_scene_seconds": 10}})
+    yield
+    configure_frame_pipeline({})
+
+
+def make_branch(size=(64, 36), duration=20, fps=25, mask=None, render_settings=None):
+    clip = SimpleNamespace(size=size, duration=duration, fps=fps, mask=mask)
+    return {"clip": clip, "render_settings": render_settings or {"fps": fps}}
+
+
+def make_reader(n_frames=100):
+    return SimpleNamespace(size=(4, 2), depth=3, fps=25, n_frames=n_frames, filename="source.mp4")
+
+
+def test_branch_frames_lie_one_after_another_in_a_slot():
+    layouts = get_branch_layouts([make_branch(size=(64, 36)), make_branch(size=(33, 17))])
+
+    assert layouts[0]["offset"] == 0
+    assert layouts[1]["offset"] == layouts[0]["nbytes"]
+    assert layouts[1]["pixel_format"] == "rgb24"
+    assert layouts[1]["nbytes"] == 33 * 17 * 3
+
+
+def test_pipeline_is_used_for_long_scenes_sharing_a_frame_rate(pipeline_settings):
+    assert should_encode_in_pipeline([make_branch(), make_branch(size=(36, 64))])
+
+    assert not should_encode_in_pipeline([])
+    assert not should_encode_in_pipeline([make_branch(duration=5)])
+    assert not should_encode_in_pipeline([make_branch(), make_branch(fps=30)])
+    assert not should_encode_in_pipeline([make_branch(mask=object())])
+    assert not should_encode_in_pipeline([make_branch(render_settings={"fps": 25, "frame_sink": False})])
+
+    configure_frame_pipeline({"frame_pipeline": {"enabled": True, "workers": 2, "max_memory_mb": 0.001}})
+    assert not should_encode_in_pipeline([make_branch()])
+
+    configure_frame_pipeline({})
+    assert not should_encode_in_pipeline([make_branch()])
+
+
+def test_output_ring_bounds_how_far_workers_run_ahead():
+    output_ring = OutputRing(2, 16, threading.Condition())
+    aborted = multiprocessing.RawValue("b", 0)
+
+    try:
+        output_ring.acquire(1, aborted)
+        output_ring.publish(1)
+        output_ring.wait_frame(1, lambda: None)
+
+        # Frame 2 takes frame 0's slot, which the encoders have not released yet
+        aborted.value = 1
+        with pytest.raises(RuntimeError):
+            output_ring.acquire(2, aborted)
+
+        output_ring.release(0)
+        output_ring.acquire(2, aborted)
+    finally:
+        output_ring.close()
+
+
+def test_source_ring_shares_decoded_frames(monkeypatch):
+    decoded_frames = []
+
+    def get_frame(t):
+        decoded_frames.append(round(t * 25))
+        return np.full((2, 4, 3), round(t * 25), dtype=np.uint8)
+
+    monkeypatch.setattr(frame_pipeline, "open_decoder_reader", lambda scene_reader: SimpleNamespace(fps=25, get_frame=get_frame, close=lambda: None))
+
+    source_ring = SourceRing(make_reader(), 2, 4, threading.Condition())
+    aborted = multiprocessing.RawValue("b", 0)
+    stopped = threading.Event()
+    decoder_thread = threading.Thread(target=source_ring.decode, args=(make_reader(), stopped))
+    decoder_thread.start()
+
+    try:
+        assert source_ring.read(10, 0, aborted)[0, 0, 0] == 10
+        assert source_ring.read(11, 1, aborted)[0, 0, 0] == 11
+
+        # The ring starts decoding shortly before the first frame read
+        assert decoded_frames[0] == 6
+
+        # Frames beyond the ring's reach of the slowest worker are decoded by the worker itself
+        assert source_ring.read(11 + source_ring.slot_count - 1, 0, aborted)[0, 0, 0] == 18
+        assert source_ring.read(11 + source_ring.slot_count, 0, aborted) is None
+        assert source_ring.read(2, 0, aborted) is None
+    finally:
+        stopped.set()
+        decoder_thread.join()
+        source_ring.close()
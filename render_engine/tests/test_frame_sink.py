@@ -0,0 +1,44 @@
+import numpy as np
+
+from frame_sink import build_encoder_command, convert_frame, get_frame_buffer_shape, get_input_pixel_format
+
+
+def test_get_frame_buffer_shape():
+    assert get_frame_buffer_shape((64, 36), "yuv420p") == (54, 64)
+    assert get_frame_buffer_shape((63, 35), "rgb24") == (35, 63, 3)
+
+
+def test_odd_sizes_are_piped_as_rgb():
+    assert get_input_pixel_format((63, 36)) == "rgb24"
+
+
+def test_frames_are_only_subsampled_for_subsampled_outputs():
+    assert get_input_pixel_format((64, 36), "yuv444p") == "rgb24"
+    assert get_input_pixel_format((64, 36), "yuv420p") == get_input_pixel_format((64, 36))
+
+
+def test_convert_frame_drops_alpha():
+    frame = np.zeros((2, 2, 4), dtype=np.uint8)
+    frame[..., 0] = 255
+    buffer = np.empty(get_frame_buffer_shape((2, 2), "rgb24"), dtype=np.uint8)
+
+    convert_frame(frame, "rgb24", buffer)
+
+    assert (buffer[..., 0] == 255).all() and (buffer[..., 1:] == 0).all()
+
+
+def test_build_encoder_command():
+    cmd = build_encoder_command("out.mp4", (64, 36), 24, "yuv420p", preset="fast", audiofile="audio.m4a", threads=2)
+
+    assert cmd[cmd.index("-s") + 1] == "64x36"
+    assert cmd[cmd.index("-r") + 1] == "24.00"
+    assert cmd[cmd.index("-preset") + 1] == "fast"
+    assert cmd[cmd.index("-threads") + 1] == "2"
+    assert cmd[cmd.index("audio.m4a") - 1] == "-i"
+    assert cmd[-3:] == ["-pix_fmt", "yuv420p", "out.mp4"]
+
+
+def test_build_encoder_command_keeps_odd_sizes_in_the_input_format():
+    cmd = build_encoder_command("out.mp4", (63, 35), 24, "rgb24")
+
+    assert cmd.count("-pix_fmt") == 1
@@ -0,0 +1,65 @@
+import os
+
+import numpy as np
+import pytest
+
+from PIL import Image
+import image_helper
+from image_helper import configure_raster_cache, decode_scaled_image, load_scaled_image_array
+
+
+@pytest.fixture
+def raster_cache(tmp_path):
+    configure_raster_cache({"raster_cache": {"path": str(tmp_path / "rasters")}})
+    image_helper._load_scaled_image_array.cache_clear()
+    yield str(tmp_path / "rasters")
+    image_helper._load_scaled_image_array.cache_clear()
+    configure_raster_cache({})
+
+
+def write_photo(file_path, size=(1600, 900)):
+    # Left half red, right half blue
+    image_array = np.zeros((size[1], size[0], 3), dtype=np.uint8)
+    image_array[:, :size[0] // 2, 0] = 255
+    image_array[:, size[0] // 2:, 2] = 255
+    Image.fromarray(image_array).save(file_path, quality=95)
+    return str(file_path)
+
+
+def test_decode_scaled_image_scales_and_crops(tmp_path):
+    photo_path = write_photo(tmp_path / "photo.jpg")
+
+    assert decode_scaled_image(photo_path, (320, 180), None, False).shape == (180, 320, 3)
+
+    vertical = decode_scaled_image(photo_path, (90, 160), "9:16", True).astype(int)
+    assert vertical.shape == (160, 90, 3)
+    # The center crop keeps the seam between both halves in the middle
+    assert vertical[80, 10, 0] > 200 and vertical[80, 80, 2] > 200
+
+
+def test_decode_scaled_image_keeps_palette_transparency(tmp_path):
+    logo_path = str(tmp_path / "logo.png")
+    Image.new("RGBA", (40, 20), (255, 0, 0, 0)).convert("P").save(logo_path, transparency=0)
+
+    assert decode_scaled_image(logo_path, (20, 10), None, False).shape == (10, 20, 4)
+
+
+def test_load_scaled_image_array_caches_rasters(tmp_path, raster_cache):
+    photo_path = write_photo(tmp_path / "photo.jpg")
+
+    image_array = load_scaled_image_array(photo_path, (320, 180))
+    assert not image_array.flags.writeable
+    assert load_scaled_image_array(photo_path, (320.0, 180.0)) is image_array
+
+    raster_file_names = [file_name for _, _, file_names in os.walk(raster_cache) for file_name in file_names]
+    assert len(raster_file_names) == 1
+
+    # A new process reads the raster from disk
+    image_helper._load_scaled_image_array.cache_clear()
+    assert np.array_equal(load_scaled_image_array(photo_path, (320, 180)), image_array)
+
+    # An edited image is scaled again
+    write_photo(tmp_path / "photo.jpg", size=(800, 450))
+    os.utime(photo_path, (0, 0))
+    load_scaled_image_array(photo_path, (320, 180))
+    assert sum(len(file_names) for _, _, file_names in os.walk(raster_cache)) == 2
@@ -0,0 +1,54 @@
+import numpy as np
+import pytest
+
+from moviepy import ColorClip, ImageClip
+from image_ops import composite_overlay, fit_size, get_image_ops_backend, resize_clip, set_image_ops_backend
+
+
+@pytest.fixture
+def image_ops_backend():
+    backend = get_image_ops_backend()
+    yield set_image_ops_backend
+    set_image_ops_backend(backend)
+
+
+def test_fit_size_keeps_the_aspect_ratio():
+    assert fit_size((1920, 1080), width=640) == (640, 360)
+    assert fit_size((1920, 1080), height=540) == (960, 540)
+    assert fit_size((1920, 1080), width=100, height=100) == (100, 100)
+    assert fit_size((1920, 1080)) == (1920, 1080)
+
+
+def test_set_image_ops_backend_rejects_unknown_backends(image_ops_backend):
+    with pytest.raises(ValueError):
+        image_ops_backend("skia")
+
+
+def make_video_clip():
+    # Decoded frames are uint8, unlike ColorClip's
+    return ImageClip(np.full((36, 64, 3), (200, 40, 40), dtype=np.uint8), duration=1)
+
+
+def make_overlay(position):
+    overlay_mask = ColorClip((20, 10), color=0.5, is_mask=True, duration=1)
+    return ColorClip((20, 10), color=(0, 0, 255), duration=1).with_mask(overlay_mask).with_position(position)
+
+
+@pytest.mark.parametrize("position", [(5, 5), (-5, 30), ("center", "center")])
+def test_composite_overlay_backends_match(image_ops_backend, position):
+    video_clip = make_video_clip()
+    frames = {}
+
+    for backend in ("moviepy", "opencv"):
+        image_ops_backend(backend)
+        frames[backend] = composite_overlay(video_clip, make_overlay(position)).get_frame(0).astype(int)
+
+    assert np.abs(frames["moviepy"] - frames["opencv"]).max() <= 1
+
+
+def test_resize_clip_backends_match_size(image_ops_backend):
+    video_clip = make_video_clip()
+
+    for backend in ("moviepy", "opencv"):
+        image_ops_backend(backend)
+        assert resize_clip(video_clip, (32, 18)).get_frame(0).shape == (18, 32, 3)
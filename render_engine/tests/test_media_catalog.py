@@ -0,0 +1,63 @@
+import os
+
+from media_catalog import MediaCatalog, get_media_type_by_extension
+
+MEDIA_TYPE_BY_EXTENSION = {".mp4": "video", ".wav": "audio", ".jpg": "image", ".png": "image"}
+
+
+def write_file(file_path, content=b"media"):
+    os.makedirs(os.path.dirname(file_path), exist_ok=True)
+
+    with open(file_path, "wb") as file:
+        file.write(content)
+
+
+def test_get_media_type_by_extension():
+    video_assembly = {"composeflow.org": {"supported_video_file_extensions": [".MP4"], "supported_image_file_extensions": [".jpg"]}}
+
+    assert get_media_type_by_extension(video_assembly) == {".mp4": "video", ".jpg": "image"}
+
+
+def test_scan_reports_added_modified_and_deleted_files(tmp_path):
+    root = str(tmp_path / "sources")
+    write_file(os.path.join(root, "a.mp4"))
+    write_file(os.path.join(root, "b.wav"))
+    write_file(os.path.join(root, "sub", "c.jpg"))
+    write_file(os.path.join(root, ".hidden.mp4"))
+    write_file(os.path.join(root, "notes.txt"))
+
+    with MediaCatalog(str(tmp_path / "catalog.sqlite3")) as catalog:
+        first_scan = catalog.scan(root, MEDIA_TYPE_BY_EXTENSION, probe=False)
+
+        assert (first_scan["files"], first_scan["changed"]) == (3, 3)
+        assert catalog.get_file(os.path.join(root, "sub", "c.jpg"))["media_type"] == "image"
+
+        write_file(os.path.join(root, "a.mp4"), b"longer media")
+        os.remove(os.path.join(root, "b.wav"))
+        write_file(os.path.join(root, "sub", "d.png"))
+
+        second_scan = catalog.scan(root, MEDIA_TYPE_BY_EXTENSION, probe=False)
+        changed_files = catalog.get_changed_files(first_scan["scan_id"], root)
+
+        assert catalog.get_last_scan_id(root) == second_scan["scan_id"]
+        assert [(os.path.relpath(changed_file["path"], root), changed_file["change"]) for changed_file in changed_files] == [
+            ("a.mp4", "modified"), ("b.wav", "deleted"), (os.path.join("sub", "d.png"), "added")
+        ]
+        assert catalog.get_file(os.path.join(root, "b.wav")) is None
+
+
+def test_scan_skips_unchanged_directories(tmp_path):
+    root = str(tmp_path / "sources")
+    write_file(os.path.join(root, "a.mp4"))
+    write_file(os.path.join(root, "sub", "c.jpg"))
+
+    # Directory mtimes older than the scan are trusted
+    for directory in (root, os.path.join(root, "sub")):
+        os.utime(directory, (0, 0))
+
+    with MediaCatalog(str(tmp_path / "catalog.sqlite3")) as catalog:
+        catalog.scan(root, MEDIA_TYPE_BY_EXTENSION, probe=False)
+        rescan = catalog.scan(root, MEDIA_TYPE_BY_EXTENSION, probe=False)
+
+        assert (rescan["files"], rescan["changed"], rescan["skipped_directories"]) == (2, 0, 2)
+        assert catalog.scan(root, MEDIA_TYPE_BY_EXTENSION, full=True, probe=False)["skipped_directories"] == 0
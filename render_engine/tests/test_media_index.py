@@ -0,0 +1,58 @@
+import shutil
+import subprocess as sp
+
+import pytest
+
+from moviepy.config import FFMPEG_BINARY
+from fingerprint_utility import source_fingerprint
+from media_index import build_media_index, collect_referenced_sources, read_audio_peaks, read_thumbnails, thumbnails_are_current
+
+
+@pytest.fixture
+def media_source(tmp_path):
+    source_path = str(tmp_path / "source.mp4")
+
+    sp.run([
+        FFMPEG_BINARY, "-y", "-loglevel", "error",
+        "-f", "lavfi", "-i", "testsrc=size=160x90:rate=10:duration=3",
+        "-f", "lavfi", "-i", "sine=frequency=440:duration=3",
+        "-pix_fmt", "yuv420p", "-shortest", source_path,
+    ], check=True)
+
+    return source_path
+
+
+def test_collect_referenced_sources_in_timeline_order():
+    video_assembly = {"cut": {"segments": [{"scenes": [
+        {"timeline_clips": [{"path": "b.mp4"}, {"path": "a.mp4"}], "sequential_audio_clips": [{"path": "music.mp3"}]},
+        {"timeline_clip_type": "image", "timeline_clips": [{"path": "photo.jpg"}]},
+        {"timeline_clips": [{"path": "a.mp4"}]},
+    ]}]}}
+
+    assert collect_referenced_sources(video_assembly) == ["b.mp4", "a.mp4", "music.mp3"]
+
+
+def test_source_fingerprint_survives_a_move(media_source, tmp_path):
+    moved_path = str(tmp_path / "moved.mp4")
+    shutil.copy(media_source, moved_path)
+
+    assert source_fingerprint(moved_path) == source_fingerprint(media_source)
+
+
+def test_build_media_index_and_read_sidecars(media_source, tmp_path):
+    index_settings = {"path": str(tmp_path / "index"), "thumbnail_interval_seconds": 1.0, "thumbnail_height": 36, "peaks_per_second": 100.0}
+
+    (entry,) = build_media_index([media_source, str(tmp_path / "missing.mp4")], index_settings, workers=1)
+
+    assert thumbnails_are_current(entry["thumbnails"], 1.0, 36)
+    assert not thumbnails_are_current(entry["thumbnails"], 2.0, 36)
+
+    thumbnails = read_thumbnails(entry["thumbnails"], start_time=1.0)
+    assert thumbnails["height"] == 36
+    assert [time for time, _ in thumbnails["thumbnails"]] == [1.0, 2.0]
+    assert all(jpeg.startswith(b"\xff\xd8") for _, jpeg in thumbnails["thumbnails"])
+
+    peaks = read_audio_peaks(entry["peaks"], end_time=1.0, bucket_count=10)
+    assert peaks["peaks"].shape == (10, 2)
+    assert peaks["peaks_per_second"] == pytest.approx(10.0)
+    assert (peaks["peaks"][:, 0] < 0).all() and (peaks["peaks"][:, 1] > 0).all()
@@ -0,0 +1,85 @@
+import numpy as np
+import pytest
+
+from moviepy import ColorClip, ImageClip, VideoFileClip
+from mezzanine_cache import configure_mezzanine_cache, encode_from_mezzanine, get_mezzanine_key, get_mezzanine_render_settings
+from video_utility import probe_media_source, write_video
+
+
+@pytest.fixture(autouse=True)
+def mezzanine_cache(tmp_path):
+    configure_mezzanine_cache({"mezzanine_cache": {"enabled": True, "path": str(tmp_path / "mezzanine")}})
+    yield
+    configure_mezzanine_cache({})
+
+
+def make_scene(tmp_path, title="one"):
+    return {"sequence": 1, "title": title, "timeline_clips": [{"sequence": 1, "path": str(tmp_path / "source.mp4")}]}
+
+
+def make_target(resolution=(640, 360), render_settings=None):
+    return {"aspect_ratio": "16:9", "resolution": resolution, "quick_and_dirty": True, "render_settings": render_settings or {}}
+
+
+def test_mezzanine_key_is_shared_by_delivery_profiles(tmp_path):
+    scene = make_scene(tmp_path)
+
+    assert get_mezzanine_key(scene, make_target(render_settings={"quality_preset": "fast"}), False) == get_mezzanine_key(scene, make_target(), False)
+    assert get_mezzanine_key(make_scene(tmp_path, title="renamed"), make_target(), False) == get_mezzanine_key(scene, make_target(), False)
+
+
+
+def test_mezzanine_key_follows_the_frame_rate_of_keyframed_overlays(tmp_path):
+    scene = make_scene(tmp_path)
+
+    assert get_mezzanine_key(scene, make_target(render_settings={"fps": 25}), False) == get_mezzanine_key(scene, make_target(render_settings={"fps": 30}), False)
+
+    scene["timeline_clips"][0]["overlay_images"] = [{"path": str(tmp_path / "logo.png"), "opacity": [{"time": 0, "value": 0}, {"time": 1, "value": 1}]}]
+
+    assert get_mezzanine_key(scene, make_target(render_settings={"fps": 25}), False) != get_mezzanine_key(scene, make_target(render_settings={"fps": 30}), False)
+
+
+def test_mezzanine_key_follows_framing_and_sources(tmp_path):
+    scene = make_scene(tmp_path)
+    key = get_mezzanine_key(scene, make_target(), False)
+
+    assert get_mezzanine_key(scene, make_target(resolution=(320, 180)), False) != key
+    assert get_mezzanine_key(scene, make_target(), True) != key
+
+    (tmp_path / "source.mp4").write_bytes(b"media")
+    assert get_mezzanine_key(scene, make_target(), False) != key
+
+
+def test_configure_mezzanine_cache_rejects_unknown_codecs():
+    with pytest.raises(ValueError):
+        configure_mezzanine_cache({"mezzanine_cache": {"codec": "prores"}})
+
+
+def test_encode_from_mezzanine_keeps_its_frame_rate_without_a_profile_fps(tmp_path):
+    clip = ColorClip((64, 36), color=(0, 128, 0), duration=0.5).with_fps(24)
+    mezzanine_file_pathname = str(tmp_path / "scene.mkv")
+    output_file_pathname = str(tmp_path / "scene.mp4")
+
+    write_video(clip, mezzanine_file_pathname, get_mezzanine_render_settings(clip))
+    encode_from_mezzanine(mezzanine_file_pathname, output_file_pathname, {"fps": None, "quality_preset": "ultrafast", "threads": 1})
+
+    assert round(probe_media_source(output_file_pathname)["video_fps"]) == 24
+
+
+@pytest.mark.parametrize("codec, max_error", [("libx264", 2), ("ffv1", 0)])
+def test_mezzanines_keep_full_chroma(tmp_path, codec, max_error):
+    configure_mezzanine_cache({"mezzanine_cache": {"enabled": True, "path": str(tmp_path / "mezzanine"), "codec": codec}})
+
+    # Alternating red and blue columns, which 4:2:0 subsampling would blur to purple
+    frame = np.zeros((36, 64, 3), dtype=np.uint8)
+    frame[:, 0::2, 0] = 255
+    frame[:, 1::2, 2] = 255
+    clip = ImageClip(frame, duration=0.2).with_fps(10)
+    mezzanine_file_pathname = str(tmp_path / "scene.mkv")
+
+    write_video(clip, mezzanine_file_pathname, get_mezzanine_render_settings(clip))
+
+    with VideoFileClip(mezzanine_file_pathname) as mezzanine_clip:
+        mezzanine_frame = mezzanine_clip.get_frame(0)
+
+    assert np.abs(mezzanine_frame.astype(int) - frame).max() <= max_error
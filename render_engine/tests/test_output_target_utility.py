@@ -0,0 +1,67 @@
+import pytest
+
+from output_target_utility import get_cut_render_settings, get_output_targets, resolve_target_overrides
+
+
+def make_render_output(output_targets=None):
+    render_output = {
+        "aspect_ratio": "16:9",
+        "quick_render": {"aspect_ratio": "16:9", "fps": 10, "width": 320, "height": None, "render_settings": {"codec": "libx264"}},
+        "high_quality_render": {"aspect_ratio": "16:9", "fps": None, "width": None, "height": None, "render_settings": {"codec": "libx264"}},
+    }
+
+    if output_targets is not None:
+        render_output["output_targets"] = output_targets
+
+    return render_output
+
+
+def test_get_output_targets_defaults_to_one_target():
+    (target,) = get_output_targets(make_render_output(), quick_and_dirty=True)
+
+    assert (target["name"], target["label"], target["resolution"], target["quick_and_dirty"]) == ("16:9_quick_render", "16:9", (320, 180), True)
+
+
+def test_get_output_targets_applies_target_sizes_and_settings():
+    targets = get_output_targets(make_render_output([
+        {"name": "landscape"},
+        {"name": "vertical", "aspect_ratio": "9:16", "width": 181, "render_settings": {"quality_preset": "fast"}},
+    ]), quick_and_dirty=False)
+
+    assert [target["resolution"] for target in targets] == [None, (180, 322)]
+    assert targets[1]["render_settings"] == {"codec": "libx264", "quality_preset": "fast"}
+
+
+def test_get_output_targets_rejects_duplicate_names():
+    with pytest.raises(ValueError):
+        get_output_targets(make_render_output([{"name": "landscape"}, {"name": "landscape", "aspect_ratio": "1:1"}]), quick_and_dirty=True)
+
+    with pytest.raises(ValueError):
+        get_output_targets(make_render_output([{"aspect_ratio": "1:1"}, {"aspect_ratio": "1:1", "width": 100}]), quick_and_dirty=True)
+
+
+def test_get_output_targets_keeps_file_labels_apart():
+    targets = get_output_targets(make_render_output([{"aspect_ratio": "16:9"}, {"aspect_ratio": "16:9", "profile": "high_quality_render"}]), quick_and_dirty=True)
+
+    assert [target["label"] for target in targets] == ["16:9", "16:9_high_quality_render"]
+
+    with pytest.raises(ValueError):
+        get_output_targets(make_render_output([{"aspect_ratio": "16:9"}, {"name": "16:9", "profile": "high_quality_render"}]), quick_and_dirty=True)
+
+
+def test_resolve_target_overrides():
+    meta = {"path": "logo.png", "width": 100, "targets": {"vertical": {"width": 50}}}
+
+    assert resolve_target_overrides(meta, {"name": "vertical"})["width"] == 50
+    assert resolve_target_overrides(meta, {"name": "landscape"}) is meta
+    assert resolve_target_overrides(meta) is meta
+
+
+def test_cut_render_settings_are_the_target_render_settings():
+    landscape, vertical = get_output_targets(make_render_output([
+        {"name": "landscape"},
+        {"name": "vertical", "aspect_ratio": "9:16", "render_settings": {"codec": "libx265", "fps": 25}},
+    ]), quick_and_dirty=True)
+
+    assert get_cut_render_settings(landscape) == {"codec": "libx264", "fps": 10}
+    assert get_cut_render_settings(vertical) == {"codec": "libx265", "fps": 25}
@@ -0,0 +1,66 @@
+import numpy as np
+import pytest
+
+from overlay_animation import compile_keyframe_track, compile_overlay_animation, get_frame_times
+
+FRAME_TIMES = get_frame_times(2.0, 10)
+
+
+def test_get_frame_times_include_one_past_the_end():
+    assert len(FRAME_TIMES) == 22
+    assert FRAME_TIMES[-1] == pytest.approx(2.1)
+
+
+def test_keyframe_track_interpolates_and_holds_its_ends():
+    keyframes = [{"time": 0.5, "x": 0}, {"time": 1.5, "x": 100}]
+    track = compile_keyframe_track(keyframes, "x", FRAME_TIMES)
+
+    assert track[0] == 0 and track[5] == 0
+    assert track[10] == pytest.approx(50)
+    assert track[15] == 100 and track[21] == 100
+
+
+def test_keyframe_track_applies_the_easing_of_the_segment_start():
+    keyframes = [{"time": 0, "x": 0, "easing": "ease_in"}, {"time": 1, "x": 100, "easing": "hold"}, {"time": 2, "x": 0}]
+    track = compile_keyframe_track(keyframes, "x", FRAME_TIMES)
+
+    assert track[5] == pytest.approx(12.5)
+    assert track[15] == 100
+    assert track[20] == 0
+
+
+def test_keyframe_track_skips_keyframes_without_the_field():
+    keyframes = [{"time": 0, "x": 10}, {"time": 1, "value": 0.5}]
+
+    assert compile_keyframe_track(keyframes, "x", FRAME_TIMES, scale=2.0).tolist() == [20.0] * 22
+    assert compile_keyframe_track(keyframes, "y", FRAME_TIMES) is None
+
+
+def test_keyframe_track_rejects_unknown_easings():
+    with pytest.raises(ValueError):
+        compile_keyframe_track([{"time": 0, "x": 0, "easing": "bounce"}, {"time": 1, "x": 1}], "x", FRAME_TIMES)
+
+
+def test_compile_overlay_animation():
+    image_meta = {
+        "position": {"type": "keyframes", "relative": True, "value": [{"time": 0, "x": 0, "y": 0.5}, {"time": 2, "x": 0.5, "y": 0.5}]},
+        "opacity": [{"time": 0, "value": -1}, {"time": 1, "value": 1}],
+    }
+    animation = compile_overlay_animation(image_meta, (200, 100), duration=2.0, fps=10)
+
+    assert animation.moves
+    assert animation.position(1.0) == (50, 50)
+    assert animation.position(99) == (100, 50)
+    assert animation.opacity_at(0) == 0.0
+    assert animation.opacity_at(1.0) == 1.0
+
+
+def test_compile_overlay_animation_of_static_overlays():
+    assert compile_overlay_animation({"position": {"type": "preset", "value": "center"}}, (200, 100), 2.0, 10) is None
+
+    animation = compile_overlay_animation({"opacity": 0.25}, (200, 100), 2.0, 10)
+    assert not animation.moves
+    assert np.all(animation.opacity == np.float32(0.25))
+
+    with pytest.raises(ValueError):
+        compile_overlay_animation({"position": {"type": "keyframes", "value": [{"time": 0, "x": 0}]}}, (200, 100), 2.0, 10)
@@ -0,0 +1,69 @@
+import time
+
+import pytest
+
+import prefetch_utility
+from prefetch_utility import ScenePrefetcher, get_scene_prefetch_plan, get_source_byte_range
+
+
+def write_file(file_path, size):
+    file_path.write_bytes(bytes(size))
+    return str(file_path)
+
+
+@pytest.fixture
+def source_reads(monkeypatch):
+    source_reads = []
+    # 100 seconds of video per source
+    monkeypatch.setattr(prefetch_utility, "probe_media_source", lambda path: {"duration": 100.0})
+    monkeypatch.setattr(prefetch_utility, "record_source_read", lambda path, byte_count, reader: source_reads.append((path, byte_count)))
+    return source_reads
+
+
+def test_get_source_byte_range_covers_the_trim_and_its_lead(tmp_path, source_reads):
+    source_path = write_file(tmp_path / "source.mp4", 1000)
+
+    assert get_source_byte_range({"path": source_path, "trim_start_seconds": 20, "trim_end_seconds": 30}) == (150, 310)
+    assert get_source_byte_range({"path": source_path, "trim_start_seconds": 2}) == (0, 1000)
+
+
+def test_get_scene_prefetch_plan(tmp_path, source_reads):
+    scene = {
+        "timeline_clips": [{"path": write_file(tmp_path / "source.mp4", 1000), "trim_start_seconds": 50}, {"path": str(tmp_path / "missing.mp4")}],
+        "sequential_audio_clips": [{"path": write_file(tmp_path / "music.wav", 300)}],
+        "overlay_images": [{"path": write_file(tmp_path / "logo.png", 20)}],
+    }
+
+    assert get_scene_prefetch_plan(scene)["byte_ranges"] == [
+        (str(tmp_path / "source.mp4"), 450, 1000), (str(tmp_path / "music.wav"), 0, 300), (str(tmp_path / "logo.png"), 0, 20)
+    ]
+
+
+def prefetch(scenes, window_bytes, source_reads, read_count):
+    prefetcher = ScenePrefetcher(scenes, scenes_ahead=2, window_bytes=window_bytes, threads=2)
+    prefetcher.advance("scene0")
+
+    # Scenes that do not fit the window wait for it until close()
+    deadline = time.time() + 5
+
+    while len(source_reads) < read_count and time.time() < deadline:
+        time.sleep(0.01)
+
+    time.sleep(0.1)
+    prefetcher.close()
+
+
+def test_scene_prefetcher_reads_the_next_scenes(tmp_path, source_reads):
+    scenes = [(f"scene{index}", {"timeline_clips": [{"path": write_file(tmp_path / f"{index}.mp4", 1000)}]}) for index in range(4)]
+
+    prefetch(scenes, 10000, source_reads, read_count=2)
+
+    assert sorted(source_reads) == [(str(tmp_path / "1.mp4"), 1000), (str(tmp_path / "2.mp4"), 1000)]
+
+
+def test_scene_prefetcher_stays_within_its_window(tmp_path, source_reads):
+    scenes = [(f"scene{index}", {"timeline_clips": [{"path": write_file(tmp_path / f"{index}.mp4", 1000)}]}) for index in range(3)]
+
+    prefetch(scenes, 600, source_reads, read_count=1)
+
+    assert source_reads == [(str(tmp_path / "1.mp4"), 600)]
@@ -0,0 +1,79 @@
+import os
+
+import render_journal
+from render_journal import RenderJournal
+
+
+def write_output(tmp_path, content=b"frames"):
+    output_file_pathname = str(tmp_path / "scene.mp4")
+
+    with open(output_file_pathname, "wb") as output_file:
+        output_file.write(content * 1024)
+
+    return output_file_pathname
+
+
+def count_checksums(monkeypatch):
+    calls = []
+    file_checksum = render_journal.file_checksum
+
+    def counting_file_checksum(file_path):
+        calls.append(file_path)
+        return file_checksum(file_path)
+
+    monkeypatch.setattr(render_journal, "file_checksum", counting_file_checksum)
+
+    return calls
+
+
+def test_resume_reuses_recorded_outputs_without_rehashing(tmp_path, monkeypatch):
+    output_file_pathname = write_output(tmp_path)
+    journal_file_pathname = str(tmp_path / "cut.render_journal.jsonl")
+    RenderJournal(journal_file_pathname).record_complete(output_file_pathname, "scene")
+
+    checksums = count_checksums(monkeypatch)
+    journal = RenderJournal(journal_file_pathname, resume=True)
+
+    assert journal.is_complete(output_file_pathname)
+    assert journal.is_complete(output_file_pathname)
+    assert checksums == []
+
+
+def test_resume_verifies_touched_outputs_once(tmp_path, monkeypatch):
+    output_file_pathname = write_output(tmp_path)
+    journal_file_pathname = str(tmp_path / "cut.render_journal.jsonl")
+    RenderJournal(journal_file_pathname).record_complete(output_file_pathname, "scene")
+    os.utime(output_file_pathname, ns=(0, 0))
+
+    checksums = count_checksums(monkeypatch)
+    journal = RenderJournal(journal_file_pathname, resume=True)
+
+    assert journal.is_complete(output_file_pathname)
+    assert journal.is_complete(output_file_pathname)
+    assert len(checksums) == 1
+
+
+def test_resume_rejects_changed_and_unrecorded_outputs(tmp_path):
+    output_file_pathname = write_output(tmp_path)
+    journal_file_pathname = str(tmp_path / "cut.render_journal.jsonl")
+    RenderJournal(journal_file_pathname).record_complete(output_file_pathname, "scene")
+
+    # Same size, different content
+    write_output(tmp_path, b"FRAMES")
+    os.utime(output_file_pathname, ns=(0, 0))
+
+    journal = RenderJournal(journal_file_pathname, resume=True)
+
+    assert not journal.is_complete(output_file_pathname)
+    assert not journal.is_complete(str(tmp_path / "other.mp4"))
+
+
+def test_journal_ignores_a_torn_last_line(tmp_path):
+    output_file_pathname = write_output(tmp_path)
+    journal_file_pathname = str(tmp_path / "cut.render_journal.jsonl")
+    RenderJournal(journal_file_pathname).record_complete(output_file_pathname, "scene")
+
+    with open(journal_file_pathname, "a", encoding="utf-8") as journal_file:
+        journal_file.write('{"task": "cut", "outp')
+
+    assert list(RenderJournal(journal_file_pathname, resume=True).records) == [os.path.abspath(output_file_pathname)]
@@ -0,0 +1,96 @@
+import pytest
+
+from render_metrics import (
+    MetricsExporter, configure_render_metrics, escape_label_value, format_openmetrics, get_metric_key, increment_metric,
+    merge_metrics, observe_metric, record_cache_lookup, set_metric, take_metrics
+)
+
+
+@pytest.fixture
+def metrics_enabled():
+    configure_render_metrics({"render_metrics": {"enabled": True}})
+    take_metrics()
+    yield
+    configure_render_metrics({})
+    take_metrics()
+
+
+def test_metrics_are_not_recorded_when_disabled():
+    configure_render_metrics({})
+    increment_metric("frames_encoded", 10)
+    observe_metric("stage_seconds", 1.0, stage="encode")
+
+    assert take_metrics() == {}
+
+
+def test_label_values_are_escaped():
+    assert escape_label_value('C:\\clips\n"beach"') == 'C:\\\\clips\\n\\"beach\\"'
+
+
+def test_counters_and_gauges_are_formatted(metrics_enabled):
+    increment_metric("frames_encoded", 10)
+    increment_metric("frames_encoded", 5)
+    record_cache_lookup("clip", True)
+    set_metric("encode_fps", 48.5)
+
+    lines = format_openmetrics().splitlines()
+
+    assert "# TYPE composeflow_frames_encoded counter" in lines
+    assert "composeflow_frames_encoded_total 15" in lines
+    assert 'composeflow_cache_hits_total{cache="clip"} 1' in lines
+    assert "composeflow_encode_fps 48.5" in lines
+    assert "composeflow_cache_misses_total" not in "\n".join(lines)
+    assert lines[-1] == "# EOF"
+
+
+def test_histogram_buckets_are_cumulative(metrics_enabled):
+    for seconds in (0.2, 1, 3, 5000):
+        observe_metric("stage_seconds", seconds, stage="encode")
+
+    lines = format_openmetrics().splitlines()
+
+    assert 'composeflow_stage_seconds_bucket{stage="encode",le="0.5"} 1' in lines
+    assert 'composeflow_stage_seconds_bucket{stage="encode",le="1.0"} 2' in lines
+    assert 'composeflow_stage_seconds_bucket{stage="encode",le="5.0"} 3' in lines
+    assert 'composeflow_stage_seconds_bucket{stage="encode",le="3600.0"} 3' in lines
+    assert 'composeflow_stage_seconds_bucket{stage="encode",le="+Inf"} 4' in lines
+    assert 'composeflow_stage_seconds_count{stage="encode"} 4' in lines
+    assert 'composeflow_stage_seconds_sum{stage="encode"} 5004.2' in lines
+
+
+def test_worker_metrics_are_merged(metrics_enabled):
+    increment_metric("frames_encoded", 10)
+    set_metric("encode_fps", 20)
+    observe_metric("stage_seconds", 1, stage="encode")
+    worker_metrics = take_metrics()
+
+    assert take_metrics() == {}
+
+    increment_metric("frames_encoded", 5)
+    set_metric("encode_fps", 30)
+    observe_metric("stage_seconds", 2, stage="encode")
+    merge_metrics(worker_metrics)
+    merge_metrics(None)
+
+    metric_values = take_metrics()
+
+    assert metric_values[get_metric_key("frames_encoded", {})] == 15
+    # Gauges take the worker's value
+    assert metric_values[get_metric_key("encode_fps", {})] == 20
+
+    histogram = metric_values[get_metric_key("stage_seconds", {"stage": "encode"})]
+    assert sum(histogram[:-1]) == 2
+    assert histogram[-1] == 3
+
+
+def test_export_replaces_the_metrics_file(metrics_enabled, tmp_path):
+    metrics_pathname = tmp_path / "metrics" / "render_metrics.prom"
+    increment_metric("scenes_rendered", 3)
+
+    MetricsExporter(str(metrics_pathname), 3600, "127.0.0.1", None).export()
+
+    metrics_text = metrics_pathname.read_text()
+
+    assert "composeflow_scenes_rendered_total 3\n" in metrics_text
+    assert 'composeflow_resident_memory_bytes{process="render"}' in metrics_text
+    assert list(metrics_pathname.parent.iterdir()) == [metrics_pathname]
@@ -0,0 +1,74 @@
+import pytest
+
+from render_preview import RenderPreview, get_preview_pathname, is_render_preview_enabled
+
+
+@pytest.fixture
+def remuxed_indexes(monkeypatch):
+    remuxed_indexes = []
+
+    def remux_scene(self, index):
+        remuxed_indexes.append(index)
+        return {"init": f"scene_{index + 1:04d}_init.mp4", "parts": [(2.5, f"scene_{index + 1:04d}_0.m4s")]}
+
+    monkeypatch.setattr(RenderPreview, "remux_scene", remux_scene)
+
+    return remuxed_indexes
+
+
+def read_playlist(render_preview):
+    with open(render_preview.playlist_pathname) as playlist:
+        return playlist.read().splitlines()
+
+
+def test_render_preview_settings():
+    assert is_render_preview_enabled({"render_preview": {"enabled": True}})
+    assert not is_render_preview_enabled({})
+    assert get_preview_pathname("out/cut.mp4") == "out/cut_preview"
+
+
+def test_scenes_are_appended_in_cut_order(tmp_path, remuxed_indexes):
+    scene_output_paths = [str(tmp_path / f"scene_{index}.mp4") for index in range(3)]
+    render_preview = RenderPreview(str(tmp_path / "cut_preview"), scene_output_paths, 2)
+
+    render_preview.add_scene(scene_output_paths[1])
+    assert remuxed_indexes == []
+
+    render_preview.add_scene(scene_output_paths[0])
+    assert remuxed_indexes == [0, 1]
+
+    playlist = read_playlist(render_preview)
+    assert "#EXT-X-PLAYLIST-TYPE:EVENT" in playlist
+    assert "#EXT-X-TARGETDURATION:3" in playlist
+    assert playlist.count("#EXT-X-DISCONTINUITY") == 1
+    assert playlist[-2:] == ["#EXTINF:2.500000,", "scene_0002_0.m4s"]
+
+
+def test_playlist_ends_once_every_scene_is_in(tmp_path, remuxed_indexes):
+    scene_output_paths = [str(tmp_path / f"scene_{index}.mp4") for index in range(2)]
+    render_preview = RenderPreview(str(tmp_path / "cut_preview"), scene_output_paths, 2)
+
+    render_preview.add_scene(scene_output_paths[0])
+    render_preview.close()
+    assert "#EXT-X-ENDLIST" not in read_playlist(render_preview)
+
+    render_preview.add_scene(scene_output_paths[1])
+    render_preview.close("cancelled")
+    assert "#EXT-X-ENDLIST" not in read_playlist(render_preview)
+
+    render_preview.close()
+    assert read_playlist(render_preview)[-1] == "#EXT-X-ENDLIST"
+
+
+def test_failed_remux_stops_the_preview(tmp_path, monkeypatch):
+    def remux_scene(self, index):
+        raise IOError("remux failed")
+
+    monkeypatch.setattr(RenderPreview, "remux_scene", remux_scene)
+
+    scene_output_path = str(tmp_path / "scene_0.mp4")
+    render_preview = RenderPreview(str(tmp_path / "cut_preview"), [scene_output_path], 2)
+    render_preview.add_scene(scene_output_path)
+
+    assert render_preview.failed
+    assert render_preview.segments == []
@@ -0,0 +1,48 @@
+import json
+
+from render_report import RenderReport, format_file_size, format_trim, get_output_facts
+
+TARGETS = [{"name": "landscape", "aspect_ratio": "16:9", "resolution": (640, 360)}]
+
+
+def test_format_trim():
+    assert format_trim({"trim_start_minutes": 1, "trim_start_seconds": 2.5}, "trim_start", "Start of clip") == "1:02.50"
+    assert format_trim({}, "trim_end", "End of clip") == "End of clip"
+
+
+def test_format_file_size():
+    assert format_file_size(3 * 1024 * 1024) == "3.0 MB"
+    assert format_file_size(None) == "N/A"
+
+
+def test_streamed_report_is_valid_json_and_escaped_html(tmp_path):
+    html_file_pathname = str(tmp_path / "cut.html")
+    json_file_pathname = str(tmp_path / "cut.json")
+    output_file_pathname = tmp_path / "scene.mp4"
+    output_file_pathname.write_bytes(b"frames")
+
+    report = RenderReport(html_file_pathname, json_file_pathname, {"cut": {"title": "<Cut>"}}, TARGETS)
+    segment = {"title": "Intro"}
+    report.start_segment(segment)
+
+    for sequence, cache_hit in ((1, False), (2, True)):
+        scene = {"sequence": sequence, "title": f"scene {sequence}", "timeline_clip_type": "image", "timeline_clips": [{"sequence": 1, "path": "photo.jpg"}]}
+        report.add_scene(segment, scene, [get_output_facts(str(output_file_pathname), cache_hit)], 1.5)
+
+    report.add_cut_output(TARGETS[0], get_output_facts(str(tmp_path / "cut.mp4"), False), 2.0)
+    report.close("cancelled")
+
+    with open(json_file_pathname, encoding="utf-8") as json_file:
+        report_json = json.load(json_file)
+
+    assert [scene["sequence"] for scene in report_json["scenes"]] == [1, 2]
+    assert report_json["scenes"][0]["outputs"][0]["size"] == 6
+    assert report_json["summary"] == {"scenes": 2, "scene_cache_hits": 1, "scene_render_seconds": 3.0}
+    assert report_json["status"] == "cancelled"
+    assert report_json["cut_outputs"][0]["target"] == "landscape"
+
+    with open(html_file_pathname, encoding="utf-8") as html_file:
+        report_html = html_file.read()
+
+    assert "<h1>&lt;Cut&gt;</h1>" in report_html
+    assert report_html.rstrip().endswith("</html>")
@@ -0,0 +1,58 @@
+import pytest
+
+from render_telemetry import RenderProgress, RenderTelemetry, count_overlays, get_cut_features, get_makespan
+
+
+def make_features(content_seconds, output_megapixels=1.0):
+    return get_cut_features(content_seconds, 1, {"resolution": (int(output_megapixels * 1e6), 1)})
+
+
+@pytest.fixture
+def render_telemetry(tmp_path):
+    render_telemetry = RenderTelemetry(str(tmp_path / "render_telemetry.sqlite3"))
+    yield render_telemetry
+    render_telemetry.close()
+
+
+def test_get_makespan_schedules_longest_first():
+    assert get_makespan([3, 5, 3, 4, 3], 2) == 10
+    assert get_makespan([3, 5, 3, 4, 3], 1) == 18
+    assert get_makespan([3, 5], 0) == 8
+    assert get_makespan([], 4) == 0
+
+
+def test_count_overlays():
+    scene = {"overlay_images": [{}, {}], "timeline_clips": [{"overlay_images": [{}]}, {}]}
+
+    assert count_overlays(scene) == 3
+
+
+def test_predict_seconds_repeats_known_renders(render_telemetry):
+    for render_seconds in (1.0, 2.0, 3.0, 4.0):
+        render_telemetry.record("cut", "cut/landscape", make_features(10), render_seconds)
+
+    assert render_telemetry.predict_seconds("cut", "cut/landscape", make_features(10)) == pytest.approx(3.0)
+
+
+def test_predict_seconds_fits_the_history(render_telemetry):
+    # 2 seconds fixed cost and 0.5 seconds per second of 1 megapixel content
+    for content_seconds in range(1, 11):
+        render_telemetry.record("cut", f"cut{content_seconds}", make_features(content_seconds), 2 + 0.5 * content_seconds)
+
+    assert render_telemetry.predict_seconds("cut", "new cut", make_features(20)) == pytest.approx(12.0)
+
+
+def test_predict_seconds_with_a_short_history(render_telemetry):
+    assert render_telemetry.predict_seconds("scene", "scene", make_features(10)) == pytest.approx(5.0)
+
+    render_telemetry.record("scene", "other scene", make_features(10), 20.0)
+    assert render_telemetry.predict_seconds("scene", "scene", make_features(5)) == pytest.approx(10.0)
+
+
+def test_render_progress_corrects_predictions():
+    progress = RenderProgress({"a": 10.0, "b": 10.0, "c": 10.0}, worker_count=1)
+    assert progress.get_remaining_seconds() == 30.0
+
+    # The first part took twice as long as predicted
+    progress.complete("a", 20.0)
+    assert progress.get_remaining_seconds() == 40.0
@@ -0,0 +1,66 @@
+import os
+import json
+
+import pytest
+
+import resource_governor
+from resource_governor import (
+    allocate_threads, allocate_worker_count, configure_resource_governor, get_host_leases, get_lease_file_pathname, lease,
+    set_process_share,
+)
+
+
+@pytest.fixture
+def governor(tmp_path, monkeypatch):
+    configure_resource_governor({"resource_governor": {"cpu_threads": 8, "memory_mb": 8192, "worker_memory_mb": 2048, "lease_path": str(tmp_path)}})
+    # An idle host, so allocations only depend on the leases
+    monkeypatch.setattr(resource_governor, "get_busy_cpu_threads", lambda: 0.0)
+    monkeypatch.setattr(resource_governor.psutil, "virtual_memory", lambda: type("memory", (), {"total": 2 ** 40, "available": 2 ** 40})())
+
+    yield
+
+    set_process_share(1)
+    configure_resource_governor({})
+
+
+def write_lease(pid, threads, memory=0):
+    with open(get_lease_file_pathname(pid), "w") as lease_file:
+        json.dump({"threads": threads, "memory": memory}, lease_file)
+
+
+def test_allocate_threads_splits_the_budget(governor):
+    assert allocate_threads() == 8
+    assert allocate_threads(parallel_count=3) == 2
+
+    set_process_share(4)
+    assert allocate_threads() == 2
+
+
+def test_leases_are_published_while_held(governor):
+    with lease(threads=6, memory=1024):
+        with open(get_lease_file_pathname(os.getpid())) as lease_file:
+            assert json.load(lease_file) == {"threads": 6, "memory": 1024}
+
+        assert allocate_threads() == 2
+
+    assert not os.path.exists(get_lease_file_pathname(os.getpid()))
+    assert get_host_leases() == {"threads": 0, "memory": 0}
+
+
+def test_leases_of_other_renders_are_counted_until_they_exit(governor):
+    # The parent process stands in for another render on the host
+    write_lease(os.getppid(), threads=7)
+    # Above the largest pid Linux hands out, so never running
+    write_lease(2 ** 22 + 1, threads=8)
+
+    assert allocate_threads() == 1
+    assert not os.path.exists(get_lease_file_pathname(2 ** 22 + 1))
+
+
+def test_allocate_worker_count_fits_threads_and_memory(governor):
+    assert allocate_worker_count(threads_per_worker=2) == 4
+
+    with lease(memory=5 * 1024 ** 3):
+        assert allocate_worker_count() == 1
+
+    assert allocate_worker_count(requested=12) == 12
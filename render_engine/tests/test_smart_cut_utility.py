@@ -0,0 +1,68 @@
+import pytest
+
+import smart_cut_utility
+from smart_cut_utility import can_smart_cut_scene, configure_smart_cut, plan_smart_cut
+
+KEYFRAME_INDEX = {
+    "codec": "h264",
+    "profile": "High",
+    "pix_fmt": "yuv420p",
+    "packet_count": 300,
+    "keyframes": [{"time": 0.0, "packet": 0}, {"time": 2.0, "packet": 60}, {"time": 4.0, "packet": 120}, {"time": 6.0, "packet": 180}],
+}
+
+
+def test_plan_smart_cut_copies_whole_gops_and_encodes_the_edges():
+    parts = plan_smart_cut(KEYFRAME_INDEX, fps=30, start=1.0, end=5.0)
+
+    assert parts == [
+        {"mode": "encode", "start": 1.0, "frames": 30},
+        {"mode": "copy", "start": 2.0, "frames": 60},
+        {"mode": "encode", "start": 4.0, "frames": 30},
+    ]
+
+
+def test_plan_smart_cut_copies_to_the_end_of_the_source():
+    parts = plan_smart_cut(KEYFRAME_INDEX, fps=30, start=4.0, end=None)
+
+    assert parts == [{"mode": "copy", "start": 4.0, "frames": 180}]
+
+
+def test_plan_smart_cut_encodes_ranges_without_a_whole_gop():
+    assert plan_smart_cut(KEYFRAME_INDEX, fps=30, start=2.5, end=3.5) == [{"mode": "encode", "start": 2.5, "frames": 30}]
+
+
+@pytest.fixture
+def smart_cut_source(monkeypatch):
+    infos = {"video_size": [1920, 1080], "video_fps": 30.0, "audio_found": False}
+
+    configure_smart_cut({"smart_cut": {"enabled": True}})
+    monkeypatch.setattr(smart_cut_utility, "probe_media_source", lambda path: infos)
+    monkeypatch.setattr(smart_cut_utility, "get_keyframe_index", lambda path: KEYFRAME_INDEX)
+
+    yield infos
+
+    configure_smart_cut({})
+
+
+def make_scene_and_target():
+    scene = {"timeline_clips": [{"path": "source.mp4"}]}
+    target = {"aspect_ratio": "16:9", "resolution": (1920, 1080), "render_settings": {"fps": 30, "codec": "libx264"}}
+    return scene, target
+
+
+def test_can_smart_cut_scene_with_matching_source(smart_cut_source):
+    assert can_smart_cut_scene(*make_scene_and_target())
+
+
+def test_can_smart_cut_scene_rejects_rotated_sources(smart_cut_source):
+    smart_cut_source["video_rotation"] = 90.0
+
+    assert not can_smart_cut_scene(*make_scene_and_target())
+
+
+def test_can_smart_cut_scene_rejects_scaled_outputs(smart_cut_source):
+    scene, target = make_scene_and_target()
+    target["resolution"] = (1280, 720)
+
+    assert not can_smart_cut_scene(scene, target)
@@ -0,0 +1,105 @@
+import os
+
+import pytest
+
+from video_assembly_helper import get_file_signature
+from staging_cache import (
+    SourceStager, close_source_staging, configure_staging_cache, copy_to_staging, get_staged_file_pathname,
+    is_staged_file_intact, is_staged_volume_path, resolve_source_path, trim_staging_cache
+)
+
+
+@pytest.fixture
+def volume_path(tmp_path):
+    volume_path = tmp_path / "volume"
+    volume_path.mkdir()
+    configure_staging_cache({
+        "common_base_file_path": str(volume_path),
+        "staging_cache": {"enabled": True, "path": str(tmp_path / "staging"), "max_size_mb": 1},
+    })
+    yield volume_path
+    close_source_staging()
+    configure_staging_cache({})
+
+
+def write_source(volume_path, name, size):
+    source_path = volume_path / name
+    source_path.write_bytes(os.urandom(size))
+    return str(source_path)
+
+
+def test_only_sources_on_the_volumes_are_staged(volume_path, tmp_path):
+    assert is_staged_volume_path(str(volume_path / "clips" / "beach.mp4"))
+    assert is_staged_volume_path(str(volume_path))
+    assert not is_staged_volume_path(str(tmp_path / "volume_2" / "beach.mp4"))
+    assert not is_staged_volume_path(str(tmp_path / "beach.mp4"))
+
+
+def test_staged_file_follows_the_source_signature(volume_path):
+    source_path = write_source(volume_path, "beach.mp4", 100)
+    staged_file_pathname = get_staged_file_pathname(source_path, get_file_signature(source_path))
+
+    assert staged_file_pathname.endswith(".mp4")
+    assert get_staged_file_pathname(source_path, ("0", 100)) != staged_file_pathname
+
+
+def test_staged_copy_is_checked_against_its_record(volume_path):
+    source_path = write_source(volume_path, "beach.mp4", 100)
+    staged_file_pathname = get_staged_file_pathname(source_path, get_file_signature(source_path))
+
+    assert not is_staged_file_intact(staged_file_pathname, verify_checksum=False)
+
+    copy_to_staging(source_path, staged_file_pathname)
+    assert is_staged_file_intact(staged_file_pathname, verify_checksum=True)
+
+    # A copy of the right size with other bytes only fails the checksum
+    with open(staged_file_pathname, "r+b") as staged_file:
+        staged_file.write(b"\0" * 10)
+
+    assert is_staged_file_intact(staged_file_pathname, verify_checksum=False)
+    assert not is_staged_file_intact(staged_file_pathname, verify_checksum=True)
+
+
+def test_cancelled_copy_leaves_nothing_staged(volume_path):
+    source_path = write_source(volume_path, "beach.mp4", 100)
+    staged_file_pathname = get_staged_file_pathname(source_path, get_file_signature(source_path))
+
+    with pytest.raises(InterruptedError):
+        copy_to_staging(source_path, staged_file_pathname, lambda: True)
+
+    assert not os.path.exists(staged_file_pathname)
+
+
+def test_trim_removes_the_least_recently_used_copies(volume_path):
+    staged_file_pathnames = []
+
+    for index in range(3):
+        source_path = write_source(volume_path, f"clip_{index}.mp4", 300 * 1024)
+        staged_file_pathname = get_staged_file_pathname(source_path, get_file_signature(source_path))
+        copy_to_staging(source_path, staged_file_pathname)
+        os.utime(staged_file_pathname, (index, index))
+        staged_file_pathnames.append(staged_file_pathname)
+
+    # The oldest copy is kept for the current render, so the next oldest goes
+    trim_staging_cache(300 * 1024, {staged_file_pathnames[0]})
+
+    assert [os.path.exists(pathname) for pathname in staged_file_pathnames] == [True, False, True]
+
+
+def test_sources_are_read_from_intact_copies(volume_path, tmp_path):
+    source_path = write_source(volume_path, "beach.mp4", 100)
+    assert resolve_source_path(source_path) == source_path
+
+    stager = SourceStager([source_path])
+    stager.thread.join()
+    staged_file_pathname = stager.get_staged_path(source_path)
+
+    assert staged_file_pathname is not None
+    assert resolve_source_path(source_path) == staged_file_pathname
+
+    # An edited source is read from its volume until it is staged again
+    write_source(volume_path, "beach.mp4", 200)
+    assert resolve_source_path(source_path) == source_path
+
+    local_path = str(tmp_path / "beach.mp4")
+    assert resolve_source_path(local_path) == local_path
@@ -0,0 +1,83 @@
+import pytest
+
+from moviepy import ColorClip
+
+from video_utility import (
+    get_cropped_size, get_decode_resolution, get_display_size, get_output_resolution, get_render_fps, parse_aspect_ratio,
+    probe_media_source, write_video, write_video_targets,
+)
+
+
+def make_clip(fps=24, duration=0.5, size=(64, 36)):
+    return ColorClip(size, color=(200, 40, 40), duration=duration).with_fps(fps)
+
+
+def test_get_render_fps_prefers_profile_then_clip():
+    assert get_render_fps({"fps": 25}, make_clip(fps=24)) == 25
+    assert get_render_fps({"fps": None}, make_clip(fps=24)) == 24
+    assert get_render_fps({}, make_clip(fps=24)) == 24
+    assert get_render_fps({"fps": None}) == 30
+
+
+def test_write_video_with_null_fps_keeps_clip_fps(tmp_path):
+    output_file_pathname = str(tmp_path / "out.mp4")
+
+    write_video(make_clip(), output_file_pathname, {"fps": None, "quality_preset": "ultrafast"})
+
+    assert round(probe_media_source(output_file_pathname)["video_fps"]) == 24
+
+
+def test_write_video_targets_with_null_fps(tmp_path):
+    branches = [
+        {"clip": make_clip(), "output_file_pathname": str(tmp_path / f"out{index}.mp4"), "render_settings": {"fps": None, "quality_preset": "ultrafast"}}
+        for index in range(2)
+    ]
+
+    write_video_targets(branches)
+
+    for branch in branches:
+        assert round(probe_media_source(branch["output_file_pathname"])["video_fps"]) == 24
+
+
+def test_get_display_size_swaps_rotated_sources():
+    assert get_display_size({"video_size": [1920, 1080]}) == (1920, 1080)
+    assert get_display_size({"video_size": [1920, 1080], "video_rotation": 0}) == (1920, 1080)
+    assert get_display_size({"video_size": [1920, 1080], "video_rotation": 90.0}) == (1080, 1920)
+    assert get_display_size({"video_size": [1920, 1080], "video_rotation": -90.0}) == (1080, 1920)
+    assert get_display_size({"video_size": [1920, 1080], "video_rotation": 180.0}) == (1920, 1080)
+
+
+def test_parse_aspect_ratio():
+    assert parse_aspect_ratio("16:9") == pytest.approx(16 / 9)
+    assert parse_aspect_ratio("9/16") == pytest.approx(9 / 16)
+    assert parse_aspect_ratio("1.85") == pytest.approx(1.85)
+
+
+@pytest.mark.parametrize("aspect_ratio", ["__import__('os')", "16:", "wide"])
+def test_parse_aspect_ratio_rejects_expressions(aspect_ratio):
+    with pytest.raises(ValueError):
+        parse_aspect_ratio(aspect_ratio)
+
+
+def test_get_cropped_size():
+    assert get_cropped_size((1920, 1080), "16:9") == (1920, 1080)
+    assert get_cropped_size((1920, 1080), "9:16") == (607, 1080)
+    assert get_cropped_size((1080, 1080), "16:9") == (1080, 607)
+
+
+def test_get_output_resolution_rounds_to_even_sizes():
+    assert get_output_resolution("16:9", width=1280) == (1280, 720)
+    assert get_output_resolution("16:9", height=362) == (644, 362)
+    assert get_output_resolution("9:16", width=181) == (180, 322)
+    assert get_output_resolution("16:9") is None
+
+
+def test_get_decode_resolution_covers_every_target():
+    landscape = {"aspect_ratio": "16:9", "resolution": (640, 360)}
+    vertical = {"aspect_ratio": "9:16", "resolution": (360, 640)}
+
+    assert get_decode_resolution((1920, 1080), [landscape]) == (640, 360)
+    # The vertical crop of a 1080p frame is 607 wide, scaled to 360
+    assert get_decode_resolution((1920, 1080), [landscape, vertical]) == (1139, 641)
+    assert get_decode_resolution((1920, 1080), [landscape, {"aspect_ratio": "16:9", "resolution": None}]) is None
+    assert get_decode_resolution((640, 360), [{"aspect_ratio": "16:9", "resolution": (1280, 720)}]) is None
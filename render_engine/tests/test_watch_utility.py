@@ -0,0 +1,76 @@
+import os
+
+from watch_utility import PollingWatcher, get_scene_watch_keys, invalidate_scene_outputs
+
+
+def make_video_assembly(tmp_path, overlay_width=100):
+    return {
+        "composeflow.org": {"settings": {"quick_and_dirty": True}},
+        "cut": {
+            "title": "Watch",
+            "render_output": {
+                "aspect_ratio": "16:9",
+                "output_paths": {"cut": str(tmp_path / "cut"), "segment_scene": str(tmp_path / "scenes")},
+                "quick_render": {"aspect_ratio": "16:9", "fps": 10, "width": 320, "height": None, "render_settings": {"codec": "libx264"}},
+            },
+            "segments": [{
+                "sequence": 1,
+                "title": "Intro",
+                "scenes": [
+                    {"sequence": 1, "title": "one", "timeline_clips": [{"sequence": 1, "path": str(tmp_path / "one.mp4")}]},
+                    {"sequence": 2, "title": "two", "timeline_clips": [{"sequence": 1, "path": str(tmp_path / "two.mp4")}],
+                     "overlay_images": [{"path": str(tmp_path / "logo.png"), "width": overlay_width}]},
+                ],
+            }],
+        },
+    }
+
+
+def write_file(file_path, content=b"media"):
+    with open(file_path, "wb") as file:
+        file.write(content)
+
+
+def get_changed_scenes(previous_keys, current_keys):
+    return sorted(os.path.basename(output_path).split("_")[2] for output_path in current_keys if previous_keys[output_path] != current_keys[output_path])
+
+
+def test_scene_watch_keys_follow_scene_edits_and_source_changes(tmp_path):
+    for name in ("one.mp4", "two.mp4", "logo.png"):
+        write_file(str(tmp_path / name))
+
+    keys = get_scene_watch_keys(make_video_assembly(tmp_path))
+    assert get_changed_scenes(keys, get_scene_watch_keys(make_video_assembly(tmp_path))) == []
+
+    write_file(str(tmp_path / "one.mp4"), b"edited media")
+    edited_source_keys = get_scene_watch_keys(make_video_assembly(tmp_path))
+    assert get_changed_scenes(keys, edited_source_keys) == ["1"]
+
+    edited_overlay_keys = get_scene_watch_keys(make_video_assembly(tmp_path, overlay_width=50))
+    assert get_changed_scenes(edited_source_keys, edited_overlay_keys) == ["2"]
+
+
+def test_invalidate_scene_outputs_removes_changed_outputs(tmp_path):
+    for name in ("one.mp4", "two.mp4"):
+        write_file(str(tmp_path / name))
+
+    removed_count = invalidate_scene_outputs(
+        {str(tmp_path / "one.mp4"): "a", str(tmp_path / "two.mp4"): "b"},
+        {str(tmp_path / "one.mp4"): "a", str(tmp_path / "two.mp4"): "c", str(tmp_path / "three.mp4"): "d"},
+    )
+
+    assert removed_count == 1
+    assert sorted(os.listdir(tmp_path)) == ["one.mp4"]
+
+
+def test_polling_watcher_reports_changed_paths(tmp_path):
+    watched_path = str(tmp_path / "one.mp4")
+    write_file(watched_path)
+
+    watcher = PollingWatcher(poll_interval=0)
+    watcher.set_paths([watched_path, str(tmp_path / "missing.mp4")])
+    assert watcher.wait_for_changes(0) == set()
+
+    write_file(watched_path, b"edited media")
+    assert watcher.wait_for_changes(0) == {watched_path}
+    assert watcher.wait_for_changes(0) == set()
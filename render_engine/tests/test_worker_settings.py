@@ -0,0 +1,23 @@
+from image_ops import get_image_ops_backend, set_image_ops_backend
+from staging_cache import configure_staging_cache, get_staging_cache_settings
+from worker_settings import apply_worker_settings, get_worker_settings
+
+
+def test_worker_settings_configure_a_worker_like_its_parent(tmp_path):
+    image_ops_backend = get_image_ops_backend()
+    set_image_ops_backend("moviepy")
+    configure_staging_cache({"staging_cache": {"enabled": True, "path": str(tmp_path), "volumes": [str(tmp_path)]}})
+    worker_settings = get_worker_settings()
+
+    try:
+        set_image_ops_backend("opencv")
+        configure_staging_cache({})
+
+        apply_worker_settings(worker_settings)
+
+        assert get_image_ops_backend() == "moviepy"
+        assert get_staging_cache_settings() == worker_settings["staging_cache"]
+        assert worker_settings["render_metrics"]["export"] is False
+    finally:
+        set_image_ops_backend(image_ops_backend)
+        configure_staging_cache({})
@@ -1,5 +1,9 @@
+import os
 import json
 
+# Scene keys that name a scene but do not change its pixels
+SCENE_LABEL_KEYS = ("title", "sequence", "description")
+
 def get_this_run_only(video_assembly):
     this_run_only = None 
 
@@ -57,4 +61,29 @@ def skip_scene_render(video_assembly, segment, scene):
 
     return  skip_scene
 
-    
+
+def collect_media_paths(node):
+    """Returns every "path" value found in a part of the assembly, e.g. clips and overlays of a scene."""
+    paths = set()
+
+    if isinstance(node, dict):
+        for key, value in node.items():
+            if key == "path" and isinstance(value, str) and value:
+                paths.add(os.path.abspath(value))
+            else:
+                paths.update(collect_media_paths(value))
+    elif isinstance(node, list):
+        for item in node:
+            paths.update(collect_media_paths(item))
+
+    return paths
+
+
+def get_file_signature(file_path):
+    """Returns the (mtime, size) of a file, or None if it does not exist."""
+    try:
+        file_stat = os.stat(file_path)
+    except OSError:
+        return None
+
+    return file_stat.st_mtime_ns, file_stat.st_size
@@ -1,10 +1,34 @@
 import os
+import re
+import sys
 import time
-import multiprocessing
+import heapq
+import shutil
 
-from typing import Union
+from typing import Any, Dict, List, Tuple, Union
+from functools import lru_cache
+from contextlib import contextmanager
 from moviepy import *
+from moviepy.tools import find_extension
+from moviepy.video.io.ffmpeg_reader import ffmpeg_parse_infos
 from datetime import datetime, MINYEAR
+from frame_sink import FrameSink
+from image_ops import resize_clip, fit_size
+from resource_governor import allocate_threads, lease
+from abr_ladder_utility import build_hls_output, get_hls_output_pathname
+from render_metrics import increment_metric, set_metric
+
+# Frame rate of outputs whose profile and clip both leave it unset
+DEFAULT_RENDER_FPS = 30
+
+
+def get_render_fps(render_settings: Dict, clip=None) -> float:
+    """
+    Returns the frame rate an output is encoded at: the profile's, or the
+    clip's own when the profile leaves it unset (e.g. "fps": null), as
+    MoviePy's write_videofile does.
+    """
+    return render_settings.get("fps") or getattr(clip, "fps", None) or DEFAULT_RENDER_FPS
 
 
 def video_file_exists(file_path: str, and_is_newer_than=None) -> bool:
@@ -29,29 +53,162 @@ def video_file_exists(file_path: str, and_is_newer_than=None) -> bool:
     return True
 
 
+@lru_cache(maxsize=None)
+def probe_media_source(file_path: str) -> Dict[str, Any]:
+    """
+    Returns ffmpeg's stream information for a source file. Results are cached
+    for the render, so each source is probed once however often it is used.
+    """
+    return ffmpeg_parse_infos(file_path)
+
+
+def get_display_size(infos: Dict[str, Any]) -> Tuple[int, int]:
+    """
+    Returns the (width, height) a source is displayed and decoded at from its
+    probed stream information, i.e. its coded size swapped for footage
+    rotated by 90 or 270 degrees, as MoviePy's reader does.
+    """
+    width, height = infos["video_size"]
+
+    if abs(infos.get("video_rotation", 0)) in (90, 270):
+        return height, width
+
+    return width, height
+
+
+def parse_aspect_ratio(aspect_ratio: str) -> float:
+    """
+    Converts an aspect ratio such as "16:9" (or "16/9", "1.78") to a float.
+    """
+    if ':' in aspect_ratio or '/' in aspect_ratio:
+        width_text, height_text = re.split(r'[:/]', aspect_ratio, maxsplit=1)
+        return float(width_text) / float(height_text)
+
+    return float(aspect_ratio)
+
+
+def get_cropped_size(size: Tuple[int, int], aspect_ratio: str) -> Tuple[int, int]:
+    """
+    Returns the (width, height) left after cropping a frame of the given size
+    to the aspect ratio, as done by crop_video_to_aspect_ratio().
+    """
+    width, height = size
+    target_aspect_ratio = parse_aspect_ratio(aspect_ratio)
+
+    if width / height > target_aspect_ratio:
+        return int(height * target_aspect_ratio), height
+    else:
+        return width, int(width / target_aspect_ratio)
+
+
+def get_output_resolution(aspect_ratio: str, width=None, height=None) -> Union[Tuple[int, int], None]:
+    """
+    Returns the output frame size for a render profile's width/height.
+
+    Only one of width or height is needed, the other follows from the aspect ratio.
+    Both are rounded to even numbers as required by yuv420p encoders.
+
+    :return: (width, height), or None when the profile keeps the source resolution.
+    """
+    target_aspect_ratio = parse_aspect_ratio(aspect_ratio)
+
+    if width:
+        height = width / target_aspect_ratio
+    elif height:
+        width = height * target_aspect_ratio
+    else:
+        return None
+
+    return int(round(width / 2)) * 2, int(round(height / 2)) * 2
+
+
+def get_decode_resolution(source_size: Tuple[int, int], output_targets) -> Union[Tuple[int, int], None]:
+    """
+    Returns the smallest decode size that still covers every output target.
+
+    Downscaling while decoding means cropping, overlays and compositing all run
+    on the smaller frames. Sources are never upscaled while decoding.
+
+    :param source_size: The (width, height) of the source video.
+    :param output_targets: The output targets sharing this decode.
+    :return: (width, height), or None when the source must be decoded at full size.
+    """
+    scale = 0
+
+    for target in output_targets:
+        resolution = target.get("resolution")
+
+        if resolution is None:
+            return None
+
+        cropped_width, cropped_height = get_cropped_size(source_size, target["aspect_ratio"])
+        scale = max(scale, resolution[0] / cropped_width, resolution[1] / cropped_height)
+
+    if scale == 0 or scale >= 1:
+        return None
+
+    return int(round(source_size[0] * scale)), int(round(source_size[1] * scale))
+
+
 def crop_video_to_aspect_ratio(video_clip: VideoFileClip, aspect_ratio: str) -> VideoFileClip:
     """Crop the video to match the desired aspect ratio."""
     width, height = video_clip.size
-    target_aspect_ratio = eval(aspect_ratio.replace(':', '/'))
+    new_width, new_height = get_cropped_size(video_clip.size, aspect_ratio)
     
-    if width / height > target_aspect_ratio:
-        new_width = int(height * target_aspect_ratio)
+    if new_width < width:
         crop_x = (width - new_width) // 2
         return video_clip.cropped(x1=crop_x, x2=crop_x + new_width)
     else:
-        new_height = int(width / target_aspect_ratio)
         crop_y = (height - new_height) // 2
         return video_clip.cropped(y1=crop_y, y2=crop_y + new_height)
+
+
+def resize_video_to_resolution(video_clip: VideoClip, resolution) -> VideoClip:
+    """Resize the clip to the output resolution, if one is set and it differs."""
+    if resolution is None:
+        return video_clip
+
+    return resize_clip(video_clip, resolution)
     
 
-def resize_clips_to_max_resolution(clips):
+def share_decoded_frames(video_clip: VideoClip) -> VideoClip:
+    """
+    Returns a copy of the clip whose last decoded frame is shared by all its copies.
+
+    Every branch derived from the returned clip (crops, overlays, concatenations)
+    that asks for the same time gets the already decoded frame, so a source
+    rendered to several output targets in lockstep is decoded only once.
+    MoviePy's own memoize cannot be used here because effects copy the clip
+    and each copy keeps its own memo.
+    """
+    decoded_frame = {"t": None, "frame": None}
+    get_frame = video_clip.get_frame
+
+    def shared_frame_function(t):
+        if decoded_frame["t"] != t:
+            decoded_frame["frame"] = get_frame(t)
+            decoded_frame["t"] = t
+
+        return decoded_frame["frame"]
+
+    return video_clip.with_updated_frame_function(shared_frame_function)
+
+
+def resize_clips_to_max_resolution(clips, resolution=None):
     """
     Takes a list of VideoFileClip objects, finds the highest resolution among them,
     and resizes all clips to match that resolution.
+
+    When an output resolution is given, clips are resized to it instead, so smaller
+    segments are not upscaled to the largest one.
     
     :param clips: List of VideoFileClip objects
+    :param resolution: Optional (width, height) output resolution
     :return: List of resized VideoFileClip objects
     """
+    if resolution is not None:
+        return [resize_video_to_resolution(clip, resolution) for clip in clips]
+
     # Find the maximum resolution
     max_width = max(clip.w for clip in clips)
     max_height = max(clip.h for clip in clips)
@@ -59,7 +216,7 @@ def resize_clips_to_max_resolution(clips):
     # Resize clips if they are not already at max resolution
     resized_clips = [
         clip if (clip.w == max_width and clip.h == max_height) 
-        else clip.resized((max_width, max_height))
+        else resize_clip(clip, (max_width, max_height))
         for clip in clips
     ]
 
@@ -83,8 +240,76 @@ def ensure_directory_exists(file_path: str) -> None:
         os.makedirs(directory, exist_ok=True)
 
 
+def get_partial_file_pathname(output_file_pathname: str) -> str:
+    """
+    Returns the temporary pathname an output is rendered to before it is renamed,
+    e.g. "cut.mp4" -> "cut.partial.mp4". The extension is kept so ffmpeg still
+    picks the right container.
+    """
+    name, extension = os.path.splitext(output_file_pathname)
+    return f"{name}.partial{extension}"
+
+
+@contextmanager
+def atomic_output_file(output_file_pathname: str):
+    """
+    Context manager yielding a partial file pathname to write to. The partial
+    file replaces output_file_pathname only if the block completes, and is
+    removed otherwise.
+    """
+    partial_file_pathname = get_partial_file_pathname(output_file_pathname)
+
+    try:
+        yield partial_file_pathname
+    except BaseException:
+        if os.path.exists(partial_file_pathname):
+            os.remove(partial_file_pathname)
+        raise
+
+    os.replace(partial_file_pathname, output_file_pathname)
+
+
+@contextmanager
+def atomic_output_directory(output_pathname: str):
+    """
+    Like atomic_output_file(), for outputs made of many files: yields a
+    partial directory that replaces output_pathname only if the block completes.
+    """
+    partial_pathname = f"{output_pathname}.partial"
+
+    if os.path.isdir(partial_pathname):
+        shutil.rmtree(partial_pathname)
+
+    os.makedirs(partial_pathname)
+
+    try:
+        yield partial_pathname
+    except BaseException:
+        shutil.rmtree(partial_pathname, ignore_errors=True)
+        raise
+
+    if os.path.isdir(output_pathname):
+        shutil.rmtree(output_pathname)
+
+    os.replace(partial_pathname, output_pathname)
+
+
+@contextmanager
+def optional_hls_output(clip, output_file_pathname: str, abr_ladder, preset: str, audio_codec: str):
+    """
+    Yields the hls_output options packaging the clip with the ABR ladder, see
+    abr_ladder_utility.build_hls_output(), or None without a ladder.
+    """
+    if not abr_ladder:
+        yield None
+        return
+
+    with atomic_output_directory(get_hls_output_pathname(output_file_pathname)) as partial_hls_output_pathname:
+        yield build_hls_output(abr_ladder, clip.size, partial_hls_output_pathname, preset, audio_codec)
+
+
 def write_video(
-    clip, output_file_pathname: str, render_settings
+    clip, output_file_pathname: str, render_settings, abr_ladder = None
 ) -> None:
     """
     Process a video file using MoviePy with multithreading and hardware acceleration.
@@ -96,15 +321,18 @@ def write_video(
     :type input_path: str
     :type output_path: str
     :type threads: int
+    :param abr_ladder: Also writes the renditions of this ABR ladder as HLS
+                       from the same frames, see abr_ladder_utility.get_abr_ladder().
     """
 
     codec = render_settings.get("codec", "libx264")
     audio_codec = render_settings.get("audio", {}).get("codec", "aac")
     quality_preset = render_settings.get("quality_preset", "medium")
-    fps = render_settings.get("fps", 30)
+    fps = get_render_fps(render_settings, clip)
+    ffmpeg_params = render_settings.get("ffmpeg_params")
+    pixel_format = render_settings.get("pixel_format")
 
-    cpu_count = multiprocessing.cpu_count() # Get max available CPU cores
-    num_threads = render_settings.get("threads", cpu_count)
+    num_threads = render_settings.get("threads") or allocate_threads()
 
     if clip.duration is None:
         raise ValueError(
@@ -129,25 +357,49 @@ def write_video(
         # Start time
     start_time = time.time()
 
-    """
-    # Handle Resize
+    # Handle Resize. Scenes are already rendered at the output resolution, so this
+    # only applies to clips that reach write_video at source resolution.
     width = render_settings.get("width")    # Can be None
     height = render_settings.get("height")   # Can be None
 
     if width:
-        clip = clip.set_size(width=width, maintain_aspect_ratio=True)
+        clip = resize_clip(clip, fit_size(clip.size, width=width)) if clip.w != width else clip
     elif height:
-        clip = clip.set_size(height=height, maintain_aspect_ratio=True)
-    """
-
-    clip.write_videofile(
-            output_file_pathname,
-            codec=codec,
-            fps=fps,
-            audio_codec=audio_codec,         
-            preset=quality_preset,         
-            threads=num_threads
-        )
+        clip = resize_clip(clip, fit_size(clip.size, height=height)) if clip.h != height else clip
+
+    # Render to a partial file that is renamed once complete, so an existing
+    # output file is never a truncated one
+    with lease(num_threads), optional_hls_output(clip, output_file_pathname, abr_ladder, quality_preset, audio_codec) as hls_output, atomic_output_file(output_file_pathname) as partial_file_pathname:
+        # The ABR ladder is encoded by the frame sink's ffmpeg, from the same frames as the cut
+        if hls_output is not None or (render_settings.get("frame_sink", True) and clip.mask is None):
+            write_clip_to_frame_sink(
+                clip,
+                partial_file_pathname,
+                codec=codec,
+                fps=fps,
+                audio_codec=audio_codec,
+                preset=quality_preset,
+                threads=num_threads,
+                ffmpeg_params=ffmpeg_params,
+                output_pixel_format=pixel_format,
+                hls_output=hls_output
+            )
+        else:
+            clip.write_videofile(
+                    partial_file_pathname,
+                    codec=codec,
+                    fps=fps,
+                    audio_codec=audio_codec,         
+                    preset=quality_preset,         
+                    threads=num_threads,
+                    ffmpeg_params=ffmpeg_params,
+                    pixel_format=pixel_format
+                )
+
+            # MoviePy's writer is not a FrameSink, its frames are counted here
+            frame_count = int(clip.duration * fps)
+            increment_metric("frames_encoded", frame_count)
+            set_metric("encode_fps", frame_count / max(time.time() - start_time, 1e-6))
 
     # End time
     end_time = time.time()
@@ -167,6 +419,185 @@ def write_video(
         f"  - Threads: {num_threads}"
     )
 
+def write_temp_audio_file(clip, output_file_pathname: str, audio_codec: str) -> Union[str, None]:
+    """
+    Writes the clip's soundtrack next to the output file, the same way MoviePy's
+    write_videofile does, so it can be muxed by the video encoder.
+
+    :return: The temporary audio file pathname, or None if the clip has no audio.
+    """
+    if not clip.audio:
+        return None
+
+    if getattr(clip.audio, "fps", None) is None:
+        clip.audio.fps = 44100  # Set a default sample rate
+
+    name, _ = os.path.splitext(os.path.basename(output_file_pathname))
+    audio_file_pathname = os.path.join(
+        os.path.dirname(os.path.abspath(output_file_pathname)),
+        f"{name}TEMP_MPY_wvf_snd.{find_extension(audio_codec)}"
+    )
+    clip.audio.write_audiofile(audio_file_pathname, codec=audio_codec, logger=None)
+
+    return audio_file_pathname
+
+
+def write_clip_to_frame_sink(
+    clip, output_file_pathname: str, codec: str, fps, audio_codec: str, preset: str, threads=None, ffmpeg_params=None, output_pixel_format=None, hls_output=None
+) -> None:
+    """
+    Encode a clip through a FrameSink instead of MoviePy's write_videofile.
+
+    Frames are copied into reused buffers and piped on a writer thread, see
+    frame_sink.FrameSink.
+    """
+    audio_file_pathname = write_temp_audio_file(clip, output_file_pathname, audio_codec)
+
+    try:
+        with FrameSink(
+            output_file_pathname,
+            clip.size,
+            fps,
+            codec=codec,
+            preset=preset,
+            audiofile=audio_file_pathname,
+            threads=threads,
+            ffmpeg_params=ffmpeg_params,
+            output_pixel_format=output_pixel_format,
+            hls_output=hls_output
+        ) as frame_sink:
+            for frame in clip.iter_frames(fps=fps, logger="bar"):
+                frame_sink.write_frame(frame)
+    finally:
+        if audio_file_pathname and os.path.exists(audio_file_pathname):
+            os.remove(audio_file_pathname)
+
+
+def _branch_frame_times(branch_index: int, duration: float, fps: float, frame_range=None):
+    """Yields (time, branch index) for every frame of one output branch."""
+    first_frame, last_frame = frame_range or (0, int(duration * fps))
+
+    for frame_index in range(first_frame, last_frame):
+        yield frame_index / fps, branch_index
+
+
+@contextmanager
+def open_branch_frame_sinks(branches: List[Dict[str, Any]]):
+    """
+    Opens a FrameSink per output branch, writing to the branch's partial file
+    with the soundtrack muxed, see write_video_targets() for the branches.
+
+    The outputs are only published once every sink finished encoding, and
+    removed if the block fails.
+
+    :return: The frame sinks, in branch order.
+    """
+    # The branches encode at the same time and split the threads this process may use
+    branch_threads = allocate_threads(len(branches))
+
+    writers = []
+    writer_threads = []
+    audio_files = {}
+
+    try:
+        for branch in branches:
+            clip = branch["clip"]
+            output_file_pathname = branch["output_file_pathname"]
+            render_settings = branch["render_settings"]
+
+            if clip.duration is None:
+                raise ValueError(
+                    "Clip duration is None. Check source video or composition process."
+                )
+
+            codec = render_settings.get("codec", "libx264")
+            audio_codec = render_settings.get("audio", {}).get("codec", "aac")
+            quality_preset = render_settings.get("quality_preset", "medium")
+            fps = get_render_fps(render_settings, clip)
+            num_threads = render_settings.get("threads") or branch_threads
+            writer_threads.append(num_threads)
+
+            ensure_directory_exists(output_file_pathname)
+
+            # All branches carry the same soundtrack, so it is written once per audio codec
+            if clip.audio and audio_codec not in audio_files:
+                audio_files[audio_codec] = write_temp_audio_file(clip, output_file_pathname, audio_codec)
+
+            writers.append(FrameSink(
+                get_partial_file_pathname(output_file_pathname),
+                clip.size,
+                fps,
+                codec=codec,
+                preset=quality_preset,
+                audiofile=audio_files.get(audio_codec) if clip.audio else None,
+                threads=num_threads,
+                ffmpeg_params=render_settings.get("ffmpeg_params"),
+                output_pixel_format=render_settings.get("pixel_format")
+            ))
+
+        with lease(sum(writer_threads)):
+            yield writers
+
+        for writer in writers:
+            writer.close()
+
+        # Only publish the outputs once every branch finished encoding
+        for branch in branches:
+            os.replace(get_partial_file_pathname(branch["output_file_pathname"]), branch["output_file_pathname"])
+    except BaseException:
+        for writer in writers:
+            writer.__exit__(*sys.exc_info())
+
+        for branch in branches:
+            partial_file_pathname = get_partial_file_pathname(branch["output_file_pathname"])
+
+            if os.path.exists(partial_file_pathname):
+                os.remove(partial_file_pathname)
+        raise
+    finally:
+        for audio_file_pathname in audio_files.values():
+            if os.path.exists(audio_file_pathname):
+                os.remove(audio_file_pathname)
+
+
+def write_video_targets(branches: List[Dict[str, Any]], frame_range=None) -> None:
+    """
+    Encode several output branches that share decoded sources in a single pass.
+
+    Each branch is a dictionary with the keys "clip", "output_file_pathname" and
+    "render_settings". Frames are requested from all branches in time order, so a
+    source frame shared through share_decoded_frames() is decoded once and then
+    cropped, composited and encoded by every branch.
+
+    :param branches: The output branches to encode.
+    :param frame_range: Optional (first frame, end frame) to encode only part of
+                        the branches, e.g. one chunk of a long scene.
+    """
+    if len(branches) == 1 and frame_range is None:
+        branch = branches[0]
+        write_video(branch["clip"], branch["output_file_pathname"], branch["render_settings"])
+        return
+
+    frame_time_iterators = [
+        _branch_frame_times(branch_index, branch["clip"].duration, get_render_fps(branch["render_settings"], branch["clip"]), frame_range)
+        for branch_index, branch in enumerate(branches)
+    ]
+
+    start_time = time.time()
+
+    with open_branch_frame_sinks(branches) as writers:
+        for t, branch_index in heapq.merge(*frame_time_iterators):
+            writers[branch_index].write_frame(branches[branch_index]["clip"].get_frame(t))
+
+    elapsed_time = time.time() - start_time
+    minutes, seconds = divmod(elapsed_time, 60)
+
+    print(f"Processed {len(branches)} output targets in one pass in {int(minutes)}m {seconds:.2f}s.")
+
+    for branch in branches:
+        print(f"  - {branch['output_file_pathname']}")
+
+
 def get_last_modified_timestamp(file_path: str) -> Union[str, None]:
     """
     Get the last modified timestamp of a given file.
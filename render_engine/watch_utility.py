@@ -0,0 +1,261 @@
+import os
+import sys
+import json
+import time
+import select
+import struct
+import ctypes
+import ctypes.util
+import hashlib
+
+from typing import Callable, Dict, Iterable, Set
+from datetime import datetime
+from output_target_utility import get_output_targets
+from video_assembly_helper import collect_media_paths, get_file_signature
+from segment_utility import iter_scene_renders
+from batch_utility import get_scene_render_key
+from image_ops import configure_image_ops
+from smart_cut_utility import configure_smart_cut
+from image_helper import load_image_array
+from video_utility import probe_media_source
+
+DEFAULT_DEBOUNCE_SECONDS = 0.5
+DEFAULT_POLL_INTERVAL_SECONDS = 1.0
+
+# inotify(7) event masks
+IN_ATTRIB = 0x004
+IN_CLOSE_WRITE = 0x008
+IN_MOVED_FROM = 0x040
+IN_MOVED_TO = 0x080
+IN_CREATE = 0x100
+IN_DELETE = 0x200
+IN_NONBLOCK = os.O_NONBLOCK
+INOTIFY_EVENT = struct.Struct("iIII")    # wd, mask, cookie, name length
+WATCH_MASK = IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE
+
+
+class InotifyWatcher:
+    """
+    Watches files through Linux inotify.
+
+    The parent directories are watched rather than the files, so a file that an
+    editor saves by writing a new file and renaming it over the old one is still
+    seen.
+    """
+
+    def __init__(self):
+        self.libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        self.fd = self.libc.inotify_init1(IN_NONBLOCK)
+
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+
+        self.directories_by_wd: Dict[int, str] = {}
+        self.paths: Set[str] = set()
+
+    def set_paths(self, paths: Iterable[str]) -> None:
+        self.paths = set(paths)
+
+        for directory in {os.path.dirname(path) for path in self.paths} - set(self.directories_by_wd.values()):
+            wd = self.libc.inotify_add_watch(self.fd, os.fsencode(directory), WATCH_MASK)
+
+            if wd >= 0:
+                self.directories_by_wd[wd] = directory
+
+    def wait_for_changes(self, timeout: float) -> Set[str]:
+        """Waits up to timeout seconds and returns the watched paths that changed."""
+        changed_paths = set()
+        readable, _, _ = select.select([self.fd], [], [], timeout)
+
+        if not readable:
+            return changed_paths
+
+        try:
+            data = os.read(self.fd, 64 * 1024)
+        except BlockingIOError:
+            return changed_paths
+
+        offset = 0
+
+        while offset < len(data):
+            wd, _, _, name_length = INOTIFY_EVENT.unpack_from(data, offset)
+            name = data[offset + INOTIFY_EVENT.size:offset + INOTIFY_EVENT.size + name_length].rstrip(b"\0")
+            offset += INOTIFY_EVENT.size + name_length
+
+            if wd in self.directories_by_wd:
+                path = os.path.join(self.directories_by_wd[wd], os.fsdecode(name))
+
+                if path in self.paths:
+                    changed_paths.add(path)
+
+        return changed_paths
+
+    def close(self) -> None:
+        os.close(self.fd)
+
+
+class PollingWatcher:
+    """Watches files by comparing their mtime and size at a fixed interval."""
+
+    def __init__(self, poll_interval: float = DEFAULT_POLL_INTERVAL_SECONDS):
+        self.poll_interval = poll_interval
+        self.signatures = {}
+
+    def set_paths(self, paths: Iterable[str]) -> None:
+        self.signatures = {path: self.signatures.get(path, get_file_signature(path)) for path in paths}
+
+    def wait_for_changes(self, timeout: float) -> Set[str]:
+        time.sleep(min(timeout, self.poll_interval))
+
+        changed_paths = set()
+
+        for path, signature in self.signatures.items():
+            current_signature = get_file_signature(path)
+
+            if current_signature != signature:
+                self.signatures[path] = current_signature
+                changed_paths.add(path)
+
+        return changed_paths
+
+    def close(self) -> None:
+        pass
+
+
+def create_watcher(poll_interval: float = DEFAULT_POLL_INTERVAL_SECONDS):
+    """Returns an inotify watcher on Linux, and a polling watcher elsewhere or when inotify is unavailable."""
+    if sys.platform.startswith("linux"):
+        try:
+            return InotifyWatcher()
+        except (OSError, AttributeError) as e:
+            print(f"Watch: inotify is not available ({e}), polling for changes.")
+
+    return PollingWatcher(poll_interval)
+
+
+def get_scene_watch_keys(video_assembly: Dict) -> Dict[str, str]:
+    """
+    Returns a key per scene output that changes whenever the output would: the
+    scene's render key plus the mtime and size of every file the scene uses.
+    """
+    settings = video_assembly.get("composeflow.org", {}).get("settings", {})
+    source_file_watermark = settings.get("source_file_watermark", False)
+    output_targets = get_output_targets(video_assembly["cut"]["render_output"], settings.get("quick_and_dirty", False))
+
+    configure_image_ops(settings)
+    configure_smart_cut(settings)
+
+    scene_watch_keys = {}
+
+    for _, scene, target, output_path in iter_scene_renders(video_assembly, output_targets):
+        file_signatures = sorted((path, get_file_signature(path)) for path in collect_media_paths(scene))
+        watch_key = get_scene_render_key(scene, target, source_file_watermark) + json.dumps(file_signatures)
+
+        scene_watch_keys[os.path.abspath(output_path)] = hashlib.sha256(watch_key.encode("utf-8")).hexdigest()
+
+    return scene_watch_keys
+
+
+def invalidate_scene_outputs(previous_keys: Dict[str, str], current_keys: Dict[str, str]) -> int:
+    """
+    Removes the scene outputs whose key changed, so the next render redoes
+    exactly those scenes.
+
+    :return: The number of scene outputs removed.
+    """
+    removed_count = 0
+
+    for output_path, watch_key in current_keys.items():
+        if previous_keys.get(output_path) != watch_key and os.path.isfile(output_path):
+            os.remove(output_path)
+            removed_count += 1
+
+    return removed_count
+
+
+def load_video_assembly(video_assembly_file_pathname: str):
+    """Loads the assembly, or returns None while it is half written or invalid."""
+    try:
+        with open(video_assembly_file_pathname, "r") as file:
+            return json.load(file)
+    except (OSError, ValueError) as e:
+        print(f"Watch: cannot read '{video_assembly_file_pathname}': {e}")
+        return None
+
+
+def watch_video_assembly(
+    video_assembly_file_pathname: str,
+    render_cut: Callable,
+    debounce_seconds: float = DEFAULT_DEBOUNCE_SECONDS,
+    poll_interval: float = DEFAULT_POLL_INTERVAL_SECONDS,
+) -> None:
+    """
+    Renders the assembly, then keeps watching it and every file it references.
+
+    After a burst of changes has been quiet for debounce_seconds, only the
+    scenes whose description or files changed are rendered again, and the cut
+    is re-assembled.
+
+    :param render_cut: Renders the cut, render_cut(video_assembly_file, force_cut=False).
+                       force_cut renders the cut even if it is newer than the assembly.
+    """
+    video_assembly_file_pathname = os.path.abspath(video_assembly_file_pathname)
+    watcher = create_watcher(poll_interval)
+
+    video_assembly = load_video_assembly(video_assembly_file_pathname)
+    scene_watch_keys = get_scene_watch_keys(video_assembly) if video_assembly else {}
+
+    render_cut(video_assembly_file_pathname)
+
+    try:
+        while True:
+            if video_assembly is not None:
+                watcher.set_paths(collect_media_paths(video_assembly.get("cut", {}).get("segments", [])) | {video_assembly_file_pathname})
+
+            print(f"Watch: waiting for changes to '{video_assembly_file_pathname}' and its media (Ctrl+C to stop).")
+
+            changed_paths = set()
+
+            while not changed_paths:
+                changed_paths = watcher.wait_for_changes(poll_interval)
+
+            # Saves come in bursts, wait until they settle
+            while True:
+                more_changed_paths = watcher.wait_for_changes(debounce_seconds)
+
+                if not more_changed_paths:
+                    break
+
+                changed_paths |= more_changed_paths
+
+            print(f"Watch: {len(changed_paths)} changed: {', '.join(sorted(changed_paths))}")
+
+            changed_video_assembly = load_video_assembly(video_assembly_file_pathname)
+
+            if changed_video_assembly is None:
+                continue
+
+            video_assembly = changed_video_assembly
+
+            # Probes and decoded images of changed files are stale
+            probe_media_source.cache_clear()
+            load_image_array.cache_clear()
+
+            start_time = time.time()
+
+            try:
+                current_scene_watch_keys = get_scene_watch_keys(video_assembly)
+                removed_count = invalidate_scene_outputs(scene_watch_keys, current_scene_watch_keys)
+                scene_watch_keys = current_scene_watch_keys
+
+                print(f"Watch: re-rendering {removed_count} affected scene outputs.")
+
+                render_cut(video_assembly_file_pathname, force_cut=True)
+            except Exception as e:
+                # Keep watching, the next save may fix it
+                print(f"Watch: render failed: {e!r}")
+                continue
+
+            print(f"Watch: cut updated in {time.time() - start_time:.2f}s at {datetime.now().strftime('%H:%M:%S')}.")
+    finally:
+        watcher.close()
@@ -0,0 +1,30 @@
+from typing import Any, Dict
+from image_ops import get_image_ops_backend, set_image_ops_backend
+from resource_governor import configure_resource_governor, get_resource_governor_settings
+from clip_cache import get_clip_cache_settings, set_clip_cache_settings
+from staging_cache import get_staging_cache_settings, set_staging_cache_settings
+from render_metrics import get_render_metrics_settings, set_render_metrics_settings
+
+
+def get_worker_settings() -> Dict[str, Any]:
+    """
+    Returns the module settings of the cut being rendered that worker
+    processes render with, see apply_worker_settings().
+    """
+    return {
+        "image_ops_backend": get_image_ops_backend(),
+        "resource_governor": get_resource_governor_settings(),
+        "clip_cache": get_clip_cache_settings(),
+        "staging_cache": get_staging_cache_settings(),
+        "render_metrics": get_render_metrics_settings(),
+    }
+
+
+def apply_worker_settings(worker_settings: Dict[str, Any]) -> None:
+    """Worker: configures the modules as the process that started it, from get_worker_settings()."""
+    # Spawned workers do not inherit module state, so the backend, budget, caches and metrics are passed along
+    set_image_ops_backend(worker_settings["image_ops_backend"])
+    configure_resource_governor(worker_settings["resource_governor"])
+    set_clip_cache_settings(worker_settings["clip_cache"])
+    set_staging_cache_settings(worker_settings["staging_cache"])
+    set_render_metrics_settings(worker_settings["render_metrics"])